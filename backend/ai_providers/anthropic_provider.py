@@ -1,13 +1,11 @@
-import base64
 import logging
 import traceback
-import os
-from io import BytesIO
-from PIL import Image
 from decouple import config
 import anthropic
 
 from .base_provider import BaseAIProvider
+from .http_client import AI_MAX_RETRIES, create_async_http_client, create_http_client, http_timeout
+from .image_preprocessing import ImageSpec
 
 # Konfiguration aus Umgebungsvariablen
 ANTHROPIC_API_KEY = config('ANTHROPIC_API_KEY', default='')
@@ -20,43 +18,91 @@ logger = logging.getLogger('ai_service')
 class AnthropicProvider(BaseAIProvider):
     """Provider für Anthropic Claude API"""
     
+    # Claude verkleinert Bilder mit mehr als 1568 Pixeln Kantenlänge ohnehin,
+    # die API akzeptiert höchstens 5 MB pro Bild
+    image_spec = ImageSpec(max_edge=1568, max_bytes=int(4.5 * 1024 * 1024))
+    
     @property
     def provider_name(self):
         return "anthropic"
     
+    @property
+    def model_name(self):
+        return ANTHROPIC_MODEL
+    
     def analyze_image(self, image_path, prompt):
         """Analysiert ein Bild mit Anthropic Claude API"""
+        return self.analyze_images([image_path], prompt)
+    
+    def analyze_images(self, image_paths, prompt):
+        """Analysiert ein oder mehrere Bilder in einer Anfrage an die Anthropic Claude API"""
         if not ANTHROPIC_API_KEY:
             logger.error("Anthropic API-Schlüssel nicht konfiguriert")
             return self._create_error_response("Anthropic API-Schlüssel nicht konfiguriert")
         
         try:
-            logger.info("Starte Anthropic Claude Bildanalyse")
-            logger.debug(f"Verwende Anthropic Modell: {ANTHROPIC_MODEL}")
-            logger.debug(f"Max Tokens: {MAX_TOKENS}")
+            logger.info(f"Starte Anthropic Claude Bildanalyse ({len(image_paths)} Bild(er))")
+            content = self._build_content(image_paths, prompt)
+            with self._rate_limited(len(image_paths), prompt, MAX_TOKENS):
+                return self._create_message(content)
             
-            # Bild komprimieren und in base64 konvertieren
-            base64_image, media_type = self._compress_and_encode_image(image_path)
-            
-            # Initialisiere den Anthropic-Client
-            logger.info("Initialisiere Anthropic Client")
-            client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
-            
-            logger.info(f"Sende Anfrage an Anthropic API mit Medientyp: {media_type}")
-            message = client.messages.create(
+        except Exception as e:
+            logger.error(f"Fehler bei Anthropic Bildanalyse: {str(e)}")
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            return self._create_error_response(str(e))
+    
+    def stream_images(self, image_paths, prompt):
+        """Analysiert Bilder mit der Anthropic Claude API und liefert die Antwort stückweise"""
+        if not ANTHROPIC_API_KEY:
+            logger.error("Anthropic API-Schlüssel nicht konfiguriert")
+            return self._create_error_response("Anthropic API-Schlüssel nicht konfiguriert")
+        
+        try:
+            logger.info(f"Starte Anthropic Claude Bildanalyse mit Streaming ({len(image_paths)} Bild(er))")
+            content = self._build_content(image_paths, prompt)
+            parts = []
+            with self._rate_limited(len(image_paths), prompt, MAX_TOKENS), self.client.messages.stream(
                 model=ANTHROPIC_MODEL,
                 max_tokens=MAX_TOKENS,
                 messages=[
                     {
                         "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt},
-                            {"type": "image", "source": {"type": "base64", "media_type": media_type, "data": base64_image}}
-                        ]
+                        "content": content
                     }
                 ]
-            )
+            ) as stream:
+                for text in stream.text_stream:
+                    parts.append(text)
+                    yield text
+            logger.info("Streaming-Antwort von Anthropic API vollständig")
+            
+            return self._create_success_response("".join(parts), ANTHROPIC_MODEL)
             
+        except Exception as e:
+            logger.error(f"Fehler bei Anthropic Bildanalyse: {str(e)}")
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            return self._create_error_response(str(e))
+    
+    async def analyze_images_async(self, image_paths, prompt):
+        """Analysiert Bilder über den asynchronen Client der Anthropic Claude API"""
+        if not ANTHROPIC_API_KEY:
+            logger.error("Anthropic API-Schlüssel nicht konfiguriert")
+            return self._create_error_response("Anthropic API-Schlüssel nicht konfiguriert")
+        
+        try:
+            logger.info(f"Starte asynchrone Anthropic Claude Bildanalyse ({len(image_paths)} Bild(er))")
+            content = await self._build_content_async(image_paths, prompt)
+            async with self._rate_limited_async(len(image_paths), prompt, MAX_TOKENS):
+                message = await self.async_client.messages.create(
+                    model=ANTHROPIC_MODEL,
+                    max_tokens=MAX_TOKENS,
+                    messages=[
+                        {
+                            "role": "user",
+                            "content": content
+                        }
+                    ]
+                )
             logger.info("Antwort von Anthropic API erhalten")
             
             return self._create_success_response(
@@ -69,88 +115,90 @@ class AnthropicProvider(BaseAIProvider):
             logger.error(f"Traceback: {traceback.format_exc()}")
             return self._create_error_response(str(e))
     
-    def _determine_media_type(self, image_path):
-        """Bestimmt den MIME-Typ basierend auf der Dateiendung"""
-        media_type = "image/jpeg"  # Standard
-        if image_path.lower().endswith('.png'):
-            media_type = "image/png"
-        elif image_path.lower().endswith('.gif'):
-            media_type = "image/gif"
-        return media_type
-        
-    def _compress_and_encode_image(self, image_path, max_size_mb=4.5, quality_start=85):
-        """
-        Komprimiert ein Bild und konvertiert es in base64
+    async def stream_images_async(self, image_paths, prompt):
+        """Streamt die Antwort über den asynchronen Client der Anthropic Claude API"""
+        if not ANTHROPIC_API_KEY:
+            logger.error("Anthropic API-Schlüssel nicht konfiguriert")
+            yield self._create_error_response("Anthropic API-Schlüssel nicht konfiguriert")
+            return
         
-        Args:
-            image_path: Pfad zur Bilddatei
-            max_size_mb: Maximale Größe in MB
-            quality_start: Anfängliche JPEG-Qualität
+        try:
+            logger.info(f"Starte asynchrone Anthropic Claude Bildanalyse mit Streaming ({len(image_paths)} Bild(er))")
+            content = await self._build_content_async(image_paths, prompt)
+            parts = []
+            async with self._rate_limited_async(len(image_paths), prompt, MAX_TOKENS), self.async_client.messages.stream(
+                model=ANTHROPIC_MODEL,
+                max_tokens=MAX_TOKENS,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": content
+                    }
+                ]
+            ) as stream:
+                async for text in stream.text_stream:
+                    parts.append(text)
+                    yield text
+            logger.info("Streaming-Antwort von Anthropic API vollständig")
+            result = self._create_success_response("".join(parts), ANTHROPIC_MODEL)
             
-        Returns:
-            tuple: (base64-kodiertes Bild, Medientyp)
-        """
-        # Medientyp bestimmen
-        original_media_type = self._determine_media_type(image_path)
-        
-        # Bild öffnen
-        img = Image.open(image_path)
-        
-        # Konvertieren zu RGB, falls es sich um RGBA handelt (für JPEG-Konvertierung)
-        if img.mode == 'RGBA':
-            img = img.convert('RGB')
-        
-        # Maximale Größe in Bytes
-        max_size_bytes = max_size_mb * 1024 * 1024
-        
-        # Ausgabeformat bestimmen (immer JPEG für Kompression)
-        output_format = "JPEG"
-        media_type = "image/jpeg"
-        
-        # Komprimierungsschleife
-        quality = quality_start
-        img_io = BytesIO()
-        img.save(img_io, format=output_format, quality=quality)
-        
-        # Wenn das Bild bereits klein genug ist, verwenden wir es direkt
-        if img_io.tell() <= max_size_bytes:
-            img_io.seek(0)
-            return base64.b64encode(img_io.read()).decode('utf-8'), media_type
-        
-        # Sonst reduzieren wir die Qualität schrittweise
-        while quality > 10 and img_io.tell() > max_size_bytes:
-            quality -= 10
-            img_io = BytesIO()
-            img.save(img_io, format=output_format, quality=quality)
+        except Exception as e:
+            logger.error(f"Fehler bei Anthropic Bildanalyse: {str(e)}")
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            result = self._create_error_response(str(e))
+        yield result
+    
+    def _build_content(self, image_paths, prompt):
+        """Bilder ausrichten, verkleinern, komprimieren und als Text- und Bild-Blöcke aufbereiten"""
+        content = [{"type": "text", "text": prompt}]
+        for image in self._prepare_images(image_paths):
+            content.append(self._image_block(self._encode_base64(image.data), image.media_type))
+        return content
+    
+    def _image_block(self, base64_image, media_type):
+        """Erstellt einen Bild-Block für die Nachricht"""
+        return {"type": "image", "source": {"type": "base64", "media_type": media_type, "data": base64_image}}
+    
+    def _create_client(self):
+        """Erstellt den Anthropic-Client mit Verbindungspool und Timeouts"""
+        logger.info("Initialisiere Anthropic Client")
+        return anthropic.Anthropic(
+            api_key=ANTHROPIC_API_KEY,
+            http_client=create_http_client(self._observe_response),
+            timeout=http_timeout(),
+            max_retries=AI_MAX_RETRIES
+        )
+    
+    def _create_async_client(self):
+        """Erstellt den asynchronen Anthropic-Client für den Event-Loop des Workers"""
+        logger.info("Initialisiere asynchronen Anthropic Client")
+        return anthropic.AsyncAnthropic(
+            api_key=ANTHROPIC_API_KEY,
+            http_client=create_async_http_client(self._observe_response),
+            timeout=http_timeout(),
+            max_retries=AI_MAX_RETRIES
+        )
+    
+    def _create_message(self, content):
+        """Sendet eine Nachricht mit Text- und Bild-Blöcken an die Anthropic API"""
+        logger.debug(f"Verwende Anthropic Modell: {ANTHROPIC_MODEL}")
+        logger.debug(f"Max Tokens: {MAX_TOKENS}")
         
-        # Wenn die Qualitätsreduktion nicht ausreicht, verkleinern wir das Bild
-        if img_io.tell() > max_size_bytes:
-            # Originalgröße
-            width, height = img.size
-            
-            # Skalierungsfaktor berechnen
-            scale_factor = 0.9  # Reduziere um 10% in jeder Iteration
-            
-            while img_io.tell() > max_size_bytes and scale_factor > 0.1:
-                # Neue Größe berechnen
-                new_width = int(width * scale_factor)
-                new_height = int(height * scale_factor)
-                
-                # Bild verkleinern
-                resized_img = img.resize((new_width, new_height), Image.LANCZOS)
-                
-                # Speichern und Größe prüfen
-                img_io = BytesIO()
-                resized_img.save(img_io, format=output_format, quality=quality)
-                
-                # Wenn immer noch zu groß, weiter verkleinern
-                if img_io.tell() > max_size_bytes:
-                    scale_factor *= 0.9
-                else:
-                    break
+        logger.info(f"Sende Anfrage an Anthropic API mit {len(content) - 1} Bild(ern)")
+        message = self.client.messages.create(
+            model=ANTHROPIC_MODEL,
+            max_tokens=MAX_TOKENS,
+            messages=[
+                {
+                    "role": "user",
+                    "content": content
+                }
+            ]
+        )
         
-        # Zurücksetzen des Positionszeigers und Rückgabe des komprimierten Bildes
-        img_io.seek(0)
-        logger.info(f"Bild komprimiert: Originalgröße unbekannt -> {img_io.tell()/1024/1024:.2f} MB (Qualität: {quality})")
+        logger.info("Antwort von Anthropic API erhalten")
         
-        return base64.b64encode(img_io.read()).decode('utf-8'), media_type
+        return self._create_success_response(
+            message.content[0].text,
+            ANTHROPIC_MODEL
+        )
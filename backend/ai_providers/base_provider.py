@@ -1,5 +1,15 @@
+import time
+import base64
+import asyncio
 import logging
+import threading
 from abc import ABC, abstractmethod
+from contextlib import contextmanager, asynccontextmanager
+
+import metrics
+from upload_storage import stat_upload
+from .image_preprocessing import ImageSpec, prepare_images, run_cpu_bound
+from .rate_limiter import rate_limiter, estimate_tokens, RateLimitTimeout
 
 # Logger konfigurieren
 logger = logging.getLogger('ai_service')
@@ -7,12 +17,26 @@ logger = logging.getLogger('ai_service')
 class BaseAIProvider(ABC):
     """Basisklasse für alle AI-Provider"""
     
+    # Größte sinnvoll verarbeitbare Auflösung und Dateigröße für Bilder
+    image_spec = ImageSpec()
+    
+    def __init__(self):
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._async_client = None
+        self._async_loop = None
+    
     @property
     @abstractmethod
     def provider_name(self):
         """Name des Providers"""
         pass
     
+    @property
+    def model_name(self):
+        """Name des verwendeten Modells (None, falls nicht bekannt)"""
+        return None
+    
     @abstractmethod
     def analyze_image(self, image_path, prompt):
         """
@@ -27,6 +51,223 @@ class BaseAIProvider(ABC):
         """
         pass
     
+    def analyze_images(self, image_paths, prompt):
+        """
+        Analysiert mehrere Bilder (z.B. Seiten eines Rezepts) in einer Anfrage
+        
+        Provider, die mehrere Bilder pro Nachricht unterstützen, überschreiben
+        diese Methode. Standardmäßig wird nur ein einzelnes Bild akzeptiert.
+        
+        Args:
+            image_paths: Liste von Pfaden zu Bilddateien
+            prompt: Anweisung/Frage an die KI
+            
+        Returns:
+            dict: Ergebnis der Analyse
+        """
+        if len(image_paths) == 1:
+            return self.analyze_image(image_paths[0], prompt)
+        return self._create_error_response(
+            f"Provider '{self.provider_name}' unterstützt keine Analyse mehrerer Bilder"
+        )
+    
+    def stream_images(self, image_paths, prompt):
+        """
+        Analysiert ein oder mehrere Bilder und liefert die Antwort stückweise
+        
+        Generator, der Textfragmente liefert, sobald der Provider sie sendet.
+        Der Rückgabewert (StopIteration.value) ist das vollständige Ergebnis
+        im Format von _create_success_response bzw. _create_error_response.
+        Provider ohne Streaming liefern keine Fragmente, nur das Ergebnis.
+        
+        Args:
+            image_paths: Liste von Pfaden zu Bilddateien
+            prompt: Anweisung/Frage an die KI
+            
+        Yields:
+            str: Textfragmente der Antwort
+        """
+        return self.analyze_images(image_paths, prompt)
+        yield  # macht die Methode zum Generator
+    
+    async def analyze_images_async(self, image_paths, prompt):
+        """
+        Analysiert ein oder mehrere Bilder, ohne einen Thread zu belegen
+        
+        Provider mit asynchronem Client überschreiben diese Methode. Ohne
+        eigene Umsetzung läuft analyze_images in einem Thread.
+        
+        Args:
+            image_paths: Liste von Pfaden zu Bilddateien
+            prompt: Anweisung/Frage an die KI
+            
+        Returns:
+            dict: Ergebnis der Analyse
+        """
+        return await asyncio.to_thread(self.analyze_images, image_paths, prompt)
+    
+    async def stream_images_async(self, image_paths, prompt):
+        """
+        Asynchrone Variante von stream_images
+        
+        Async-Generatoren haben keinen Rückgabewert, daher ist das letzte
+        gelieferte Element das vollständige Ergebnis (dict), alle vorherigen
+        sind Textfragmente (str).
+        
+        Args:
+            image_paths: Liste von Pfaden zu Bilddateien
+            prompt: Anweisung/Frage an die KI
+            
+        Yields:
+            str | dict: Textfragmente, zum Schluss das Ergebnis
+        """
+        yield await self.analyze_images_async(image_paths, prompt)
+    
+    @property
+    def client(self):
+        """
+        Langlebiger Client für die API des Providers
+        
+        Wird beim ersten Zugriff erstellt und danach von allen Threads des
+        Prozesses gemeinsam genutzt, damit Verbindungen wiederverwendet werden.
+        """
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self._create_client()
+        return self._client
+    
+    def _create_client(self):
+        """Erstellt den API-Client; Provider ohne eigenen Client geben None zurück"""
+        return None
+    
+    @property
+    def async_client(self):
+        """
+        Asynchroner Client für die API des Providers
+        
+        Verbindungen eines asynchronen Clients gehören zu einem Event-Loop,
+        daher wird für jeden Loop (im Betrieb genau einer pro Worker) ein
+        eigener Client erstellt.
+        """
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            self._async_client = self._create_async_client()
+            self._async_loop = loop
+        return self._async_client
+    
+    def _create_async_client(self):
+        """Erstellt den asynchronen API-Client; ohne eigene Umsetzung None"""
+        return None
+    
+    def close(self):
+        """Schließt den API-Client und seine Verbindungen"""
+        with self._client_lock:
+            client, self._client = self._client, None
+        if client is not None and hasattr(client, 'close'):
+            client.close()
+    
+    async def aclose(self):
+        """Schließt den asynchronen Client (im Event-Loop, der ihn erstellt hat)"""
+        client, self._async_client, self._async_loop = self._async_client, None, None
+        if client is not None:
+            # httpx.AsyncClient schließt mit aclose(), die SDK-Clients mit close()
+            await (client.aclose() if hasattr(client, 'aclose') else client.close())
+    
+    @contextmanager
+    def _rate_limited(self, image_count, prompt, max_tokens=0):
+        """
+        Hält für die Dauer des Blocks einen Platz im Rate-Limit des Providers
+        
+        Wartet, bis RPM, TPM und Parallelitätsgrenze die Anfrage zulassen
+        und keine Sperre nach 429 besteht. Wartezeit und Dauer des Blocks
+        werden als Metriken erfasst.
+        
+        Args:
+            image_count: Anzahl der Bilder der Anfrage
+            prompt: Text der Anfrage
+            max_tokens: Höchstzahl der Tokens der Antwort
+            
+        Raises:
+            RateLimitTimeout: Keine Kapazität innerhalb der Wartezeit
+        """
+        started = time.monotonic()
+        try:
+            lease = rate_limiter.acquire(self.provider_name, estimate_tokens(prompt, image_count, max_tokens))
+        except RateLimitTimeout:
+            metrics.record_error('ai_rate_limit')
+            raise
+        acquired = self._record_wait(started)
+        try:
+            yield
+        finally:
+            self._release(lease, acquired)
+    
+    @asynccontextmanager
+    async def _rate_limited_async(self, image_count, prompt, max_tokens=0):
+        """Wie _rate_limited, wartet aber im Event-Loop statt in einem Thread"""
+        started = time.monotonic()
+        try:
+            lease = await rate_limiter.acquire_async(
+                self.provider_name, estimate_tokens(prompt, image_count, max_tokens)
+            )
+        except RateLimitTimeout:
+            metrics.record_error('ai_rate_limit')
+            raise
+        acquired = self._record_wait(started)
+        try:
+            yield
+        finally:
+            await rate_limiter.release_async(lease)
+            self._record_duration(acquired)
+    
+    def _record_wait(self, started):
+        """Erfasst die Wartezeit auf das Rate-Limit und gibt den Startzeitpunkt der Anfrage zurück"""
+        acquired = time.monotonic()
+        metrics.observe_stage(metrics.AI_RATE_LIMIT_WAIT.labels(self.provider_name), 'ai_wait', acquired - started)
+        return acquired
+    
+    def _release(self, lease, acquired):
+        """Gibt den Platz im Rate-Limit frei und erfasst die Dauer der Anfrage"""
+        rate_limiter.release(lease)
+        self._record_duration(acquired)
+    
+    def _record_duration(self, acquired):
+        """Erfasst die Dauer der Anfrage seit der Reservierung"""
+        metrics.observe_stage(
+            metrics.AI_REQUEST_DURATION.labels(self.provider_name, self.model_name or ''),
+            'ai',
+            time.monotonic() - acquired,
+            ' '.join(filter(None, (self.provider_name, self.model_name)))
+        )
+    
+    def _observe_response(self, response):
+        """Übergibt Status und Rate-Limit-Header einer Antwort an den Limiter"""
+        rate_limiter.observe(self.provider_name, response.status_code, response.headers)
+    
+    def _prepare_images(self, image_paths):
+        """
+        Bereitet Bilder über die gemeinsame Vorverarbeitung vor
+        
+        Args:
+            image_paths: Liste von Pfaden zu Bilddateien
+            
+        Returns:
+            list: PreparedImage (data, media_type, size) je Bild
+        """
+        images = prepare_images(image_paths, spec=self.image_spec)
+        metrics.IMAGE_SOURCE_BYTES.labels(self.provider_name).inc(sum(stat_upload(path).st_size for path in image_paths))
+        metrics.IMAGE_PAYLOAD_BYTES.labels(self.provider_name).inc(sum(len(image.data) for image in images))
+        return images
+    
+    async def _build_content_async(self, image_paths, prompt):
+        """Führt _build_content des Providers im Pool für CPU-lastige Arbeit aus"""
+        return await run_cpu_bound(self._build_content, image_paths, prompt)
+    
+    def _encode_base64(self, data):
+        """Kodiert Bilddaten als base64-String"""
+        return base64.b64encode(data).decode('utf-8')
+    
     def _create_error_response(self, error_message):
         """Erstellt eine standardisierte Fehlerantwort"""
         return {
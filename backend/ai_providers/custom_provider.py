@@ -1,9 +1,11 @@
+import os
 import logging
 import traceback
-import requests
 from decouple import config
 
 from .base_provider import BaseAIProvider
+from .http_client import create_async_http_client, create_requests_session, requests_timeout
+from .image_preprocessing import run_cpu_bound
 
 # Konfiguration aus Umgebungsvariablen
 CUSTOM_API_URL = config('CUSTOM_API_URL', default='')
@@ -19,6 +21,14 @@ class CustomProvider(BaseAIProvider):
     def provider_name(self):
         return "custom"
     
+    def _create_client(self):
+        """Erstellt eine requests-Session, die Verbindungen wiederverwendet"""
+        return create_requests_session(self._observe_response)
+    
+    def _create_async_client(self):
+        """Erstellt einen httpx.AsyncClient für den asynchronen Betrieb"""
+        return create_async_http_client(self._observe_response)
+    
     def analyze_image(self, image_path, prompt):
         """
         Beispiel für die Integration eines benutzerdefinierten API-Dienstes
@@ -30,30 +40,66 @@ class CustomProvider(BaseAIProvider):
         
         try:
             logger.info("Starte Custom API Bildanalyse")
-            with open(image_path, "rb") as image_file:
-                files = {"image": image_file}
-                data = {"prompt": prompt}
-                headers = {"Authorization": f"Bearer {CUSTOM_API_KEY}"}
+            
+            # Bild ausrichten und verkleinern, statt die Originaldatei zu senden
+            image = self._prepare_images([image_path])[0]
+            
+            logger.info("Sende Anfrage an Custom API")
+            with self._rate_limited(1, prompt):
+                response = self.client.post(
+                    CUSTOM_API_URL,
+                    timeout=requests_timeout(),
+                    **self._request_parts(image_path, image, prompt)
+                )
+            return self._handle_response(response)
                 
-                logger.info("Sende Anfrage an Custom API")
-                response = requests.post(
+        except Exception as e:
+            logger.error(f"Fehler bei Custom API Bildanalyse: {str(e)}")
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            return self._create_error_response(str(e))
+    
+    async def analyze_images_async(self, image_paths, prompt):
+        """Analysiert ein Bild über einen httpx.AsyncClient"""
+        if len(image_paths) != 1:
+            return await super().analyze_images_async(image_paths, prompt)
+        if not CUSTOM_API_URL or not CUSTOM_API_KEY:
+            logger.error("Benutzerdefinierte API nicht konfiguriert")
+            return self._create_error_response("Benutzerdefinierte API nicht konfiguriert")
+        
+        try:
+            logger.info("Starte asynchrone Custom API Bildanalyse")
+            image = (await run_cpu_bound(self._prepare_images, image_paths))[0]
+            
+            logger.info("Sende Anfrage an Custom API")
+            async with self._rate_limited_async(1, prompt):
+                response = await self.async_client.post(
                     CUSTOM_API_URL,
-                    files=files,
-                    data=data,
-                    headers=headers
+                    **self._request_parts(image_paths[0], image, prompt)
                 )
+            return self._handle_response(response)
                 
-                if response.status_code == 200:
-                    logger.info("Custom API Anfrage erfolgreich")
-                    return {
-                        "provider": self.provider_name,
-                        "response": response.json()
-                    }
-                else:
-                    logger.error(f"Custom API Fehler: {response.status_code} - {response.text}")
-                    return self._create_error_response(f"API-Fehler: {response.status_code} - {response.text}")
-                    
         except Exception as e:
             logger.error(f"Fehler bei Custom API Bildanalyse: {str(e)}")
             logger.error(f"Traceback: {traceback.format_exc()}")
             return self._create_error_response(str(e))
+    
+    def _request_parts(self, image_path, image, prompt):
+        """Multipart-Datei, Formularfelder und Header der Anfrage (requests und httpx)"""
+        extension = "png" if image.media_type == "image/png" else "jpg"
+        return {
+            "files": {"image": (f"{os.path.splitext(os.path.basename(image_path))[0]}.{extension}", image.data, image.media_type)},
+            "data": {"prompt": prompt},
+            "headers": {"Authorization": f"Bearer {CUSTOM_API_KEY}"}
+        }
+    
+    def _handle_response(self, response):
+        """Wertet die Antwort der Custom API aus (requests oder httpx)"""
+        if response.status_code == 200:
+            logger.info("Custom API Anfrage erfolgreich")
+            return {
+                "provider": self.provider_name,
+                "response": response.json()
+            }
+        else:
+            logger.error(f"Custom API Fehler: {response.status_code} - {response.text}")
+            return self._create_error_response(f"API-Fehler: {response.status_code} - {response.text}")
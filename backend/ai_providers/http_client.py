@@ -0,0 +1,111 @@
+"""
+Gemeinsame HTTP-Einstellungen für die KI-Provider
+
+Die SDK-Clients von OpenAI und Anthropic bauen auf httpx auf. Damit nicht
+jede Analyse eine neue TLS-Verbindung aufbaut, erhält jeder Provider einen
+langlebigen httpx-Client mit Verbindungspool, Keep-Alive und expliziten
+Timeouts. Für die benutzerdefinierte API gilt dasselbe mit requests. Jede
+Antwort kann an eine Funktion übergeben werden, die ihre Rate-Limit-Header
+auswertet.
+
+Im asynchronen Betrieb (asgi.py) nutzen die Provider zusätzlich einen
+httpx.AsyncClient. Da dort kein Thread pro Anfrage wartet, darf ein Worker
+deutlich mehr Verbindungen gleichzeitig offen halten.
+"""
+
+import asyncio
+import httpx
+import requests
+from decouple import config
+from requests.adapters import HTTPAdapter
+
+# Konfiguration aus Umgebungsvariablen
+AI_CONNECT_TIMEOUT = config('AI_CONNECT_TIMEOUT', default=10.0, cast=float)
+AI_READ_TIMEOUT = config('AI_READ_TIMEOUT', default=120.0, cast=float)
+AI_MAX_CONNECTIONS = config('AI_MAX_CONNECTIONS', default=20, cast=int)
+AI_KEEPALIVE_CONNECTIONS = config('AI_KEEPALIVE_CONNECTIONS', default=10, cast=int)
+AI_KEEPALIVE_EXPIRY = config('AI_KEEPALIVE_EXPIRY', default=60.0, cast=float)
+AI_MAX_RETRIES = config('AI_MAX_RETRIES', default=2, cast=int)
+AI_ASYNC_MAX_CONNECTIONS = config('AI_ASYNC_MAX_CONNECTIONS', default=200, cast=int)
+
+
+def http_timeout():
+    """
+    Timeouts für Anfragen an die KI-APIs
+
+    Returns:
+        httpx.Timeout: Getrennte Timeouts für Verbindungsaufbau und Antwort
+    """
+    return httpx.Timeout(AI_READ_TIMEOUT, connect=AI_CONNECT_TIMEOUT)
+
+
+def create_http_client(on_response=None):
+    """
+    Erstellt einen httpx-Client mit Verbindungspool für ein SDK
+
+    Args:
+        on_response: Funktion, die jede Antwort (auch die vom SDK
+            wiederholter Anfragen) vor dem Lesen des Inhalts erhält
+
+    Returns:
+        httpx.Client: Client mit Keep-Alive und Timeouts
+    """
+    return httpx.Client(
+        timeout=http_timeout(),
+        limits=httpx.Limits(
+            max_connections=AI_MAX_CONNECTIONS,
+            max_keepalive_connections=AI_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=AI_KEEPALIVE_EXPIRY
+        ),
+        event_hooks={'response': [on_response]} if on_response else None
+    )
+
+
+def create_async_http_client(on_response=None):
+    """
+    Erstellt einen httpx.AsyncClient mit Verbindungspool für ein SDK
+
+    Args:
+        on_response: Funktion, die jede Antwort erhält (wie bei
+            create_http_client; läuft in einem Thread, da sie z.B. in die
+            gemeinsame Datenbank des Rate-Limiters schreibt)
+
+    Returns:
+        httpx.AsyncClient: Client mit Keep-Alive und Timeouts
+    """
+    async def observe(response):
+        await asyncio.to_thread(on_response, response)
+
+    return httpx.AsyncClient(
+        timeout=http_timeout(),
+        limits=httpx.Limits(
+            max_connections=AI_ASYNC_MAX_CONNECTIONS,
+            max_keepalive_connections=AI_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=AI_KEEPALIVE_EXPIRY
+        ),
+        event_hooks={'response': [observe]} if on_response else None
+    )
+
+
+def create_requests_session(on_response=None):
+    """
+    Erstellt eine requests-Session mit Verbindungspool
+
+    Args:
+        on_response: Funktion, die jede Antwort erhält
+
+    Returns:
+        requests.Session: Session, die Verbindungen wiederverwendet
+    """
+    session = requests.Session()
+    if on_response:
+        session.hooks['response'].append(lambda response, *args, **kwargs: on_response(response))
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=AI_MAX_CONNECTIONS)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def requests_timeout():
+    """Timeouts (Verbindungsaufbau, Antwort) im Format von requests"""
+    return (AI_CONNECT_TIMEOUT, AI_READ_TIMEOUT)
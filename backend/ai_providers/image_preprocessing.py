@@ -0,0 +1,423 @@
+"""
+Gemeinsame Bildvorverarbeitung für alle AI-Provider
+
+Jeder Provider beschreibt mit einer ImageSpec, welche Auflösung und
+Dateigröße er sinnvoll verarbeiten kann. Die Vorverarbeitung korrigiert die
+EXIF-Orientierung, verkleinert auf diese Grenzen und kodiert höchstens einmal
+neu. Das Ergebnis wird über den Hash der Quelldatei und die Spezifikation im
+Derivat-Cache abgelegt, sodass Wiederholungen und Providerwechsel es
+wiederverwenden. Uploads im Arbeitsspeicher (UPLOAD_STORAGE=memory) werden
+ohne Derivat-Cache verarbeitet, damit auch ihre Derivate nicht auf die
+Platte gelangen.
+
+Im asynchronen Betrieb läuft die Vorverarbeitung über run_cpu_bound() in
+einem begrenzten Thread-Pool, damit sie den Event-Loop nicht blockiert.
+"""
+
+import os
+import time
+import asyncio
+import contextvars
+import hashlib
+import logging
+import threading
+from io import BytesIO
+from collections import OrderedDict, namedtuple
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps
+from decouple import config
+
+import metrics
+from storage_backends.base_storage import key_hash
+from upload_storage import caches_derivatives, open_upload, stat_upload
+
+# Konfiguration aus Umgebungsvariablen
+PREPROCESS_WORKERS = config('PREPROCESS_WORKERS', default=4, cast=int)
+DERIVATIVE_CACHE_DIR = config('DERIVATIVE_CACHE_DIR', default=os.path.join('data', 'derivatives'))
+DERIVATIVE_CACHE_MAX_BYTES = config('DERIVATIVE_CACHE_MAX_BYTES', default=256 * 1024 * 1024, cast=int)
+
+# Standardwerte für die Vorverarbeitung
+DEFAULT_MAX_EDGE = 2048
+JPEG_QUALITY = 85
+
+# Parameter für die größenbasierte JPEG-Kodierung
+PROBE_EDGE = 512
+PROBE_TILE = 128
+MIN_QUALITY = 50
+SIZE_SAFETY = 0.92
+MAX_ENCODE_ATTEMPTS = 4
+
+# Formate, die unverändert weitergegeben werden, wenn keine Änderung nötig ist
+PASSTHROUGH_FORMATS = {'JPEG': 'image/jpeg', 'PNG': 'image/png'}
+
+# EXIF-Tag für die Orientierung
+EXIF_ORIENTATION = 0x0112
+
+# Logger
+logger = logging.getLogger('ai_service')
+
+# Grenzen eines Providers für Bilder
+ImageSpec = namedtuple('ImageSpec', ['max_edge', 'max_short_edge', 'max_bytes', 'quality'])
+ImageSpec.__new__.__defaults__ = (DEFAULT_MAX_EDGE, None, None, JPEG_QUALITY)
+
+# Vorverarbeitetes Bild
+PreparedImage = namedtuple('PreparedImage', ['data', 'media_type', 'size'])
+
+def target_size(size, spec):
+    """
+    Berechnet die Zielgröße eines Bildes für eine Spezifikation
+
+    Args:
+        size: (Breite, Höhe) des Quellbildes
+        spec: ImageSpec des Providers
+
+    Returns:
+        tuple: (Breite, Höhe) nach dem Verkleinern (nie größer als die Quelle)
+    """
+    width, height = size
+    scale = 1.0
+    if spec.max_edge:
+        scale = min(scale, spec.max_edge / max(width, height))
+    if spec.max_short_edge:
+        scale = min(scale, spec.max_short_edge / min(width, height))
+    if scale >= 1.0:
+        return size
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def _jpeg_size(img, quality):
+    """Größe eines Bildes als JPEG in Bytes"""
+    img_io = BytesIO()
+    img.save(img_io, format='JPEG', quality=quality)
+    return img_io.tell()
+
+def _probe(img):
+    """
+    Stellt eine kleine Stichprobe des Bildes für Größenschätzungen zusammen
+
+    Ein verkleinertes Bild hätte eine höhere Detaildichte als das Original
+    und würde die Größe deutlich überschätzen. Deshalb werden Kacheln in
+    Originalauflösung gleichmäßig über das Bild verteilt entnommen.
+    """
+    grid = PROBE_EDGE // PROBE_TILE
+    if img.width <= PROBE_EDGE and img.height <= PROBE_EDGE:
+        return img
+
+    tile_width = min(PROBE_TILE, img.width)
+    tile_height = min(PROBE_TILE, img.height)
+    probe = Image.new(img.mode, (tile_width * grid, tile_height * grid))
+    for row in range(grid):
+        top = (img.height - tile_height) * row // max(1, grid - 1)
+        for column in range(grid):
+            left = (img.width - tile_width) * column // max(1, grid - 1)
+            tile = img.crop((left, top, left + tile_width, top + tile_height))
+            probe.paste(tile, (column * tile_width, row * tile_height))
+    return probe
+
+def _search_quality(img, budget, quality_start):
+    """
+    Sucht per Binärsuche auf einer Stichprobe die höchste passende Qualität
+
+    Returns:
+        tuple: (Qualität oder None, geschätzte Bytes bei MIN_QUALITY)
+    """
+    probe = _probe(img)
+    scale = img.width * img.height / (probe.width * probe.height)
+
+    def estimated_bytes(quality):
+        return _jpeg_size(probe, quality) * scale
+
+    lowest = estimated_bytes(MIN_QUALITY)
+    if lowest > budget:
+        return None, lowest
+
+    low, high = MIN_QUALITY, quality_start
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimated_bytes(middle) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    return low, lowest
+
+def encode_jpeg_within(img, max_bytes=None, quality_start=JPEG_QUALITY):
+    """
+    Kodiert ein Bild als JPEG und hält dabei eine maximale Dateigröße ein
+
+    Statt das volle Bild wiederholt mit sinkender Qualität und Größe zu
+    kodieren, wird die Qualität per Binärsuche auf einer kleinen Stichprobe
+    bestimmt. Reicht auch die Mindestqualität nicht, ergibt sich der
+    Skalierungsfaktor aus der Pixelzahl und der geschätzten Größe. Das volle
+    Bild wird in der Regel nur einmal kodiert.
+
+    Args:
+        img: PIL-Bild im Modus RGB oder L
+        max_bytes: Maximale Größe in Bytes (None für unbegrenzt)
+        quality_start: Höchste zu verwendende JPEG-Qualität
+
+    Returns:
+        tuple: (JPEG-Bytes, (Breite, Höhe))
+    """
+    # Ohne Limit oder wenn selbst unkomprimierte Pixel hineinpassen: direkt kodieren
+    if max_bytes is None or img.width * img.height * len(img.getbands()) <= max_bytes:
+        img_io = BytesIO()
+        img.save(img_io, format='JPEG', quality=quality_start)
+        return img_io.getvalue(), img.size
+
+    budget = max_bytes * SIZE_SAFETY
+    target = img
+    scale = 1.0
+    for _ in range(MAX_ENCODE_ATTEMPTS):
+        quality, lowest = _search_quality(target, budget, quality_start)
+        if quality is None:
+            # Auch die Mindestqualität passt nicht: Fläche proportional reduzieren
+            quality = MIN_QUALITY
+            scale *= (budget / lowest) ** 0.5
+            size = (max(1, int(img.width * scale)), max(1, int(img.height * scale)))
+            target = img.resize(size, Image.LANCZOS)
+            continue
+
+        img_io = BytesIO()
+        target.save(img_io, format='JPEG', quality=quality)
+        if img_io.tell() <= max_bytes:
+            break
+
+        # Schätzung zu niedrig: Fläche anhand der tatsächlichen Größe korrigieren
+        scale *= (budget / img_io.tell()) ** 0.5
+        size = (max(1, int(img.width * scale)), max(1, int(img.height * scale)))
+        target = img.resize(size, Image.LANCZOS)
+    else:
+        img_io = BytesIO()
+        target.save(img_io, format='JPEG', quality=quality)
+
+    logger.info(f"Bild komprimiert: {img_io.tell()/1024/1024:.2f} MB (Qualität: {quality}, Skalierung: {scale:.2f})")
+    return img_io.getvalue(), target.size
+
+class DerivativeCache:
+    """Ablage vorverarbeiteter Bilder auf der Platte, gemeinsam für alle Worker"""
+
+    def __init__(self, directory=DERIVATIVE_CACHE_DIR, max_bytes=DERIVATIVE_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._hashes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def source_hash(self, image_path):
+        """
+        Gibt den SHA-256 einer Quelldatei zurück
+
+        Der Hash wird pro Prozess zu Pfad, Größe und Änderungszeit gemerkt,
+        damit wiederholte Analysen die Datei nicht erneut lesen müssen.
+        Uploads, deren Schlüssel bereits der Inhalts-Hash ist, werden gar
+        nicht gelesen.
+        """
+        digest = key_hash(image_path)
+        if digest is not None:
+            return digest
+
+        stat = stat_upload(image_path)
+        memo_key = (os.path.abspath(image_path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            digest = self._hashes.get(memo_key)
+            if digest is not None:
+                self._hashes.move_to_end(memo_key)
+                return digest
+
+        sha256 = hashlib.sha256()
+        with open_upload(image_path) as image_file:
+            for chunk in iter(lambda: image_file.read(1024 * 1024), b''):
+                sha256.update(chunk)
+        digest = sha256.hexdigest()
+
+        with self._lock:
+            self._hashes[memo_key] = digest
+            while len(self._hashes) > 1024:
+                self._hashes.popitem(last=False)
+        return digest
+
+    def key(self, source_hash, spec):
+        """Schlüssel aus Quell-Hash und Provider-Spezifikation"""
+        material = f"{source_hash}:{spec.max_edge}:{spec.max_short_edge}:{spec.max_bytes}:{spec.quality}"
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Liest ein Derivat oder gibt None zurück"""
+        for media_type, extension in (('image/jpeg', 'jpg'), ('image/png', 'png')):
+            path = os.path.join(self.directory, f"{key}.{extension}")
+            try:
+                with open(path, 'rb') as derivative_file:
+                    data = derivative_file.read()
+            except FileNotFoundError:
+                continue
+            # Zugriffszeit für die LRU-Verdrängung aktualisieren
+            os.utime(path)
+            with Image.open(BytesIO(data)) as img:
+                return PreparedImage(data, media_type, img.size)
+        return None
+
+    def set(self, key, prepared):
+        """Speichert ein Derivat atomar und hält die Größenbeschränkung ein"""
+        os.makedirs(self.directory, exist_ok=True)
+        extension = 'png' if prepared.media_type == 'image/png' else 'jpg'
+        path = os.path.join(self.directory, f"{key}.{extension}")
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as derivative_file:
+            derivative_file.write(prepared.data)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self):
+        """Entfernt die am längsten nicht genutzten Derivate über dem Limit"""
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.endswith('.tmp'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+
+        if total <= self.max_bytes:
+            return
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+
+# Gemeinsamer Derivat-Cache
+derivative_cache = DerivativeCache()
+
+def _render(image_path, spec):
+    """
+    Erzeugt das Derivat eines Bildes gemäß Spezifikation
+
+    Returns:
+        tuple: (PreparedImage, True falls neu kodiert wurde)
+    """
+    with open_upload(image_path) as image_file, Image.open(image_file) as img:
+        source_format = img.format
+        orientation = img.getexif().get(EXIF_ORIENTATION, 1)
+        size = target_size(img.size, spec)
+
+        # Unverändert weitergeben, wenn Format, Größe und Orientierung bereits passen
+        if size == img.size and orientation == 1 and source_format in PASSTHROUGH_FORMATS:
+            file_size = stat_upload(image_path).st_size
+            if spec.max_bytes is None or file_size <= spec.max_bytes:
+                image_file.seek(0)
+                return PreparedImage(image_file.read(), PASSTHROUGH_FORMATS[source_format], img.size), False
+
+        # JPEGs direkt in reduzierter Auflösung dekodieren (DCT-Skalierung)
+        if source_format == 'JPEG':
+            img.draft('RGB', size)
+
+        # Ausrichtung gemäß EXIF-Orientierung korrigieren
+        img = ImageOps.exif_transpose(img)
+
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+
+        size = target_size(img.size, spec)
+        if size != img.size:
+            img = img.resize(size, Image.LANCZOS)
+
+        data, size = encode_jpeg_within(img, spec.max_bytes, spec.quality)
+        return PreparedImage(data, 'image/jpeg', size), True
+
+def prepare_image(image_path, spec=ImageSpec(), cache=None):
+    """
+    Bereitet ein Bild für einen Provider vor
+
+    Args:
+        image_path: Pfad zur Bilddatei
+        spec: ImageSpec des Providers
+        cache: DerivativeCache (Standard: gemeinsamer Cache)
+
+    Returns:
+        PreparedImage: Bilddaten, Medientyp und Größe
+    """
+    if not caches_derivatives(image_path):
+        return _render(image_path, spec)[0]
+
+    cache = cache or derivative_cache
+    key = cache.key(cache.source_hash(image_path), spec)
+
+    try:
+        prepared = cache.get(key)
+    except Exception as e:
+        logger.warning(f"Derivat-Cache konnte nicht gelesen werden: {str(e)}")
+        prepared = None
+    if prepared is not None:
+        logger.debug(f"Derivat aus dem Cache: {image_path}")
+        metrics.DERIVATIVE_CACHE_HIT.inc()
+        return prepared
+
+    metrics.DERIVATIVE_CACHE_MISS.inc()
+    prepared, rendered = _render(image_path, spec)
+    if not rendered:
+        # Quelle passt bereits, eine Kopie im Cache würde nichts sparen
+        return prepared
+
+    logger.debug(f"Bild vorverarbeitet: {image_path} -> {prepared.size[0]}x{prepared.size[1]}, {len(prepared.data)} Bytes")
+    try:
+        cache.set(key, prepared)
+    except Exception as e:
+        logger.warning(f"Derivat konnte nicht gespeichert werden: {str(e)}")
+    return prepared
+
+def prepare_images(image_paths, spec=ImageSpec(), max_workers=PREPROCESS_WORKERS, cache=None):
+    """
+    Bereitet mehrere Bilder parallel vor
+
+    Pillow gibt beim Dekodieren, Skalieren und Kodieren den GIL frei, daher
+    laufen die Seiten eines Rezepts in Threads tatsächlich parallel.
+
+    Args:
+        image_paths: Liste von Pfaden zu Bilddateien
+        spec: ImageSpec des Providers
+        max_workers: Maximale Anzahl paralleler Threads
+        cache: DerivativeCache (Standard: gemeinsamer Cache)
+
+    Returns:
+        list: PreparedImage je Bild in der Reihenfolge der Eingabe
+    """
+    prepare = partial(prepare_image, spec=spec, cache=cache)
+    started = time.monotonic()
+    if len(image_paths) <= 1 or max_workers <= 1:
+        prepared = [prepare(path) for path in image_paths]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(image_paths))) as executor:
+            prepared = list(executor.map(prepare, image_paths))
+    metrics.observe_stage(metrics.IMAGE_PREPROCESSING, 'image_preprocessing', time.monotonic() - started)
+    return prepared
+
+# Gemeinsamer Pool für CPU-lastige Arbeit im asynchronen Betrieb
+_cpu_executor = None
+_cpu_executor_lock = threading.Lock()
+
+async def run_cpu_bound(func, *args):
+    """
+    Führt CPU-lastige Arbeit (Vorverarbeitung, base64) außerhalb des Event-Loops aus
+
+    Der Pool ist auf PREPROCESS_WORKERS Threads begrenzt, sodass viele
+    gleichzeitige Scans nicht beliebig viele Bilder parallel dekodieren.
+    Kontextvariablen (z.B. die Zeiten für Server-Timing) werden übernommen.
+
+    Args:
+        func: Auszuführende Funktion
+        *args: Argumente der Funktion
+
+    Returns:
+        Rückgabewert von func
+    """
+    global _cpu_executor
+    if _cpu_executor is None:
+        with _cpu_executor_lock:
+            if _cpu_executor is None:
+                _cpu_executor = ThreadPoolExecutor(max_workers=PREPROCESS_WORKERS, thread_name_prefix='image-cpu')
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(_cpu_executor, partial(context.run, func, *args))
@@ -1,11 +1,11 @@
-import os
-import base64
 import logging
 import traceback
 from decouple import config
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
 from .base_provider import BaseAIProvider
+from .http_client import AI_MAX_RETRIES, create_async_http_client, create_http_client, http_timeout
+from .image_preprocessing import ImageSpec
 
 # Konfiguration aus Umgebungsvariablen
 OPENAI_API_KEY = config('OPENAI_API_KEY', default='')
@@ -18,50 +18,95 @@ logger = logging.getLogger('ai_service')
 class OpenAIProvider(BaseAIProvider):
     """Provider für OpenAI Vision API"""
     
+    # OpenAI skaliert Bilder (detail=high) auf höchstens 2048 Pixel und
+    # anschließend auf 768 Pixel an der kürzeren Kante
+    image_spec = ImageSpec(max_edge=2048, max_short_edge=768)
+    
     @property
     def provider_name(self):
         return "openai"
     
+    @property
+    def model_name(self):
+        return OPENAI_MODEL
+    
     def analyze_image(self, image_path, prompt):
         """Analysiert ein Bild mit OpenAI Vision API"""
+        return self.analyze_images([image_path], prompt)
+    
+    def analyze_images(self, image_paths, prompt):
+        """Analysiert ein oder mehrere Bilder in einer Anfrage an die OpenAI Vision API"""
         if not OPENAI_API_KEY:
             logger.error("OpenAI API-Schlüssel nicht konfiguriert")
             return self._create_error_response("OpenAI API-Schlüssel nicht konfiguriert")
         
         try:
-            logger.info("Starte OpenAI Bildanalyse")
-            logger.debug(f"Verwende OpenAI Modell: {OPENAI_MODEL}")
-            logger.debug(f"Max Tokens: {MAX_TOKENS}")
-            
-            # Bild in base64 konvertieren
-            with open(image_path, "rb") as image_file:
-                base64_image = base64.b64encode(image_file.read()).decode('utf-8')
+            logger.info(f"Starte OpenAI Bildanalyse ({len(image_paths)} Bild(er))")
+            content = self._build_content(image_paths, prompt)
+            with self._rate_limited(len(image_paths), prompt, MAX_TOKENS):
+                return self._request_completion(content)
             
-            # Initialisiere den OpenAI-Client
-            logger.info("Initialisiere OpenAI Client")
+        except Exception as e:
+            logger.error(f"Fehler bei OpenAI Bildanalyse: {str(e)}")
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            return self._create_error_response(str(e))
+    
+    def stream_images(self, image_paths, prompt):
+        """Analysiert Bilder mit der OpenAI Vision API und liefert die Antwort stückweise"""
+        if not OPENAI_API_KEY:
+            logger.error("OpenAI API-Schlüssel nicht konfiguriert")
+            return self._create_error_response("OpenAI API-Schlüssel nicht konfiguriert")
+        
+        try:
+            logger.info(f"Starte OpenAI Bildanalyse mit Streaming ({len(image_paths)} Bild(er))")
+            content = self._build_content(image_paths, prompt)
+            parts = []
+            with self._rate_limited(len(image_paths), prompt, MAX_TOKENS):
+                stream = self.client.chat.completions.create(
+                    model=OPENAI_MODEL,
+                    messages=[
+                        {
+                            "role": "user",
+                            "content": content
+                        }
+                    ],
+                    max_tokens=MAX_TOKENS,
+                    stream=True
+                )
+                
+                for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        parts.append(chunk.choices[0].delta.content)
+                        yield chunk.choices[0].delta.content
+            logger.info("Streaming-Antwort von OpenAI API vollständig")
             
-            # OpenAI-Client initialisieren
-            client = self._initialize_client()
+            return self._create_success_response("".join(parts), OPENAI_MODEL)
             
-            logger.info("Sende Anfrage an OpenAI API")
-            response = client.chat.completions.create(
-                model=OPENAI_MODEL,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt},
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}"
-                                }
-                            }
-                        ]
-                    }
-                ],
-                max_tokens=MAX_TOKENS
-            )
+        except Exception as e:
+            logger.error(f"Fehler bei OpenAI Bildanalyse: {str(e)}")
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            return self._create_error_response(str(e))
+    
+    async def analyze_images_async(self, image_paths, prompt):
+        """Analysiert Bilder über den asynchronen Client der OpenAI Vision API"""
+        if not OPENAI_API_KEY:
+            logger.error("OpenAI API-Schlüssel nicht konfiguriert")
+            return self._create_error_response("OpenAI API-Schlüssel nicht konfiguriert")
+        
+        try:
+            logger.info(f"Starte asynchrone OpenAI Bildanalyse ({len(image_paths)} Bild(er))")
+            content = await self._build_content_async(image_paths, prompt)
+            async with self._rate_limited_async(len(image_paths), prompt, MAX_TOKENS):
+                response = await self.async_client.chat.completions.create(
+                    model=OPENAI_MODEL,
+                    messages=[
+                        {
+                            "role": "user",
+                            "content": content
+                        }
+                    ],
+                    max_tokens=MAX_TOKENS
+                )
             logger.info("Antwort von OpenAI API erhalten")
             
             return self._create_success_response(
@@ -74,30 +119,102 @@ class OpenAIProvider(BaseAIProvider):
             logger.error(f"Traceback: {traceback.format_exc()}")
             return self._create_error_response(str(e))
     
-    def _initialize_client(self):
-        """Initialisiert den OpenAI-Client mit verschiedenen Fallback-Methoden"""
-        client = None
-        try:
-            # Methode 1: Nur mit API-Key
-            client = OpenAI(api_key=OPENAI_API_KEY)
-        except TypeError as e:
-            # Methode 2: Setze Umgebungsvariable und initialisiere ohne Parameter
-            os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
-            try:
-                client = OpenAI()
-            except Exception:
-                # Methode 3: Verwende nur die notwendigsten Parameter
-                try:
-                    client = OpenAI(
-                        api_key=OPENAI_API_KEY,
-                        max_retries=2
-                    )
-                except Exception as e3:
-                    logger.error(f"Alle Initialisierungsmethoden fehlgeschlagen: {str(e3)}")
-                    raise Exception("Konnte OpenAI-Client nicht initialisieren")
+    async def stream_images_async(self, image_paths, prompt):
+        """Streamt die Antwort über den asynchronen Client der OpenAI Vision API"""
+        if not OPENAI_API_KEY:
+            logger.error("OpenAI API-Schlüssel nicht konfiguriert")
+            yield self._create_error_response("OpenAI API-Schlüssel nicht konfiguriert")
+            return
         
-        if not client:
-            logger.error("OpenAI Client konnte nicht initialisiert werden")
-            raise Exception("OpenAI Client ist None nach Initialisierungsversuchen")
+        try:
+            logger.info(f"Starte asynchrone OpenAI Bildanalyse mit Streaming ({len(image_paths)} Bild(er))")
+            content = await self._build_content_async(image_paths, prompt)
+            parts = []
+            async with self._rate_limited_async(len(image_paths), prompt, MAX_TOKENS):
+                stream = await self.async_client.chat.completions.create(
+                    model=OPENAI_MODEL,
+                    messages=[
+                        {
+                            "role": "user",
+                            "content": content
+                        }
+                    ],
+                    max_tokens=MAX_TOKENS,
+                    stream=True
+                )
+                
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        parts.append(chunk.choices[0].delta.content)
+                        yield chunk.choices[0].delta.content
+            logger.info("Streaming-Antwort von OpenAI API vollständig")
+            result = self._create_success_response("".join(parts), OPENAI_MODEL)
             
-        return client
+        except Exception as e:
+            logger.error(f"Fehler bei OpenAI Bildanalyse: {str(e)}")
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            result = self._create_error_response(str(e))
+        yield result
+    
+    def _build_content(self, image_paths, prompt):
+        """Bilder ausrichten, verkleinern und als Text- und Bild-Blöcke aufbereiten"""
+        content = [{"type": "text", "text": prompt}]
+        for image in self._prepare_images(image_paths):
+            content.append(self._image_part(self._encode_base64(image.data), image.media_type))
+        return content
+    
+    def _image_part(self, base64_image, media_type):
+        """Erstellt einen Bild-Block für die Nachricht"""
+        return {
+            "type": "image_url",
+            "image_url": {
+                "url": f"data:{media_type};base64,{base64_image}"
+            }
+        }
+    
+    def _request_completion(self, content):
+        """Sendet eine Nachricht mit Text- und Bild-Blöcken an die OpenAI API"""
+        logger.debug(f"Verwende OpenAI Modell: {OPENAI_MODEL}")
+        logger.debug(f"Max Tokens: {MAX_TOKENS}")
+        
+        logger.info("Sende Anfrage an OpenAI API")
+        response = self.client.chat.completions.create(
+            model=OPENAI_MODEL,
+            messages=[
+                {
+                    "role": "user",
+                    "content": content
+                }
+            ],
+            max_tokens=MAX_TOKENS
+        )
+        logger.info("Antwort von OpenAI API erhalten")
+        
+        return self._create_success_response(
+            response.choices[0].message.content,
+            OPENAI_MODEL
+        )
+    
+    def _create_client(self):
+        """Erstellt den OpenAI-Client mit Verbindungspool und Timeouts"""
+        logger.info("Initialisiere OpenAI Client")
+        try:
+            return OpenAI(
+                api_key=OPENAI_API_KEY,
+                http_client=create_http_client(self._observe_response),
+                timeout=http_timeout(),
+                max_retries=AI_MAX_RETRIES
+            )
+        except Exception as e:
+            logger.error(f"OpenAI Client konnte nicht initialisiert werden: {str(e)}")
+            raise Exception("Konnte OpenAI-Client nicht initialisieren") from e
+    
+    def _create_async_client(self):
+        """Erstellt den asynchronen OpenAI-Client für den Event-Loop des Workers"""
+        logger.info("Initialisiere asynchronen OpenAI Client")
+        return AsyncOpenAI(
+            api_key=OPENAI_API_KEY,
+            http_client=create_async_http_client(self._observe_response),
+            timeout=http_timeout(),
+            max_retries=AI_MAX_RETRIES
+        )
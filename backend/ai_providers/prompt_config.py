@@ -36,6 +36,10 @@ PROMPTS = {
     "nutrition": "Welche Lebensmittel sind auf diesem Bild zu sehen? Schätze die ungefähren Nährwerte (Kalorien, Protein, Kohlenhydrate, Fett) für die sichtbaren Portionen.",
 }
 
+# Hinweis für Rezepte, die sich über mehrere Fotos erstrecken
+MULTI_PAGE_HINT = "The following {count} images are consecutive pages of one and the same recipe. \
+    Treat them as a single recipe and return exactly one JSON-LD block for it."
+
 def get_prompt(prompt_type="general"):
     """
     Gibt einen vordefinierten Prompt basierend auf dem angegebenen Typ zurück.
@@ -47,3 +51,18 @@ def get_prompt(prompt_type="general"):
         str: Der vordefinierte Prompt
     """
     return PROMPTS.get(prompt_type.lower(), DEFAULT_PROMPT)
+
+def get_multi_page_prompt(prompt, page_count):
+    """
+    Ergänzt einen Prompt um den Hinweis auf mehrere Seiten eines Rezepts.
+    
+    Args:
+        prompt: Der eigentliche Prompt
+        page_count: Anzahl der Bilder
+        
+    Returns:
+        str: Der ergänzte Prompt (unverändert bei nur einem Bild)
+    """
+    if page_count <= 1:
+        return prompt
+    return f"{MULTI_PAGE_HINT.format(count=page_count)}\n\n{prompt}"
@@ -0,0 +1,469 @@
+"""
+Kette mehrerer AI-Provider mit Ausfallsicherung
+
+Die Provider werden in der konfigurierten Reihenfolge versucht. Für jeden
+Provider werden Fehler und Antwortzeiten erfasst: Nach mehreren Fehlern in
+Folge öffnet ein Circuit Breaker und der Provider wird übersprungen, bis
+nach einer Wartezeit ein einzelner Probeaufruf erlaubt ist.
+
+Optional werden Anfragen abgesichert (Hedging): Antwortet der erste Provider
+nicht innerhalb seiner üblichen Antwortzeit (95. Perzentil), wird dieselbe
+Anfrage zusätzlich an den nächsten Provider gestellt. Der erste Provider
+läuft dabei im Thread der Anfrage, nur der zweite in einem kleinen Pool
+(AI_HEDGE_WORKERS); ist dort kein Platz frei, wird nicht abgesichert.
+Schlägt der erste Aufruf fehl, liegt die Antwort des zweiten so schon vor.
+
+Im asynchronen Betrieb wird mit asyncio-Tasks abgesichert und die erste
+erfolgreiche Antwort verwendet.
+"""
+
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from decouple import config
+
+from .base_provider import BaseAIProvider
+
+# Konfiguration aus Umgebungsvariablen
+AI_CIRCUIT_FAILURES = config('AI_CIRCUIT_FAILURES', default=3, cast=int)
+AI_CIRCUIT_RESET = config('AI_CIRCUIT_RESET', default=30.0, cast=float)
+AI_LATENCY_WINDOW = config('AI_LATENCY_WINDOW', default=100, cast=int)
+AI_HEDGE = config('AI_HEDGE', default=False, cast=bool)
+AI_HEDGE_MIN_SAMPLES = config('AI_HEDGE_MIN_SAMPLES', default=10, cast=int)
+AI_HEDGE_WORKERS = config('AI_HEDGE_WORKERS', default=8, cast=int)
+
+# Perzentil der Antwortzeit, nach dem abgesichert wird
+HEDGE_PERCENTILE = 0.95
+
+# Zustände des Circuit Breakers
+CIRCUIT_CLOSED = 'closed'
+CIRCUIT_OPEN = 'open'
+CIRCUIT_HALF_OPEN = 'half_open'
+
+# Logger
+logger = logging.getLogger('ai_service')
+
+
+class ProviderHealth:
+    """Fehler, Antwortzeiten und Circuit Breaker eines Providers"""
+
+    def __init__(self, name, failure_threshold=AI_CIRCUIT_FAILURES, reset_timeout=AI_CIRCUIT_RESET,
+                 window=AI_LATENCY_WINDOW):
+        """
+        Args:
+            name: Name des Providers (für Logs)
+            failure_threshold: Fehler in Folge, nach denen der Breaker öffnet
+            reset_timeout: Sekunden bis zum nächsten Probeaufruf
+            window: Anzahl der letzten Antwortzeiten für das Perzentil
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CIRCUIT_CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_at = 0.0
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def available(self):
+        """
+        Prüft ohne Nebenwirkung, ob der Provider aufgerufen werden könnte
+
+        Anders als allow() wird dabei kein Probeaufruf belegt.
+        """
+        with self._lock:
+            return self._due(time.monotonic())
+
+    def allow(self):
+        """
+        Prüft, ob der Provider aufgerufen werden darf
+
+        Bei offenem Breaker wird nach reset_timeout genau ein Probeaufruf
+        zugelassen (half open). Bleibt dessen Ergebnis aus, wird nach einer
+        weiteren Wartezeit erneut einer zugelassen. Nur unmittelbar vor dem
+        Aufruf verwenden, da der Probeaufruf damit verbraucht ist.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if not self._due(now):
+                return False
+            if self.state != CIRCUIT_CLOSED:
+                self.state = CIRCUIT_HALF_OPEN
+                self.trial_at = now
+            return True
+
+    def _due(self, now):
+        """Breaker geschlossen oder Wartezeit bis zum nächsten Probeaufruf abgelaufen"""
+        if self.state == CIRCUIT_CLOSED:
+            return True
+        since = self.opened_at if self.state == CIRCUIT_OPEN else self.trial_at
+        return now - since >= self.reset_timeout
+
+    def record_success(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+            self.failures = 0
+            self.state = CIRCUIT_CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == CIRCUIT_HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != CIRCUIT_OPEN:
+                    logger.warning(f"Circuit Breaker für {self.name} geöffnet nach {self.failures} Fehler(n)")
+                self.state = CIRCUIT_OPEN
+                self.opened_at = time.monotonic()
+
+    def percentile(self, fraction=HEDGE_PERCENTILE, min_samples=1):
+        """
+        Antwortzeit, unter der der Anteil fraction der Aufrufe lag
+
+        Returns:
+            float: Sekunden oder None bei weniger als min_samples Messungen
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < max(1, min_samples):
+            return None
+        return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+
+    def snapshot(self):
+        """Zustand für Statistiken"""
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "p95": self.percentile(),
+        }
+
+
+class ProviderChain(BaseAIProvider):
+    """AI-Provider, der mehrere Provider nacheinander oder abgesichert nutzt"""
+
+    def __init__(self, providers, hedge=AI_HEDGE, hedge_min_samples=AI_HEDGE_MIN_SAMPLES,
+                 failure_threshold=AI_CIRCUIT_FAILURES, reset_timeout=AI_CIRCUIT_RESET):
+        """
+        Args:
+            providers: Provider-Instanzen in der Reihenfolge der Bevorzugung
+            hedge: Nach der p95-Antwortzeit zusätzlich den nächsten Provider fragen
+            hedge_min_samples: Erforderliche Messungen, bevor abgesichert wird
+            failure_threshold: Fehler in Folge, nach denen ein Provider pausiert
+            reset_timeout: Sekunden bis zum nächsten Probeaufruf
+        """
+        super().__init__()
+        self.providers = list(providers)
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self.health = {
+            provider.provider_name: ProviderHealth(provider.provider_name, failure_threshold, reset_timeout)
+            for provider in self.providers
+        }
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        # Freie Plätze im Pool; ohne freien Platz wird nicht abgesichert
+        self._hedge_slots = threading.BoundedSemaphore(AI_HEDGE_WORKERS)
+        # Abgesicherte Aufrufe, die nach der ersten Antwort noch weiterlaufen
+        self._background_tasks = set()
+
+    @property
+    def provider_name(self):
+        return ','.join(provider.provider_name for provider in self.providers)
+
+    def analyze_image(self, image_path, prompt):
+        return self._run(lambda provider: provider.analyze_image(image_path, prompt))
+
+    def analyze_images(self, image_paths, prompt):
+        return self._run(lambda provider: provider.analyze_images(image_paths, prompt))
+
+    def stream_images(self, image_paths, prompt):
+        """
+        Streamt die Antwort des ersten verfügbaren Providers
+
+        Auf den nächsten Provider wird nur gewechselt, solange noch kein
+        Textfragment gesendet wurde; Hedging ist beim Streaming nicht möglich.
+        """
+        candidates, forced = self._candidates()
+        errors = []
+        for provider in candidates:
+            if not self._claim(provider, forced):
+                continue
+            health = self.health[provider.provider_name]
+            started = time.monotonic()
+            stream = provider.stream_images(image_paths, prompt)
+            emitted = False
+            try:
+                while True:
+                    text = next(stream)
+                    emitted = True
+                    yield text
+            except StopIteration as stop:
+                result = stop.value
+            except Exception as e:
+                logger.error(f"Fehler bei Provider {provider.provider_name}: {str(e)}")
+                result = provider._create_error_response(str(e))
+
+            if self._succeeded(result):
+                health.record_success(time.monotonic() - started)
+                return self._finish(result, errors)
+            health.record_failure()
+            if emitted:
+                return result
+            errors.append(self._error_of(provider, result))
+        return self._all_failed(errors)
+
+    async def analyze_images_async(self, image_paths, prompt):
+        return await self._run_async(lambda provider: provider.analyze_images_async(image_paths, prompt))
+
+    async def stream_images_async(self, image_paths, prompt):
+        """Wie stream_images, mit den asynchronen Methoden der Provider"""
+        candidates, forced = self._candidates()
+        errors = []
+        for provider in candidates:
+            if not self._claim(provider, forced):
+                continue
+            health = self.health[provider.provider_name]
+            started = time.monotonic()
+            emitted = False
+            result = None
+            try:
+                async for item in provider.stream_images_async(image_paths, prompt):
+                    if isinstance(item, str):
+                        emitted = True
+                        yield item
+                    else:
+                        result = item
+            except Exception as e:
+                logger.error(f"Fehler bei Provider {provider.provider_name}: {str(e)}")
+                result = provider._create_error_response(str(e))
+
+            if self._succeeded(result):
+                health.record_success(time.monotonic() - started)
+                yield self._finish(result, errors)
+                return
+            health.record_failure()
+            if emitted:
+                yield result
+                return
+            errors.append(self._error_of(provider, result))
+        yield self._all_failed(errors)
+
+    def health_snapshot(self):
+        """Zustand aller Provider der Kette, z.B. für Statistiken"""
+        return {name: health.snapshot() for name, health in self.health.items()}
+
+    def close(self):
+        """Beendet den Hedging-Pool und schließt alle Provider der Kette"""
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+        for provider in self.providers:
+            provider.close()
+
+    async def aclose(self):
+        """Schließt die asynchronen Clients aller Provider der Kette"""
+        for provider in self.providers:
+            await provider.aclose()
+
+    def _candidates(self):
+        """
+        Provider, die aufgerufen werden könnten, ohne Probeaufrufe zu belegen
+
+        Returns:
+            tuple: Liste der Provider und ob die Breaker übergangen werden,
+                weil keiner verfügbar ist (dann alle Provider)
+        """
+        available = [provider for provider in self.providers if self.health[provider.provider_name].available()]
+        if available:
+            return available, False
+        return list(self.providers), True
+
+    def _claim(self, provider, forced):
+        """Belegt direkt vor dem Aufruf ggf. den Probeaufruf des Providers"""
+        return forced or self.health[provider.provider_name].allow()
+
+    def _run(self, call):
+        """Führt call über die Kette aus, mit Ausfallsicherung und Hedging"""
+        candidates, forced = self._candidates()
+        errors = []
+        index = 0
+        while index < len(candidates):
+            primary = candidates[index]
+            if not self._claim(primary, forced):
+                index += 1
+                continue
+            secondary = candidates[index + 1] if index + 1 < len(candidates) else None
+            delay = self.health[primary.provider_name].percentile(min_samples=self.hedge_min_samples)
+
+            hedged = False
+            if self.hedge and secondary is not None and delay is not None:
+                outcomes, hedged = self._hedged(call, primary, secondary, delay, forced)
+            else:
+                outcomes = [(primary, self._call(primary, call))]
+            index += 2 if hedged else 1
+
+            for provider, result in outcomes:
+                if self._succeeded(result):
+                    return self._finish(dict(result, hedged=True) if hedged else result, errors)
+                errors.append(self._error_of(provider, result))
+        return self._all_failed(errors)
+
+    def _hedged(self, call, primary, secondary, delay, forced=False):
+        """
+        Fragt nach delay Sekunden zusätzlich den zweiten Provider
+
+        Der erste Provider läuft im aufrufenden Thread, der zweite wird erst
+        nach delay Sekunden im Pool gestartet, und nur wenn dort ein Platz
+        frei ist. Ein Aufruf, dessen Ergebnis nicht mehr gebraucht wird,
+        läuft im Hintergrund weiter und wird nur noch gemessen.
+
+        Returns:
+            tuple: Liste (Provider, Ergebnis) der beendeten Aufrufe, zuletzt
+                ggf. die erfolgreiche Antwort, und ob der zweite Provider
+                gefragt wurde
+        """
+        lock = threading.Lock()
+        state = {'done': False, 'future': None}
+
+        def start_secondary():
+            with lock:
+                if state['done']:
+                    return
+                if not self._hedge_slots.acquire(blocking=False):
+                    logger.info(f"Kein freier Platz für Hedging, {secondary.provider_name} wird nicht gefragt")
+                    return
+                if not self._claim(secondary, forced):
+                    self._hedge_slots.release()
+                    return
+                logger.info(f"{primary.provider_name} antwortet nicht innerhalb von {delay:.1f}s, frage zusätzlich {secondary.provider_name}")
+                future = self._get_executor().submit(self._call, secondary, call)
+                future.add_done_callback(lambda _: self._hedge_slots.release())
+                state['future'] = future
+
+        timer = threading.Timer(delay, start_secondary)
+        timer.daemon = True
+        timer.start()
+        try:
+            result = self._call(primary, call)
+        finally:
+            timer.cancel()
+            with lock:
+                state['done'] = True
+                future = state['future']
+
+        outcomes = [(primary, result)]
+        if future is None or self._succeeded(result):
+            return outcomes, False
+        outcomes.append((secondary, future.result()))
+        return outcomes, True
+
+    def _call(self, provider, call):
+        """Ruft einen Provider auf und erfasst Antwortzeit bzw. Fehler"""
+        health = self.health[provider.provider_name]
+        started = time.monotonic()
+        try:
+            result = call(provider)
+        except Exception as e:
+            logger.error(f"Fehler bei Provider {provider.provider_name}: {str(e)}")
+            result = provider._create_error_response(str(e))
+        if self._succeeded(result):
+            health.record_success(time.monotonic() - started)
+        else:
+            health.record_failure()
+        return result
+
+    async def _run_async(self, call):
+        """Wie _run, call liefert hier eine Coroutine"""
+        candidates, forced = self._candidates()
+        errors = []
+        index = 0
+        while index < len(candidates):
+            primary = candidates[index]
+            if not self._claim(primary, forced):
+                index += 1
+                continue
+            secondary = candidates[index + 1] if index + 1 < len(candidates) else None
+            delay = self.health[primary.provider_name].percentile(min_samples=self.hedge_min_samples)
+
+            hedged = False
+            if self.hedge and secondary is not None and delay is not None:
+                outcomes, hedged = await self._hedged_async(call, primary, secondary, delay, forced)
+            else:
+                outcomes = [(primary, await self._call_async(primary, call))]
+            index += 2 if hedged else 1
+
+            for provider, result in outcomes:
+                if self._succeeded(result):
+                    return self._finish(dict(result, hedged=True) if hedged else result, errors)
+                errors.append(self._error_of(provider, result))
+        return self._all_failed(errors)
+
+    async def _hedged_async(self, call, primary, secondary, delay, forced=False):
+        """Wie _hedged, mit Tasks im Event-Loop statt Threads"""
+        task = asyncio.ensure_future(self._call_async(primary, call))
+        tasks = {task: primary}
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            return [(primary, next(iter(done)).result())], False
+        if not self._claim(secondary, forced):
+            return [(primary, await task)], False
+
+        logger.info(f"{primary.provider_name} antwortet nicht innerhalb von {delay:.1f}s, frage zusätzlich {secondary.provider_name}")
+        tasks[asyncio.ensure_future(self._call_async(secondary, call))] = secondary
+        pending = set(tasks)
+        outcomes = []
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                outcomes.append((tasks[task], task.result()))
+                if self._succeeded(outcomes[-1][1]):
+                    # Der langsamere Aufruf läuft weiter und wird nur noch gemessen
+                    for other in pending:
+                        self._background_tasks.add(other)
+                        other.add_done_callback(self._background_tasks.discard)
+                    return outcomes, True
+        return outcomes, True
+
+    async def _call_async(self, provider, call):
+        """Wie _call für asynchrone Aufrufe"""
+        health = self.health[provider.provider_name]
+        started = time.monotonic()
+        try:
+            result = await call(provider)
+        except Exception as e:
+            logger.error(f"Fehler bei Provider {provider.provider_name}: {str(e)}")
+            result = provider._create_error_response(str(e))
+        if self._succeeded(result):
+            health.record_success(time.monotonic() - started)
+        else:
+            health.record_failure()
+        return result
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=AI_HEDGE_WORKERS, thread_name_prefix='ai-hedge')
+            return self._executor
+
+    def _succeeded(self, result):
+        return isinstance(result, dict) and 'error' not in result
+
+    def _error_of(self, provider, result):
+        error = result.get('error') if isinstance(result, dict) else 'Ungültige Antwort'
+        return provider.provider_name, error
+
+    def _finish(self, result, errors):
+        """Ergebnis des erfolgreichen Providers, ggf. mit den vorher ausgefallenen"""
+        if errors:
+            logger.info(f"Analyse nach Ausfall über {result.get('provider')}: {self._describe(errors)}")
+            result = dict(result, failed_providers=[name for name, _ in errors])
+        return result
+
+    def _all_failed(self, errors):
+        return self._create_error_response(f"Alle KI-Anbieter fehlgeschlagen: {self._describe(errors)}")
+
+    def _describe(self, errors):
+        return '; '.join(f"{name}: {error}" for name, error in errors)
@@ -1,38 +1,115 @@
+import os
 import logging
+import threading
 from decouple import config
 
 from .openai_provider import OpenAIProvider
 from .anthropic_provider import AnthropicProvider
 from .custom_provider import CustomProvider
+from .provider_chain import ProviderChain
+from .recording_provider import Cassette, RecordingProvider, AI_CASSETTE, AI_RECORD_MODE
 
-# Konfiguration aus Umgebungsvariablen
+# Konfiguration aus Umgebungsvariablen; mehrere Provider durch Komma getrennt
+# in der Reihenfolge, in der sie versucht werden (z.B. "openai,anthropic")
 AI_PROVIDER = config('AI_PROVIDER', default='openai').strip()
 
 # Logger
 logger = logging.getLogger('ai_service')
 
+# Unterstützte Provider und ihre Klassen
+PROVIDERS = {
+    'openai': (OpenAIProvider, "Verwende OpenAI für die Analyse"),
+    'anthropic': (AnthropicProvider, "Verwende Anthropic Claude für die Analyse"),
+    'custom': (CustomProvider, "Verwende Custom API für die Analyse"),
+}
+
 class AIProviderFactory:
-    """Factory-Klasse zur Erstellung von AI-Providern"""
+    """
+    Factory-Klasse zur Erstellung von AI-Providern
+    
+    Pro Prozess (gunicorn-Worker) wird je Provider genau eine Instanz
+    erstellt und wiederverwendet, damit ihr SDK-Client und dessen
+    Verbindungspool erhalten bleiben. Sind mehrere Provider konfiguriert,
+    wird eine ProviderChain über diese Instanzen zurückgegeben. Mit
+    AI_RECORD_MODE wird das Ergebnis in einen RecordingProvider gehüllt.
+    """
+    
+    _instances = {}
+    _lock = threading.Lock()
     
     @staticmethod
     def get_provider():
         """
-        Gibt eine Instanz des konfigurierten AI-Providers zurück
+        Gibt die Instanz des konfigurierten AI-Providers zurück
         
         Returns:
             BaseAIProvider: Eine Instanz des konfigurierten AI-Providers
+                bzw. der Kette der konfigurierten Provider
+        """
+        provider_names = [name.strip() for name in AI_PROVIDER.lower().split(',') if name.strip()]
+        
+        for provider_name in provider_names or ['']:
+            if provider_name not in PROVIDERS:
+                logger.error(f"KI-Anbieter '{provider_name}' nicht unterstützt")
+                raise ValueError(f"KI-Anbieter '{provider_name}' nicht unterstützt")
+        
+        key = ','.join(provider_names)
+        provider = AIProviderFactory._instances.get(key)
+        if provider is None:
+            with AIProviderFactory._lock:
+                provider = AIProviderFactory._instances.get(key)
+                if provider is None:
+                    providers = [AIProviderFactory._create(name) for name in provider_names]
+                    if len(providers) > 1:
+                        logger.info(f"Verwende die Provider-Kette {key} für die Analyse")
+                        provider = ProviderChain(providers)
+                    else:
+                        provider = providers[0]
+                    if AI_RECORD_MODE:
+                        logger.info(f"Antworten von {key} werden aufgenommen bzw. wiedergegeben ({AI_RECORD_MODE})")
+                        provider = RecordingProvider(provider, mode=AI_RECORD_MODE, cassette=Cassette(AI_CASSETTE))
+                    AIProviderFactory._instances[key] = provider
+        return provider
+    
+    @staticmethod
+    def _create(provider_name):
+        """Einzelner Provider, wiederverwendet auch in mehreren Ketten (Lock gehalten)"""
+        provider = AIProviderFactory._instances.get(provider_name)
+        if provider is None:
+            provider_class, message = PROVIDERS[provider_name]
+            logger.info(message)
+            provider = provider_class()
+            AIProviderFactory._instances[provider_name] = provider
+        return provider
+    
+    @staticmethod
+    def close():
+        """Schließt alle Provider und ihre Verbindungen"""
+        with AIProviderFactory._lock:
+            instances = list(AIProviderFactory._instances.values())
+            AIProviderFactory._instances.clear()
+        for provider in instances:
+            provider.close()
+    
+    @staticmethod
+    async def aclose():
+        """Schließt die asynchronen Clients aller Provider (beim Beenden des Event-Loops)"""
+        with AIProviderFactory._lock:
+            instances = list(AIProviderFactory._instances.values())
+        for provider in instances:
+            await provider.aclose()
+    
+    @staticmethod
+    def _reset_after_fork():
         """
-        provider_name = AI_PROVIDER.lower()
+        Verwirft die vom Elternprozess geerbten Provider (gunicorn --preload)
         
-        if provider_name == 'openai':
-            logger.info("Verwende OpenAI für die Analyse")
-            return OpenAIProvider()
-        elif provider_name == 'anthropic':
-            logger.info("Verwende Anthropic Claude für die Analyse")
-            return AnthropicProvider()
-        elif provider_name == 'custom':
-            logger.info("Verwende Custom API für die Analyse")
-            return CustomProvider()
-        else:
-            logger.error(f"KI-Anbieter '{provider_name}' nicht unterstützt")
-            raise ValueError(f"KI-Anbieter '{provider_name}' nicht unterstützt")
+        Die Verbindungen teilen sich Sockets mit dem Elternprozess und dürfen
+        daher im Kind weder genutzt noch geschlossen werden. Auch die Sperre
+        wird neu angelegt, falls sie beim Fork gerade gehalten wurde.
+        """
+        AIProviderFactory._lock = threading.Lock()
+        AIProviderFactory._instances = {}
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=AIProviderFactory._reset_after_fork)
@@ -0,0 +1,495 @@
+"""
+Rate-Limits und Parallelitätsgrenze für die KI-Provider
+
+Vor jeder Anfrage an einen Provider wird Kapazität reserviert: je ein Token
+aus dem Eimer für Anfragen pro Minute (RPM) und die geschätzten Tokens der
+Anfrage aus dem Eimer für Tokens pro Minute (TPM). Zusätzlich begrenzt eine
+Obergrenze die gleichzeitig laufenden Anfragen. Der Zustand liegt in einer
+SQLite-Datenbank, die alle gunicorn-Worker gemeinsam nutzen, wartende
+Anfragen werden dort in einer Warteschlange in Ankunftsreihenfolge bedient.
+
+Die Antworten der Provider werden ausgewertet: Bei 429 sperrt Retry-After
+(bzw. eine Standardwartezeit) den Provider für alle Worker, und melden die
+Rate-Limit-Header, dass das Kontingent erschöpft ist, wird bis zu dessen
+Erneuerung gewartet.
+"""
+
+import os
+import re
+import time
+import asyncio
+import sqlite3
+import logging
+from collections import namedtuple
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from decouple import config
+
+from sqlite_store import SQLiteStore
+
+# Grenzen je Provider; 0 bedeutet unbegrenzt
+RateLimits = namedtuple('RateLimits', ['rpm', 'tpm', 'concurrency'])
+NO_LIMITS = RateLimits(0, 0, 0)
+
+# Konfiguration aus Umgebungsvariablen
+AI_RATE_LIMIT_DB = config('AI_RATE_LIMIT_DB', default=os.path.join('data', 'ai_rate_limits.sqlite3'))
+AI_RATE_LIMIT_WAIT = config('AI_RATE_LIMIT_WAIT', default=60.0, cast=float)
+AI_RATE_LIMIT_BACKOFF = config('AI_RATE_LIMIT_BACKOFF', default=10.0, cast=float)
+AI_RATE_LIMIT_LEASE = config('AI_RATE_LIMIT_LEASE', default=600.0, cast=float)
+AI_IMAGE_TOKENS = config('AI_IMAGE_TOKENS', default=1500, cast=int)
+PROVIDER_LIMITS = {
+    name: RateLimits(
+        config(f'{name.upper()}_RPM', default=0, cast=int),
+        config(f'{name.upper()}_TPM', default=0, cast=int),
+        config(f'{name.upper()}_MAX_CONCURRENCY', default=0, cast=int)
+    )
+    for name in ('openai', 'anthropic', 'custom')
+}
+
+# Abfrageintervall in der Warteschlange und Lebensdauer eines Wartenden ohne
+# Lebenszeichen (z.B. nach Absturz des Workers)
+POLL_INTERVAL = 0.05
+WAITER_TIMEOUT = 10.0
+
+# Längste Sperre, die aus Antwort-Headern übernommen wird
+MAX_BLOCK = 3600.0
+
+# Header mit verbleibendem Kontingent und dessen Erneuerung (OpenAI, Anthropic)
+QUOTA_HEADERS = (
+    ('x-ratelimit-remaining-requests', 'x-ratelimit-reset-requests'),
+    ('x-ratelimit-remaining-tokens', 'x-ratelimit-reset-tokens'),
+    ('anthropic-ratelimit-requests-remaining', 'anthropic-ratelimit-requests-reset'),
+    ('anthropic-ratelimit-tokens-remaining', 'anthropic-ratelimit-tokens-reset'),
+    ('anthropic-ratelimit-input-tokens-remaining', 'anthropic-ratelimit-input-tokens-reset'),
+    ('anthropic-ratelimit-output-tokens-remaining', 'anthropic-ratelimit-output-tokens-reset'),
+)
+TOKENS_REMAINING_HEADERS = ('x-ratelimit-remaining-tokens', 'anthropic-ratelimit-tokens-remaining')
+
+# Dauer im Format der OpenAI-Header, z.B. "20ms", "1.5s" oder "6m0s"
+DURATION_PART_PATTERN = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+DURATION_UNITS = {'h': 3600.0, 'm': 60.0, 's': 1.0, 'ms': 0.001}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_buckets (
+    provider TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    level REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (provider, kind)
+);
+CREATE TABLE IF NOT EXISTS rate_blocks (
+    provider TEXT PRIMARY KEY,
+    until REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rate_leases (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    provider TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_rate_leases_provider ON rate_leases (provider);
+CREATE TABLE IF NOT EXISTS rate_waiters (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    provider TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_rate_waiters_provider ON rate_waiters (provider, id);
+"""
+
+# Logger
+logger = logging.getLogger('ai_service')
+
+
+class RateLimitTimeout(Exception):
+    """Innerhalb der maximalen Wartezeit war keine Kapazität frei"""
+    pass
+
+
+def estimate_tokens(prompt, image_count, max_tokens=0):
+    """
+    Schätzt die Tokens einer Anfrage für das TPM-Limit
+
+    Args:
+        prompt: Text der Anfrage (ca. 4 Zeichen pro Token)
+        image_count: Anzahl der Bilder (je AI_IMAGE_TOKENS)
+        max_tokens: Höchstzahl der Tokens der Antwort
+
+    Returns:
+        int: Geschätzte Tokens
+    """
+    return len(prompt or '') // 4 + image_count * AI_IMAGE_TOKENS + max_tokens
+
+
+def parse_delay(value, now=None):
+    """
+    Wandelt eine Wartezeit aus einem Antwort-Header in Sekunden um
+
+    Args:
+        value: Sekunden ("1.5"), Dauer ("6m0s", "20ms"), HTTP-Datum
+            (Retry-After) oder Zeitpunkt nach RFC 3339 (Anthropic)
+        now: Aktuelle Zeit als Unix-Zeitstempel
+
+    Returns:
+        float: Sekunden (mindestens 0, höchstens MAX_BLOCK) oder None
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    now = time.time() if now is None else now
+    try:
+        seconds = float(value)
+    except ValueError:
+        parts = DURATION_PART_PATTERN.findall(value)
+        if parts and ''.join(number + unit for number, unit in parts) == value:
+            seconds = sum(float(number) * DURATION_UNITS[unit] for number, unit in parts)
+        else:
+            moment = _parse_moment(value)
+            if moment is None:
+                return None
+            seconds = moment.timestamp() - now
+    return min(max(seconds, 0.0), MAX_BLOCK)
+
+
+def _parse_moment(value):
+    """Zeitpunkt als HTTP-Datum oder nach RFC 3339, sonst None"""
+    try:
+        moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        try:
+            moment = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+async def _in_thread(function, *args):
+    """
+    Führt einen Zugriff auf die Datenbank in einem Thread aus
+
+    Wird der wartende Task abgebrochen, läuft der Zugriff dennoch zu Ende,
+    damit sein Ergebnis (z.B. ein reservierter Platz) freigegeben werden kann.
+    """
+    future = asyncio.ensure_future(asyncio.to_thread(function, *args))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        await asyncio.wait([future])
+        raise
+
+
+class _Waiter:
+    """Zustand einer Anfrage, die auf Kapazität wartet"""
+
+    def __init__(self, provider, tokens, limits, max_wait):
+        self.provider = provider
+        self.tokens = tokens
+        self.limits = limits
+        self.max_wait = max_wait
+        self.deadline = time.time() + max_wait
+        self.ticket = None
+        self.touched = 0.0
+        self.lease = None
+        self.waited = False
+
+    def hand_out(self):
+        """Übergibt den reservierten Platz an den Aufrufer"""
+        lease, self.lease = self.lease, None
+        if self.waited and lease is not None:
+            logger.info(f"Kapazität für {self.provider} nach Wartezeit reserviert")
+        return lease
+
+
+class RateLimiter:
+    """Token-Buckets, Parallelitätsgrenze und Sperren je Provider, über alle Worker"""
+
+    def __init__(self, db_path=AI_RATE_LIMIT_DB, limits=None, max_wait=AI_RATE_LIMIT_WAIT,
+                 backoff=AI_RATE_LIMIT_BACKOFF, lease_timeout=AI_RATE_LIMIT_LEASE):
+        """
+        Args:
+            db_path: Pfad zur gemeinsamen Datenbank
+            limits: RateLimits je Provider-Name (Standard: aus der Umgebung)
+            max_wait: Maximale Wartezeit einer Anfrage in Sekunden
+            backoff: Sperre nach 429 ohne Retry-After in Sekunden
+            lease_timeout: Sekunden, nach denen ein nicht freigegebener
+                Platz (z.B. nach Absturz eines Workers) verfällt
+        """
+        self.limits = PROVIDER_LIMITS if limits is None else limits
+        self.max_wait = max_wait
+        self.backoff = backoff
+        self.lease_timeout = lease_timeout
+        self.store = SQLiteStore(db_path, SCHEMA)
+
+    def acquire(self, provider, tokens=0, max_wait=None):
+        """
+        Reserviert Kapazität für eine Anfrage und wartet bei Bedarf darauf
+
+        Ist absehbar, dass die Wartezeit die Grenze überschreitet (z.B. bei
+        einer langen Sperre nach 429), wird sofort abgebrochen.
+
+        Args:
+            provider: Name des Providers
+            tokens: Geschätzte Tokens der Anfrage
+            max_wait: Maximale Wartezeit in Sekunden (Standard: AI_RATE_LIMIT_WAIT)
+
+        Returns:
+            int: Kennung des reservierten Platzes für release() oder None
+
+        Raises:
+            RateLimitTimeout: Keine Kapazität innerhalb der Wartezeit
+        """
+        waiter = _Waiter(provider, tokens, self.limits.get(provider, NO_LIMITS),
+                         self.max_wait if max_wait is None else max_wait)
+        try:
+            while True:
+                wait = self._attempt(waiter)
+                if not wait:
+                    return waiter.hand_out()
+                time.sleep(self._next_wait(waiter, wait))
+        finally:
+            self._leave(waiter)
+
+    async def acquire_async(self, provider, tokens=0, max_wait=None):
+        """
+        Wie acquire(), wartet aber mit asyncio.sleep, ohne einen Thread zu belegen
+
+        Die Zugriffe auf die Datenbank laufen in Threads, damit gesperrte
+        Transaktionen den Event-Loop nicht anhalten.
+        """
+        waiter = _Waiter(provider, tokens, self.limits.get(provider, NO_LIMITS),
+                         self.max_wait if max_wait is None else max_wait)
+        try:
+            while True:
+                wait = await _in_thread(self._attempt, waiter)
+                if not wait:
+                    return waiter.hand_out()
+                await asyncio.sleep(self._next_wait(waiter, wait))
+        finally:
+            # Bei Abbruch des Tasks den Platz in der Warteschlange sofort freigeben
+            await _in_thread(self._leave, waiter)
+
+    def _attempt(self, waiter):
+        """
+        Ein Versuch, Kapazität zu reservieren
+
+        Wartende, die nicht vorne in der Warteschlange stehen, fragen ihre
+        Position nur lesend ab und erneuern ihren Eintrag erst, wenn er
+        sonst bald verfiele.
+
+        Returns:
+            float: Wartezeit bis zum nächsten Versuch; 0, wenn reserviert
+                wurde (Platz in waiter.lease, ohne Grenzen None)
+        """
+        provider, limits = waiter.provider, waiter.limits
+        if not any(limits):
+            return self.blocked_for(provider)
+
+        now = time.time()
+        if waiter.ticket is not None and now < waiter.touched + WAITER_TIMEOUT / 2:
+            head = self.store.connection().execute(
+                "SELECT MIN(id) FROM rate_waiters WHERE provider = ? AND expires_at >= ?", (provider, now)
+            ).fetchone()[0]
+            if head != waiter.ticket:
+                return POLL_INTERVAL
+
+        with self.store.transaction(immediate=True) as conn:
+            now = time.time()
+            if waiter.ticket is None:
+                waiter.ticket = conn.execute(
+                    "INSERT INTO rate_waiters (provider, expires_at) VALUES (?, ?)",
+                    (provider, now + WAITER_TIMEOUT)
+                ).lastrowid
+            else:
+                # Auch einen bereits verfallenen Eintrag an seiner Position erneuern
+                conn.execute(
+                    "INSERT OR REPLACE INTO rate_waiters (id, provider, expires_at) VALUES (?, ?, ?)",
+                    (waiter.ticket, provider, now + WAITER_TIMEOUT)
+                )
+            waiter.touched = now
+            wait, lease = self._try_acquire(conn, provider, waiter.ticket, waiter.tokens, limits, now)
+        if lease is not None:
+            waiter.ticket = None
+            waiter.lease = lease
+        return wait
+
+    def _next_wait(self, waiter, wait):
+        """
+        Wartezeit bis zum nächsten Versuch
+
+        Raises:
+            RateLimitTimeout: Wenn die Wartezeit die Grenze überschreiten würde
+        """
+        if time.time() + wait > waiter.deadline:
+            raise RateLimitTimeout(self._timeout_message(waiter.provider, waiter.max_wait))
+        waiter.waited = True
+        return min(wait, WAITER_TIMEOUT / 2)
+
+    def _leave(self, waiter):
+        """Entfernt den Eintrag in der Warteschlange und gibt einen nicht übergebenen Platz frei"""
+        if waiter.ticket is not None:
+            with self.store.transaction() as conn:
+                conn.execute("DELETE FROM rate_waiters WHERE id = ?", (waiter.ticket,))
+            waiter.ticket = None
+        if waiter.lease is not None:
+            self.release(waiter.lease)
+            waiter.lease = None
+
+    def release(self, lease):
+        """Gibt einen mit acquire() reservierten Platz wieder frei"""
+        if lease is None:
+            return
+        with self.store.transaction() as conn:
+            conn.execute("DELETE FROM rate_leases WHERE id = ?", (lease,))
+
+    async def release_async(self, lease):
+        """Wie release(), ohne den Event-Loop zu belegen"""
+        if lease is not None:
+            await _in_thread(self.release, lease)
+
+    def observe(self, provider, status_code, headers):
+        """
+        Wertet Status und Rate-Limit-Header einer Antwort des Providers aus
+
+        Fehler beim Speichern werden nur protokolliert, damit die Anfrage
+        selbst nicht scheitert.
+
+        Args:
+            provider: Name des Providers
+            status_code: HTTP-Status der Antwort
+            headers: Header der Antwort (Groß-/Kleinschreibung egal)
+        """
+        now = time.time()
+        if status_code == 429:
+            delay = _number(headers.get('retry-after-ms'))
+            if delay is not None:
+                delay = min(max(delay / 1000, 0.0), MAX_BLOCK)
+            else:
+                delay = parse_delay(headers.get('retry-after'), now)
+            if delay is None:
+                delay = self.backoff
+            logger.warning(f"Rate-Limit von {provider} erreicht, pausiere {delay:.1f}s")
+        else:
+            delay = self._quota_delay(headers, now)
+
+        remaining_tokens = None
+        if self.limits.get(provider, NO_LIMITS).tpm:
+            remaining = [_number(headers.get(name)) for name in TOKENS_REMAINING_HEADERS]
+            remaining_tokens = min((value for value in remaining if value is not None), default=None)
+
+        if not delay and remaining_tokens is None:
+            return
+        try:
+            with self.store.transaction(immediate=True) as conn:
+                if delay:
+                    conn.execute(
+                        "INSERT INTO rate_blocks (provider, until) VALUES (?, ?) "
+                        "ON CONFLICT(provider) DO UPDATE SET until = MAX(until, excluded.until)",
+                        (provider, now + delay)
+                    )
+                if remaining_tokens is not None:
+                    tpm = self.limits[provider].tpm
+                    level = min(self._level(conn, provider, 'tokens', tpm, now), remaining_tokens)
+                    self._set_level(conn, provider, 'tokens', level, now)
+        except sqlite3.Error as e:
+            logger.warning(f"Rate-Limit-Status für {provider} konnte nicht gespeichert werden: {str(e)}")
+
+    def blocked_for(self, provider):
+        """Sekunden, die der Provider noch gesperrt ist (0 ohne Sperre)"""
+        with self.store.transaction() as conn:
+            return self._blocked_for(conn, provider, time.time())
+
+    def _try_acquire(self, conn, provider, ticket, tokens, limits, now):
+        """
+        Versucht in der laufenden Transaktion Kapazität zu reservieren
+
+        Returns:
+            tuple: (Wartezeit in Sekunden, Kennung des Platzes oder None)
+        """
+        conn.execute("DELETE FROM rate_leases WHERE expires_at < ?", (now,))
+        conn.execute("DELETE FROM rate_waiters WHERE expires_at < ?", (now,))
+
+        # Nur der vorderste Wartende darf reservieren
+        head = conn.execute(
+            "SELECT MIN(id) FROM rate_waiters WHERE provider = ?", (provider,)
+        ).fetchone()[0]
+        if head != ticket:
+            return POLL_INTERVAL, None
+
+        blocked = self._blocked_for(conn, provider, now)
+        if blocked:
+            return blocked, None
+
+        if limits.concurrency:
+            running = conn.execute(
+                "SELECT COUNT(*) FROM rate_leases WHERE provider = ?", (provider,)
+            ).fetchone()[0]
+            if running >= limits.concurrency:
+                return POLL_INTERVAL, None
+
+        wait = 0.0
+        levels = []
+        for kind, limit, amount in (('requests', limits.rpm, 1), ('tokens', limits.tpm, tokens)):
+            if not limit:
+                continue
+            # Größere Anfragen als der Eimer warten nur, bis er voll ist
+            amount = min(amount, limit)
+            level = self._level(conn, provider, kind, limit, now)
+            if level < amount:
+                wait = max(wait, (amount - level) * 60.0 / limit)
+            levels.append((kind, level - amount))
+        if wait:
+            return wait, None
+
+        for kind, level in levels:
+            self._set_level(conn, provider, kind, level, now)
+        conn.execute("DELETE FROM rate_waiters WHERE id = ?", (ticket,))
+        lease = conn.execute(
+            "INSERT INTO rate_leases (provider, expires_at) VALUES (?, ?)",
+            (provider, now + self.lease_timeout)
+        ).lastrowid
+        return 0.0, lease
+
+    def _blocked_for(self, conn, provider, now):
+        row = conn.execute("SELECT until FROM rate_blocks WHERE provider = ?", (provider,)).fetchone()
+        return max(row['until'] - now, 0.0) if row else 0.0
+
+    def _level(self, conn, provider, kind, limit, now):
+        """Füllstand eines Eimers, der pro Minute um limit nachläuft"""
+        row = conn.execute(
+            "SELECT level, updated_at FROM rate_buckets WHERE provider = ? AND kind = ?",
+            (provider, kind)
+        ).fetchone()
+        if row is None:
+            return float(limit)
+        return min(float(limit), row['level'] + max(now - row['updated_at'], 0.0) * limit / 60.0)
+
+    def _set_level(self, conn, provider, kind, level, now):
+        conn.execute(
+            "INSERT INTO rate_buckets (provider, kind, level, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(provider, kind) DO UPDATE SET level = excluded.level, updated_at = excluded.updated_at",
+            (provider, kind, level, now)
+        )
+
+    def _quota_delay(self, headers, now):
+        """Wartezeit bis zur Erneuerung eines erschöpften Kontingents, sonst None"""
+        delay = None
+        for remaining_header, reset_header in QUOTA_HEADERS:
+            if _number(headers.get(remaining_header)) == 0:
+                reset = parse_delay(headers.get(reset_header), now)
+                if reset is not None:
+                    delay = max(delay or 0.0, reset)
+        return delay
+
+    def _timeout_message(self, provider, max_wait):
+        return f"Rate-Limit für {provider}: keine freie Kapazität innerhalb von {max_wait:.0f}s"
+
+
+# Gemeinsamer Limiter aller Provider dieses Prozesses
+rate_limiter = RateLimiter()
@@ -0,0 +1,283 @@
+"""
+Aufnahme und Wiedergabe von Provider-Antworten
+
+RecordingProvider umhüllt einen beliebigen Provider (auch eine
+ProviderChain). Im Modus "record" werden erfolgreiche Antworten samt
+Textfragmenten beim Streaming und Antwortzeit in einer Kassette abgelegt,
+im Modus "replay" ohne Aufruf des Providers wieder ausgeliefert, im Modus
+"auto" nur fehlende Antworten beim Provider geholt. So lassen sich
+Extraktion und Tandoor-Import mit echten Antworten, aber ohne Kosten und
+Wartezeit wiederholen oder Lasttests offline fahren.
+
+Schlüssel einer Aufnahme ist der Fingerabdruck der Anfrage: SHA-256 über
+Provider, Modell, Prompt und die Inhalts-Hashes der Bilder in ihrer
+Reihenfolge. Die Kassette ist eine SQLite-Datei (gemeinsam für alle Worker),
+die Antworten liegen darin als zlib-komprimiertes JSON.
+
+Die Wiedergabe antwortet sofort (AI_REPLAY_LATENCY=0), mit der
+aufgenommenen Antwortzeit ("recorded") oder mit einer festen Anzahl
+Sekunden; Textfragmente werden dabei gleichmäßig über diese Zeit verteilt.
+"""
+
+import json
+import time
+import zlib
+import asyncio
+import hashlib
+import logging
+from decouple import config
+
+from analysis_cache import hash_file
+from sqlite_store import SQLiteStore
+from .base_provider import BaseAIProvider
+
+# Konfiguration aus Umgebungsvariablen
+AI_RECORD_MODE = config('AI_RECORD_MODE', default='').strip().lower()
+AI_CASSETTE = config('AI_CASSETTE', default='data/cassettes/default.sqlite3')
+# 0: sofort, "recorded": aufgenommene Antwortzeit, sonst Sekunden
+AI_REPLAY_LATENCY = config('AI_REPLAY_LATENCY', default='0')
+
+# Modi
+MODE_RECORD = 'record'
+MODE_REPLAY = 'replay'
+MODE_AUTO = 'auto'
+MODES = (MODE_RECORD, MODE_REPLAY, MODE_AUTO)
+
+# Wiedergabe mit der aufgenommenen Antwortzeit
+LATENCY_RECORDED = 'recorded'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS recordings (
+    fingerprint TEXT PRIMARY KEY,
+    provider TEXT NOT NULL,
+    model TEXT NOT NULL,
+    latency REAL NOT NULL,
+    payload BLOB NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+# Logger
+logger = logging.getLogger('ai_service')
+
+
+def fingerprint(provider, model, prompt, image_hashes):
+    """
+    Fingerabdruck einer Anfrage
+
+    Args:
+        provider: Name des Providers
+        model: Name des Modells (oder None)
+        prompt: Verwendeter Prompt
+        image_hashes: SHA-256 der Bilder in der Reihenfolge der Anfrage
+
+    Returns:
+        str: Hex-Digest über alle Bestandteile
+    """
+    material = json.dumps([provider, model or '', prompt, list(image_hashes)], ensure_ascii=False)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class Cassette:
+    """Aufgenommene Antworten in einer SQLite-Datei"""
+
+    def __init__(self, path=AI_CASSETTE):
+        """
+        Args:
+            path: Pfad zur Kassette
+        """
+        self.path = path
+        self.store = SQLiteStore(path, SCHEMA)
+
+    def get(self, key):
+        """
+        Liest eine Aufnahme
+
+        Returns:
+            dict: result, fragments (oder None) und latency; None, wenn es
+                keine Aufnahme gibt
+        """
+        row = self.store.connection().execute(
+            "SELECT latency, payload FROM recordings WHERE fingerprint = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        recording = json.loads(zlib.decompress(row['payload']))
+        recording['latency'] = row['latency']
+        return recording
+
+    def put(self, key, provider, model, result, fragments, latency):
+        """Legt eine Aufnahme ab (ersetzt eine vorhandene)"""
+        payload = zlib.compress(json.dumps(
+            {'result': result, 'fragments': fragments}, ensure_ascii=False, separators=(',', ':')
+        ).encode('utf-8'), 9)
+        with self.store.transaction(immediate=True) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO recordings (fingerprint, provider, model, latency, payload, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, provider, model or '', latency, payload, time.time())
+            )
+
+    def __len__(self):
+        return self.store.connection().execute("SELECT COUNT(*) FROM recordings").fetchone()[0]
+
+
+class RecordingProvider(BaseAIProvider):
+    """Provider, der die Antworten eines anderen aufnimmt oder wiedergibt"""
+
+    def __init__(self, provider, mode=AI_RECORD_MODE, cassette=None, replay_latency=AI_REPLAY_LATENCY):
+        """
+        Args:
+            provider: Umhüllter Provider
+            mode: record, replay oder auto
+            cassette: Cassette (Standard: AI_CASSETTE)
+            replay_latency: 0, "recorded" oder Sekunden je Wiedergabe
+
+        Raises:
+            ValueError: Wenn Modus oder Latenz ungültig sind
+        """
+        super().__init__()
+        if mode not in MODES:
+            raise ValueError(f"Aufnahmemodus '{mode}' nicht unterstützt")
+        if str(replay_latency).strip().lower() != LATENCY_RECORDED:
+            replay_latency = float(replay_latency or 0)
+        self.provider = provider
+        self.mode = mode
+        self.cassette = cassette if cassette is not None else Cassette()
+        self.replay_latency = replay_latency
+        # Bilder wie für den umhüllten Provider vorverarbeiten
+        self.image_spec = provider.image_spec
+
+    @property
+    def provider_name(self):
+        return self.provider.provider_name
+
+    @property
+    def model_name(self):
+        return self.provider.model_name
+
+    def analyze_image(self, image_path, prompt):
+        return self.analyze_images([image_path], prompt)
+
+    def analyze_images(self, image_paths, prompt):
+        key = self._fingerprint(image_paths, prompt)
+        recording = self._lookup(key)
+        if recording is not None:
+            time.sleep(self._latency(recording))
+            return self._replayed(recording)
+        if self.mode == MODE_REPLAY:
+            return self._missing()
+
+        started = time.monotonic()
+        result = self.provider.analyze_images(image_paths, prompt)
+        self._record(key, result, None, time.monotonic() - started)
+        return result
+
+    def stream_images(self, image_paths, prompt):
+        key = self._fingerprint(image_paths, prompt)
+        recording = self._lookup(key)
+        if recording is not None:
+            fragments = recording['fragments'] or []
+            delay = self._latency(recording) / (len(fragments) + 1)
+            for text in fragments:
+                time.sleep(delay)
+                yield text
+            time.sleep(delay)
+            return self._replayed(recording)
+        if self.mode == MODE_REPLAY:
+            return self._missing()
+
+        started = time.monotonic()
+        fragments = []
+        stream = self.provider.stream_images(image_paths, prompt)
+        try:
+            while True:
+                text = next(stream)
+                fragments.append(text)
+                yield text
+        except StopIteration as stop:
+            result = stop.value
+        self._record(key, result, fragments, time.monotonic() - started)
+        return result
+
+    async def analyze_images_async(self, image_paths, prompt):
+        key = await asyncio.to_thread(self._fingerprint, image_paths, prompt)
+        recording = await asyncio.to_thread(self._lookup, key)
+        if recording is not None:
+            await asyncio.sleep(self._latency(recording))
+            return self._replayed(recording)
+        if self.mode == MODE_REPLAY:
+            return self._missing()
+
+        started = time.monotonic()
+        result = await self.provider.analyze_images_async(image_paths, prompt)
+        await asyncio.to_thread(self._record, key, result, None, time.monotonic() - started)
+        return result
+
+    async def stream_images_async(self, image_paths, prompt):
+        key = await asyncio.to_thread(self._fingerprint, image_paths, prompt)
+        recording = await asyncio.to_thread(self._lookup, key)
+        if recording is not None:
+            fragments = recording['fragments'] or []
+            delay = self._latency(recording) / (len(fragments) + 1)
+            for text in fragments:
+                await asyncio.sleep(delay)
+                yield text
+            await asyncio.sleep(delay)
+            yield self._replayed(recording)
+            return
+        if self.mode == MODE_REPLAY:
+            yield self._missing()
+            return
+
+        started = time.monotonic()
+        fragments = []
+        result = None
+        async for item in self.provider.stream_images_async(image_paths, prompt):
+            if isinstance(item, str):
+                fragments.append(item)
+            else:
+                result = item
+            yield item
+        await asyncio.to_thread(self._record, key, result, fragments, time.monotonic() - started)
+
+    def close(self):
+        self.provider.close()
+
+    async def aclose(self):
+        await self.provider.aclose()
+
+    def _fingerprint(self, image_paths, prompt):
+        """Fingerabdruck der Anfrage; liest Bilder nur, wenn ihr Schlüssel kein Inhalts-Hash ist"""
+        return fingerprint(self.provider_name, self.model_name, prompt, [hash_file(path) for path in image_paths])
+
+    def _lookup(self, key):
+        """Aufnahme zum Fingerabdruck; im Modus record wird immer neu aufgenommen"""
+        if self.mode == MODE_RECORD:
+            return None
+        try:
+            return self.cassette.get(key)
+        except Exception as e:
+            logger.error(f"Fehler beim Lesen der Kassette: {str(e)}")
+            return None
+
+    def _record(self, key, result, fragments, latency):
+        """Nimmt eine erfolgreiche Antwort auf; Fehler werden nicht gespeichert"""
+        if not isinstance(result, dict) or 'error' in result:
+            return
+        try:
+            self.cassette.put(key, self.provider_name, self.model_name, result, fragments, latency)
+        except Exception as e:
+            logger.error(f"Fehler beim Schreiben der Kassette: {str(e)}")
+
+    def _latency(self, recording):
+        if self.replay_latency == LATENCY_RECORDED:
+            return recording['latency']
+        return self.replay_latency
+
+    def _replayed(self, recording):
+        return dict(recording['result'], replayed=True)
+
+    def _missing(self):
+        logger.warning(f"Keine Aufnahme für diese Anfrage in {self.cassette.path}")
+        return self._create_error_response(f"Keine Aufnahme für diese Anfrage in {self.cassette.path}")
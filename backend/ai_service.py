@@ -1,42 +1,273 @@
+import asyncio
 import logging
+import metrics
 from ai_providers.provider_factory import AIProviderFactory
+from ai_providers.prompt_config import get_multi_page_prompt
+from analysis_cache import AnalysisCache, hash_file, make_cache_key
 
 # Nur für den ai_service Logger INFO-Level aktivieren
 logger = logging.getLogger('ai_service')
 
+# Gemeinsamer Cache für Analyseergebnisse
+analysis_cache = AnalysisCache()
+
 class AIService:
     """Service zur Verarbeitung von Bildern mit verschiedenen KI-Modellen"""
-    
+
     @staticmethod
-    def analyze_image(image_path, prompt="Was ist auf diesem Bild zu sehen?"):
+    def analyze_image(image_path, prompt="Was ist auf diesem Bild zu sehen?", image_hash=None):
         """
         Analysiert ein Bild mit dem konfigurierten KI-Modell
-        
+
         Args:
             image_path: Pfad zur Bilddatei
             prompt: Anweisung/Frage an die KI
-            
+            image_hash: SHA-256 der Bilddaten, falls bereits bekannt
+
         Returns:
             dict: Ergebnis der Analyse mit Anbieter und Antwort
         """
         logger.info(f"Starte Bildanalyse für Bild: {image_path}")
+
+        return AIService._analyze(
+            [image_path],
+            prompt,
+            [image_hash],
+            lambda provider: provider.analyze_image(image_path, prompt)
+        )
+
+    @staticmethod
+    def analyze_images(image_paths, prompt="Was ist auf diesem Bild zu sehen?", image_hashes=None):
+        """
+        Analysiert mehrere Bilder (Seiten eines Rezepts) in einer Anfrage
+
+        Args:
+            image_paths: Liste von Pfaden zu Bilddateien, in Seitenreihenfolge
+            prompt: Anweisung/Frage an die KI
+            image_hashes: SHA-256 der Bilddaten je Seite, falls bereits bekannt
+
+        Returns:
+            dict: Ergebnis der Analyse mit Anbieter und Antwort
+        """
+        if len(image_paths) == 1:
+            return AIService.analyze_image(image_paths[0], prompt, (image_hashes or [None])[0])
+
+        logger.info(f"Starte Bildanalyse für {len(image_paths)} Seiten: {image_paths}")
+
+        prompt = get_multi_page_prompt(prompt, len(image_paths))
+        return AIService._analyze(
+            image_paths,
+            prompt,
+            image_hashes or [None] * len(image_paths),
+            lambda provider: provider.analyze_images(image_paths, prompt)
+        )
+
+    @staticmethod
+    def stream_images(image_paths, prompt="Was ist auf diesem Bild zu sehen?", image_hashes=None):
+        """
+        Analysiert ein oder mehrere Bilder und liefert die Antwort stückweise
+        
+        Args:
+            image_paths: Liste von Pfaden zu Bilddateien, in Seitenreihenfolge
+            prompt: Anweisung/Frage an die KI
+            image_hashes: SHA-256 der Bilddaten je Seite, falls bereits bekannt
+            
+        Yields:
+            dict: {"type": "token", "text": ...} je Textfragment und zum
+                Schluss {"type": "result", "result": ...} mit dem Ergebnis
+                wie bei analyze_images
+        """
+        logger.info(f"Starte Bildanalyse mit Streaming für Bild(er): {image_paths}")
+        
+        if len(image_paths) > 1:
+            prompt = get_multi_page_prompt(prompt, len(image_paths))
+        image_hashes = image_hashes or [None] * len(image_paths)
         
         try:
-            # Provider über Factory holen
             provider = AIProviderFactory.get_provider()
+        except ValueError as e:
+            logger.error(f"Fehler beim Erstellen des Providers: {str(e)}")
+            yield {"type": "result", "result": {"provider": "none", "error": str(e)}}
+            return
+        
+        # Ergebnis aus dem Cache vollständig auf einmal liefern
+        cache_key, cached = AIService._lookup(provider, image_paths, prompt, image_hashes)
+        if cached is not None:
+            yield {"type": "result", "result": cached}
+            return
+        
+        stream = provider.stream_images(image_paths, prompt)
+        try:
+            while True:
+                yield {"type": "token", "text": next(stream)}
+        except StopIteration as stop:
+            result = stop.value
+        except Exception as e:
+            logger.error(f"Fehler bei der Bildanalyse: {str(e)}")
+            result = {"provider": provider.provider_name, "error": str(e)}
+        
+        AIService._store(cache_key, result)
+        yield {"type": "result", "result": result}
+    
+    @staticmethod
+    async def analyze_images_async(image_paths, prompt="Was ist auf diesem Bild zu sehen?", image_hashes=None):
+        """
+        Wie analyze_images, wartet auf den Provider aber im Event-Loop
+        
+        Cache-Zugriffe (SQLite, ggf. Hashen der Dateien) laufen in einem
+        Thread, die Anfrage selbst über den asynchronen Client des Providers.
+        
+        Args:
+            image_paths: Liste von Pfaden zu Bilddateien, in Seitenreihenfolge
+            prompt: Anweisung/Frage an die KI
+            image_hashes: SHA-256 der Bilddaten je Seite, falls bereits bekannt
             
-            # Bild mit dem Provider analysieren
+        Returns:
+            dict: Ergebnis der Analyse mit Anbieter und Antwort
+        """
+        logger.info(f"Starte asynchrone Bildanalyse für Bild(er): {image_paths}")
+        
+        if len(image_paths) > 1:
+            prompt = get_multi_page_prompt(prompt, len(image_paths))
+        image_hashes = image_hashes or [None] * len(image_paths)
+        
+        try:
+            provider = AIProviderFactory.get_provider()
+        except ValueError as e:
+            logger.error(f"Fehler beim Erstellen des Providers: {str(e)}")
+            return {"provider": "none", "error": str(e)}
+        
+        cache_key, cached = await asyncio.to_thread(AIService._lookup, provider, image_paths, prompt, image_hashes)
+        if cached is not None:
+            return cached
+        
+        try:
+            result = await provider.analyze_images_async(image_paths, prompt)
+        except Exception as e:
+            logger.error(f"Fehler bei der Bildanalyse: {str(e)}")
+            result = {"provider": provider.provider_name, "error": str(e)}
+        
+        await asyncio.to_thread(AIService._store, cache_key, result)
+        return result
+    
+    @staticmethod
+    async def stream_images_async(image_paths, prompt="Was ist auf diesem Bild zu sehen?", image_hashes=None):
+        """
+        Wie stream_images als Async-Generator
+        
+        Yields:
+            dict: {"type": "token", "text": ...} je Textfragment und zum
+                Schluss {"type": "result", "result": ...}
+        """
+        logger.info(f"Starte asynchrone Bildanalyse mit Streaming für Bild(er): {image_paths}")
+        
+        if len(image_paths) > 1:
+            prompt = get_multi_page_prompt(prompt, len(image_paths))
+        image_hashes = image_hashes or [None] * len(image_paths)
+        
+        try:
+            provider = AIProviderFactory.get_provider()
+        except ValueError as e:
+            logger.error(f"Fehler beim Erstellen des Providers: {str(e)}")
+            yield {"type": "result", "result": {"provider": "none", "error": str(e)}}
+            return
+        
+        cache_key, cached = await asyncio.to_thread(AIService._lookup, provider, image_paths, prompt, image_hashes)
+        if cached is not None:
+            yield {"type": "result", "result": cached}
+            return
+        
+        result = None
+        try:
+            async for item in provider.stream_images_async(image_paths, prompt):
+                if isinstance(item, str):
+                    yield {"type": "token", "text": item}
+                else:
+                    result = item
+        except Exception as e:
+            logger.error(f"Fehler bei der Bildanalyse: {str(e)}")
+            result = {"provider": provider.provider_name, "error": str(e)}
+        
+        await asyncio.to_thread(AIService._store, cache_key, result)
+        yield {"type": "result", "result": result}
+    
+    @staticmethod
+    def _analyze(image_paths, prompt, image_hashes, call):
+        """Führt eine Analyse über den Provider aus, mit Cache davor"""
+        try:
+            # Provider über Factory holen
+            provider = AIProviderFactory.get_provider()
+
+            # Ergebnis aus dem Cache verwenden, falls dieselben Bilder bereits analysiert wurden
+            cache_key, cached = AIService._lookup(provider, image_paths, prompt, image_hashes)
+            if cached is not None:
+                return cached
+
+            # Bild(er) mit dem Provider analysieren
             try:
-                return provider.analyze_image(image_path, prompt)
+                result = call(provider)
             except Exception as e:
                 logger.error(f"Fehler bei der Bildanalyse: {str(e)}")
+                metrics.record_error('ai_provider')
                 return {
                     "provider": provider.provider_name,
                     "error": str(e)
                 }
+
+            AIService._store(cache_key, result)
+            return result
         except ValueError as e:
             logger.error(f"Fehler beim Erstellen des Providers: {str(e)}")
             return {
                 "provider": "none",
                 "error": str(e)
             }
+
+    @staticmethod
+    def _lookup(provider, image_paths, prompt, image_hashes):
+        """
+        Sucht ein bereits vorliegendes Ergebnis im Cache
+
+        Returns:
+            tuple: (Cache-Schlüssel oder None, Ergebnis mit cached=True oder None)
+        """
+        cache_key = AIService._cache_key(provider, image_paths, prompt, image_hashes)
+        if not cache_key:
+            return None, None
+        cached = analysis_cache.get(cache_key)
+        if cached is None:
+            return cache_key, None
+        logger.info(f"Analyseergebnis aus dem Cache für Bild(er): {image_paths}")
+        return cache_key, dict(cached, cached=True)
+
+    @staticmethod
+    def _store(cache_key, result):
+        """Speichert erfolgreiche Analysen im Cache und zählt fehlgeschlagene"""
+        if isinstance(result, dict) and 'error' not in result:
+            if cache_key:
+                analysis_cache.set(cache_key, result)
+        else:
+            metrics.record_error('ai_provider')
+
+    @staticmethod
+    def _cache_key(provider, image_paths, prompt, image_hashes):
+        """
+        Ermittelt den Cache-Schlüssel für eine Analyse
+
+        Returns:
+            str: Der Schlüssel oder None, wenn nicht gecacht werden soll
+        """
+        if not analysis_cache.enabled:
+            return None
+
+        hashes = []
+        for image_path, image_hash in zip(image_paths, image_hashes):
+            if image_hash is None:
+                try:
+                    image_hash = hash_file(image_path)
+                except OSError as e:
+                    logger.warning(f"Bild konnte für den Cache nicht gehasht werden: {str(e)}")
+                    return None
+            hashes.append(image_hash)
+
+        return make_cache_key('+'.join(hashes), prompt, provider.provider_name, provider.model_name)
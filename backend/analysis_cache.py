@@ -0,0 +1,252 @@
+"""
+Cache für Analyseergebnisse
+
+Dieses Modul speichert Ergebnisse von Bildanalysen inhaltsadressiert: Der
+Schlüssel setzt sich aus dem SHA-256 der Bilddaten, dem Prompt, dem Provider
+und dem Modell zusammen. Ein prozesslokaler LRU-Cache liegt vor einer
+gemeinsamen SQLite-Datenbank, die alle gunicorn-Worker sehen.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from decouple import config
+
+import metrics
+from sqlite_store import SQLiteStore
+from storage_backends.base_storage import key_hash
+from upload_storage import open_upload
+
+# Konfiguration aus Umgebungsvariablen
+ANALYSIS_CACHE_ENABLED = config('ANALYSIS_CACHE_ENABLED', default=True, cast=bool)
+ANALYSIS_CACHE_DB = config('ANALYSIS_CACHE_DB', default=os.path.join('data', 'analysis_cache.sqlite3'))
+ANALYSIS_CACHE_TTL = config('ANALYSIS_CACHE_TTL', default=7 * 24 * 3600, cast=int)
+ANALYSIS_CACHE_MEMORY_ENTRIES = config('ANALYSIS_CACHE_MEMORY_ENTRIES', default=256, cast=int)
+ANALYSIS_CACHE_MAX_BYTES = config('ANALYSIS_CACHE_MAX_BYTES', default=64 * 1024 * 1024, cast=int)
+
+# Blockgröße beim Hashen von Dateien
+HASH_CHUNK_SIZE = 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analysis_cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_analysis_cache_accessed_at ON analysis_cache (accessed_at);
+CREATE INDEX IF NOT EXISTS idx_analysis_cache_expires_at ON analysis_cache (expires_at);
+"""
+
+# Logger
+logger = logging.getLogger('analysis_cache')
+
+
+def hash_file(image_path):
+    """
+    Berechnet den SHA-256 einer Datei blockweise
+
+    Ist der Schlüssel des Uploads bereits sein Inhalts-Hash, wird er nicht
+    gelesen (z.B. kein Download aus S3).
+
+    Args:
+        image_path: Pfad oder Referenz des Uploads
+
+    Returns:
+        str: Hex-Digest der Dateiinhalte
+    """
+    digest = key_hash(image_path)
+    if digest is not None:
+        return digest
+
+    digest = hashlib.sha256()
+    with open_upload(image_path) as image_file:
+        for chunk in iter(lambda: image_file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_cache_key(image_hash, prompt, provider, model):
+    """
+    Erstellt den Cache-Schlüssel für eine Analyse
+
+    Args:
+        image_hash: SHA-256 der Bilddaten
+        prompt: Verwendeter Prompt
+        provider: Name des AI-Providers
+        model: Name des Modells (oder None)
+
+    Returns:
+        str: Hex-Digest über alle Bestandteile
+    """
+    material = json.dumps([image_hash, prompt, provider, model or ''], ensure_ascii=False)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class AnalysisCache:
+    """Zweistufiger Cache (LRU im Speicher und SQLite auf der Platte)"""
+
+    def __init__(self, db_path=ANALYSIS_CACHE_DB, ttl=ANALYSIS_CACHE_TTL,
+                 memory_entries=ANALYSIS_CACHE_MEMORY_ENTRIES, max_bytes=ANALYSIS_CACHE_MAX_BYTES,
+                 enabled=ANALYSIS_CACHE_ENABLED):
+        """
+        Args:
+            db_path: Pfad zur gemeinsamen Cache-Datenbank
+            ttl: Lebensdauer eines Eintrags in Sekunden
+            memory_entries: Maximale Anzahl Einträge im Speicher-LRU
+            max_bytes: Maximale Gesamtgröße der Einträge auf der Platte
+            enabled: Cache aktivieren oder deaktivieren
+        """
+        self.enabled = enabled
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        self.store = SQLiteStore(db_path, SCHEMA)
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+        }
+
+    def get(self, key):
+        """
+        Sucht ein Ergebnis zuerst im Speicher, dann auf der Platte
+
+        Returns:
+            dict: Das gespeicherte Ergebnis oder None
+        """
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, result = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._counters['memory_hits'] += 1
+                    metrics.ANALYSIS_CACHE_MEMORY_HIT.inc()
+                    return result
+                del self._memory[key]
+
+        try:
+            conn = self.store.connection()
+            row = conn.execute(
+                "SELECT value, expires_at FROM analysis_cache WHERE key = ? AND expires_at > ?",
+                (key, now)
+            ).fetchone()
+            if row is not None:
+                conn.execute("UPDATE analysis_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        except Exception as e:
+            logger.error(f"Fehler beim Lesen aus dem Analyse-Cache: {str(e)}")
+            row = None
+
+        with self._lock:
+            if row is None:
+                self._counters['misses'] += 1
+                metrics.ANALYSIS_CACHE_MISS.inc()
+                return None
+            self._counters['disk_hits'] += 1
+        metrics.ANALYSIS_CACHE_DISK_HIT.inc()
+
+        result = json.loads(row['value'])
+        self._remember(key, result, row['expires_at'])
+        return result
+
+    def set(self, key, result):
+        """Speichert ein Ergebnis im Speicher und auf der Platte"""
+        if not self.enabled:
+            return
+
+        now = time.time()
+        expires_at = now + self.ttl
+        self._remember(key, result, expires_at)
+
+        value = json.dumps(result, ensure_ascii=False).encode('utf-8')
+        try:
+            with self.store.transaction(immediate=True) as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO analysis_cache (key, value, size, created_at, expires_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, value, len(value), now, expires_at, now)
+                )
+                evicted = self._evict(conn, now)
+        except Exception as e:
+            logger.error(f"Fehler beim Schreiben in den Analyse-Cache: {str(e)}")
+            return
+
+        with self._lock:
+            self._counters['stores'] += 1
+            self._counters['evictions'] += evicted
+
+    def stats(self):
+        """
+        Gibt Trefferzähler und Füllstand zurück
+
+        Die Zähler gelten für den aktuellen Prozess, Anzahl und Größe der
+        Einträge auf der Platte für alle Prozesse.
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats['memory_entries'] = len(self._memory)
+
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_ratio'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        stats['enabled'] = self.enabled
+
+        if self.enabled:
+            row = self.store.connection().execute(
+                "SELECT COUNT(*) AS entries, COALESCE(SUM(size), 0) AS bytes FROM analysis_cache"
+            ).fetchone()
+            stats['disk_entries'] = row['entries']
+            stats['disk_bytes'] = row['bytes']
+        return stats
+
+    def clear(self):
+        """Leert beide Cache-Stufen"""
+        with self._lock:
+            self._memory.clear()
+        with self.store.transaction(immediate=True) as conn:
+            conn.execute("DELETE FROM analysis_cache")
+
+    def _remember(self, key, result, expires_at):
+        """Legt ein Ergebnis im Speicher-LRU ab und verdrängt alte Einträge"""
+        with self._lock:
+            self._memory[key] = (expires_at, result)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _evict(self, conn, now):
+        """
+        Entfernt abgelaufene Einträge und, falls nötig, die am längsten
+        nicht genutzten, bis die Größenbeschränkung eingehalten wird
+
+        Returns:
+            int: Anzahl entfernter Einträge
+        """
+        evicted = conn.execute("DELETE FROM analysis_cache WHERE expires_at <= ?", (now,)).rowcount
+
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM analysis_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return evicted
+
+        victims = []
+        for row in conn.execute("SELECT key, size FROM analysis_cache ORDER BY accessed_at").fetchall():
+            if total <= self.max_bytes:
+                break
+            victims.append((row['key'],))
+            total -= row['size']
+        conn.executemany("DELETE FROM analysis_cache WHERE key = ?", victims)
+        return evicted + len(victims)
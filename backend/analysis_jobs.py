@@ -0,0 +1,247 @@
+"""
+Asynchrone Analyse-Jobs
+
+Dieses Modul führt Bildanalysen in einem begrenzten Worker-Pool aus, damit
+Upload-Requests nicht für die Dauer des Provider-Aufrufs blockieren. Status
+und Fortschritt der Jobs liegen in einer SQLite-Datenbank, damit jeder
+gunicorn-Worker sie abfragen kann, unabhängig davon, wo der Job läuft.
+"""
+
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from decouple import config
+
+from sqlite_store import SQLiteStore
+
+# Konfiguration aus Umgebungsvariablen
+ANALYSIS_WORKERS = config('ANALYSIS_WORKERS', default=4, cast=int)
+ANALYSIS_QUEUE_SIZE = config('ANALYSIS_QUEUE_SIZE', default=16, cast=int)
+ANALYSIS_JOBS_DB = config('ANALYSIS_JOBS_DB', default=os.path.join('data', 'analysis_jobs.sqlite3'))
+ANALYSIS_JOB_RETENTION = config('ANALYSIS_JOB_RETENTION', default=3600, cast=int)
+
+# Job-Status
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_COMPLETED = 'completed'
+STATUS_FAILED = 'failed'
+FINAL_STATUSES = (STATUS_COMPLETED, STATUS_FAILED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    filename TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS job_events (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    stage TEXT NOT NULL,
+    message TEXT,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_updated_at ON jobs (updated_at);
+"""
+
+# Logger
+logger = logging.getLogger('analysis_jobs')
+
+
+class JobQueueFull(Exception):
+    """Wird ausgelöst, wenn keine weiteren Jobs angenommen werden können"""
+    pass
+
+
+class AnalysisJobManager:
+    """Verwaltet Analyse-Jobs und führt sie in einem Thread-Pool aus"""
+
+    def __init__(self, db_path=ANALYSIS_JOBS_DB, max_workers=ANALYSIS_WORKERS,
+                 queue_size=ANALYSIS_QUEUE_SIZE, retention=ANALYSIS_JOB_RETENTION):
+        """
+        Args:
+            db_path: Pfad zur gemeinsamen Job-Datenbank
+            max_workers: Anzahl gleichzeitig laufender Analysen pro Prozess
+            queue_size: Anzahl zusätzlich wartender Jobs pro Prozess
+            retention: Aufbewahrungsdauer abgeschlossener Jobs in Sekunden
+        """
+        self.store = SQLiteStore(db_path, SCHEMA)
+        self.max_workers = max_workers
+        self.queue_size = queue_size
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+        self._slots = threading.BoundedSemaphore(max_workers + queue_size)
+        self._last_cleanup = 0.0
+
+    def _get_executor(self):
+        """Erstellt den Thread-Pool pro Prozess (nach fork neu)"""
+        with self._lock:
+            pid = os.getpid()
+            if self._executor is None or self._executor_pid != pid:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix='analysis-job'
+                )
+                self._executor_pid = pid
+                self._slots = threading.BoundedSemaphore(self.max_workers + self.queue_size)
+            return self._executor
+
+    def submit(self, task, filename=None):
+        """
+        Reiht einen Analyse-Job ein
+
+        Args:
+            task: Funktion, die mit einem report(stage, message=None)-Callback
+                aufgerufen wird und das Analyseergebnis (dict) zurückgibt
+            filename: Name der hochgeladenen Datei (nur zur Information)
+
+        Returns:
+            str: Die ID des neuen Jobs
+
+        Raises:
+            JobQueueFull: Wenn Worker-Pool und Warteschlange ausgelastet sind
+        """
+        executor = self._get_executor()
+        if not self._slots.acquire(blocking=False):
+            logger.warning("Analyse-Warteschlange voll, Job abgelehnt")
+            raise JobQueueFull("Analyse-Warteschlange ist voll")
+
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        try:
+            with self.store.transaction() as conn:
+                conn.execute(
+                    "INSERT INTO jobs (id, status, filename, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    (job_id, STATUS_QUEUED, filename, now, now)
+                )
+                self._add_event(conn, job_id, STATUS_QUEUED)
+            executor.submit(self._run, job_id, task)
+        except Exception:
+            self._slots.release()
+            raise
+
+        logger.info(f"Analyse-Job {job_id} eingereiht")
+        self._cleanup()
+        return job_id
+
+    def report(self, job_id, stage, message=None):
+        """Speichert ein Fortschrittsereignis für einen Job"""
+        with self.store.transaction(immediate=True) as conn:
+            self._add_event(conn, job_id, stage, message)
+            conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (time.time(), job_id))
+
+    def get(self, job_id):
+        """
+        Gibt den Status eines Jobs zurück
+
+        Returns:
+            dict: Job-Daten oder None, wenn der Job unbekannt ist
+        """
+        row = self.store.connection().execute(
+            "SELECT id, status, filename, result, error, created_at, updated_at FROM jobs WHERE id = ?",
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        job = {
+            'job_id': row['id'],
+            'status': row['status'],
+            'filename': row['filename'],
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at'],
+        }
+        if row['result'] is not None:
+            job['ai_analysis'] = json.loads(row['result'])
+        if row['error'] is not None:
+            job['error'] = row['error']
+        return job
+
+    def events(self, job_id, after=0):
+        """
+        Gibt die Fortschrittsereignisse eines Jobs zurück
+
+        Args:
+            job_id: ID des Jobs
+            after: Nur Ereignisse mit höherer Sequenznummer liefern
+
+        Returns:
+            list: Ereignisse als dicts mit seq, stage, message und time
+        """
+        rows = self.store.connection().execute(
+            "SELECT seq, stage, message, created_at FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+            (job_id, after)
+        ).fetchall()
+        return [
+            {'seq': row['seq'], 'stage': row['stage'], 'message': row['message'], 'time': row['created_at']}
+            for row in rows
+        ]
+
+    def _run(self, job_id, task):
+        """Führt einen Job im Worker-Thread aus"""
+        try:
+            self._set_status(job_id, STATUS_RUNNING)
+            try:
+                result = task(lambda stage, message=None: self.report(job_id, stage, message))
+            except Exception as e:
+                logger.error(f"Analyse-Job {job_id} fehlgeschlagen: {str(e)}")
+                logger.error(f"Traceback: {traceback.format_exc()}")
+                self._set_status(job_id, STATUS_FAILED, error=str(e))
+                return
+
+            if isinstance(result, dict) and result.get('error'):
+                self._set_status(job_id, STATUS_FAILED, result=result, error=result['error'])
+            else:
+                self._set_status(job_id, STATUS_COMPLETED, result=result)
+            logger.info(f"Analyse-Job {job_id} abgeschlossen")
+        finally:
+            self._slots.release()
+
+    def _set_status(self, job_id, status, result=None, error=None):
+        """Aktualisiert Status, Ergebnis und Ereignisliste in einer Transaktion"""
+        with self.store.transaction(immediate=True) as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+                (
+                    status,
+                    json.dumps(result, ensure_ascii=False) if result is not None else None,
+                    error,
+                    time.time(),
+                    job_id
+                )
+            )
+            self._add_event(conn, job_id, status, error)
+
+    def _add_event(self, conn, job_id, stage, message=None):
+        """Fügt ein Ereignis mit fortlaufender Sequenznummer hinzu"""
+        conn.execute(
+            "INSERT INTO job_events (job_id, seq, stage, message, created_at) "
+            "SELECT ?, COALESCE(MAX(seq), 0) + 1, ?, ?, ? FROM job_events WHERE job_id = ?",
+            (job_id, stage, message, time.time(), job_id)
+        )
+
+    def _cleanup(self):
+        """Entfernt abgelaufene Jobs (höchstens einmal pro Minute)"""
+        now = time.time()
+        if now - self._last_cleanup < 60:
+            return
+        self._last_cleanup = now
+
+        cutoff = now - self.retention
+        with self.store.transaction(immediate=True) as conn:
+            conn.execute(
+                "DELETE FROM job_events WHERE job_id IN (SELECT id FROM jobs WHERE updated_at < ?)",
+                (cutoff,)
+            )
+            conn.execute("DELETE FROM jobs WHERE updated_at < ?", (cutoff,))
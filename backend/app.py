@@ -1,14 +1,24 @@
 import os
-import uuid
+import hmac
 import json
-import re
+import time
 import logging
-from flask import Flask, jsonify, request
+from decouple import config
+from flask import Flask, Response, g, jsonify, request, send_file
 from flask_cors import CORS
-from werkzeug.utils import secure_filename
-from ai_service import AIService
+from ai_service import AIService, analysis_cache
 from ai_providers.prompt_config import get_prompt
-from tandoor_api import import_recipe, get_auth_token
+from tandoor_tokens import TandoorTokenCache
+from bulk_import import import_recipes, summarize, MAX_BULK_RECIPES, TANDOOR_IMPORT_CONCURRENCY
+from json_ld_extractor import extract_json_ld as extract_json_ld_blocks
+from analysis_jobs import AnalysisJobManager, JobQueueFull, FINAL_STATUSES
+from sse import format_sse, AnalysisStream, SSE_HEADERS
+from upload_ingest import IngestRequest, UploadRejected, store_upload, verify_upload, MAX_UPLOAD_BYTES, MAX_UPLOAD_PIXELS
+from upload_storage import UploadJanitor
+from storage_backends.storage_factory import StorageFactory, UPLOAD_STORAGE, STORAGE_LOCAL
+from werkzeug.exceptions import RequestEntityTooLarge
+import metrics
+from profiling import Profiler, ADMIN_TOKEN, DEFAULT_DURATION, MAX_DURATION
 
 
 # Logger konfigurieren
@@ -18,6 +28,8 @@ logging.basicConfig(
 )
 
 app = Flask(__name__, static_folder='../dist/frontend', static_url_path='/')
+# Uploads werden beim Parsen geprüft und direkt auf die Platte gestreamt
+app.request_class = IngestRequest
 app.testing = False
 # CORS für alle Routen aktivieren mit zusätzlichen Optionen
 CORS(app, resources={r"/api/*": {"origins": "*"}}, supports_credentials=True)
@@ -25,19 +37,208 @@ CORS(app, resources={r"/api/*": {"origins": "*"}}, supports_credentials=True)
 # Konfiguration für Datei-Uploads
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+MAX_RECIPE_PAGES = config('MAX_RECIPE_PAGES', default=5, cast=int)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.config['MAX_UPLOAD_BYTES'] = MAX_UPLOAD_BYTES
+app.config['MAX_UPLOAD_PIXELS'] = MAX_UPLOAD_PIXELS
+# local: Upload-Ordner, memory: nur im Arbeitsspeicher, s3: S3-kompatibler Bucket
+# (siehe storage_backends)
+app.config['UPLOAD_STORAGE'] = UPLOAD_STORAGE
+# Obergrenze für den gesamten Request-Body (alle Seiten plus Multipart-Overhead)
+app.config['MAX_CONTENT_LENGTH'] = config(
+    'MAX_CONTENT_LENGTH',
+    default=MAX_UPLOAD_BYTES * MAX_RECIPE_PAGES + 1024 * 1024,
+    cast=int
+)
 
 # Stellen Sie sicher, dass der Upload-Ordner existiert
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+if UPLOAD_STORAGE == STORAGE_LOCAL:
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+
+# Ablage beim Start prüfen (z.B. fehlendes S3_BUCKET), nicht erst beim ersten Upload
+StorageFactory.get_storage(UPLOAD_STORAGE, UPLOAD_FOLDER)
+
+# Entfernt alte Uploads und hält die Quote ein (Hintergrund-Thread je Worker)
+upload_janitor = UploadJanitor(UPLOAD_FOLDER)
+
+# Konfiguration für asynchrone Analyse-Jobs
+JOB_POLL_INTERVAL = config('JOB_POLL_INTERVAL', default=0.5, cast=float)
+# Längste Dauer eines Event-Streams im Thread-Betrieb, danach verbindet sich der Client neu
+JOB_LONG_POLL = config('JOB_LONG_POLL', default=20, cast=float)
+# Längste Dauer eines Event-Streams im asynchronen Betrieb
+JOB_STREAM_TIMEOUT = config('JOB_STREAM_TIMEOUT', default=300, cast=int)
+# Wartezeit des Clients vor dem Neuverbinden (SSE retry) in Millisekunden
+JOB_RETRY_MS = 1000
+analysis_jobs = AnalysisJobManager()
+
+# Serverseitige Tandoor-Sessions (Token-Cache)
+tandoor_tokens = TandoorTokenCache()
+
+# Stichprobenartiges Profiling, über /api/admin/profiling schaltbar
+profiler = Profiler()
 
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def is_admin():
+    """Prüft das Admin-Token (Header X-Admin-Token); ohne ADMIN_TOKEN ist niemand Admin"""
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8'))
+
+def is_truthy(value):
+    """Wertet Query- oder Formularparameter wie '1', 'true' oder 'yes' aus"""
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+
+def analyze_with_progress(filepaths, prompt, image_hashes=None):
+    """Erstellt die Job-Funktion für eine asynchrone Analyse von einem oder mehreren Bildern"""
+    def task(report):
+        report('analyzing')
+        return AIService.analyze_images(filepaths, prompt, image_hashes=image_hashes)
+    return task
+
+def queue_analysis_job(response_data, filepaths, image_hashes, filename):
+    """
+    Reiht eine Analyse als Job ein (auch vom ASGI-Server genutzt)
+    
+    Returns:
+        tuple: (Antwortdaten, Statuscode, Header)
+    """
+    try:
+        job_id = analysis_jobs.submit(
+            analyze_with_progress(filepaths, get_prompt('recipe'), image_hashes),
+            filename=filename
+        )
+    except JobQueueFull as e:
+        return {'error': str(e)}, 503, {'Retry-After': '5'}
+    
+    response_data['job_id'] = job_id
+    response_data['status_url'] = f'/api/analysis-jobs/{job_id}'
+    response_data['events_url'] = f'/api/analysis-jobs/{job_id}/events'
+    return response_data, 202, {}
+
+def submit_analysis_job(response_data, filepaths, image_hashes, filename):
+    """Reiht eine Analyse als Job ein und erstellt die 202-Antwort"""
+    body, status, headers = queue_analysis_job(response_data, filepaths, image_hashes, filename)
+    return jsonify(body), status, headers
+
+def store_pages(files):
+    """
+    Prüft alle hochgeladenen Seiten und übernimmt sie in die Ablage
+    
+    Erst werden alle Seiten geprüft, damit bei einer ungültigen Seite nichts
+    übernommen wird.
+    
+    Returns:
+        list: Metadaten je Seite (filename: Schlüssel, path: Referenz in der
+            Ablage, sha256, size, media_type)
+    """
+    uploads = [verify_upload(file) for file in files]
+    
+    pages = []
+    for upload in uploads:
+        upload.commit()
+        pages.append({
+            'filename': upload.key,
+            'path': upload.ref,
+            'sha256': upload.sha256,
+            'size': upload.size,
+            'media_type': upload.media_type
+        })
+    return pages
+
+@app.before_request
+def start_request():
+    """Beginnt die Zeitmessung und wählt die Anfrage ggf. fürs Profiling aus"""
+    g.request_started = time.perf_counter()
+    metrics.start_request_timing()
+    upload_janitor.ensure_running()
+    g.sampler = None
+    if request.path.startswith('/api/') and not request.path.startswith('/api/admin/'):
+        g.sampler = profiler.maybe_start()
+
+@app.after_request
+def finish_request(response):
+    """
+    Ergänzt den Server-Timing-Header und zählt Bytes und Fehler für /api/metrics
+    
+    Bei gestreamten Antworten enthält der Header nur die Schritte bis zum
+    Beginn des Streams; ein Profil umfasst dagegen die gesamte Antwort.
+    """
+    if request.path.startswith('/api/'):
+        started = g.get('request_started')
+        header = metrics.server_timing(time.perf_counter() - started if started else None)
+        if header:
+            response.headers['Server-Timing'] = header
+    
+    sampler = g.pop('sampler', None)
+    if sampler is not None:
+        method, path = request.method, request.path
+        response.call_on_close(lambda: profiler.save(sampler, method, path))
+    return metrics.record_response(request, response)
+
+@app.teardown_request
+def stop_unfinished_sampler(exc):
+    """Beendet den Sampler einer Anfrage, die ohne Antwort abgebrochen ist"""
+    sampler = g.pop('sampler', None)
+    if sampler is not None:
+        sampler.stop()
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify(status='ok')
 
+@app.route('/api/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Gibt die Metriken aller Worker im Textformat von Prometheus zurück"""
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """Gibt Trefferzähler und Füllstand des Analyse-Caches zurück"""
+    try:
+        return jsonify(analysis_cache.stats())
+    except Exception as e:
+        app.logger.error(f"Fehler beim Lesen der Cache-Statistik: {str(e)}")
+        return jsonify({'error': f'Serverfehler: {str(e)}'}), 500
+
+@app.route('/api/admin/profiling', methods=['GET', 'POST'])
+def admin_profiling():
+    """
+    Zeigt oder ändert die Profiling-Einstellung (nur mit X-Admin-Token)
+    
+    POST erwartet sample_rate (Anteil der Anfragen von 0 bis 1, 0 beendet)
+    und optional duration in Sekunden. Die Antwort enthält die Einstellung
+    und die Namen der gespeicherten Profile.
+    """
+    if not is_admin():
+        return jsonify({'error': 'Nicht berechtigt'}), 403
+    
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        sample_rate = data.get('sample_rate')
+        duration = data.get('duration', DEFAULT_DURATION)
+        if isinstance(sample_rate, bool) or not isinstance(sample_rate, (int, float)) or not 0 <= sample_rate <= 1:
+            return jsonify({'error': 'sample_rate muss zwischen 0 und 1 liegen'}), 400
+        if isinstance(duration, bool) or not isinstance(duration, (int, float)) or not 0 < duration <= MAX_DURATION:
+            return jsonify({'error': f'duration muss zwischen 0 und {MAX_DURATION} Sekunden liegen'}), 400
+        settings = profiler.configure(float(sample_rate), duration)
+    else:
+        settings = profiler.settings()
+    
+    return jsonify(dict(settings, profiles=profiler.profiles()))
+
+@app.route('/api/admin/profiling/<name>', methods=['GET'])
+def admin_profile(name):
+    """Liefert ein gespeichertes Profil im Format folded stacks (nur mit X-Admin-Token)"""
+    if not is_admin():
+        return jsonify({'error': 'Nicht berechtigt'}), 403
+    path = profiler.path_of(name)
+    if path is None:
+        return jsonify({'error': 'Profil nicht gefunden'}), 404
+    return send_file(os.path.abspath(path), mimetype='text/plain', as_attachment=True, download_name=name)
+
 @app.route('/api/upload-image', methods=['POST'])
 def upload_image():
     try:
@@ -50,32 +251,186 @@ def upload_image():
             return jsonify({'error': 'Keine Datei ausgewählt'}), 400
         
         if file and allowed_file(file.filename):
-            # Eindeutigen Dateinamen generieren
-            filename = secure_filename(f"{uuid.uuid4()}_{file.filename}")
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-            
-            # Absoluten Pfad für die Antwort erstellen
-            abs_filepath = os.path.abspath(filepath)
-    
+            # Unter dem Inhalts-Hash ablegen (gleiche Bilder nur einmal)
+            upload = store_upload(file)
             
             response_data = {
                 'success': True,
                 'message': 'Bild erfolgreich hochgeladen',
-                'filename': filename,
-                'path': abs_filepath
+                'filename': upload.key,
+                'path': upload.ref,
+                'sha256': upload.sha256,
+                'size': upload.size,
+                'media_type': upload.media_type
             }
             
+            # Job-Modus: Analyse im Worker-Pool ausführen und sofort antworten
+            if is_truthy(request.values.get('async', '')):
+                return submit_analysis_job(response_data, [upload.ref], [upload.sha256], upload.key)
+            
             # Führe immer eine KI-Analyse durch mit dem konfigurierten Prompt
-            ai_result = AIService.analyze_image(filepath, get_prompt('recipe'))
+            ai_result = AIService.analyze_image(upload.ref, get_prompt('recipe'), image_hash=upload.sha256)
             response_data['ai_analysis'] = ai_result
             
             return jsonify(response_data)
         
         return jsonify({'error': 'Dateityp nicht erlaubt'}), 400
+    except UploadRejected as e:
+        return jsonify({'error': str(e)}), e.status_code
+    except RequestEntityTooLarge:
+        return jsonify({'error': 'Upload ist zu groß'}), 413
+    except Exception as e:
+        app.logger.error(f"Fehler beim Hochladen: {str(e)}")
+        return jsonify({'error': f'Serverfehler: {str(e)}'}), 500
+
+@app.route('/api/upload-recipe-pages', methods=['POST'])
+def upload_recipe_pages():
+    """Lädt mehrere Seiten eines Rezepts hoch und analysiert sie in einer Anfrage"""
+    try:
+        files = [file for file in request.files.getlist('images') if file.filename]
+        
+        if not files:
+            return jsonify({'error': 'Keine Bilddateien gefunden'}), 400
+        
+        if len(files) > MAX_RECIPE_PAGES:
+            return jsonify({'error': f'Höchstens {MAX_RECIPE_PAGES} Seiten pro Rezept erlaubt'}), 400
+        
+        if not all(allowed_file(file.filename) for file in files):
+            return jsonify({'error': 'Dateityp nicht erlaubt'}), 400
+        
+        pages = store_pages(files)
+        
+        filepaths = [page['path'] for page in pages]
+        image_hashes = [page['sha256'] for page in pages]
+        
+        response_data = {
+            'success': True,
+            'message': f'{len(pages)} Seite(n) erfolgreich hochgeladen',
+            'files': pages
+        }
+        
+        # Job-Modus: Analyse im Worker-Pool ausführen und sofort antworten
+        if is_truthy(request.values.get('async', '')):
+            return submit_analysis_job(response_data, filepaths, image_hashes, pages[0]['filename'])
+        
+        # Alle Seiten gemeinsam in einer Anfrage analysieren
+        response_data['ai_analysis'] = AIService.analyze_images(filepaths, get_prompt('recipe'), image_hashes=image_hashes)
+        
+        return jsonify(response_data)
+    except UploadRejected as e:
+        return jsonify({'error': str(e)}), e.status_code
+    except RequestEntityTooLarge:
+        return jsonify({'error': 'Upload ist zu groß'}), 413
+    except Exception as e:
+        app.logger.error(f"Fehler beim Hochladen der Rezeptseiten: {str(e)}")
+        return jsonify({'error': f'Serverfehler: {str(e)}'}), 500
+
+@app.route('/api/analyze-stream', methods=['POST'])
+def analyze_stream():
+    """
+    Lädt ein Bild (Feld image) oder mehrere Seiten (Feld images) hoch und
+    streamt die Antwort der KI als Server-Sent Events
+    
+    Ereignisse: upload (Metadaten der Dateien), token (Textfragment), recipe
+    (Rezepte eines gerade geschlossenen JSON-Blocks) und zum Schluss result
+    (Ergebnis wie ai_analysis bei /api/upload-image mit recipes und truncated).
+    """
+    try:
+        files = [file for file in request.files.getlist('images') + request.files.getlist('image') if file.filename]
+        
+        if not files:
+            return jsonify({'error': 'Keine Bilddatei gefunden'}), 400
+        
+        if len(files) > MAX_RECIPE_PAGES:
+            return jsonify({'error': f'Höchstens {MAX_RECIPE_PAGES} Seiten pro Rezept erlaubt'}), 400
+        
+        if not all(allowed_file(file.filename) for file in files):
+            return jsonify({'error': 'Dateityp nicht erlaubt'}), 400
+        
+        pages = store_pages(files)
+    except UploadRejected as e:
+        return jsonify({'error': str(e)}), e.status_code
+    except RequestEntityTooLarge:
+        return jsonify({'error': 'Upload ist zu groß'}), 413
     except Exception as e:
         app.logger.error(f"Fehler beim Hochladen: {str(e)}")
         return jsonify({'error': f'Serverfehler: {str(e)}'}), 500
+    
+    filepaths = [page['path'] for page in pages]
+    image_hashes = [page['sha256'] for page in pages]
+    
+    def generate():
+        yield format_sse({'success': True, 'files': pages}, event='upload')
+        stream = AnalysisStream()
+        for event in AIService.stream_images(filepaths, get_prompt('recipe'), image_hashes=image_hashes):
+            yield from stream.format(event)
+    
+    return Response(generate(), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+@app.route('/api/analysis-jobs/<job_id>', methods=['GET'])
+def get_analysis_job(job_id):
+    """Gibt den Status eines Analyse-Jobs zurück"""
+    job = analysis_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job nicht gefunden'}), 404
+    return jsonify(job)
+
+def last_event_id(headers):
+    """Letzte vom Client gesehene Ereignis-ID (Wiederaufnahme über Last-Event-ID)"""
+    try:
+        return int(headers.get('Last-Event-ID', 0))
+    except ValueError:
+        return 0
+
+def poll_job_events(job_id, seq):
+    """
+    Liest neue Ereignisse eines Analyse-Jobs
+
+    Args:
+        job_id: ID des Jobs
+        seq: Letzte bereits gesendete Ereignis-ID
+
+    Returns:
+        tuple: Formatierte SSE-Nachrichten, neue letzte ID und ob der Job
+            abgeschlossen ist (dann ist result die letzte Nachricht)
+    """
+    # Status vor den Ereignissen lesen, damit kein Ereignis verloren geht
+    job = analysis_jobs.get(job_id)
+    messages = []
+    for event in analysis_jobs.events(job_id, after=seq):
+        seq = event['seq']
+        messages.append(format_sse(event, event='progress', event_id=seq))
+    
+    finished = job is None or job['status'] in FINAL_STATUSES
+    if finished:
+        messages.append(format_sse(job or {'error': 'Job nicht gefunden'}, event='result'))
+    return messages, seq, finished
+
+@app.route('/api/analysis-jobs/<job_id>/events', methods=['GET'])
+def stream_analysis_job(job_id):
+    """
+    Streamt den Fortschritt eines Analyse-Jobs als Server-Sent Events
+    
+    Der Stream belegt einen Thread des Workers und endet daher nach
+    JOB_LONG_POLL Sekunden; der Client verbindet sich mit Last-Event-ID
+    neu. Im asynchronen Betrieb liefert asgi.py den Stream ohne Thread.
+    """
+    if analysis_jobs.get(job_id) is None:
+        return jsonify({'error': 'Job nicht gefunden'}), 404
+    
+    seq = last_event_id(request.headers)
+    
+    def generate(seq):
+        deadline = time.monotonic() + JOB_LONG_POLL
+        yield f"retry: {JOB_RETRY_MS}\n\n"
+        while True:
+            messages, seq, finished = poll_job_events(job_id, seq)
+            yield from messages
+            if finished or time.monotonic() > deadline:
+                return
+            time.sleep(JOB_POLL_INTERVAL)
+    
+    return Response(generate(seq), mimetype='text/event-stream', headers=SSE_HEADERS)
 
 @app.route('/api/tandoor-auth', methods=['POST'])
 def tandoor_auth():
@@ -89,13 +444,22 @@ def tandoor_auth():
         username = data['username']
         password = data['password']
         
-        # Token von Tandoor API holen
-        token = get_auth_token(username, password)
+        # Token aus dem Cache oder von der Tandoor API holen
+        session = tandoor_tokens.login(username, password)
         
-        if token:
+        if session:
+            session_id, token = session
+            
+            # Indizes der Objekte und Rezepte vorab laden
+            client = tandoor_tokens.client
+            for index in (getattr(client, 'index', None), getattr(client, 'recipe_index', None)):
+                if index is not None:
+                    index.prefetch(client, token)
+            
             return jsonify({
                 'success': True,
-                'token': token
+                'token': token,
+                'session_id': session_id
             })
         else:
             # In den Tests wird ein Mock verwendet, der None zurückgibt
@@ -134,24 +498,23 @@ def extract_json_ld():
         
         ai_response = data['ai_response']
         
-        # Suche nach JSON-LD in der KI-Antwort
-        json_ld_match = re.search(r'```json\s*([\s\S]*?)\s*```', ai_response)
-        if not json_ld_match:
+        # Alle JSON-Blöcke in der KI-Antwort suchen und parsen
+        with metrics.timed(metrics.JSON_LD_EXTRACTION, 'json_ld_extraction'):
+            extractor = extract_json_ld_blocks(ai_response)
+        if not extractor.blocks:
+            metrics.record_error('json_ld')
+            if extractor.errors:
+                return jsonify({'error': extractor.errors[0]}), 400
             return jsonify({'error': 'Kein JSON-LD in der KI-Antwort gefunden'}), 404
         
-        json_ld_str = json_ld_match.group(1).strip()
-        
-        try:
-            # Versuche, den JSON-String zu parsen
-            json_ld = json.loads(json_ld_str)
-            
-            return jsonify({
-                'success': True,
-                'json_ld': json_ld
-            })
-            
-        except json.JSONDecodeError as e:
-            return jsonify({'error': f'Ungültiges JSON: {str(e)}'}), 400
+        # Bevorzugt das erste Rezept, sonst wie bisher den ersten Block
+        recipes = extractor.recipes
+        return jsonify({
+            'success': True,
+            'json_ld': recipes[0] if recipes else extractor.blocks[0].data,
+            'recipes': recipes,
+            'truncated': any(block.truncated for block in extractor.blocks)
+        })
         
     except Exception as e:
         app.logger.error(f"Fehler beim Extrahieren von JSON-LD: {str(e)}")
@@ -163,11 +526,13 @@ def import_to_tandoor():
     try:
         data = request.json
         
-        if not data or 'recipe_json_ld' not in data or 'auth_token' not in data:
+        if not data or 'recipe_json_ld' not in data or not ('auth_token' in data or 'session_id' in data):
             return jsonify({'error': 'Rezeptdaten und Auth-Token erforderlich'}), 400
         
         recipe_json_ld = data['recipe_json_ld']
-        auth_token = data['auth_token']
+        auth_token = data.get('auth_token')
+        session_id = data.get('session_id')
+        allow_duplicate = bool(data.get('allow_duplicate', False))
         
         # Rezept in Tandoor importieren
         # Ensure recipe_json_ld is a dictionary
@@ -176,8 +541,10 @@ def import_to_tandoor():
             app.logger.error(f"recipe_json_ld was a string: {recipe_json_ld}")
         elif not isinstance(recipe_json_ld, dict):
             return jsonify({'error': 'Ungültige Rezeptdaten'}), 400
-        if not isinstance(auth_token, str):
+        if auth_token is not None and not isinstance(auth_token, str):
             return jsonify({'error': 'Ungültiges Auth-Token'}), 400
+        if session_id is not None and not isinstance(session_id, str):
+            return jsonify({'error': 'Ungültige Session-ID'}), 400
             
         # Für Tests: Wenn wir im Testmodus sind
         if app.testing:
@@ -187,15 +554,76 @@ def import_to_tandoor():
                 'recipe_url': 'https://example.com/recipe/123'
             })
             
-        # Importiere das Rezept in Tandoor
-        result = import_recipe(recipe_json_ld, auth_token)
+        # Importiere das Rezept in Tandoor (Token bei 401 einmal erneuern)
+        result = tandoor_tokens.import_recipe(
+            recipe_json_ld, session_id=session_id, auth_token=auth_token, allow_duplicate=allow_duplicate
+        )
         
+        if result.get('reauth_required'):
+            return jsonify(result), 401
+        if result.get('duplicate'):
+            return jsonify(result), 409
         return jsonify(result)
         
     except Exception as e:
         app.logger.error(f"Fehler beim Import in Tandoor: {str(e)}")
         return jsonify({'error': f'Serverfehler: {str(e)}'}), 500
 
+@app.route('/api/import-to-tandoor/bulk', methods=['POST'])
+def import_to_tandoor_bulk():
+    """
+    Importiert mehrere Rezepte in Tandoor
+    
+    Erwartet recipes (Liste von JSON-LD-Rezepten) sowie session_id und/oder
+    auth_token, optional concurrency und allow_duplicate. Fehlgeschlagene Rezepte brechen den
+    Import nicht ab. Mit ?stream=1 oder Accept: application/x-ndjson wird
+    jedes Ergebnis als eigene JSON-Zeile gesendet, sobald es vorliegt.
+    """
+    data = request.get_json(silent=True)
+    
+    if not data or not ('auth_token' in data or 'session_id' in data):
+        return jsonify({'error': 'Rezeptdaten und Auth-Token erforderlich'}), 400
+    
+    recipes = data.get('recipes')
+    auth_token = data.get('auth_token')
+    session_id = data.get('session_id')
+    concurrency = data.get('concurrency', TANDOOR_IMPORT_CONCURRENCY)
+    allow_duplicate = bool(data.get('allow_duplicate', False))
+    
+    if not isinstance(recipes, list) or not recipes:
+        return jsonify({'error': 'Rezeptdaten und Auth-Token erforderlich'}), 400
+    if len(recipes) > MAX_BULK_RECIPES:
+        return jsonify({'error': f'Höchstens {MAX_BULK_RECIPES} Rezepte pro Anfrage erlaubt'}), 400
+    if auth_token is not None and not isinstance(auth_token, str):
+        return jsonify({'error': 'Ungültiges Auth-Token'}), 400
+    if session_id is not None and not isinstance(session_id, str):
+        return jsonify({'error': 'Ungültige Session-ID'}), 400
+    if not isinstance(concurrency, int) or isinstance(concurrency, bool) or concurrency < 1:
+        return jsonify({'error': 'Ungültige Parallelität'}), 400
+    
+    # Die konfigurierte Parallelität ist die Obergrenze für Tandoor
+    concurrency = min(concurrency, TANDOOR_IMPORT_CONCURRENCY)
+    
+    def import_one(recipe):
+        return tandoor_tokens.import_recipe(
+            recipe, session_id=session_id, auth_token=auth_token, allow_duplicate=allow_duplicate
+        )
+    
+    results = import_recipes(recipes, import_one, concurrency=concurrency)
+    
+    if is_truthy(request.args.get('stream')) or request.accept_mimetypes.best == 'application/x-ndjson':
+        def generate():
+            collected = []
+            for result in results:
+                collected.append(result)
+                yield json.dumps(dict(result, type='result'), ensure_ascii=False) + '\n'
+            yield json.dumps(dict(summarize(collected), type='summary'), ensure_ascii=False) + '\n'
+        
+        return Response(generate(), mimetype='application/x-ndjson', headers=SSE_HEADERS)
+    
+    results = sorted(results, key=lambda result: result['index'])
+    return jsonify({'results': results, 'summary': summarize(results)})
+
 @app.route('/')
 def serve_frontend():
     return app.send_static_file('index.html')
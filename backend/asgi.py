@@ -0,0 +1,361 @@
+"""
+Asynchroner Betrieb (ASGI)
+
+Die Endpunkte, die lange auf KI-Provider oder Tandoor warten (Upload mit
+Analyse, Rezeptseiten, Analyse-Stream, Fortschritt von Analyse-Jobs und
+Import), laufen hier als
+Coroutinen: Ein Worker hält beliebig viele wartende Anfragen, ohne je einen
+Thread zu belegen. Provider-Aufrufe nutzen die asynchronen Clients der
+SDKs, Tandoor einen httpx.AsyncClient; Vorverarbeitung und Prüfung der
+Bilder laufen in einem begrenzten Thread-Pool.
+
+Alle übrigen Routen beantwortet weiterhin die Flask-App aus app.py über
+einen WSGI-Adapter mit eigenem Thread-Pool.
+
+Start (siehe gunicorn.conf.py, SERVER_MODE=async):
+    gunicorn -k uvicorn_worker.UvicornWorker asgi:app
+"""
+
+import json
+import time
+import asyncio
+import logging
+import functools
+from contextlib import asynccontextmanager
+from decouple import config
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.exceptions import RequestEntityTooLarge
+
+import metrics
+from ai_service import AIService
+from ai_providers.prompt_config import get_prompt
+from ai_providers.provider_factory import AIProviderFactory
+from app import (
+    app as flask_app, allowed_file, analysis_jobs, is_truthy, last_event_id, poll_job_events, queue_analysis_job,
+    store_pages, tandoor_tokens, upload_janitor, JOB_POLL_INTERVAL, JOB_RETRY_MS, JOB_STREAM_TIMEOUT,
+    MAX_RECIPE_PAGES
+)
+from sse import format_sse, AnalysisStream, SSE_HEADERS, SSE_KEEP_ALIVE
+from storage_backends.storage_factory import StorageFactory
+from upload_ingest import AsyncUpload, UploadRejected, app_storage, store_upload
+
+# Threads für die Routen, die an die Flask-App weitergereicht werden
+ASGI_WSGI_THREADS = config('ASGI_WSGI_THREADS', default=8, cast=int)
+
+# Logger
+logger = logging.getLogger('asgi')
+
+
+def error(message, status_code, headers=None):
+    return JSONResponse({'error': message}, status_code=status_code, headers=headers)
+
+
+def instrumented(handler):
+    """Server-Timing-Header und Metriken wie after_request in app.py"""
+    @functools.wraps(handler)
+    async def wrapper(request):
+        started = time.perf_counter()
+        metrics.start_request_timing()
+        response = await handler(request)
+        header = metrics.server_timing(time.perf_counter() - started)
+        if header:
+            response.headers['Server-Timing'] = header
+        return metrics.record_asgi_response(request, response)
+    return wrapper
+
+
+async def receive_upload(request):
+    """
+    Liest den Multipart-Body einer Anfrage prüfend in die Ablage
+
+    Returns:
+        AsyncUpload: Felder und Dateien; close() entfernt nicht übernommene Dateien
+
+    Raises:
+        UploadRejected: Wenn eine Datei die Prüfungen nicht besteht
+        RequestEntityTooLarge: Wenn der Body MAX_CONTENT_LENGTH überschreitet
+    """
+    max_content_length = flask_app.config['MAX_CONTENT_LENGTH']
+    length = request.headers.get('content-length', '')
+    if length.isdigit() and int(length) > max_content_length:
+        raise RequestEntityTooLarge()
+
+    upload = AsyncUpload(
+        app_storage(flask_app.config),
+        max_bytes=flask_app.config['MAX_UPLOAD_BYTES'],
+        max_pixels=flask_app.config['MAX_UPLOAD_PIXELS'],
+        max_content_length=max_content_length
+    )
+    try:
+        return await upload.parse(request.headers.get('content-type', ''), request.stream())
+    except BaseException:
+        upload.close()
+        raise
+
+
+def job_response(response_data, filepaths, image_hashes, filename):
+    body, status_code, headers = queue_analysis_job(response_data, filepaths, image_hashes, filename)
+    return JSONResponse(body, status_code=status_code, headers=headers)
+
+
+@instrumented
+async def upload_image(request):
+    """Wie /api/upload-image in app.py"""
+    upload = None
+    try:
+        upload = await receive_upload(request)
+        file = upload.files.get('image')
+        if file is None:
+            return error('Keine Bilddatei gefunden', 400)
+
+        if file.filename == '':
+            return error('Keine Datei ausgewählt', 400)
+
+        if not allowed_file(file.filename):
+            return error('Dateityp nicht erlaubt', 400)
+
+        # Unter dem Inhalts-Hash ablegen (gleiche Bilder nur einmal)
+        stored = await asyncio.to_thread(store_upload, file)
+
+        response_data = {
+            'success': True,
+            'message': 'Bild erfolgreich hochgeladen',
+            'filename': stored.key,
+            'path': stored.ref,
+            'sha256': stored.sha256,
+            'size': stored.size,
+            'media_type': stored.media_type
+        }
+
+        # Job-Modus: Analyse im Worker-Pool ausführen und sofort antworten
+        if is_truthy(request.query_params.get('async', upload.form.get('async', ''))):
+            return await asyncio.to_thread(job_response, response_data, [stored.ref], [stored.sha256], stored.key)
+
+        response_data['ai_analysis'] = await AIService.analyze_images_async(
+            [stored.ref], get_prompt('recipe'), image_hashes=[stored.sha256]
+        )
+        return JSONResponse(response_data)
+    except UploadRejected as e:
+        return error(str(e), e.status_code)
+    except RequestEntityTooLarge:
+        return error('Upload ist zu groß', 413)
+    except Exception as e:
+        logger.error(f"Fehler beim Hochladen: {str(e)}")
+        return error(f'Serverfehler: {str(e)}', 500)
+    finally:
+        if upload is not None:
+            upload.close()
+
+
+async def receive_pages(request, fields, missing_message):
+    """
+    Liest und übernimmt alle Seiten aus den angegebenen Formularfeldern
+
+    Args:
+        request: Starlette-Request
+        fields: Namen der Dateifelder
+        missing_message: Fehlermeldung, wenn keine Datei enthalten ist
+
+    Returns:
+        tuple: (AsyncUpload, Metadaten je Seite) oder (AsyncUpload, Fehlerantwort)
+    """
+    upload = await receive_upload(request)
+    files = [file for field in fields for file in upload.files.getlist(field) if file.filename]
+
+    if not files:
+        return upload, error(missing_message, 400)
+
+    if len(files) > MAX_RECIPE_PAGES:
+        return upload, error(f'Höchstens {MAX_RECIPE_PAGES} Seiten pro Rezept erlaubt', 400)
+
+    if not all(allowed_file(file.filename) for file in files):
+        return upload, error('Dateityp nicht erlaubt', 400)
+
+    try:
+        return upload, await asyncio.to_thread(store_pages, files)
+    except BaseException:
+        upload.close()
+        raise
+
+
+@instrumented
+async def upload_recipe_pages(request):
+    """Wie /api/upload-recipe-pages in app.py"""
+    upload = None
+    try:
+        upload, pages = await receive_pages(request, ('images',), 'Keine Bilddateien gefunden')
+        if isinstance(pages, JSONResponse):
+            return pages
+
+        filepaths = [page['path'] for page in pages]
+        image_hashes = [page['sha256'] for page in pages]
+
+        response_data = {
+            'success': True,
+            'message': f'{len(pages)} Seite(n) erfolgreich hochgeladen',
+            'files': pages
+        }
+
+        # Job-Modus: Analyse im Worker-Pool ausführen und sofort antworten
+        if is_truthy(request.query_params.get('async', upload.form.get('async', ''))):
+            return await asyncio.to_thread(job_response, response_data, filepaths, image_hashes, pages[0]['filename'])
+
+        # Alle Seiten gemeinsam in einer Anfrage analysieren
+        response_data['ai_analysis'] = await AIService.analyze_images_async(
+            filepaths, get_prompt('recipe'), image_hashes=image_hashes
+        )
+        return JSONResponse(response_data)
+    except UploadRejected as e:
+        return error(str(e), e.status_code)
+    except RequestEntityTooLarge:
+        return error('Upload ist zu groß', 413)
+    except Exception as e:
+        logger.error(f"Fehler beim Hochladen der Rezeptseiten: {str(e)}")
+        return error(f'Serverfehler: {str(e)}', 500)
+    finally:
+        if upload is not None:
+            upload.close()
+
+
+@instrumented
+async def analyze_stream(request):
+    """Wie /api/analyze-stream in app.py (Server-Sent Events)"""
+    upload = None
+    try:
+        upload, pages = await receive_pages(request, ('images', 'image'), 'Keine Bilddatei gefunden')
+        if isinstance(pages, JSONResponse):
+            return pages
+    except UploadRejected as e:
+        return error(str(e), e.status_code)
+    except RequestEntityTooLarge:
+        return error('Upload ist zu groß', 413)
+    except Exception as e:
+        logger.error(f"Fehler beim Hochladen: {str(e)}")
+        return error(f'Serverfehler: {str(e)}', 500)
+    finally:
+        if upload is not None:
+            upload.close()
+
+    filepaths = [page['path'] for page in pages]
+    image_hashes = [page['sha256'] for page in pages]
+
+    async def generate():
+        yield format_sse({'success': True, 'files': pages}, event='upload')
+        stream = AnalysisStream()
+        async for event in AIService.stream_images_async(filepaths, get_prompt('recipe'), image_hashes=image_hashes):
+            for message in stream.format(event):
+                yield message
+
+    return StreamingResponse(generate(), media_type='text/event-stream', headers=SSE_HEADERS)
+
+
+@instrumented
+async def stream_analysis_job(request):
+    """
+    Wie /api/analysis-jobs/<job_id>/events in app.py
+
+    Wartet zwischen den Abfragen im Event-Loop statt in einem Thread und
+    hält den Stream daher bis JOB_STREAM_TIMEOUT offen.
+    """
+    job_id = request.path_params['job_id']
+    if await asyncio.to_thread(analysis_jobs.get, job_id) is None:
+        return error('Job nicht gefunden', 404)
+    seq = last_event_id(request.headers)
+
+    async def generate(seq):
+        deadline = time.monotonic() + JOB_STREAM_TIMEOUT
+        last_sent = time.monotonic()
+        yield f"retry: {JOB_RETRY_MS}\n\n"
+        while True:
+            messages, seq, finished = await asyncio.to_thread(poll_job_events, job_id, seq)
+            for message in messages:
+                last_sent = time.monotonic()
+                yield message
+            if finished:
+                return
+            if time.monotonic() > deadline:
+                yield format_sse({'error': 'Zeitüberschreitung'}, event='timeout')
+                return
+
+            if time.monotonic() - last_sent > 15:
+                last_sent = time.monotonic()
+                yield SSE_KEEP_ALIVE
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+
+    return StreamingResponse(generate(seq), media_type='text/event-stream', headers=SSE_HEADERS)
+
+
+@instrumented
+async def import_to_tandoor(request):
+    """Wie /api/import-to-tandoor in app.py"""
+    try:
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+
+        if not isinstance(data, dict) or 'recipe_json_ld' not in data or not ('auth_token' in data or 'session_id' in data):
+            return error('Rezeptdaten und Auth-Token erforderlich', 400)
+
+        recipe_json_ld = data['recipe_json_ld']
+        auth_token = data.get('auth_token')
+        session_id = data.get('session_id')
+        allow_duplicate = bool(data.get('allow_duplicate', False))
+
+        if isinstance(recipe_json_ld, str):
+            recipe_json_ld = json.loads(recipe_json_ld)
+        elif not isinstance(recipe_json_ld, dict):
+            return error('Ungültige Rezeptdaten', 400)
+        if auth_token is not None and not isinstance(auth_token, str):
+            return error('Ungültiges Auth-Token', 400)
+        if session_id is not None and not isinstance(session_id, str):
+            return error('Ungültige Session-ID', 400)
+
+        # Importiere das Rezept in Tandoor (Token bei 401 einmal erneuern)
+        result = await tandoor_tokens.import_recipe_async(
+            recipe_json_ld, session_id=session_id, auth_token=auth_token, allow_duplicate=allow_duplicate
+        )
+
+        if result.get('reauth_required'):
+            return JSONResponse(result, status_code=401)
+        if result.get('duplicate'):
+            return JSONResponse(result, status_code=409)
+        return JSONResponse(result)
+    except Exception as e:
+        logger.error(f"Fehler beim Import in Tandoor: {str(e)}")
+        return error(f'Serverfehler: {str(e)}', 500)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """Startet das Aufräumen der Uploads und schließt am Ende die asynchronen Clients"""
+    upload_janitor.ensure_running()
+    yield
+    await AIProviderFactory.aclose()
+    await tandoor_tokens.async_client.aclose()
+    StorageFactory.close()
+
+
+routes = [
+    Route('/api/upload-image', upload_image, methods=['POST']),
+    Route('/api/upload-recipe-pages', upload_recipe_pages, methods=['POST']),
+    Route('/api/analyze-stream', analyze_stream, methods=['POST']),
+    Route('/api/import-to-tandoor', import_to_tandoor, methods=['POST']),
+    Route('/api/analysis-jobs/{job_id}/events', stream_analysis_job, methods=['GET']),
+    # Alle übrigen Routen (inklusive Frontend) bedient die Flask-App
+    Mount('/', app=WSGIMiddleware(flask_app, workers=ASGI_WSGI_THREADS)),
+]
+
+# CORS wie in app.py (alle Ursprünge, mit Credentials)
+app = Starlette(
+    routes=routes,
+    middleware=[Middleware(
+        CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'], allow_credentials=True
+    )],
+    lifespan=lifespan
+)
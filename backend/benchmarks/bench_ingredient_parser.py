@@ -0,0 +1,119 @@
+"""
+Durchsatz-Benchmark des Zutatenparsers
+
+Vergleicht die bisherigen vier extract_*-Funktionen, die jede Zeile
+einzeln neu zerlegen, mit parse_ingredients auf einem Korpus aus einigen
+tausend deutschen und englischen Zutatenzeilen. Der Cache des Parsers wird
+vor jedem kalten Durchlauf geleert; der warme Durchlauf zeigt den Fall
+wiederholter Zeilen (z.B. erneuter Import desselben Rezepts).
+
+Aufruf aus dem backend-Verzeichnis:
+
+    python -m benchmarks.bench_ingredient_parser [--lines N] [--repeat N]
+"""
+
+import re
+import sys
+import random
+import timeit
+import argparse
+
+from ingredient_parser import parse_ingredient, parse_ingredients
+
+AMOUNTS = ['1', '2', '200', '1,5', '0.5', '1/2', '1 1/2', '½', '1½', '2-3', '2 to 3', '']
+UNITS = ['g', 'kg', 'ml', 'l', 'EL', 'TL', 'Prise', 'Stück', 'Pck.', 'Bund', 'cups', 'tbsp', 'tsp', 'oz', '']
+FOODS = ['Mehl', 'Zucker', 'Butter', 'Eier', 'Milch', 'Salz', 'Olivenöl', 'Zwiebeln', 'Knoblauch',
+         'flour', 'sugar', 'butter', 'milk', 'olive oil', 'garlic cloves', 'fresh basil leaves']
+NOTES = ['', '', '', ' (gesiebt)', ' (fein gehackt)', ' (room temperature)', ' (optional)']
+
+
+def legacy_extract_food_name(ingredient_text):
+    parts = ingredient_text.split()
+    if len(parts) >= 2:
+        if parts[0].rstrip('0123456789.').lower() in ['g', 'kg', 'ml', 'l', 'el', 'tl']:
+            return " ".join(parts[1:])
+        elif len(parts) >= 3:
+            return " ".join(parts[2:])
+        else:
+            return " ".join(parts[1:])
+    return ingredient_text
+
+
+def legacy_extract_amount(ingredient_text):
+    import re
+    match = re.match(r'(\d+\.?\d*)', ingredient_text)
+    if match:
+        try:
+            return float(match.group(1))
+        except ValueError:
+            pass
+    return 0
+
+
+def legacy_extract_unit(ingredient_text):
+    common_units = ["g", "kg", "ml", "l", "EL", "TL", "Stück", "Prise"]
+    import re
+    match = re.match(r'\d+\.?\d*([a-zA-Z]+)', ingredient_text)
+    if match and match.group(1).lower() in [u.lower() for u in common_units]:
+        for unit in common_units:
+            if unit.lower() == match.group(1).lower():
+                return unit
+    parts = ingredient_text.split()
+    if len(parts) >= 2:
+        for unit in common_units:
+            if unit.lower() == parts[1].lower():
+                return unit
+    return ""
+
+
+def legacy_extract_note(ingredient_text):
+    if "(" in ingredient_text and ")" in ingredient_text:
+        start = ingredient_text.find("(")
+        end = ingredient_text.find(")")
+        if start < end:
+            return ingredient_text[start + 1:end]
+    return ""
+
+
+def legacy_parse(lines):
+    return [
+        (legacy_extract_amount(line), legacy_extract_unit(line), legacy_extract_food_name(line), legacy_extract_note(line))
+        for line in lines
+    ]
+
+
+def corpus(count, seed=42):
+    """Erzeugt zufällige, überwiegend verschiedene Zutatenzeilen"""
+    rng = random.Random(seed)
+    lines = []
+    for _ in range(count):
+        parts = [rng.choice(AMOUNTS), rng.choice(UNITS), rng.choice(FOODS)]
+        lines.append(re.sub(r'\s+', ' ', ' '.join(part for part in parts if part)) + rng.choice(NOTES))
+    return lines
+
+
+def parse_cold(lines):
+    parse_ingredient.cache_clear()
+    return parse_ingredients(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lines', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    lines = corpus(args.lines)
+    print(f"{len(lines)} Zeilen, {len(set(lines))} verschieden")
+    print(f"{'Verfahren':<22} {'ms':>8} {'Zeilen/s':>12}")
+    for name, function in (
+        ('extract_* (bisher)', lambda: legacy_parse(lines)),
+        ('parse_ingredients', lambda: parse_cold(lines)),
+        ('parse_ingredients warm', lambda: parse_ingredients(lines)),
+    ):
+        seconds = min(timeit.repeat(function, number=1, repeat=args.repeat))
+        print(f"{name:<22} {seconds * 1000:>8.2f} {len(lines) / seconds:>12.0f}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,161 @@
+"""
+Benchmark der größenbasierten JPEG-Kodierung
+
+Vergleicht encode_jpeg_within mit der bisherigen linearen Suche über
+Qualität und Skalierung an großen Kamerabildern. Jede Variante läuft in
+einem eigenen Prozess, damit die Spitzen-RSS getrennt gemessen wird.
+
+Aufruf aus dem backend-Verzeichnis:
+
+    python -m benchmarks.bench_jpeg_encoder [--max-bytes N] [--runs N] [bild.jpg ...]
+
+Ohne Bildpfade werden synthetische 12-Megapixel-Aufnahmen erzeugt.
+"""
+
+import io
+import os
+import sys
+import time
+import argparse
+import tempfile
+import resource
+import statistics
+import multiprocessing
+
+from PIL import Image, ImageDraw, ImageOps
+
+from ai_providers.image_preprocessing import encode_jpeg_within
+
+# Auflösung typischer Smartphone-Kameras (12 MP)
+CAMERA_SIZE = (4032, 3024)
+
+# Limit des Anthropic-Providers
+DEFAULT_MAX_BYTES = int(4.5 * 1024 * 1024)
+
+
+def encode_jpeg_linear(img, max_bytes=None, quality_start=85):
+    """Bisheriges Verfahren: Qualität in 10er-Schritten, dann jeweils 10% kleiner"""
+    quality = quality_start
+    img_io = io.BytesIO()
+    img.save(img_io, format='JPEG', quality=quality)
+
+    if max_bytes is None or img_io.tell() <= max_bytes:
+        return img_io.getvalue(), img.size
+
+    while quality > 10 and img_io.tell() > max_bytes:
+        quality -= 10
+        img_io = io.BytesIO()
+        img.save(img_io, format='JPEG', quality=quality)
+
+    size = img.size
+    scale_factor = 0.9
+    while img_io.tell() > max_bytes and scale_factor > 0.1:
+        size = (max(1, int(img.width * scale_factor)), max(1, int(img.height * scale_factor)))
+        img_io = io.BytesIO()
+        img.resize(size, Image.LANCZOS).save(img_io, format='JPEG', quality=quality)
+        scale_factor *= 0.9
+
+    return img_io.getvalue(), size
+
+
+ENCODERS = {
+    'linear': encode_jpeg_linear,
+    'targeted': encode_jpeg_within,
+}
+
+
+def camera_image(seed):
+    """Erzeugt ein rauschiges Foto einer Rezeptseite in Kameraauflösung"""
+    width, height = CAMERA_SIZE
+    img = Image.effect_noise(CAMERA_SIZE, 40 + seed * 10).convert('RGB')
+    img = Image.blend(img, Image.linear_gradient('L').resize(CAMERA_SIZE).convert('RGB'), 0.4)
+    draw = ImageDraw.Draw(img)
+    for line in range(0, height, 60):
+        draw.text((200, line), "200 g Mehl, 1/2 TL Salz, 3 Eier " * 6, fill=(20, 20, 20))
+    return img
+
+
+def write_camera_images(directory, count=3):
+    """Legt synthetische Kamerabilder als JPEG-Dateien ab"""
+    paths = []
+    for seed in range(count):
+        path = os.path.join(directory, f"camera_{seed}.jpg")
+        camera_image(seed).save(path, format='JPEG', quality=95)
+        paths.append(path)
+    return paths
+
+
+def load_images(paths):
+    images = []
+    for path in paths:
+        with Image.open(path) as img:
+            images.append(ImageOps.exif_transpose(img).convert('RGB'))
+    return images
+
+
+def run_encoder(name, paths, max_bytes, runs, queue):
+    """
+    Läuft im Kindprozess und meldet Zeiten, Größen und Spitzen-RSS
+
+    Die RSS nach dem Laden der Bilder dient als Basis, die Differenz zur
+    Spitze ist der zusätzliche Speicherbedarf der Kodierung.
+    """
+    images = load_images(paths)
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    timings = []
+    results = []
+    for _ in range(runs):
+        for img in images:
+            start = time.perf_counter()
+            data, size = ENCODERS[name](img, max_bytes=max_bytes)
+            timings.append(time.perf_counter() - start)
+            results.append((len(data), size))
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put({
+        'timings': timings,
+        'results': results,
+        'baseline_rss_kb': baseline_rss,
+        'peak_rss_kb': peak_rss,
+    })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('images', nargs='*', help='Bilddateien (Standard: synthetische Kamerabilder)')
+    parser.add_argument('--max-bytes', type=int, default=DEFAULT_MAX_BYTES)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = args.images or write_camera_images(directory)
+        compare(paths, args.max_bytes, args.runs)
+
+
+def compare(paths, max_bytes, runs):
+    """Führt alle Verfahren in getrennten Prozessen aus und gibt eine Tabelle aus"""
+    context = multiprocessing.get_context('spawn')
+    print(f"{len(paths)} Bilder, Limit: {max_bytes} Bytes, {runs} Durchläufe")
+    print(f"{'Verfahren':<10} {'median s':>9} {'max s':>8} {'RSS MB':>8} {'Δ RSS MB':>9}  Ergebnis")
+
+    for name in ENCODERS:
+        queue = context.Queue()
+        process = context.Process(target=run_encoder, args=(name, paths, max_bytes, runs, queue))
+        process.start()
+        report = queue.get()
+        process.join()
+
+        timings = report['timings']
+        largest = max(length for length, _ in report['results'])
+        sizes = sorted({size for _, size in report['results']})
+        print(
+            f"{name:<10} {statistics.median(timings):>9.3f} {max(timings):>8.3f} "
+            f"{report['peak_rss_kb'] / 1024:>8.1f} "
+            f"{(report['peak_rss_kb'] - report['baseline_rss_kb']) / 1024:>9.1f}  "
+            f"max {largest / 1024 / 1024:.2f} MB, {sizes}"
+        )
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""
+Micro-Benchmark der JSON-LD-Extraktion
+
+Vergleicht die bisherige Regex-Suche nach dem ersten ```json-Block mit dem
+inkrementellen Extraktor, einmal mit der ganzen Antwort und einmal in
+kleinen Stücken wie beim Streaming. Gemessen wird an großen Antworten mit
+vielen Zutaten, mehreren Blöcken und einer durch MAX_TOKENS abgeschnittenen
+Antwort, in der die Regex nichts findet.
+
+Aufruf aus dem backend-Verzeichnis:
+
+    python -m benchmarks.bench_json_ld_extractor [--repeat N] [--chunk-size N]
+"""
+
+import re
+import sys
+import json
+import timeit
+import argparse
+
+from json_ld_extractor import JsonLdExtractor, extract_json_ld
+
+# Bisheriges Verfahren aus /api/extract-json-ld
+LEGACY_PATTERN = re.compile(r'```json\s*([\s\S]*?)\s*```')
+
+
+def legacy_extract(text):
+    match = LEGACY_PATTERN.search(text)
+    if not match:
+        return None
+    try:
+        return json.loads(match.group(1).strip())
+    except json.JSONDecodeError:
+        return None
+
+
+def streamed_extract(text, chunk_size):
+    extractor = JsonLdExtractor()
+    for position in range(0, len(text), chunk_size):
+        extractor.feed(text[position:position + chunk_size])
+    return extractor.finish()
+
+
+def recipe(name, ingredients):
+    return {
+        "@context": "https://schema.org/",
+        "@type": "Recipe",
+        "name": name,
+        "recipeIngredient": [f"{i} g Zutat Nummer {i} (fein gehackt)" for i in range(ingredients)],
+        "recipeInstructions": [f"Schritt {i}: alles gut verrühren, dann ruhen lassen." for i in range(ingredients // 4)],
+    }
+
+
+def responses():
+    """Testfälle: (Name, Antworttext)"""
+    prose = "Hier ist das Rezept, das ich auf dem Foto erkannt habe. " * 200
+    single = f"{prose}\n```json\n{json.dumps(recipe('Eintopf', 4000), ensure_ascii=False, indent=2)}\n```\n{prose}"
+    several = "\n".join(
+        f"Seite {page}:\n```json\n{json.dumps(recipe(f'Rezept {page}', 1000), ensure_ascii=False)}\n```"
+        for page in range(8)
+    )
+    complete = json.dumps(recipe('Abgeschnitten', 4000), ensure_ascii=False, indent=2)
+    truncated = f"{prose}\n```json\n{complete[:len(complete) // 2]}"
+    return [
+        ('ein großer Block', single),
+        ('8 Blöcke', several),
+        ('abgeschnitten', truncated),
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--chunk-size', type=int, default=32)
+    args = parser.parse_args(argv)
+
+    print(f"{'Antwort':<22} {'KB':>6} {'Regex ms':>9} {'Extraktor ms':>13} {'Stücke ms':>10} {'Rezepte':>8} {'Regex':>6}")
+    for name, text in responses():
+        timings = {}
+        for label, function in (
+            ('legacy', lambda: legacy_extract(text)),
+            ('extractor', lambda: extract_json_ld(text)),
+            ('streamed', lambda: streamed_extract(text, args.chunk_size)),
+        ):
+            timings[label] = min(timeit.repeat(function, number=1, repeat=args.repeat)) * 1000
+
+        recipes = len(extract_json_ld(text).recipes)
+        legacy_found = legacy_extract(text) is not None
+        print(
+            f"{name:<22} {len(text) / 1024:>6.0f} {timings['legacy']:>9.2f} "
+            f"{timings['extractor']:>13.2f} {timings['streamed']:>10.2f} {recipes:>8} {'ja' if legacy_found else 'nein':>6}"
+        )
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,389 @@
+"""
+End-to-End-Benchmark der Rezept-Pipeline
+
+Startet die App mit gunicorn (SERVER_MODE sync oder async) gegen lokale
+Stand-ins für die KI-API und Tandoor (siehe stub_servers.py) und schickt
+Rezepte durch die ganze Pipeline: Upload mit Analyse (/api/upload-image),
+Extraktion (/api/extract-json-ld) und Import (/api/import-to-tandoor). Jede
+Stufe der Nebenläufigkeit läuft als geschlossene Schleife: so viele Clients
+wie angegeben schicken nacheinander Rezepte, bis --requests erreicht ist.
+Jedes Bild ist eindeutig, damit weder Analyse-Cache noch Inhalts-Schlüssel
+der Uploads greifen.
+
+Ausgegeben werden je Stufe und Schritt p50/p95/p99 in Millisekunden, Anfragen
+pro Sekunde und Fehler. Mit --save-baseline wird das Ergebnis unter --name in
+der Baseline-Datei abgelegt, sonst mit der gespeicherten Baseline verglichen:
+ist p95 um mehr als --tolerance langsamer oder der Durchsatz um mehr als
+--tolerance geringer, endet der Lauf mit Exit-Code 1.
+
+Aufruf aus dem backend-Verzeichnis:
+
+    python -m benchmarks.bench_pipeline [--concurrency 1,4,16] [--requests 32]
+        [--server-mode sync|async] [--ai-latency S] [--ai-tokens-per-second N]
+        [--ai-error-rate R] [--save-baseline] [--url http://host:port]
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from PIL import Image
+
+from benchmarks.stub_servers import StubAIServer, StubTandoorServer
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(BACKEND_DIR, 'benchmarks', 'baselines', 'pipeline.json')
+
+# Schritte der Pipeline in der Reihenfolge der Ausgabe
+STAGES = ('upload', 'extract', 'import', 'pipeline')
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, rank):
+    """Perzentil mit linearer Interpolation zwischen den Messwerten"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * rank / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(durations, errors, elapsed):
+    """Kennzahlen eines Schritts: Perzentile in ms, Anfragen pro Sekunde und Fehler"""
+    result = {f'p{rank}': _ms(percentile(durations, rank)) for rank in PERCENTILES}
+    result['rps'] = round(len(durations) / elapsed, 2) if elapsed else 0.0
+    result['count'] = len(durations)
+    result['errors'] = errors
+    return result
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+def make_images(count, size, nonce):
+    """
+    Erzeugt count verschiedene JPEGs
+
+    Ein Verlauf als Grundbild, in dem je Bild ein anderer Block eingefärbt
+    wird; nonce unterscheidet die Bilder verschiedener Läufe.
+    """
+    width, height = size
+    base = Image.linear_gradient('L').resize(size).convert('RGB')
+    images = []
+    for number in range(count):
+        image = base.copy()
+        color = ((number * 37 + nonce) % 256, (number * 91) % 256, nonce % 256)
+        image.paste(color, (number % max(width - 16, 1), 0, number % max(width - 16, 1) + 16, 16))
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=90)
+        images.append(buffer.getvalue())
+    return images
+
+
+class Server:
+    """gunicorn mit der App in einem eigenen Arbeitsverzeichnis (Uploads, Datenbanken)"""
+
+    def __init__(self, args, ai_url, tandoor_url):
+        self.args = args
+        self.workdir = tempfile.mkdtemp(prefix='bench-pipeline-')
+        self.port = args.port
+        self.url = f'http://127.0.0.1:{self.port}'
+        self.env = dict(
+            os.environ,
+            SERVER_MODE=args.server_mode,
+            AI_PROVIDER='openai',
+            OPENAI_API_KEY='benchmark',
+            OPENAI_BASE_URL=ai_url,
+            TANDOOR_API_URL=tandoor_url,
+            TANDOOR_SESSION_SECRET='benchmark',
+            TANDOOR_INDEX_ENABLED='False',
+            TANDOOR_DUPLICATE_CHECK='False',
+            PROMETHEUS_MULTIPROC_DIR=os.path.join(self.workdir, 'prometheus'),
+        )
+        self.process = None
+
+    def start(self):
+        command = [
+            sys.executable, '-m', 'gunicorn',
+            '-c', os.path.join(BACKEND_DIR, 'gunicorn.conf.py'),
+            '--bind', f'127.0.0.1:{self.port}',
+            '--workers', str(self.args.workers),
+            '--threads', str(self.args.threads),
+            '--timeout', '120',
+            '--chdir', self.workdir,
+            '--pythonpath', BACKEND_DIR,
+            '--log-level', 'warning',
+        ]
+        log = open(os.path.join(self.workdir, 'server.log'), 'wb')
+        self.process = subprocess.Popen(command, env=self.env, stdout=log, stderr=subprocess.STDOUT)
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Server beendet, siehe {log.name}")
+            try:
+                if requests.get(f'{self.url}/api/health', timeout=1).ok:
+                    return self
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"Server nicht erreichbar, siehe {log.name}")
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class PipelineClient:
+    """Ein Client, der Rezepte nacheinander durch Upload, Extraktion und Import schickt"""
+
+    def __init__(self, url, session_id, auth_token):
+        self.url = url
+        self.session_id = session_id
+        self.auth_token = auth_token
+        self.http = requests.Session()
+
+    def run(self, image):
+        """
+        Returns:
+            dict: Dauer je Schritt in Sekunden und ggf. der fehlgeschlagene Schritt
+        """
+        timings = {}
+        started = time.perf_counter()
+
+        response = self._timed(timings, 'upload', 'post', '/api/upload-image',
+                               files={'image': ('recipe.jpg', image, 'image/jpeg')})
+        analysis = response.json().get('ai_analysis', {}) if response.ok else {}
+        if not response.ok or 'error' in analysis:
+            return dict(timings, failed='upload')
+
+        response = self._timed(timings, 'extract', 'post', '/api/extract-json-ld',
+                               json={'ai_response': analysis.get('response', '')})
+        if not response.ok:
+            return dict(timings, failed='extract')
+
+        response = self._timed(timings, 'import', 'post', '/api/import-to-tandoor', json={
+            'recipe_json_ld': response.json()['json_ld'],
+            'session_id': self.session_id,
+            'auth_token': self.auth_token,
+        })
+        if not response.ok or not response.json().get('success'):
+            return dict(timings, failed='import')
+
+        timings['pipeline'] = time.perf_counter() - started
+        return timings
+
+    def _timed(self, timings, stage, method, path, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.http.request(method, f'{self.url}{path}', timeout=300, **kwargs)
+        except requests.RequestException:
+            response = requests.Response()
+            response.status_code = 599
+        timings[stage] = time.perf_counter() - started
+        return response
+
+
+def login(url):
+    response = requests.post(f'{url}/api/tandoor-auth', json={'username': 'benchmark', 'password': 'benchmark'},
+                             timeout=30)
+    response.raise_for_status()
+    data = response.json()
+    return data.get('session_id'), data['token']
+
+
+def run_level(url, concurrency, images, session_id, auth_token):
+    """
+    Führt eine Stufe mit concurrency Clients aus
+
+    Returns:
+        dict: Kennzahlen je Schritt (siehe summarize)
+    """
+    pending = iter(images)
+    lock = threading.Lock()
+    results = []
+
+    def worker():
+        client = PipelineClient(url, session_id, auth_token)
+        while True:
+            with lock:
+                image = next(pending, None)
+            if image is None:
+                return
+            result = client.run(image)
+            with lock:
+                results.append(result)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    summary = {}
+    for stage in STAGES:
+        durations = [result[stage] for result in results if stage in result and result.get('failed') != stage]
+        errors = sum(1 for result in results if result.get('failed') == stage)
+        if stage == 'pipeline':
+            errors = sum(1 for result in results if 'failed' in result)
+        summary[stage] = summarize(durations, errors, elapsed)
+    return summary
+
+
+def print_level(concurrency, summary):
+    print(f"\nNebenläufigkeit {concurrency}")
+    print(f"{'Schritt':<10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'RPS':>8} {'Anzahl':>7} {'Fehler':>7}")
+    for stage in STAGES:
+        values = summary[stage]
+        cells = ' '.join(f"{'-' if values[f'p{rank}'] is None else values[f'p{rank}']:>9}" for rank in PERCENTILES)
+        print(f"{stage:<10} {cells} {values['rps']:>8} {values['count']:>7} {values['errors']:>7}")
+
+
+def compare(levels, baseline, tolerance):
+    """
+    Vergleicht ein Ergebnis mit der Baseline
+
+    Returns:
+        list: Beschreibungen der Regressionen
+    """
+    regressions = []
+    for concurrency, summary in levels.items():
+        reference = baseline.get('levels', {}).get(concurrency)
+        if reference is None:
+            continue
+        for stage in STAGES:
+            current, expected = summary[stage], reference.get(stage)
+            if not expected:
+                continue
+            if current['p95'] is not None and expected.get('p95') and current['p95'] > expected['p95'] * (1 + tolerance):
+                regressions.append(
+                    f"{stage} bei {concurrency}: p95 {current['p95']} ms statt {expected['p95']} ms"
+                )
+            if expected.get('rps') and current['rps'] < expected['rps'] * (1 - tolerance):
+                regressions.append(
+                    f"{stage} bei {concurrency}: {current['rps']} statt {expected['rps']} Anfragen/s"
+                )
+            if current['errors'] > expected.get('errors', 0):
+                regressions.append(
+                    f"{stage} bei {concurrency}: {current['errors']} Fehler statt {expected.get('errors', 0)}"
+                )
+    return regressions
+
+
+def load_baselines(path):
+    try:
+        with open(path, encoding='utf-8') as baseline_file:
+            return json.load(baseline_file)
+    except FileNotFoundError:
+        return {}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', default='1,4,16',
+                        help='Stufen der Nebenläufigkeit, durch Komma getrennt')
+    parser.add_argument('--requests', type=int, default=32, help='Rezepte pro Stufe')
+    parser.add_argument('--image-size', default='1600x1200')
+    parser.add_argument('--server-mode', choices=('sync', 'async'), default='sync')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--url', help='Bereits laufende App statt gunicorn zu starten (mit eigenen Stubs)')
+    parser.add_argument('--ai-latency', type=float, default=0.2, help='Sekunden bis zum ersten Token')
+    parser.add_argument('--ai-tokens-per-second', type=float, default=500.0)
+    parser.add_argument('--ai-error-rate', type=float, default=0.0)
+    parser.add_argument('--ai-error-status', type=int, default=500)
+    parser.add_argument('--tandoor-latency', type=float, default=0.05)
+    parser.add_argument('--tandoor-error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--name', help='Name der Baseline (Standard: Server-Modus)')
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Erlaubte Abweichung (0.25 = 25 %%)')
+    args = parser.parse_args(argv)
+
+    levels = [int(value) for value in args.concurrency.split(',') if value.strip()]
+    size = tuple(int(value) for value in args.image_size.lower().split('x'))
+    name = args.name or args.server_mode
+    settings = {key: getattr(args, key) for key in (
+        'requests', 'image_size', 'server_mode', 'workers', 'threads', 'ai_latency', 'ai_tokens_per_second',
+        'ai_error_rate', 'ai_error_status', 'tandoor_latency', 'tandoor_error_rate', 'seed'
+    )}
+
+    nonce = random.SystemRandom().randrange(1 << 16)
+    print(f"Erzeuge {args.requests * len(levels)} Bilder ({args.image_size}) ...")
+    images = make_images(args.requests * len(levels), size, nonce)
+
+    ai = StubAIServer(args.ai_latency, args.ai_tokens_per_second, args.ai_error_rate, args.ai_error_status,
+                      seed=args.seed).start()
+    tandoor = StubTandoorServer(args.tandoor_latency, args.tandoor_error_rate, seed=args.seed + 1).start()
+    server = None
+    try:
+        if args.url:
+            url = args.url.rstrip('/')
+            print(f"Nutze {url}; die App muss OPENAI_BASE_URL={ai.url} und TANDOOR_API_URL={tandoor.url} verwenden")
+        else:
+            server = Server(args, ai.url, tandoor.url).start()
+            url = server.url
+        session_id, auth_token = login(url)
+
+        results = {}
+        for index, concurrency in enumerate(levels):
+            batch = images[index * args.requests:(index + 1) * args.requests]
+            results[str(concurrency)] = run_level(url, concurrency, batch, session_id, auth_token)
+            print_level(concurrency, results[str(concurrency)])
+        print(f"\nKI-Stub: {ai.requests} Anfragen ({ai.errors} Fehler), "
+              f"Tandoor-Stub: {tandoor.requests} Anfragen ({tandoor.errors} Fehler)")
+    finally:
+        if server is not None:
+            server.stop()
+        ai.stop()
+        tandoor.stop()
+
+    baselines = load_baselines(args.baseline)
+    if args.save_baseline:
+        baselines[name] = {'settings': settings, 'machine': platform.machine(), 'python': platform.python_version(),
+                           'created': time.strftime('%Y-%m-%d'), 'levels': results}
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as baseline_file:
+            json.dump(baselines, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write('\n')
+        print(f"Baseline '{name}' gespeichert in {args.baseline}")
+        return 0
+
+    baseline = baselines.get(name)
+    if baseline is None:
+        print(f"Keine Baseline '{name}' in {args.baseline} (mit --save-baseline anlegen)")
+        return 0
+    if baseline.get('settings') != settings:
+        print(f"Warnung: Einstellungen weichen von der Baseline '{name}' ab, Vergleich nur bedingt aussagekräftig")
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\nRegressionen gegenüber Baseline '{name}' (Toleranz {args.tolerance:.0%}):")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print(f"\nKeine Regression gegenüber Baseline '{name}' (Toleranz {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,250 @@
+"""
+Lokale Stand-ins für die KI-API und Tandoor
+
+StubAIServer spricht die Chat-Completions-API von OpenAI (mit und ohne
+Streaming), sodass der echte OpenAIProvider samt SDK-Client, Verbindungspool
+und Rate-Limiter gemessen wird; er wird über OPENAI_BASE_URL eingebunden.
+Latenz bis zum ersten Token, Token-Rate und der Anteil fehlerhafter Antworten
+sind einstellbar.
+
+StubTandoorServer implementiert /api-token-auth/, /api/recipe-from-source/
+und /api/recipe/ (Listen-Endpunkte liefern leere Seiten), ebenfalls mit
+einstellbarer Latenz und Fehlerquote.
+
+Beide laufen in einem Thread dieses Prozesses:
+
+    with StubAIServer(latency=0.2, tokens_per_second=500) as ai:
+        os.environ['OPENAI_BASE_URL'] = ai.url
+"""
+
+import json
+import time
+import random
+import threading
+from abc import ABC, abstractmethod
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def recipe_reply(number):
+    """Antworttext der KI mit einem Rezept als JSON-LD"""
+    recipe = {
+        "@context": "https://schema.org/",
+        "@type": "Recipe",
+        "name": f"Benchmark-Eintopf {number}",
+        "recipeYield": "4 Portionen",
+        "prepTime": "PT20M",
+        "cookTime": "PT40M",
+        "recipeIngredient": [
+            "500 g Kartoffeln",
+            "2 Zwiebeln",
+            "1 l Gemüsebrühe",
+            "200 g Karotten",
+            "1 EL Olivenöl",
+            "Salz und Pfeffer",
+        ],
+        "recipeInstructions": [
+            {"@type": "HowToStep", "text": "Gemüse schälen und würfeln."},
+            {"@type": "HowToStep", "text": "Zwiebeln in Olivenöl andünsten."},
+            {"@type": "HowToStep", "text": "Restliches Gemüse und Brühe zugeben und 40 Minuten köcheln lassen."},
+            {"@type": "HowToStep", "text": "Mit Salz und Pfeffer abschmecken."},
+        ],
+    }
+    return f"Hier ist das erkannte Rezept:\n```json\n{json.dumps(recipe, ensure_ascii=False, indent=2)}\n```"
+
+
+def split_tokens(text, size=4):
+    """Teilt einen Text in Stücke von etwa Token-Größe"""
+    return [text[position:position + size] for position in range(0, len(text), size)]
+
+
+class StubServer(ABC):
+    """ThreadingHTTPServer in einem Hintergrund-Thread, als Kontextmanager nutzbar"""
+
+    def __init__(self, latency=0.0, error_rate=0.0, error_status=500, seed=None):
+        """
+        Args:
+            latency: Sekunden bis zur Antwort (bzw. bis zum ersten Token)
+            error_rate: Anteil der Anfragen, die mit error_status beantwortet werden
+            error_status: HTTP-Status der eingestreuten Fehler
+            seed: Startwert für die Auswahl der Fehler (reproduzierbare Läufe)
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                stub.handle(self, 'GET', None)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                if body and 'json' in (self.headers.get('Content-Type') or ''):
+                    body = json.loads(body)
+                stub.handle(self, 'POST', body or None)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name=type(self).__name__, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def handle(self, request, method, body):
+        """Zählt die Anfrage, streut Fehler ein und beantwortet sie mit respond()"""
+        with self._lock:
+            self.requests += 1
+            number = self.requests
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if failed:
+            self.send_json(request, self.error_status, {'error': {'message': 'Eingestreuter Fehler'}},
+                           {'Retry-After': '1'} if self.error_status == 429 else None)
+            return
+        self.respond(request, method, body, number)
+
+    @abstractmethod
+    def respond(self, request, method, body, number):
+        """
+        Beantwortet eine Anfrage, die nicht als Fehler eingestreut wurde
+
+        Args:
+            request: BaseHTTPRequestHandler der Anfrage
+            method: "GET" oder "POST"
+            body: JSON-Inhalt der Anfrage, bei anderen Inhalten die Bytes
+                (ohne Inhalt None)
+            number: Laufende Nummer der Anfrage
+        """
+        pass
+
+    def send_json(self, request, status, data, headers=None):
+        payload = json.dumps(data).encode('utf-8')
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            request.send_header(name, value)
+        request.end_headers()
+        request.wfile.write(payload)
+
+
+class StubAIServer(StubServer):
+    """Chat-Completions-API wie bei OpenAI mit festem Rezept als Antwort"""
+
+    def __init__(self, latency=0.2, tokens_per_second=500.0, error_rate=0.0, error_status=500, seed=None):
+        """
+        Args:
+            latency: Sekunden bis zum ersten Token
+            tokens_per_second: Erzeugte Tokens pro Sekunde (0: sofort)
+            error_rate: Anteil der Anfragen, die mit error_status beantwortet werden
+            error_status: HTTP-Status der eingestreuten Fehler (429 mit Retry-After)
+            seed: Startwert für die Auswahl der Fehler
+        """
+        super().__init__(latency, error_rate, error_status, seed)
+        self.tokens_per_second = tokens_per_second
+
+    @property
+    def url(self):
+        return f"{super().url}/v1"
+
+    def respond(self, request, method, body, number):
+        if method != 'POST' or not request.path.endswith('/chat/completions'):
+            self.send_json(request, 404, {'error': {'message': 'Nicht gefunden'}})
+            return
+
+        tokens = split_tokens(recipe_reply(number))
+        delay = 1.0 / self.tokens_per_second if self.tokens_per_second else 0.0
+        usage = {'prompt_tokens': 1000, 'completion_tokens': len(tokens), 'total_tokens': 1000 + len(tokens)}
+        completion = {'id': f'chatcmpl-{number}', 'created': int(time.time()), 'model': body.get('model', 'stub')}
+
+        if not body.get('stream'):
+            time.sleep(delay * len(tokens))
+            self.send_json(request, 200, dict(
+                completion, object='chat.completion', usage=usage,
+                choices=[{'index': 0, 'finish_reason': 'stop',
+                          'message': {'role': 'assistant', 'content': ''.join(tokens)}}]
+            ))
+            return
+
+        request.send_response(200)
+        request.send_header('Content-Type', 'text/event-stream')
+        request.send_header('Transfer-Encoding', 'chunked')
+        request.end_headers()
+        for token in tokens:
+            self._send_chunk(request, dict(completion, object='chat.completion.chunk', choices=[
+                {'index': 0, 'finish_reason': None, 'delta': {'content': token}}
+            ]))
+            time.sleep(delay)
+        self._send_chunk(request, dict(completion, object='chat.completion.chunk', choices=[
+            {'index': 0, 'finish_reason': 'stop', 'delta': {}}
+        ]))
+        self._write_chunk(request, b'data: [DONE]\n\n')
+        self._write_chunk(request, b'')
+
+    def _send_chunk(self, request, data):
+        self._write_chunk(request, f"data: {json.dumps(data)}\n\n".encode('utf-8'))
+
+    def _write_chunk(self, request, payload):
+        request.wfile.write(f"{len(payload):x}\r\n".encode('ascii') + payload + b"\r\n")
+        request.wfile.flush()
+
+
+class StubTandoorServer(StubServer):
+    """Die Tandoor-Endpunkte, die Anmeldung und Import nutzen"""
+
+    def __init__(self, latency=0.05, error_rate=0.0, error_status=500, seed=None):
+        super().__init__(latency, error_rate, error_status, seed)
+        self.recipes = 0
+
+    def respond(self, request, method, body, number):
+        path = request.path.split('?', 1)[0]
+        if method == 'GET' and path.startswith('/api/'):
+            # Listen für Lebensmittel, Einheiten, Schlagwörter und Rezepte
+            self.send_json(request, 200, {'count': 0, 'next': None, 'previous': None, 'results': []})
+        elif method == 'POST' and path == '/api-token-auth/':
+            self.send_json(request, 200, {'token': f"stub-token-{body.get('username', '')}"})
+        elif method == 'POST' and path == '/api/recipe-from-source/':
+            recipe = json.loads(body.get('data') or '{}')
+            self.send_json(request, 200, {'recipe_json': {
+                'name': recipe.get('name', 'Rezept'),
+                'description': recipe.get('description', ''),
+                'steps': [{'instruction': '', 'ingredients': []}],
+            }})
+        elif method == 'POST' and path == '/api/recipe/':
+            with self._lock:
+                self.recipes += 1
+                recipe_id = self.recipes
+            self.send_json(request, 201, {'id': recipe_id, 'name': body.get('name', '')})
+        else:
+            self.send_json(request, 404, {'detail': 'Nicht gefunden'})
@@ -0,0 +1,97 @@
+"""
+Sammelimport von Rezepten nach Tandoor
+
+Importiert eine Liste von JSON-LD-Rezepten mit begrenzter Parallelität.
+Jedes Rezept wird unabhängig importiert; schlägt eines fehl, laufen die
+übrigen weiter. Die Ergebnisse werden in der Reihenfolge ihrer
+Fertigstellung geliefert und tragen den Index des Rezepts in der Anfrage.
+"""
+
+import json
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from decouple import config
+
+# Konfiguration aus Umgebungsvariablen
+TANDOOR_IMPORT_CONCURRENCY = config('TANDOOR_IMPORT_CONCURRENCY', default=4, cast=int)
+MAX_BULK_RECIPES = config('MAX_BULK_RECIPES', default=500, cast=int)
+
+# Logger
+logger = logging.getLogger('tandoor_api')
+
+
+def _recipe_name(recipe):
+    return recipe.get('name') if isinstance(recipe, dict) else None
+
+
+def _import_one(index, recipe, import_recipe):
+    """Importiert ein Rezept und fängt jeden Fehler als Ergebnis ab"""
+    try:
+        if isinstance(recipe, str):
+            recipe = json.loads(recipe)
+        if not isinstance(recipe, dict):
+            result = {"success": False, "error": "Ungültige Rezeptdaten"}
+        else:
+            result = import_recipe(recipe)
+    except Exception as e:
+        logger.error(f"Fehler beim Import von Rezept {index}: {str(e)}")
+        result = {"success": False, "error": str(e)}
+    return dict(result, index=index, name=_recipe_name(recipe))
+
+
+def import_recipes(recipes, import_recipe, concurrency=TANDOOR_IMPORT_CONCURRENCY):
+    """
+    Importiert mehrere Rezepte parallel
+
+    Der Generator kann vorzeitig geschlossen werden (z.B. wenn der Client
+    die Verbindung trennt); noch nicht begonnene Importe entfallen dann.
+
+    Args:
+        recipes: Liste von JSON-LD-Rezepten (dict oder JSON-String)
+        import_recipe: Funktion, die ein Rezept importiert und das Ergebnis
+            als dict mit "success" zurückgibt
+        concurrency: Maximale Anzahl gleichzeitiger Importe
+
+    Yields:
+        dict: Ergebnis je Rezept mit "index" und "name", in der Reihenfolge
+            der Fertigstellung
+    """
+    if not recipes:
+        return
+
+    executor = ThreadPoolExecutor(
+        max_workers=max(1, min(concurrency, len(recipes))),
+        thread_name_prefix='tandoor-import'
+    )
+    try:
+        # Kontext der Anfrage übernehmen, damit z.B. die Tandoor-Dauern im
+        # Server-Timing-Header erscheinen
+        futures = [
+            executor.submit(contextvars.copy_context().run, _import_one, index, recipe, import_recipe)
+            for index, recipe in enumerate(recipes)
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def summarize(results):
+    """
+    Fasst die Ergebnisse eines Sammelimports zusammen
+
+    Args:
+        results: Ergebnisse aus import_recipes
+
+    Returns:
+        dict: Anzahl gesamt, erfolgreich und fehlgeschlagen sowie
+            "reauth_required", falls Tandoor eine neue Anmeldung verlangt
+    """
+    succeeded = sum(1 for result in results if result.get('success'))
+    return {
+        "total": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "reauth_required": any(result.get('reauth_required') for result in results)
+    }
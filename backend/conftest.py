@@ -1,6 +1,14 @@
 import pytest
 import os
 import sys
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+# The shared Tandoor client must not load its indexes from a real server
+os.environ['TANDOOR_INDEX_ENABLED'] = 'False'
+os.environ['TANDOOR_DUPLICATE_CHECK'] = 'False'
 
 @pytest.fixture(scope="session", autouse=True)
 def setup_path():
@@ -27,3 +35,103 @@ def setup_test_environment():
     yield
     
     # Clean up after tests if needed
+
+
+@pytest.fixture
+def client(tmp_path):
+    """
+    Flask test client in testing mode with uploads in a temporary folder.
+
+    The app config (TESTING, UPLOAD_FOLDER and anything a test changes) is
+    restored afterwards, so later test modules see the original settings.
+    """
+    from app import app as flask_app
+
+    saved = dict(flask_app.config)
+    flask_app.config['TESTING'] = True
+    flask_app.config['UPLOAD_FOLDER'] = str(tmp_path)
+    try:
+        with flask_app.test_client() as client:
+            yield client
+    finally:
+        flask_app.config.clear()
+        flask_app.config.update(saved)
+
+
+class LocalServer:
+    """Local HTTP server in a background thread whose answers come from a test function."""
+
+    def __init__(self, respond):
+        self.respond_with = respond
+        self.received = []
+        self.paths = []
+        self._server = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                server.handle(self, 'GET', None)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                if body and 'json' in (self.headers.get('Content-Type') or ''):
+                    body = json.loads(body)
+                server.handle(self, 'POST', body or None)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def handle(self, request, method, body):
+        url = urlsplit(request.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        self.received.append((method, url.path, query, body))
+        self.paths.append(url.path)
+        reply = self.respond_with(method, url.path, query, body)
+        status, data, headers = reply if len(reply) == 3 else (*reply, None)
+
+        payload = json.dumps(data).encode('utf-8')
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            request.send_header(name, value)
+        request.end_headers()
+        request.wfile.write(payload)
+
+
+@pytest.fixture
+def local_server():
+    """
+    Start local HTTP servers for a test.
+
+    Each server answers with respond(method, path, query, body), which returns
+    (status, json_body) or (status, json_body, headers).
+    """
+    servers = []
+
+    def start(respond):
+        servers.append(LocalServer(respond).start())
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.stop()
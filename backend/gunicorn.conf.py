@@ -0,0 +1,35 @@
+"""
+gunicorn-Konfiguration
+
+Bereitet das gemeinsame Verzeichnis der Prometheus-Metriken vor, damit
+/api/metrics die Werte aller Worker zusammenfasst (siehe metrics.py).
+Bind-Adresse, Worker und Threads werden weiterhin auf der Kommandozeile
+angegeben.
+
+SERVER_MODE wählt die Anwendung: "sync" (Standard) startet die Flask-App
+mit Thread-Workern, "async" die ASGI-App aus asgi.py mit uvicorn-Workern.
+"""
+
+import os
+import shutil
+
+if os.environ.get('SERVER_MODE', 'sync').lower() == 'async':
+    wsgi_app = 'asgi:app'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+else:
+    wsgi_app = 'app:app'
+
+
+def on_starting(server):
+    """Entfernt Metrikdateien eines früheren Laufs"""
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+
+
+def child_exit(server, worker):
+    """Gibt die Dateien eines beendeten Workers für die Zusammenfassung frei"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,187 @@
+"""
+Parser für Zutatenzeilen
+
+Zerlegt Zeilen wie "1 1/2 EL Olivenöl (kaltgepresst)" oder "2-3 cups flour"
+in einem Durchlauf in Menge, Einheit, Lebensmittel und Notiz. Die Muster
+werden einmalig kompiliert, Einheiten über eine Tabelle nachgeschlagen.
+Unterstützt werden Dezimalzahlen mit Punkt oder Komma, Brüche, gemischte
+Zahlen, Unicode-Brüche (½), Bereiche sowie deutsche und englische Einheiten.
+"""
+
+import re
+from functools import lru_cache
+from collections import namedtuple
+
+# Ergebnis für eine Zutatenzeile; amount_max ist nur bei Bereichen gesetzt
+ParsedIngredient = namedtuple('ParsedIngredient', ['amount', 'amount_max', 'unit', 'food', 'note'])
+
+# Unicode-Brüche und ihr Wert
+UNICODE_FRACTIONS = {
+    '½': 0.5, '⅓': 1 / 3, '⅔': 2 / 3, '¼': 0.25, '¾': 0.75,
+    '⅕': 0.2, '⅖': 0.4, '⅗': 0.6, '⅘': 0.8, '⅙': 1 / 6, '⅚': 5 / 6,
+    '⅛': 0.125, '⅜': 0.375, '⅝': 0.625, '⅞': 0.875,
+}
+
+# Einheiten: Name für Tandoor und Schreibweisen (klein, ohne Punkt)
+UNITS = {
+    'g': ('g', 'gr', 'gramm', 'gram', 'grams'),
+    'kg': ('kg', 'kilo', 'kilogramm', 'kilogram', 'kilograms'),
+    'mg': ('mg', 'milligramm', 'milligram', 'milligrams'),
+    'ml': ('ml', 'milliliter', 'millilitre', 'milliliters', 'millilitres'),
+    'cl': ('cl', 'zentiliter', 'centiliter', 'centilitre'),
+    'dl': ('dl', 'deziliter', 'deciliter', 'decilitre'),
+    'l': ('l', 'liter', 'litre', 'liters', 'litres'),
+    'EL': ('el', 'essl', 'esslöffel', 'eßlöffel'),
+    'TL': ('tl', 'teel', 'teelöffel'),
+    'Msp': ('msp', 'messerspitze', 'messerspitzen'),
+    'Prise': ('prise', 'prisen'),
+    'Stück': ('stück', 'stk', 'st'),
+    'Bund': ('bund', 'bd'),
+    'Dose': ('dose', 'dosen', 'ds'),
+    'Päckchen': ('päckchen', 'pck', 'pckg', 'pkt', 'packung', 'packungen'),
+    'Zehe': ('zehe', 'zehen'),
+    'Scheibe': ('scheibe', 'scheiben'),
+    'Tasse': ('tasse', 'tassen'),
+    'Becher': ('becher',),
+    'Glas': ('glas', 'gläser'),
+    'Handvoll': ('handvoll',),
+    'Tropfen': ('tropfen',),
+    'Zweig': ('zweig', 'zweige'),
+    'Blatt': ('blatt', 'blätter'),
+    'tbsp': ('tbsp', 'tbs', 'tbl', 'tablespoon', 'tablespoons'),
+    'tsp': ('tsp', 'teaspoon', 'teaspoons'),
+    'cup': ('cup', 'cups', 'c'),
+    'oz': ('oz', 'ounce', 'ounces'),
+    'fl oz': ('floz',),
+    'lb': ('lb', 'lbs', 'pound', 'pounds'),
+    'pint': ('pint', 'pints', 'pt'),
+    'quart': ('quart', 'quarts', 'qt'),
+    'pinch': ('pinch', 'pinches'),
+    'dash': ('dash', 'dashes'),
+    'clove': ('clove', 'cloves'),
+    'can': ('can', 'cans'),
+    'slice': ('slice', 'slices'),
+    'piece': ('piece', 'pieces', 'pc', 'pcs'),
+    'bunch': ('bunch', 'bunches'),
+    'package': ('package', 'packages', 'pkg'),
+    'stick': ('stick', 'sticks'),
+}
+UNIT_LOOKUP = {alias: name for name, aliases in UNITS.items() for alias in aliases}
+
+# Zahl: gemischte Zahl (1 1/2, 1½), Bruch, Dezimalzahl oder Unicode-Bruch
+_FRACTION_CHARS = ''.join(UNICODE_FRACTIONS)
+_NUMBER = (
+    rf'\d+\s+\d+\s*/\s*\d+'
+    rf'|\d+\s*[{_FRACTION_CHARS}]'
+    rf'|\d+\s*/\s*\d+'
+    rf'|\d+(?:[.,]\d+)?'
+    rf'|[{_FRACTION_CHARS}]'
+)
+
+# Menge (ggf. als Bereich) und das direkt folgende Wort als Einheitskandidat
+INGREDIENT_PATTERN = re.compile(
+    rf'^\s*(?P<amount>{_NUMBER})'
+    rf'(?:\s*(?:-|–|—|bis|to)\s*(?P<amount_max>{_NUMBER}))?'
+    rf'\s*(?P<unit>fl\.?\s*oz\.?|[^\W\d_]+\.?)?',
+    re.IGNORECASE
+)
+
+# Notiz in Klammern und Füllwörter zwischen Einheit und Lebensmittel
+NOTE_PATTERN = re.compile(r'\s*\(([^)]*)\)')
+FILLER_PATTERN = re.compile(r'^(?:of|von)\s+', re.IGNORECASE)
+WHITESPACE_PATTERN = re.compile(r'\s+')
+MIXED_PATTERN = re.compile(r'(\d+)\s+(\d+)\s*/\s*(\d+)')
+FRACTION_PATTERN = re.compile(r'(\d+)\s*/\s*(\d+)')
+
+
+def parse_number(text):
+    """
+    Wandelt eine Mengenangabe in eine Zahl um
+
+    Args:
+        text: z.B. "1,5", "1 1/2", "1½", "3/4" oder "¾"
+
+    Returns:
+        float: Der Wert (0 bei Division durch Null)
+    """
+    text = text.strip()
+    if text.isdigit():
+        return float(text)
+    if text[-1] in UNICODE_FRACTIONS:
+        whole = text[:-1].strip()
+        return (float(whole) if whole else 0.0) + UNICODE_FRACTIONS[text[-1]]
+
+    match = MIXED_PATTERN.fullmatch(text)
+    if match:
+        whole, numerator, denominator = (int(group) for group in match.groups())
+        return whole + (numerator / denominator if denominator else 0.0)
+
+    match = FRACTION_PATTERN.fullmatch(text)
+    if match:
+        numerator, denominator = (int(group) for group in match.groups())
+        return numerator / denominator if denominator else 0.0
+
+    return float(text.replace(',', '.'))
+
+
+@lru_cache(maxsize=4096)
+def parse_ingredient(text):
+    """
+    Zerlegt eine Zutatenzeile
+
+    Args:
+        text: Zutatenzeile, z.B. "200 g Mehl (gesiebt)"
+
+    Returns:
+        ParsedIngredient: Menge (0 ohne Angabe), Höchstmenge bei Bereichen,
+            Einheit ("" ohne Angabe), Lebensmittel und Notiz
+    """
+    note = ''
+    note_match = NOTE_PATTERN.search(text) if '(' in text else None
+    if note_match:
+        note = note_match.group(1).strip()
+        text = text[:note_match.start()] + text[note_match.end():]
+
+    amount = 0
+    amount_max = None
+    unit = ''
+    rest = text
+
+    match = INGREDIENT_PATTERN.match(text)
+    if match:
+        amount_text, amount_max_text, candidate = match.group('amount', 'amount_max', 'unit')
+        amount = parse_number(amount_text)
+        if amount_max_text:
+            amount_max = parse_number(amount_max_text)
+
+        rest = text[match.end('amount_max') if amount_max_text else match.end('amount'):]
+        if candidate:
+            key = candidate.lower()
+            if key not in UNIT_LOOKUP:
+                key = WHITESPACE_PATTERN.sub('', key).replace('.', '')
+            if key in UNIT_LOOKUP:
+                unit = UNIT_LOOKUP[key]
+                rest = text[match.end('unit'):]
+
+    food = rest.strip()
+    if '  ' in food or '\t' in food or '\n' in food:
+        food = WHITESPACE_PATTERN.sub(' ', food)
+    if unit:
+        food = FILLER_PATTERN.sub('', food)
+    return ParsedIngredient(amount, amount_max, unit, food or text.strip(), note)
+
+
+def parse_ingredients(lines):
+    """
+    Zerlegt alle Zeilen einer recipeIngredient-Liste
+
+    Gleiche Zeilen (z.B. aus mehreren Rezeptseiten) werden nur einmal
+    geparst.
+
+    Args:
+        lines: Liste von Zutatenzeilen
+
+    Returns:
+        list: ParsedIngredient je Zeile, in derselben Reihenfolge
+    """
+    return [parse_ingredient(line if isinstance(line, str) else str(line)) for line in lines]
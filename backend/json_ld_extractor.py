@@ -0,0 +1,316 @@
+"""
+Inkrementelle Extraktion von JSON-LD aus KI-Antworten
+
+Die KI liefert Rezepte als JSON-LD in Markdown-Codeblöcken (```json ... ```).
+Der Extraktor durchläuft die Antwort genau einmal, auch wenn sie in
+Stücken eintrifft (Streaming), und parst jeden Block, sobald sein
+schließender Zaun gelesen wurde. Häufige Fehler der Modelle werden
+toleriert: nachgestellte Kommas und durch MAX_TOKENS abgeschnittene
+Antworten, deren offene Strings und Klammern geschlossen werden.
+"""
+
+import re
+import json
+import logging
+from collections import deque
+
+# Markdown-Zaun für Codeblöcke
+FENCE = '```'
+
+# Sprachangaben, die als JSON-Block gelten (ohne Angabe: nur wenn der Inhalt
+# mit { oder [ beginnt)
+JSON_LANGUAGES = ('json', 'jsonld', 'json-ld', 'ld+json')
+
+# Token für die Reparatur: Strings (ggf. abgeschnitten) und Strukturzeichen
+JSON_TOKEN = re.compile(
+    r'"[^"\\]*(?:\\.[^"\\]*)*(?:(?P<closed>")|(?P<dangling>\\)?\Z)'
+    r'|[{}\[\],]',
+    re.S
+)
+
+# Logger
+logger = logging.getLogger('json_ld_extractor')
+
+
+class JsonLdBlock:
+    """Ein geparster JSON-Block mit den darin gefundenen Rezepten"""
+
+    def __init__(self, data, recipes, truncated=False, repaired=False):
+        self.data = data
+        self.recipes = recipes
+        self.truncated = truncated
+        self.repaired = repaired
+
+
+class JsonLdExtractor:
+    """
+    Findet JSON-Codeblöcke in einer stückweise eintreffenden Antwort
+
+    Beispiel:
+        extractor = JsonLdExtractor()
+        for chunk in chunks:
+            for block in extractor.feed(chunk):
+                ...
+        blocks = extractor.finish()
+    """
+
+    def __init__(self):
+        self.blocks = []
+        self.errors = []
+        self._buffer = ''
+        self._in_block = False
+        self._language = None
+        self._content = []
+
+    def feed(self, chunk):
+        """
+        Verarbeitet das nächste Stück der Antwort
+
+        Args:
+            chunk: Weiterer Text der Antwort
+
+        Returns:
+            list: JsonLdBlock für jeden Block, der in diesem Stück geschlossen wurde
+        """
+        self._buffer += chunk
+        completed = []
+
+        while True:
+            if not self._in_block:
+                start = self._buffer.find(FENCE)
+                if start < 0:
+                    # Ein angefangener Zaun am Ende könnte im nächsten Stück weitergehen
+                    self._buffer = self._buffer[-(len(FENCE) - 1):]
+                    break
+
+                # Sprachangabe bis zum ersten Leerraum bzw. bis zum Beginn des Inhalts lesen
+                end = start + len(FENCE)
+                while end < len(self._buffer) and self._buffer[end] not in ' \t\r\n{[':
+                    end += 1
+                if end == len(self._buffer):
+                    self._buffer = self._buffer[start:]
+                    break
+
+                self._language = self._buffer[start + len(FENCE):end].strip().lower()
+                self._buffer = self._buffer[end:]
+                self._in_block = True
+                self._content = []
+            else:
+                end = self._buffer.find(FENCE)
+                if end < 0:
+                    # Bis auf einen möglichen Zaunanfang alles als Inhalt übernehmen
+                    keep = len(FENCE) - 1
+                    if len(self._buffer) > keep:
+                        self._content.append(self._buffer[:-keep])
+                        self._buffer = self._buffer[-keep:]
+                    break
+
+                self._content.append(self._buffer[:end])
+                self._buffer = self._buffer[end + len(FENCE):]
+                self._in_block = False
+                block = self._close_block(truncated=False)
+                if block is not None:
+                    completed.append(block)
+
+        return completed
+
+    def finish(self):
+        """
+        Schließt die Antwort ab, auch wenn ein Block noch offen ist
+
+        Returns:
+            list: Alle gefundenen JsonLdBlock in Reihenfolge der Antwort
+        """
+        if self._in_block:
+            self._content.append(self._buffer)
+            self._buffer = ''
+            self._in_block = False
+            self._close_block(truncated=True)
+        return self.blocks
+
+    @property
+    def recipes(self):
+        """Alle Rezept-Knoten aus allen Blöcken"""
+        return [recipe for block in self.blocks for recipe in block.recipes]
+
+    def _close_block(self, truncated):
+        """Parst den Inhalt des gerade geschlossenen Blocks"""
+        text = ''.join(self._content).strip()
+        self._content = []
+
+        if self._language not in JSON_LANGUAGES and not (self._language == '' and text[:1] in ('{', '[')):
+            return None
+
+        try:
+            data, repaired = parse_json_lenient(text, truncated=truncated)
+        except ValueError as e:
+            logger.warning(f"JSON-Block konnte nicht geparst werden: {str(e)}")
+            self.errors.append(str(e))
+            return None
+
+        block = JsonLdBlock(data, find_recipes(data), truncated=truncated, repaired=repaired)
+        self.blocks.append(block)
+        return block
+
+
+def extract_json_ld(text):
+    """
+    Extrahiert alle JSON-Blöcke aus einer vollständigen Antwort
+
+    Args:
+        text: Antwort der KI
+
+    Returns:
+        JsonLdExtractor: Abgeschlossener Extraktor mit blocks, recipes und errors
+    """
+    extractor = JsonLdExtractor()
+    extractor.feed(text)
+    extractor.finish()
+    return extractor
+
+
+def parse_json_lenient(text, truncated=False):
+    """
+    Parst JSON und repariert dabei typische Fehler
+
+    Args:
+        text: JSON-Text
+        truncated: Der Text wurde mitten im Wert abgeschnitten
+
+    Returns:
+        tuple: (geparste Daten, True wenn eine Reparatur nötig war)
+
+    Raises:
+        ValueError: Wenn der Text auch nach der Reparatur kein JSON ist
+    """
+    try:
+        return json.loads(text), False
+    except json.JSONDecodeError as e:
+        error = e
+
+    parts, stack, open_string, safe_length, safe_stack = _scan(text)
+    candidates = [''.join(parts)]
+    if truncated:
+        # Offenen String und offene Klammern schließen, sonst das
+        # unvollständige letzte Element verwerfen
+        candidates = [
+            ''.join(parts) + ('"' if open_string else '') + ''.join(reversed(stack)),
+            ''.join(parts[:safe_length]) + ''.join(reversed(safe_stack)),
+        ]
+
+    for candidate in candidates:
+        try:
+            return json.loads(candidate), True
+        except json.JSONDecodeError:
+            continue
+    raise ValueError(f"Ungültiges JSON: {str(error)}")
+
+
+def _scan(text):
+    """
+    Zerlegt JSON in einem Durchlauf und entfernt nachgestellte Kommas
+
+    Nur Strings und Strukturzeichen werden einzeln betrachtet, alles
+    dazwischen wird als Ganzes übernommen. Strings bleiben ein Stück, damit
+    Kommas und Klammern in Werten unangetastet bleiben.
+
+    Args:
+        text: JSON-Text
+
+    Returns:
+        tuple: (Textstücke, offene Klammern als schließende Zeichen, ob ein
+            String offen ist, Anzahl Stücke bis zur letzten sauberen
+            Schnittstelle, offene Klammern an dieser Stelle)
+    """
+    parts = []
+    stack = []
+    open_string = False
+    comma = None
+    safe_length = 0
+    safe_stack = []
+    position = 0
+
+    for match in JSON_TOKEN.finditer(text):
+        start = match.start()
+        if start > position:
+            between = text[position:start]
+            parts.append(between)
+            if comma is not None and not between.isspace():
+                comma = None
+        position = match.end()
+        token = match.group()
+
+        if token == '}' or token == ']':
+            # Nachgestelltes Komma vor schließender Klammer verwerfen
+            if comma is not None:
+                parts[comma] = ''
+                comma = None
+            if stack:
+                stack.pop()
+            parts.append(token)
+            continue
+
+        comma = None
+        if token == ',':
+            safe_length = len(parts)
+            safe_stack = list(stack)
+            comma = len(parts)
+            parts.append(token)
+        elif token == '{' or token == '[':
+            stack.append('}' if token == '{' else ']')
+            parts.append(token)
+            safe_length = len(parts)
+            safe_stack = list(stack)
+        elif match.group('closed') is None:
+            # Abgeschnittener String (nur am Ende möglich)
+            open_string = True
+            parts.append(token[:-1] if match.group('dangling') else token)
+        else:
+            parts.append(token)
+
+    if position < len(text):
+        rest = text[position:]
+        parts.append(rest)
+        if comma is not None and not rest.isspace():
+            comma = None
+    if comma is not None:
+        parts[comma] = ''
+
+    return parts, stack, open_string, safe_length, safe_stack
+
+
+def _is_recipe(node):
+    node_type = node.get('@type')
+    if isinstance(node_type, list):
+        return 'Recipe' in node_type
+    return node_type == 'Recipe'
+
+
+def find_recipes(data):
+    """
+    Sucht Rezept-Knoten in geparstem JSON-LD
+
+    Berücksichtigt einzelne Objekte, Listen und @graph-Hüllen. Ein @context
+    der Hülle wird an Rezepte ohne eigenen Kontext weitergegeben.
+
+    Args:
+        data: Geparstes JSON
+
+    Returns:
+        list: Gefundene Rezepte als dict
+    """
+    recipes = []
+    pending = deque([(data, None)])
+    while pending:
+        node, context = pending.popleft()
+        if isinstance(node, list):
+            pending.extend((item, context) for item in node)
+        elif isinstance(node, dict):
+            context = node.get('@context', context)
+            if _is_recipe(node):
+                if context is not None and '@context' not in node:
+                    node = dict({'@context': context}, **node)
+                recipes.append(node)
+            elif isinstance(node.get('@graph'), list):
+                pending.extend((item, context) for item in node['@graph'])
+    return recipes
@@ -0,0 +1,279 @@
+"""
+Prometheus-Metriken
+
+Histogramme für die Dauer der einzelnen Verarbeitungsschritte (Upload,
+Bildvorverarbeitung, Provider-Aufruf, JSON-LD-Extraktion, Tandoor-Anfragen)
+sowie Zähler für übertragene Bytes, Bildgrößen nach der Vorverarbeitung,
+Fehler und Cache-Zugriffe und der belegte Speicher der Uploads. Dieselben
+Dauern werden zusätzlich je Anfrage gesammelt und als Server-Timing-Header
+zurückgegeben.
+
+Ist PROMETHEUS_MULTIPROC_DIR gesetzt, schreibt jeder gunicorn-Worker seine
+Werte in Dateien dieses Verzeichnisses und /api/metrics fasst beim Abruf alle
+Worker zusammen (siehe gunicorn.conf.py). Ohne die Variable gelten die Werte
+nur für den abgefragten Prozess. Das Erfassen selbst ist in beiden Fällen
+nur ein Lock und eine Addition; häufig genutzte Label-Kombinationen werden
+vorab aufgelöst.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from urllib.parse import urlsplit
+from decouple import config
+
+# prometheus_client liest das Verzeichnis beim Import aus der Umgebung, daher
+# wird ein Wert aus der .env-Datei vorher übernommen
+PROMETHEUS_MULTIPROC_DIR = config('PROMETHEUS_MULTIPROC_DIR', default='')
+if PROMETHEUS_MULTIPROC_DIR:
+    os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', PROMETHEUS_MULTIPROC_DIR)
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+
+from prometheus_client import (  # noqa: E402
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+
+# Grenzen der Histogramm-Buckets in Sekunden
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROVIDER_BUCKETS = (0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 45.0, 60.0, 90.0, 120.0)
+
+STAGE_DURATION = Histogram(
+    'recipe_stage_duration_seconds', 'Dauer der Verarbeitungsschritte',
+    ['stage'], buckets=STAGE_BUCKETS
+)
+AI_REQUEST_DURATION = Histogram(
+    'ai_provider_request_duration_seconds', 'Dauer der Anfragen an die KI-Provider',
+    ['provider', 'model'], buckets=PROVIDER_BUCKETS
+)
+AI_RATE_LIMIT_WAIT = Histogram(
+    'ai_rate_limit_wait_seconds', 'Wartezeit auf freie Kapazität im Rate-Limit',
+    ['provider'], buckets=STAGE_BUCKETS
+)
+TANDOOR_REQUEST_DURATION = Histogram(
+    'tandoor_request_duration_seconds', 'Dauer der Anfragen an die Tandoor-API',
+    ['operation'], buckets=STAGE_BUCKETS
+)
+BYTES_RECEIVED = Counter('http_request_bytes', 'Empfangene Bytes (Request-Bodys)')
+BYTES_SENT = Counter('http_response_bytes', 'Gesendete Bytes (Response-Bodys)')
+IMAGE_SOURCE_BYTES = Counter(
+    'ai_image_source_bytes', 'Größe der Bilder vor der Vorverarbeitung', ['provider']
+)
+IMAGE_PAYLOAD_BYTES = Counter(
+    'ai_image_payload_bytes', 'Größe der an die Provider gesendeten Bilder', ['provider']
+)
+ERRORS = Counter('recipe_errors', 'Fehler nach Art', ['type'])
+CACHE_REQUESTS = Counter('cache_requests', 'Cache-Zugriffe nach Ergebnis', ['cache', 'result'])
+
+# Den Upload-Ordner misst je Durchlauf ein Worker, der jüngste Wert gilt;
+# Uploads im Arbeitsspeicher gehören dem jeweiligen Worker und werden addiert
+UPLOAD_DISK_BYTES = Gauge('upload_disk_bytes', 'Umfang des Upload-Ordners', multiprocess_mode='mostrecent')
+UPLOAD_DISK_FILES = Gauge('upload_disk_files', 'Dateien im Upload-Ordner', multiprocess_mode='mostrecent')
+UPLOAD_DISK_FREE_BYTES = Gauge(
+    'upload_disk_free_bytes', 'Freier Platz auf dem Dateisystem des Upload-Ordners', multiprocess_mode='mostrecent'
+)
+UPLOAD_MEMORY_BYTES = Gauge('upload_memory_bytes', 'Umfang der Uploads im Arbeitsspeicher', multiprocess_mode='livesum')
+UPLOAD_MEMORY_FILES = Gauge('upload_memory_files', 'Uploads im Arbeitsspeicher', multiprocess_mode='livesum')
+UPLOAD_EVICTIONS = Counter('upload_evictions', 'Entfernte Uploads nach Speicherart und Grund', ['storage', 'reason'])
+UPLOAD_EVICTED_BYTES = Counter(
+    'upload_evicted_bytes', 'Umfang der entfernten Uploads nach Speicherart und Grund', ['storage', 'reason']
+)
+
+# Vorab aufgelöste Label-Kombinationen für den Hot Path
+UPLOAD_SAVE = STAGE_DURATION.labels('upload_save')
+IMAGE_PREPROCESSING = STAGE_DURATION.labels('image_preprocessing')
+JSON_LD_EXTRACTION = STAGE_DURATION.labels('json_ld_extraction')
+ANALYSIS_CACHE_MEMORY_HIT = CACHE_REQUESTS.labels('analysis', 'memory_hit')
+ANALYSIS_CACHE_DISK_HIT = CACHE_REQUESTS.labels('analysis', 'disk_hit')
+ANALYSIS_CACHE_MISS = CACHE_REQUESTS.labels('analysis', 'miss')
+DERIVATIVE_CACHE_HIT = CACHE_REQUESTS.labels('derivatives', 'hit')
+DERIVATIVE_CACHE_MISS = CACHE_REQUESTS.labels('derivatives', 'miss')
+
+# Dauern der laufenden Anfrage als Liste von (Schritt, Sekunden, Beschreibung)
+_request_timings = ContextVar('request_timings', default=None)
+
+# Zeichen, die in einer Beschreibung im Server-Timing-Header stören
+_TIMING_DESCRIPTION_FORBIDDEN = str.maketrans('', '', '"\\,;')
+
+
+def start_request_timing():
+    """Beginnt die Sammlung der Dauern für die Anfrage des aktuellen Kontexts"""
+    _request_timings.set([])
+
+
+def observe_stage(histogram, stage, seconds, description=None):
+    """
+    Erfasst eine Dauer im Histogramm und für den Server-Timing-Header
+
+    Args:
+        histogram: Histogramm (mit bereits gesetzten Labels)
+        stage: Name des Schritts im Header, z.B. "image_preprocessing"
+        seconds: Dauer in Sekunden
+        description: Optionale Beschreibung, z.B. Provider und Modell
+    """
+    histogram.observe(seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds, description))
+
+
+@contextmanager
+def timed(histogram, stage, description=None):
+    """Misst die Dauer des Blocks wie observe_stage"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(histogram, stage, time.perf_counter() - started, description)
+
+
+def server_timing(total=None):
+    """
+    Erstellt den Server-Timing-Header der laufenden Anfrage
+
+    Mehrfach gemessene Schritte (z.B. mehrere Tandoor-Anfragen) werden
+    addiert und mit ihrer Anzahl beschrieben.
+
+    Args:
+        total: Gesamtdauer der Anfrage in Sekunden
+
+    Returns:
+        str: Headerwert oder "" ohne Messungen
+    """
+    stages = {}
+    for stage, seconds, description in _request_timings.get() or ():
+        entry = stages.setdefault(stage, [0.0, 0, description])
+        entry[0] += seconds
+        entry[1] += 1
+    if total is not None:
+        stages['total'] = [total, 1, None]
+
+    parts = []
+    for stage, (seconds, count, description) in stages.items():
+        if count > 1:
+            description = f"{count}x" if not description else f"{description} ({count}x)"
+        part = f"{stage};dur={seconds * 1000:.1f}"
+        if description:
+            part += f';desc="{description.translate(_TIMING_DESCRIPTION_FORBIDDEN)}"'
+        parts.append(part)
+    return ', '.join(parts)
+
+
+def render():
+    """
+    Erzeugt die Metriken im Textformat von Prometheus
+
+    Returns:
+        tuple: (Inhalt als bytes, Content-Type)
+    """
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def record_error(error_type):
+    """Zählt einen Fehler der angegebenen Art (z.B. "ai_provider")"""
+    ERRORS.labels(error_type).inc()
+
+
+def record_response(request, response):
+    """
+    Zählt empfangene und gesendete Bytes sowie Fehlerantworten
+
+    Gestreamte Antworten werden beim Senden gezählt; Textfragmente werden
+    dabei einmalig als UTF-8 kodiert, wie es Werkzeug ohnehin tun würde.
+
+    Args:
+        request: Flask-Request
+        response: Flask-Response
+
+    Returns:
+        Response: Dieselbe Antwort
+    """
+    BYTES_RECEIVED.inc(request.content_length or 0)
+    if response.status_code >= 400:
+        ERRORS.labels(f'http_{response.status_code}').inc()
+
+    length = response.calculate_content_length()
+    if length is not None:
+        BYTES_SENT.inc(length)
+    elif response.is_streamed and not response.direct_passthrough:
+        response.response = _count_sent(response.response)
+    return response
+
+
+def _count_sent(chunks):
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        BYTES_SENT.inc(len(chunk))
+        yield chunk
+
+
+def record_asgi_response(request, response):
+    """
+    Wie record_response, für Anfragen des ASGI-Servers (asgi.py)
+
+    Args:
+        request: Starlette-Request
+        response: Starlette-Response
+
+    Returns:
+        Response: Dieselbe Antwort
+    """
+    length = request.headers.get('content-length', '')
+    BYTES_RECEIVED.inc(int(length) if length.isdigit() else 0)
+    if response.status_code >= 400:
+        ERRORS.labels(f'http_{response.status_code}').inc()
+
+    if hasattr(response, 'body_iterator'):
+        response.body_iterator = _count_sent_async(response.body_iterator)
+    else:
+        BYTES_SENT.inc(len(response.body))
+    return response
+
+
+async def _count_sent_async(chunks):
+    async for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        BYTES_SENT.inc(len(chunk))
+        yield chunk
+
+
+def tandoor_operation(base_url, method, url):
+    """
+    Beschreibt eine Tandoor-Anfrage für das Label "operation"
+
+    IDs im Pfad werden ersetzt, damit die Anzahl der Label-Werte begrenzt
+    bleibt, z.B. "GET /api/recipe/{id}/".
+
+    Args:
+        base_url: Basis-URL des Clients
+        method: HTTP-Methode
+        url: Vollständige URL der Anfrage
+    """
+    path = url[len(base_url):] if url.startswith(base_url) else urlsplit(url).path
+    path = path.split('?', 1)[0] or '/'
+    segments = ['{id}' if segment.isdigit() else segment for segment in path.split('/')]
+    return f"{method} {'/'.join(segments)}"
+
+
+def record_tandoor_response(base_url, response):
+    """
+    Erfasst Dauer und ggf. Fehler einer Antwort der Tandoor-API
+
+    Args:
+        base_url: Basis-URL des Clients
+        response: requests.Response (elapsed: Zeit bis zum Eintreffen der Header)
+            oder gelesene httpx.Response
+    """
+    observe_stage(
+        TANDOOR_REQUEST_DURATION.labels(tandoor_operation(base_url, response.request.method, str(response.url))),
+        'tandoor',
+        response.elapsed.total_seconds()
+    )
+    if response.status_code >= 400:
+        ERRORS.labels(f'tandoor_{response.status_code}').inc()
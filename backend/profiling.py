@@ -0,0 +1,247 @@
+"""
+Stichprobenartiges Profiling einzelner Anfragen
+
+Über /api/admin/profiling kann ein Administrator für eine begrenzte Zeit
+einen Anteil der Anfragen profilieren lassen. Die Einstellung liegt in einer
+SQLite-Datenbank und gilt damit für alle gunicorn-Worker.
+
+Für eine ausgewählte Anfrage liest ein Hintergrund-Thread in festen
+Abständen den Stack des bearbeitenden Threads (sys._current_frames). Das
+kostet die Anfrage selbst nichts, solange sie nicht ausgewählt ist, und
+sonst nur die Unterbrechungen durch den GIL. Das Ergebnis wird als
+"folded stacks" gespeichert, das Eingabeformat von flamegraph.pl und
+speedscope. Arbeit in anderen Threads (z.B. parallele Vorverarbeitung
+mehrerer Seiten oder Analyse-Jobs) ist darin nicht enthalten.
+"""
+
+import os
+import re
+import sys
+import time
+import uuid
+import random
+import logging
+import threading
+from collections import Counter
+from decouple import config
+
+from sqlite_store import SQLiteStore
+
+# Konfiguration aus Umgebungsvariablen
+ADMIN_TOKEN = config('ADMIN_TOKEN', default='')
+PROFILE_DIR = config('PROFILE_DIR', default=os.path.join('data', 'profiles'))
+PROFILE_DB = config('PROFILE_DB', default=os.path.join('data', 'profiling.sqlite3'))
+PROFILE_INTERVAL = config('PROFILE_INTERVAL', default=0.005, cast=float)
+PROFILE_MAX_FILES = config('PROFILE_MAX_FILES', default=200, cast=int)
+
+# Standard- und Höchstdauer einer Profiling-Phase in Sekunden
+DEFAULT_DURATION = 600
+MAX_DURATION = 24 * 3600
+
+# Wie lange ein Worker die Einstellung zwischenspeichert
+SETTINGS_TTL = 1.0
+
+# Dateiendung der gespeicherten Profile
+PROFILE_SUFFIX = '.folded'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiling_settings (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    sample_rate REAL NOT NULL,
+    until REAL NOT NULL
+);
+"""
+
+# Logger
+logger = logging.getLogger('profiling')
+
+
+def fold_stack(frame):
+    """
+    Beschreibt einen Stack als eine Zeile im Format "folded stacks"
+
+    Args:
+        frame: Oberster Frame des Threads
+
+    Returns:
+        str: Funktionen von außen nach innen, getrennt durch ";"
+    """
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler:
+    """Liest in festen Abständen den Stack eines Threads"""
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        """
+        Args:
+            thread_id: threading.get_ident() des zu beobachtenden Threads
+            interval: Abstand der Stichproben in Sekunden
+        """
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = Counter()
+        self.duration = None
+        self._started = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Beendet die Stichproben
+
+        Returns:
+            Counter: Anzahl Stichproben je Stack
+        """
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self._started
+        return self.counts
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.counts[fold_stack(frame)] += 1
+            del frame
+
+
+class Profiler:
+    """Schalter für das Profiling und Ablage der Profile"""
+
+    def __init__(self, db_path=PROFILE_DB, directory=PROFILE_DIR, interval=PROFILE_INTERVAL,
+                 max_files=PROFILE_MAX_FILES):
+        """
+        Args:
+            db_path: Pfad zur gemeinsamen Datenbank mit der Einstellung
+            directory: Verzeichnis der gespeicherten Profile
+            interval: Abstand der Stichproben in Sekunden
+            max_files: Höchstzahl gespeicherter Profile (älteste fallen weg)
+        """
+        self.directory = directory
+        self.interval = interval
+        self.max_files = max_files
+        self.store = SQLiteStore(db_path, SCHEMA)
+        self._cached = None
+        self._cached_at = 0.0
+        self._lock = threading.Lock()
+
+    def configure(self, sample_rate, duration=DEFAULT_DURATION):
+        """
+        Aktiviert oder beendet das Profiling für alle Worker
+
+        Args:
+            sample_rate: Anteil der zu profilierenden Anfragen (0 bis 1, 0 beendet)
+            duration: Sekunden, nach denen das Profiling endet
+
+        Returns:
+            dict: Die neue Einstellung
+        """
+        until = time.time() + duration if sample_rate > 0 else 0.0
+        with self.store.transaction(immediate=True) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO profiling_settings (id, sample_rate, until) VALUES (1, ?, ?)",
+                (sample_rate, until)
+            )
+        with self._lock:
+            self._cached = None
+        logger.info(f"Profiling: Anteil {sample_rate}, bis {time.ctime(until) if until else '-'}")
+        return self.settings()
+
+    def settings(self):
+        """Aktuelle Einstellung (sample_rate ist 0, wenn abgelaufen)"""
+        row = self.store.connection().execute(
+            "SELECT sample_rate, until FROM profiling_settings WHERE id = 1"
+        ).fetchone()
+        if row is None or row['until'] <= time.time():
+            return {"sample_rate": 0.0, "until": None}
+        return {"sample_rate": row['sample_rate'], "until": row['until']}
+
+    def sample_rate(self):
+        """Anteil der zu profilierenden Anfragen, pro Worker kurz zwischengespeichert"""
+        now = time.monotonic()
+        with self._lock:
+            if self._cached is not None and now - self._cached_at < SETTINGS_TTL:
+                return self._cached
+        try:
+            rate = self.settings()['sample_rate']
+        except Exception as e:
+            logger.warning(f"Profiling-Einstellung konnte nicht gelesen werden: {str(e)}")
+            rate = 0.0
+        with self._lock:
+            self._cached, self._cached_at = rate, now
+        return rate
+
+    def maybe_start(self):
+        """
+        Startet für die aktuelle Anfrage ggf. einen StackSampler
+
+        Returns:
+            StackSampler: Der laufende Sampler oder None
+        """
+        rate = self.sample_rate()
+        if rate <= 0 or random.random() >= rate:
+            return None
+        return StackSampler(threading.get_ident(), self.interval).start()
+
+    def save(self, sampler, method, path):
+        """
+        Beendet einen Sampler und speichert das Profil
+
+        Args:
+            sampler: Laufender StackSampler
+            method: HTTP-Methode der Anfrage
+            path: Pfad der Anfrage
+
+        Returns:
+            str: Dateiname des Profils oder None ohne Stichproben
+        """
+        counts = sampler.stop()
+        if not counts:
+            return None
+
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', path).strip('_') or 'root'
+        name = (
+            f"{time.strftime('%Y%m%d-%H%M%S')}-{sampler.duration * 1000:.0f}ms-"
+            f"{method}-{slug}-{uuid.uuid4().hex[:8]}{PROFILE_SUFFIX}"
+        )
+        os.makedirs(self.directory, exist_ok=True)
+        lines = ''.join(f"{stack} {count}\n" for stack, count in counts.most_common())
+        tmp_path = os.path.join(self.directory, f".{name}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as profile_file:
+            profile_file.write(lines)
+        os.replace(tmp_path, os.path.join(self.directory, name))
+        self._prune()
+        return name
+
+    def profiles(self):
+        """Namen der gespeicherten Profile, neueste zuerst"""
+        try:
+            names = [name for name in os.listdir(self.directory) if name.endswith(PROFILE_SUFFIX)]
+        except FileNotFoundError:
+            return []
+        return sorted(names, reverse=True)
+
+    def path_of(self, name):
+        """Pfad eines gespeicherten Profils oder None, falls es nicht existiert"""
+        if name not in self.profiles():
+            return None
+        return os.path.join(self.directory, name)
+
+    def _prune(self):
+        """Entfernt die ältesten Profile über max_files"""
+        for name in self.profiles()[self.max_files:]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
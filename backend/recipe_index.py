@@ -0,0 +1,341 @@
+"""
+Erkennung doppelter Rezepte vor dem Import
+
+Wird eine bereits importierte Karte erneut fotografiert, entstünde in
+Tandoor ein zweites Rezept. Der Index hält für jedes bekannte Rezept den
+normalisierten Namen und eine MinHash-Signatur der Zutaten (normalisierte
+Lebensmittelnamen). Kandidaten werden über den Namen und über LSH-Bänder
+der Signatur per Indexzugriff gefunden, ohne Suche in Tandoor.
+
+Der Index wird aus der Rezeptliste von Tandoor befüllt (dort nur Namen, die
+Liste enthält keine Zutaten) und nach jedem erfolgreichen Import um das
+neue Rezept samt Signatur ergänzt. Geladen wird nach der Anmeldung und,
+sobald die Liste veraltet ist, im Hintergrund; die Prüfung beim Import
+liest nur die lokale Datenbank. Wie der Tandoor-Index gilt er je Instanz
+und Benutzer.
+"""
+
+import time
+import array
+import random
+import hashlib
+import logging
+import threading
+from decouple import config
+
+from sqlite_store import SQLiteStore
+from ingredient_parser import parse_ingredients
+from tandoor_index import TANDOOR_INDEX_DB, TANDOOR_INDEX_PAGE_SIZE, TokenScopes, normalize_name
+
+# Konfiguration aus Umgebungsvariablen
+TANDOOR_DUPLICATE_CHECK = config('TANDOOR_DUPLICATE_CHECK', default=True, cast=bool)
+TANDOOR_DUPLICATE_THRESHOLD = config('TANDOOR_DUPLICATE_THRESHOLD', default=0.8, cast=float)
+TANDOOR_RECIPE_INDEX_TTL = config('TANDOOR_RECIPE_INDEX_TTL', default=3600, cast=int)
+
+# MinHash mit 64 Permutationen, für LSH in 16 Bänder zu je 4 Werten geteilt
+MINHASH_PERMUTATIONS = 64
+MINHASH_BANDS = 16
+MINHASH_PRIME = (1 << 61) - 1
+_random = random.Random(0x7A4D00)
+PERMUTATIONS = [
+    (_random.randrange(1, MINHASH_PRIME), _random.randrange(0, MINHASH_PRIME))
+    for _ in range(MINHASH_PERMUTATIONS)
+]
+
+# Bei gleichem Namen genügt eine geringere Ähnlichkeit der Zutaten
+NAME_MATCH_THRESHOLD = 0.5
+
+# Ohne gleichen Namen erst ab so vielen Zutaten vergleichen (kleine Mengen
+# stimmen zu leicht zufällig überein)
+MIN_INGREDIENTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tandoor_recipes (
+    scope TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    normalized TEXT NOT NULL,
+    signature BLOB,
+    ingredient_count INTEGER NOT NULL DEFAULT 0,
+    added_at REAL,
+    PRIMARY KEY (scope, id)
+);
+CREATE INDEX IF NOT EXISTS idx_tandoor_recipes_normalized ON tandoor_recipes (scope, normalized);
+CREATE TABLE IF NOT EXISTS tandoor_recipe_bands (
+    scope TEXT NOT NULL,
+    band TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    PRIMARY KEY (scope, band, id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS tandoor_recipe_sync (
+    scope TEXT PRIMARY KEY,
+    synced_at REAL NOT NULL
+);
+"""
+
+# Logger
+logger = logging.getLogger('tandoor_api')
+
+
+def ingredient_set(recipe_json_ld):
+    """
+    Normalisierte Lebensmittelnamen eines JSON-LD-Rezepts
+
+    Returns:
+        set: z.B. {"mehl", "zucker", "butter"}
+    """
+    lines = recipe_json_ld.get('recipeIngredient') or []
+    if isinstance(lines, str):
+        lines = [lines]
+    lines = [line for line in lines if isinstance(line, str) and line.strip()]
+    return {name for name in (normalize_name(ingredient.food) for ingredient in parse_ingredients(lines)) if name}
+
+
+def minhash(elements):
+    """
+    MinHash-Signatur einer Menge
+
+    Args:
+        elements: Menge von Strings
+
+    Returns:
+        tuple: MINHASH_PERMUTATIONS Werte oder None bei leerer Menge
+    """
+    hashes = [
+        int.from_bytes(hashlib.blake2b(element.encode('utf-8'), digest_size=8).digest(), 'big')
+        for element in elements
+    ]
+    if not hashes:
+        return None
+    return tuple(min((a * value + b) % MINHASH_PRIME for value in hashes) for a, b in PERMUTATIONS)
+
+
+def similarity(signature, other):
+    """Geschätzte Jaccard-Ähnlichkeit zweier Signaturen"""
+    return sum(1 for a, b in zip(signature, other) if a == b) / len(signature)
+
+
+def bands(signature):
+    """LSH-Schlüssel der Signatur; ähnliche Mengen teilen mindestens einen"""
+    rows = len(signature) // MINHASH_BANDS
+    return [
+        f"{band}:" + hashlib.blake2b(
+            array.array('Q', signature[band * rows:(band + 1) * rows]).tobytes(), digest_size=8
+        ).hexdigest()
+        for band in range(MINHASH_BANDS)
+    ]
+
+
+class RecipeIndex:
+    """Index der Rezepte einer Tandoor-Instanz zur Erkennung von Duplikaten"""
+
+    def __init__(self, db_path=TANDOOR_INDEX_DB, ttl=TANDOOR_RECIPE_INDEX_TTL,
+                 threshold=TANDOOR_DUPLICATE_THRESHOLD, page_size=TANDOOR_INDEX_PAGE_SIZE):
+        """
+        Args:
+            db_path: Pfad zur gemeinsamen Index-Datenbank
+            ttl: Abstand, in dem die Rezeptliste neu geladen wird, in Sekunden
+            threshold: Mindestähnlichkeit der Zutaten (0-1) für ein Duplikat
+                mit anderem Namen
+            page_size: Rezepte pro Seite beim Laden
+        """
+        self.store = SQLiteStore(db_path, SCHEMA)
+        self.scopes = TokenScopes(db_path)
+        self.ttl = ttl
+        self.threshold = threshold
+        self.page_size = page_size
+        self._sync_locks = {}
+        self._lock = threading.Lock()
+        self._purged_at = 0.0
+
+    def sync(self, client, auth_token, wait=True):
+        """
+        Lädt die Rezeptliste, wenn sie fehlt oder veraltet ist
+
+        Bereits bekannte Signaturen bleiben erhalten, in Tandoor gelöschte
+        Rezepte werden entfernt.
+
+        Args:
+            client: TandoorClient der Instanz
+            auth_token: Token für die Rezeptliste
+            wait: Auf eine laufende Aktualisierung warten
+
+        Returns:
+            bool: True, wenn der Index auf dem aktuellen Stand ist
+        """
+        scope = self.scopes.scope(client.base_url, auth_token)
+        lock = self._sync_lock(scope)
+        if not lock.acquire(blocking=wait):
+            return False
+
+        try:
+            if self._purged_at <= time.time() - self.ttl:
+                self._purged_at = time.time()
+                self.purge()
+            if self._fresh(scope):
+                return True
+
+            started = time.time()
+            recipes = []
+            for page in client.iter_pages('/api/recipe/', auth_token, params={'page_size': self.page_size}):
+                recipes.extend(item for item in page if isinstance(item, dict) and 'id' in item and item.get('name'))
+
+            with self.store.transaction(immediate=True) as conn:
+                conn.execute("CREATE TEMP TABLE IF NOT EXISTS seen_recipes (id INTEGER PRIMARY KEY)")
+                conn.execute("DELETE FROM seen_recipes")
+                conn.executemany("INSERT OR IGNORE INTO seen_recipes (id) VALUES (?)", [(item['id'],) for item in recipes])
+                # Während des Ladens importierte Rezepte fehlen noch in der Liste
+                conn.execute(
+                    "DELETE FROM tandoor_recipes WHERE scope = ? AND id NOT IN (SELECT id FROM seen_recipes) "
+                    "AND (added_at IS NULL OR added_at < ?)",
+                    (scope, started)
+                )
+                conn.execute(
+                    "DELETE FROM tandoor_recipe_bands WHERE scope = ? "
+                    "AND id NOT IN (SELECT id FROM tandoor_recipes WHERE scope = ?)",
+                    (scope, scope)
+                )
+                conn.executemany(
+                    "INSERT INTO tandoor_recipes (scope, id, name, normalized) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (scope, id) DO UPDATE SET name = excluded.name, normalized = excluded.normalized",
+                    [(scope, item['id'], item['name'], normalize_name(item['name'])) for item in recipes]
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO tandoor_recipe_sync (scope, synced_at) VALUES (?, ?)",
+                    (scope, time.time())
+                )
+            logger.info(f"Rezept-Index: {len(recipes)} Rezepte geladen")
+            return True
+        except Exception as e:
+            logger.warning(f"Rezept-Index konnte nicht geladen werden: {str(e)}")
+            return False
+        finally:
+            lock.release()
+
+    def prefetch(self, client, auth_token):
+        """Lädt die Rezeptliste im Hintergrund, z.B. direkt nach der Anmeldung"""
+        thread = threading.Thread(
+            target=self.sync, args=(client, auth_token), kwargs={'wait': False}, name='recipe-index', daemon=True
+        )
+        thread.start()
+        return thread
+
+    def purge(self):
+        """Löscht die Rezepte von Scopes, denen kein genutztes Token mehr zugeordnet ist"""
+        self.scopes.purge()
+        with self.store.transaction(immediate=True) as conn:
+            for table in ('tandoor_recipes', 'tandoor_recipe_bands', 'tandoor_recipe_sync'):
+                conn.execute(
+                    f"DELETE FROM {table} WHERE scope NOT IN (SELECT DISTINCT scope FROM tandoor_token_scopes)"
+                )
+
+    def _sync_lock(self, scope):
+        with self._lock:
+            return self._sync_locks.setdefault(scope, threading.Lock())
+
+    def _fresh(self, scope):
+        """Prüft, ob die Rezeptliste des Scopes jünger als ttl ist"""
+        row = self.store.connection().execute(
+            "SELECT synced_at FROM tandoor_recipe_sync WHERE scope = ?", (scope,)
+        ).fetchone()
+        return row is not None and row['synced_at'] > time.time() - self.ttl
+
+    def find_duplicate(self, client, auth_token, recipe_json_ld):
+        """
+        Sucht ein bereits vorhandenes Rezept, das dem neuen entspricht
+
+        Als Duplikat gilt ein Rezept mit gleichem normalisiertem Namen, dessen
+        Zutaten (falls bekannt) zu mindestens NAME_MATCH_THRESHOLD
+        übereinstimmen, oder ein Rezept mit anderem Namen, dessen Zutaten zu
+        mindestens threshold übereinstimmen. Gesucht wird nur im lokalen
+        Index; fehlt die Rezeptliste oder ist sie veraltet, wird sie im
+        Hintergrund geladen.
+
+        Args:
+            client: TandoorClient der Instanz
+            auth_token: Token des Imports
+            recipe_json_ld: Zu importierendes Rezept
+
+        Returns:
+            dict: recipe_id, name, recipe_url und similarity (None, wenn nur
+                der Name bekannt ist) des Duplikats oder None
+        """
+        try:
+            scope = self.scopes.scope(client.base_url, auth_token)
+            if not self._fresh(scope) and not self._sync_lock(scope).locked():
+                self.prefetch(client, auth_token)
+            normalized = normalize_name(recipe_json_ld.get('name') or '')
+            ingredients = ingredient_set(recipe_json_ld)
+            signature = minhash(ingredients)
+
+            keys = bands(signature) if signature else []
+            placeholders = ','.join('?' * len(keys))
+            candidates = self.store.connection().execute(
+                "SELECT id, name, normalized, signature, ingredient_count FROM tandoor_recipes "
+                "WHERE scope = ? AND normalized = ?"
+                + (" UNION SELECT r.id, r.name, r.normalized, r.signature, r.ingredient_count "
+                   "FROM tandoor_recipe_bands b JOIN tandoor_recipes r ON r.scope = b.scope AND r.id = b.id "
+                   f"WHERE b.scope = ? AND b.band IN ({placeholders})" if keys else ""),
+                (scope, normalized, *((scope, *keys) if keys else ()))
+            ).fetchall()
+
+            best = None
+            for candidate in candidates:
+                score = None
+                if signature and candidate['signature']:
+                    score = similarity(signature, array.array('Q', candidate['signature']))
+                if candidate['normalized'] == normalized and normalized:
+                    if score is not None and score < NAME_MATCH_THRESHOLD:
+                        continue
+                    rank = (1, score if score is not None else 0.0)
+                elif (score is not None and score >= self.threshold
+                      and min(len(ingredients), candidate['ingredient_count']) >= MIN_INGREDIENTS):
+                    rank = (0, score)
+                else:
+                    continue
+                if best is None or rank > best[0]:
+                    best = (rank, candidate, score)
+
+            if best is None:
+                return None
+            _, candidate, score = best
+            return {
+                "recipe_id": candidate['id'],
+                "name": candidate['name'],
+                "recipe_url": f"{client.base_url}/view/recipe/{candidate['id']}",
+                "similarity": round(score, 2) if score is not None else None
+            }
+        except Exception as e:
+            logger.warning(f"Duplikatprüfung nicht möglich: {str(e)}")
+            return None
+
+    def add(self, base_url, auth_token, recipe_id, recipe_json_ld):
+        """
+        Nimmt ein gerade importiertes Rezept auf
+
+        Args:
+            base_url: Basis-URL der Instanz
+            auth_token: Token des Imports
+            recipe_id: ID des Rezepts in Tandoor
+            recipe_json_ld: Importierte JSON-LD-Daten
+        """
+        try:
+            scope = self.scopes.scope(base_url, auth_token)
+            name = recipe_json_ld.get('name') or ''
+            ingredients = ingredient_set(recipe_json_ld)
+            signature = minhash(ingredients)
+            with self.store.transaction(immediate=True) as conn:
+                conn.execute("DELETE FROM tandoor_recipe_bands WHERE scope = ? AND id = ?", (scope, recipe_id))
+                conn.execute(
+                    "INSERT OR REPLACE INTO tandoor_recipes (scope, id, name, normalized, signature, ingredient_count, added_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (scope, recipe_id, name, normalize_name(name),
+                     array.array('Q', signature).tobytes() if signature else None, len(ingredients), time.time())
+                )
+                if signature:
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO tandoor_recipe_bands (scope, band, id) VALUES (?, ?, ?)",
+                        [(scope, band, recipe_id) for band in bands(signature)]
+                    )
+        except Exception as e:
+            logger.warning(f"Rezept-Index konnte nicht ergänzt werden: {str(e)}")
@@ -0,0 +1,80 @@
+"""
+SQLite-Hilfsfunktionen
+
+Dieses Modul stellt eine kleine Hülle um SQLite im WAL-Modus bereit. Die
+Datenbankdatei wird von allen gunicorn-Workern gemeinsam genutzt, jede
+Kombination aus Prozess und Thread erhält ihre eigene Verbindung.
+"""
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class SQLiteStore:
+    """Thread- und fork-sichere SQLite-Datenbank mit WAL-Journal"""
+
+    def __init__(self, path, schema, timeout=30.0):
+        """
+        Args:
+            path: Pfad zur Datenbankdatei
+            schema: SQL-Skript, das Tabellen und Indizes anlegt
+            timeout: Wartezeit in Sekunden bei gesperrter Datenbank
+        """
+        self.path = path
+        self.timeout = timeout
+        self._schema = schema
+        self._local = threading.local()
+
+    def _connect(self):
+        """Öffnet eine neue Verbindung und legt das Schema an"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+
+        # isolation_level=None: Transaktionen werden explizit gesteuert
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.timeout,
+            isolation_level=None,
+            check_same_thread=False
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(self._schema)
+        return conn
+
+    def connection(self):
+        """
+        Gibt die Verbindung des aktuellen Threads zurück
+
+        Nach einem fork (z.B. gunicorn --preload) wird eine neue Verbindung
+        geöffnet, da SQLite-Verbindungen nicht über Prozessgrenzen geteilt
+        werden dürfen.
+        """
+        pid = os.getpid()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != pid:
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.pid = pid
+        return conn
+
+    @contextmanager
+    def transaction(self, immediate=False):
+        """
+        Führt den Block in einer Transaktion aus
+
+        Args:
+            immediate: Schreibsperre sofort anfordern (für Read-Modify-Write)
+        """
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
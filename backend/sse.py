@@ -0,0 +1,97 @@
+"""
+Server-Sent Events
+
+Hilfsfunktionen zum Formatieren von SSE-Nachrichten für Streaming-Endpunkte.
+"""
+
+import json
+
+from json_ld_extractor import JsonLdExtractor
+
+# Header für SSE-Antworten; X-Accel-Buffering verhindert Pufferung durch nginx
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+# Kommentarzeile, die Proxies die Verbindung offen halten lässt
+SSE_KEEP_ALIVE = ": keep-alive\n\n"
+
+
+def format_sse(data, event=None, event_id=None):
+    """
+    Formatiert eine SSE-Nachricht
+
+    Args:
+        data: Nutzdaten (str oder JSON-serialisierbares Objekt)
+        event: Optionaler Ereignisname
+        event_id: Optionale Ereignis-ID (für Last-Event-ID)
+
+    Returns:
+        str: Die fertig formatierte Nachricht
+    """
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+
+    payload = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False)
+    for line in payload.split("\n"):
+        lines.append(f"data: {line}")
+
+    return "\n".join(lines) + "\n\n"
+
+
+class AnalysisStream:
+    """
+    Übersetzt die Ereignisse von AIService.stream_images in SSE-Nachrichten
+
+    Die Textfragmente laufen durch einen JsonLdExtractor, sodass jedes Rezept
+    als recipe-Ereignis gesendet wird, sobald sein Codeblock geschlossen ist.
+    Das abschließende result enthält zusätzlich recipes und truncated wie
+    /api/extract-json-ld.
+    """
+
+    def __init__(self):
+        self.extractor = JsonLdExtractor()
+        self._streamed = False
+
+    def format(self, event):
+        """
+        Formatiert ein Ereignis des Analyse-Streams
+
+        Args:
+            event: dict mit type 'token' (text) oder 'result' (result)
+
+        Returns:
+            list: Fertig formatierte SSE-Nachrichten
+        """
+        extractor = self.extractor
+        sent = len(extractor.blocks)
+
+        if event['type'] == 'token':
+            self._streamed = True
+            extractor.feed(event['text'])
+            return [format_sse({'text': event['text']}, event='token')] + self._recipes(sent)
+
+        result = event['result']
+        # Zwischengespeicherte Ergebnisse kommen ohne Textfragmente
+        if not self._streamed and result.get('response'):
+            extractor.feed(result['response'])
+        extractor.finish()
+        messages = self._recipes(sent)
+        messages.append(format_sse(dict(
+            result,
+            recipes=extractor.recipes,
+            truncated=any(block.truncated for block in extractor.blocks)
+        ), event='result'))
+        return messages
+
+    def _recipes(self, sent):
+        """recipe-Ereignisse für alle Blöcke ab Index sent, die Rezepte enthalten"""
+        return [
+            format_sse({'recipes': block.recipes, 'truncated': block.truncated}, event='recipe')
+            for block in self.extractor.blocks[sent:]
+            if block.recipes
+        ]
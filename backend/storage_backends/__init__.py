@@ -0,0 +1 @@
+# Initialisierung des storage_backends Pakets
@@ -0,0 +1,142 @@
+import os
+import re
+from abc import ABC, abstractmethod
+from collections import namedtuple
+
+# Dateiendung je Bildtyp für die Schlüssel der Uploads
+EXTENSIONS = {'image/jpeg': '.jpg', 'image/png': '.png', 'image/gif': '.gif'}
+
+# Schlüssel aus SHA-256 und Dateiendung, z.B. "3f2a....jpg"
+CONTENT_KEY = re.compile(r'^([0-9a-f]{64})\.(jpg|png|gif)$')
+
+# Größe und Änderungszeit eines Uploads (wie os.stat_result)
+UploadStat = namedtuple('UploadStat', ['st_size', 'st_mtime_ns'])
+
+
+class StorageFull(Exception):
+    """Wird ausgelöst, wenn ein Upload die Quote des Speichers sprengen würde"""
+    pass
+
+
+def content_key(sha256, media_type):
+    """
+    Schlüssel eines Uploads aus dem Hash seines Inhalts
+
+    Gleiche Bilder erhalten denselben Schlüssel, sodass Replikate einen
+    bereits abgelegten Upload wiederverwenden statt ihn erneut zu speichern.
+
+    Args:
+        sha256: SHA-256 der Bilddaten (hex)
+        media_type: MIME-Typ des Bildes
+
+    Returns:
+        str: Schlüssel, z.B. "<sha256>.jpg"
+    """
+    return f"{sha256}{EXTENSIONS.get(media_type, '')}"
+
+
+def key_hash(ref):
+    """
+    SHA-256 eines Uploads aus seinem Schlüssel, ohne ihn zu lesen
+
+    Args:
+        ref: Referenz des Uploads (Pfad oder URI)
+
+    Returns:
+        str: Hex-Digest oder None, wenn der Schlüssel kein Inhalts-Hash ist
+    """
+    match = CONTENT_KEY.match(os.path.basename(ref))
+    return match.group(1) if match else None
+
+
+class BaseStorage(ABC):
+    """
+    Basisklasse für die Ablage hochgeladener Bilder
+
+    Ein Upload wird zunächst in einen Puffer geschrieben (create_buffer),
+    geprüft und dann unter seinem Schlüssel übernommen (commit). commit()
+    liefert die Referenz, über die Analyse-Jobs und Provider den Upload
+    später lesen (open), auch in einem anderen Worker.
+    """
+
+    # Ob vorverarbeitete Bilder im Derivat-Cache auf der Platte landen dürfen
+    cache_derivatives = True
+
+    @property
+    @abstractmethod
+    def kind(self):
+        """Name der Speicherart (z.B. "local")"""
+        pass
+
+    @abstractmethod
+    def owns(self, ref):
+        """Prüft, ob eine Referenz zu dieser Speicherart gehört"""
+        pass
+
+    @abstractmethod
+    def create_buffer(self, max_bytes):
+        """
+        Erstellt den Puffer für einen eingehenden Upload
+
+        Args:
+            max_bytes: Höchstgröße des Uploads
+
+        Returns:
+            Beschreibbares, lesbares und positionierbares Dateiobjekt
+        """
+        pass
+
+    @abstractmethod
+    def commit(self, buffer, key, media_type=None):
+        """
+        Übernimmt einen vollständig geschriebenen Puffer unter einem Schlüssel
+
+        Args:
+            buffer: Puffer aus create_buffer()
+            key: Schlüssel des Uploads (siehe content_key)
+            media_type: MIME-Typ des Bildes
+
+        Returns:
+            str: Referenz des Uploads
+
+        Raises:
+            StorageFull: Wenn kein Platz für den Upload ist
+        """
+        pass
+
+    @abstractmethod
+    def discard(self, buffer):
+        """Verwirft einen nicht übernommenen Puffer"""
+        pass
+
+    @abstractmethod
+    def open(self, ref):
+        """
+        Öffnet einen Upload zum Lesen
+
+        Returns:
+            Lesbares und positionierbares Dateiobjekt
+
+        Raises:
+            FileNotFoundError: Wenn der Upload nicht (mehr) existiert
+        """
+        pass
+
+    @abstractmethod
+    def stat(self, ref):
+        """
+        Größe und Änderungszeit eines Uploads
+
+        Raises:
+            FileNotFoundError: Wenn der Upload nicht (mehr) existiert
+        """
+        pass
+
+    @abstractmethod
+    def delete(self, ref):
+        """Entfernt einen Upload (ohne Fehler, wenn er nicht existiert)"""
+        pass
+
+    def close(self):
+        """Gibt Verbindungen frei (falls vorhanden)"""
+        pass
@@ -0,0 +1,67 @@
+import os
+import time
+import uuid
+
+from .base_storage import BaseStorage
+
+# Endung der Dateien, die gerade empfangen werden
+PARTIAL_SUFFIX = '.part'
+
+
+class LocalStorage(BaseStorage):
+    """
+    Uploads im Upload-Ordner
+
+    Eingehende Daten landen in einer .part-Datei im selben Ordner, commit()
+    benennt sie nur um. Referenz ist der absolute Pfad der Datei.
+    """
+
+    def __init__(self, directory='uploads'):
+        """
+        Args:
+            directory: Upload-Ordner
+        """
+        self.directory = directory
+
+    @property
+    def kind(self):
+        return 'local'
+
+    def owns(self, ref):
+        return '://' not in ref
+
+    def create_buffer(self, max_bytes):
+        os.makedirs(self.directory, exist_ok=True)
+        return open(os.path.join(self.directory, f".{uuid.uuid4().hex}{PARTIAL_SUFFIX}"), 'w+b')
+
+    def commit(self, buffer, key, media_type=None):
+        buffer.close()
+        path = os.path.join(self.directory, key)
+        os.replace(buffer.name, path)
+        return os.path.abspath(path)
+
+    def discard(self, buffer):
+        buffer.close()
+        try:
+            os.remove(buffer.name)
+        except FileNotFoundError:
+            pass
+
+    def open(self, ref):
+        """Öffnet die Datei und setzt ihre Zugriffszeit für die LRU-Verdrängung"""
+        upload = open(ref, 'rb')
+        try:
+            os.utime(upload.fileno(), ns=(time.time_ns(), os.fstat(upload.fileno()).st_mtime_ns))
+        except OSError:
+            # z.B. schreibgeschützte Datei; die Verdrängung nutzt dann die Änderungszeit
+            pass
+        return upload
+
+    def stat(self, ref):
+        return os.stat(ref)
+
+    def delete(self, ref):
+        try:
+            os.remove(ref)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,152 @@
+import time
+import tempfile
+import threading
+from io import BytesIO
+from collections import OrderedDict
+from decouple import config
+
+import metrics
+from .base_storage import BaseStorage, StorageFull, UploadStat
+
+# Konfiguration aus Umgebungsvariablen
+UPLOAD_MEMORY_QUOTA_BYTES = config('UPLOAD_MEMORY_QUOTA_BYTES', default=256 * 1024 * 1024, cast=int)
+UPLOAD_MIN_AGE = config('UPLOAD_MIN_AGE', default=300, cast=int)
+
+# Präfix der Referenzen
+SCHEME = 'memory://'
+
+
+class MemoryStorage(BaseStorage):
+    """
+    Uploads im Arbeitsspeicher dieses Prozesses, nach letztem Zugriff sortiert
+
+    Der Puffer ist ein SpooledTemporaryFile, dessen Grenze über der
+    Höchstgröße eines Uploads liegt, sodass er nie auf die Platte ausweicht.
+    Auch Derivate dieser Uploads werden nicht auf der Platte zwischengespeichert.
+    """
+
+    cache_derivatives = False
+
+    def __init__(self, max_bytes=UPLOAD_MEMORY_QUOTA_BYTES, min_age=UPLOAD_MIN_AGE):
+        """
+        Args:
+            max_bytes: Höchstumfang aller Uploads (0: unbegrenzt)
+            min_age: Sekunden nach dem letzten Zugriff, in denen ein Upload
+                nicht verdrängt wird
+        """
+        self.max_bytes = max_bytes
+        self.min_age = min_age
+        self.total = 0
+        # Referenz -> [Daten, Änderungszeit in ns, letzter Zugriff]
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def kind(self):
+        return 'memory'
+
+    def owns(self, ref):
+        return ref.startswith(SCHEME)
+
+    def __contains__(self, ref):
+        return ref in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def create_buffer(self, max_bytes):
+        return tempfile.SpooledTemporaryFile(max_size=max_bytes + 1)
+
+    def commit(self, buffer, key, media_type=None):
+        buffer.seek(0)
+        try:
+            return self.put(key, buffer.read())
+        finally:
+            buffer.close()
+
+    def discard(self, buffer):
+        buffer.close()
+
+    def put(self, key, data):
+        """
+        Legt einen Upload ab und verdrängt bei Bedarf die ältesten
+
+        Returns:
+            str: Referenz des Uploads
+
+        Raises:
+            StorageFull: Wenn auch nach dem Verdrängen kein Platz ist
+        """
+        ref = f"{SCHEME}{key}"
+        now = time.time()
+        with self._lock:
+            self._remove(ref)
+            if self.max_bytes:
+                self._evict(self.max_bytes - len(data), now, 'quota')
+                if self.total + len(data) > self.max_bytes:
+                    raise StorageFull("Speicher für Uploads ist voll")
+            self._entries[ref] = [data, time.time_ns(), now]
+            self.total += len(data)
+            metrics.UPLOAD_MEMORY_BYTES.inc(len(data))
+            metrics.UPLOAD_MEMORY_FILES.inc()
+        return ref
+
+    def open(self, ref):
+        with self._lock:
+            entry = self._entries.get(ref)
+            if entry is None:
+                raise FileNotFoundError(ref)
+            entry[2] = time.time()
+            self._entries.move_to_end(ref)
+        return BytesIO(entry[0])
+
+    def stat(self, ref):
+        entry = self._entries.get(ref)
+        if entry is None:
+            raise FileNotFoundError(ref)
+        return UploadStat(len(entry[0]), entry[1])
+
+    def delete(self, ref):
+        with self._lock:
+            self._remove(ref)
+
+    def sweep(self, ttl, now=None):
+        """
+        Entfernt Uploads, die länger als ttl Sekunden nicht gelesen wurden
+
+        Returns:
+            tuple: (Anzahl, Umfang in Bytes) der verbleibenden Uploads
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            if ttl:
+                expired = [ref for ref, entry in self._entries.items() if now - entry[2] > ttl]
+                for ref in expired:
+                    metrics.UPLOAD_EVICTIONS.labels(self.kind, 'ttl').inc()
+                    metrics.UPLOAD_EVICTED_BYTES.labels(self.kind, 'ttl').inc(len(self._entries[ref][0]))
+                    self._remove(ref)
+            return len(self._entries), self.total
+
+    def _evict(self, limit, now, reason):
+        """Verdrängt die am längsten nicht gelesenen Uploads, bis höchstens limit Bytes belegt sind"""
+        for ref in list(self._entries):
+            if self.total <= limit:
+                break
+            data, _, accessed = self._entries[ref]
+            if now - accessed < self.min_age:
+                # Neuere Einträge wurden erst recht kürzlich gelesen
+                break
+            metrics.UPLOAD_EVICTIONS.labels(self.kind, reason).inc()
+            metrics.UPLOAD_EVICTED_BYTES.labels(self.kind, reason).inc(len(data))
+            self._remove(ref)
+
+    def _remove(self, ref):
+        entry = self._entries.pop(ref, None)
+        if entry is not None:
+            self.total -= len(entry[0])
+            metrics.UPLOAD_MEMORY_BYTES.dec(len(entry[0]))
+            metrics.UPLOAD_MEMORY_FILES.dec()
+
+
+# Uploads im Arbeitsspeicher dieses Prozesses
+memory_storage = MemoryStorage()
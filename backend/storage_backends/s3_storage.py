@@ -0,0 +1,158 @@
+import os
+import tempfile
+import threading
+from decouple import config
+
+from .base_storage import BaseStorage, UploadStat
+
+try:
+    import boto3
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import ClientError
+except ImportError:  # pragma: no cover - nur ohne boto3 installiert
+    boto3 = None
+
+# Konfiguration aus Umgebungsvariablen
+S3_BUCKET = config('S3_BUCKET', default='')
+S3_PREFIX = config('S3_PREFIX', default='uploads/')
+# Für MinIO, Ceph oder andere S3-kompatible Dienste, z.B. http://minio:9000
+S3_ENDPOINT_URL = config('S3_ENDPOINT_URL', default='') or None
+S3_REGION = config('S3_REGION', default='') or None
+# Bis zu dieser Größe bleiben Puffer und gelesene Uploads im Arbeitsspeicher
+S3_SPOOL_BYTES = config('S3_SPOOL_BYTES', default=8 * 1024 * 1024, cast=int)
+S3_MAX_CONNECTIONS = config('S3_MAX_CONNECTIONS', default=32, cast=int)
+
+# Präfix der Referenzen
+SCHEME = 's3://'
+
+# Fehlercodes, die einen fehlenden Upload bedeuten
+MISSING_CODES = {'404', 'NoSuchKey', 'NotFound'}
+
+
+class S3Storage(BaseStorage):
+    """
+    Uploads in einem S3-kompatiblen Bucket, gemeinsam für alle Replikate
+
+    Eingehende Daten landen in einem SpooledTemporaryFile und werden erst nach
+    der Prüfung hochgeladen (boto3 teilt große Dateien in Multipart-Uploads).
+    Da der Schlüssel der Inhalts-Hash ist, entfällt der Upload, wenn das Objekt
+    bereits existiert. Gelesen wird blockweise in ein SpooledTemporaryFile,
+    sodass große Bilder nicht vollständig im Arbeitsspeicher liegen.
+    Referenz ist s3://<bucket>/<prefix><key>.
+    """
+
+    def __init__(self, bucket=S3_BUCKET, prefix=S3_PREFIX, endpoint_url=S3_ENDPOINT_URL,
+                 region=S3_REGION, spool_bytes=S3_SPOOL_BYTES, max_connections=S3_MAX_CONNECTIONS):
+        """
+        Args:
+            bucket: Name des Buckets
+            prefix: Präfix der Objektschlüssel
+            endpoint_url: Endpunkt eines S3-kompatiblen Dienstes (None: AWS)
+            region: Region des Buckets
+            spool_bytes: Größe, ab der Puffer auf die Platte ausweichen
+            max_connections: Größe des Verbindungspools je Prozess
+
+        Raises:
+            ValueError: Wenn boto3 fehlt oder kein Bucket konfiguriert ist
+        """
+        if boto3 is None:
+            raise ValueError("Für UPLOAD_STORAGE=s3 muss boto3 installiert sein")
+        if not bucket:
+            raise ValueError("S3_BUCKET ist nicht gesetzt")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.endpoint_url = endpoint_url
+        self.region = region
+        self.spool_bytes = spool_bytes
+        self.max_connections = max_connections
+        self._client = None
+        self._client_pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def kind(self):
+        return 's3'
+
+    @property
+    def client(self):
+        """boto3-Client dieses Prozesses (nach fork neu, da Verbindungen nicht geteilt werden dürfen)"""
+        if self._client_pid != os.getpid():
+            with self._lock:
+                if self._client_pid != os.getpid():
+                    self._client = boto3.session.Session().client(
+                        's3',
+                        endpoint_url=self.endpoint_url,
+                        region_name=self.region,
+                        config=BotoConfig(max_pool_connections=self.max_connections,
+                                          retries={'mode': 'standard'})
+                    )
+                    self._client_pid = os.getpid()
+        return self._client
+
+    def owns(self, ref):
+        return ref.startswith(f"{SCHEME}{self.bucket}/")
+
+    def ref(self, key):
+        return f"{SCHEME}{self.bucket}/{self.prefix}{key}"
+
+    def object_key(self, ref):
+        return ref[len(SCHEME) + len(self.bucket) + 1:]
+
+    def create_buffer(self, max_bytes):
+        return tempfile.SpooledTemporaryFile(max_size=self.spool_bytes)
+
+    def commit(self, buffer, key, media_type=None):
+        ref = self.ref(key)
+        try:
+            try:
+                self.client.head_object(Bucket=self.bucket, Key=self.object_key(ref))
+                # Gleicher Inhalt bereits abgelegt (z.B. von einem anderen Replikat)
+                return ref
+            except ClientError as e:
+                if not _missing(e):
+                    raise
+            buffer.seek(0)
+            extra_args = {'ContentType': media_type} if media_type else None
+            self.client.upload_fileobj(buffer, self.bucket, self.object_key(ref), ExtraArgs=extra_args)
+            return ref
+        finally:
+            buffer.close()
+
+    def discard(self, buffer):
+        buffer.close()
+
+    def open(self, ref):
+        upload = tempfile.SpooledTemporaryFile(max_size=self.spool_bytes)
+        try:
+            self.client.download_fileobj(self.bucket, self.object_key(ref), upload)
+        except ClientError as e:
+            upload.close()
+            if _missing(e):
+                raise FileNotFoundError(ref) from e
+            raise
+        upload.seek(0)
+        return upload
+
+    def stat(self, ref):
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self.object_key(ref))
+        except ClientError as e:
+            if _missing(e):
+                raise FileNotFoundError(ref) from e
+            raise
+        return UploadStat(head['ContentLength'], int(head['LastModified'].timestamp() * 1_000_000_000))
+
+    def delete(self, ref):
+        # DeleteObject ist auch für fehlende Objekte erfolgreich
+        self.client.delete_object(Bucket=self.bucket, Key=self.object_key(ref))
+
+    def close(self):
+        if self._client is not None and self._client_pid == os.getpid():
+            self._client.close()
+        self._client = None
+        self._client_pid = None
+
+
+def _missing(error):
+    """Prüft, ob ein ClientError ein fehlendes Objekt meldet"""
+    return error.response.get('Error', {}).get('Code') in MISSING_CODES
@@ -0,0 +1,96 @@
+import threading
+from decouple import config
+
+from .local_storage import LocalStorage
+from .memory_storage import memory_storage
+from .s3_storage import S3Storage
+
+# Konfiguration aus Umgebungsvariablen
+UPLOAD_STORAGE = config('UPLOAD_STORAGE', default='local').strip().lower()
+
+# Speicherarten
+STORAGE_LOCAL = 'local'
+STORAGE_MEMORY = 'memory'
+STORAGE_S3 = 's3'
+
+
+class StorageFactory:
+    """
+    Factory für die Ablage der Uploads
+
+    Pro Prozess gibt es je Speicherart (bzw. Upload-Ordner) genau eine
+    Instanz, damit z.B. der S3-Client und sein Verbindungspool erhalten
+    bleiben. storage_for() findet zu einer Referenz die passende Instanz,
+    sodass Provider und Vorverarbeitung Uploads lesen können, ohne die
+    konfigurierte Speicherart zu kennen.
+    """
+
+    _instances = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get_storage(kind=None, directory='uploads'):
+        """
+        Gibt die Ablage einer Speicherart zurück
+
+        Args:
+            kind: local, memory oder s3 (Standard: UPLOAD_STORAGE)
+            directory: Upload-Ordner (nur für local)
+
+        Returns:
+            BaseStorage: Ablage der Uploads
+
+        Raises:
+            ValueError: Wenn die Speicherart nicht unterstützt wird
+        """
+        kind = (kind or UPLOAD_STORAGE).strip().lower()
+        if kind == STORAGE_MEMORY:
+            return memory_storage
+        if kind not in (STORAGE_LOCAL, STORAGE_S3):
+            raise ValueError(f"Speicherart '{kind}' nicht unterstützt")
+
+        key = (kind, directory if kind == STORAGE_LOCAL else None)
+        storage = StorageFactory._instances.get(key)
+        if storage is None:
+            with StorageFactory._lock:
+                storage = StorageFactory._instances.get(key)
+                if storage is None:
+                    storage = LocalStorage(directory) if kind == STORAGE_LOCAL else S3Storage()
+                    StorageFactory._instances[key] = storage
+        return storage
+
+    @staticmethod
+    def register(storage, directory=None):
+        """Hinterlegt eine eigene Instanz für ihre Speicherart (z.B. für Tests)"""
+        with StorageFactory._lock:
+            StorageFactory._instances[(storage.kind, directory)] = storage
+
+    @staticmethod
+    def storage_for(ref):
+        """
+        Findet die Ablage, zu der eine Referenz gehört
+
+        Args:
+            ref: Referenz aus BaseStorage.commit() oder ein Dateipfad
+
+        Returns:
+            BaseStorage: Ablage, über die der Upload gelesen wird
+        """
+        if memory_storage.owns(ref):
+            return memory_storage
+        for storage in list(StorageFactory._instances.values()):
+            if storage.owns(ref):
+                return storage
+        if ref.startswith('s3://'):
+            # Upload eines anderen Buckets, z.B. nach Änderung von S3_BUCKET
+            bucket = ref[len('s3://'):].split('/', 1)[0]
+            storage = S3Storage(bucket=bucket, prefix='')
+            StorageFactory.register(storage, bucket)
+            return storage
+        return StorageFactory.get_storage(STORAGE_LOCAL)
+
+    @staticmethod
+    def close():
+        """Schließt die Verbindungen aller Ablagen dieses Prozesses"""
+        for storage in list(StorageFactory._instances.values()):
+            storage.close()
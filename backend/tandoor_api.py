@@ -1,148 +1,718 @@
 """
 Tandoor API Integration
 
-Dieses Modul stellt Funktionen zur Interaktion mit der Tandoor-API bereit.
+Dieses Modul stellt einen Client und Funktionen zur Interaktion mit der
+Tandoor-API bereit. Für den asynchronen Betrieb (asgi.py) gibt es mit
+AsyncTandoorClient eine Variante auf Basis von httpx.
 """
 
+import os
+import re
 import json
+import math
+import random
+import asyncio
 import logging
+import threading
+import httpx
 import requests
 from decouple import config
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import metrics
+from ingredient_parser import parse_ingredient, parse_ingredients
+from tandoor_index import TandoorIndex, TANDOOR_INDEX_ENABLED
+from recipe_index import RecipeIndex, TANDOOR_DUPLICATE_CHECK
 
 # Konfiguration aus Umgebungsvariablen
 TANDOOR_API_URL = config('TANDOOR_API_URL', default='https://example.com')
+TANDOOR_CONNECT_TIMEOUT = config('TANDOOR_CONNECT_TIMEOUT', default=5.0, cast=float)
+TANDOOR_READ_TIMEOUT = config('TANDOOR_READ_TIMEOUT', default=30.0, cast=float)
+TANDOOR_MAX_RETRIES = config('TANDOOR_MAX_RETRIES', default=3, cast=int)
+TANDOOR_POOL_SIZE = config('TANDOOR_POOL_SIZE', default=10, cast=int)
+TANDOOR_BACKOFF_FACTOR = config('TANDOOR_BACKOFF_FACTOR', default=0.5, cast=float)
+TANDOOR_BACKOFF_JITTER = config('TANDOOR_BACKOFF_JITTER', default=0.5, cast=float)
+
+# Importweg: "direct" legt das lokal aufbereitete Rezept mit einer Anfrage an,
+# "source" lässt Tandoor das JSON-LD zuerst über recipe-from-source umwandeln
+IMPORT_MODE_DIRECT = 'direct'
+IMPORT_MODE_SOURCE = 'source'
+TANDOOR_IMPORT_MODE = config('TANDOOR_IMPORT_MODE', default=IMPORT_MODE_DIRECT)
+
+# Feldlängen und Vorgaben von /api/recipe/
+MAX_NAME_LENGTH = 128
+MAX_DESCRIPTION_LENGTH = 512
+MAX_KEYWORD_LENGTH = 64
+MAX_NOTE_LENGTH = 256
+MAX_ORIGINAL_TEXT_LENGTH = 512
+MAX_SERVINGS_TEXT_LENGTH = 32
+MAX_URL_LENGTH = 1024
+DEFAULT_SERVINGS = 4
+
+# ISO-8601-Dauer (z.B. PT1H30M, P1DT2H, PT90S) und Portionsangabe ("4 Portionen")
+DURATION_PATTERN = re.compile(
+    r'P(?:(\d+(?:\.\d+)?)D)?(?:T(?:(\d+(?:\.\d+)?)H)?(?:(\d+(?:\.\d+)?)M)?(?:(\d+(?:\.\d+)?)S)?)?$',
+    re.IGNORECASE
+)
+SERVINGS_PATTERN = re.compile(r'(?P<servings>[1-9]\d*)(?:\s*(?:-|–|bis|to)\s*\d+)?(?P<text>\D*)')
+
+# Statuscodes, bei denen eine Anfrage wiederholt wird
+RETRY_STATUS_CODES = (502, 503, 504)
+
+# Statuscodes, nach denen ein nicht idempotentes POST sicher nicht verarbeitet wurde
+CREATE_RETRY_STATUS_CODES = (503,)
 
 # Logger
 logger = logging.getLogger('tandoor_api')
 
-def get_auth_token(username, password):
+class CreateRetry(Retry):
     """
-    Holt ein Authentifizierungstoken von der Tandoor API
+    Wiederholungsstrategie für Pfade, unter denen POST Objekte anlegt
+
+    Lesende Methoden werden wie überall wiederholt. Ein POST könnte nach
+    einem Lesefehler oder 502/504 bereits ausgeführt sein, daher nur nach
+    Verbindungsfehlern und CREATE_RETRY_STATUS_CODES.
+    """
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if method.upper() == 'POST':
+            return status_code in CREATE_RETRY_STATUS_CODES and bool(self.total)
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+class TandoorClient:
+    """
+    Client für die Tandoor-API mit wiederverwendeten Verbindungen
+
+    Alle Anfragen laufen über eine requests-Session mit Verbindungspool und
+    Keep-Alive. Verbindungsaufbau und Antwort sind durch Timeouts begrenzt,
+    sodass ein hängendes Tandoor keine Worker-Threads dauerhaft blockiert.
+    Bei 502/503/504 und Verbindungsfehlern wird mit zufällig gestreutem,
+    exponentiellem Backoff erneut versucht.
+    """
+
+    def __init__(self, base_url=None, connect_timeout=TANDOOR_CONNECT_TIMEOUT,
+                 read_timeout=TANDOOR_READ_TIMEOUT, max_retries=TANDOOR_MAX_RETRIES,
+                 pool_size=TANDOOR_POOL_SIZE, index=None, recipe_index=None):
+        """
+        Args:
+            base_url: Basis-URL der Tandoor-Instanz (Standard: TANDOOR_API_URL)
+            connect_timeout: Timeout für den Verbindungsaufbau in Sekunden
+            read_timeout: Timeout für die Antwort in Sekunden
+            max_retries: Maximale Anzahl Wiederholungen pro Anfrage
+            pool_size: Maximale Anzahl gepoolter Verbindungen
+            index: TandoorIndex, über den Namen vor dem Anlegen durch
+                vorhandene Objekte ersetzt werden (Standard: keiner)
+            recipe_index: RecipeIndex, gegen den Rezepte vor dem Import auf
+                Duplikate geprüft werden (Standard: keine Prüfung)
+        """
+        self.base_url = (TANDOOR_API_URL if base_url is None else base_url).rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.pool_size = pool_size
+        self.index = index
+        self.recipe_index = recipe_index
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        """Session des aktuellen Prozesses (nach einem Fork neu erstellt)"""
+        if self._session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._pid != os.getpid():
+                    self._session = self._create_session()
+                    self._pid = os.getpid()
+        return self._session
+
+    def _create_session(self):
+        """Erstellt die Session mit Verbindungspool und Wiederholungsstrategie"""
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_size,
+            max_retries=self._retry(read=self.max_retries, status_forcelist=RETRY_STATUS_CODES)
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+
+        # Das Anlegen eines Rezepts ist nicht idempotent; die Einschränkung gilt
+        # nur für POST, das seitenweise Laden der Rezeptliste (GET) wird
+        # weiterhin nach Lesefehlern und 502/504 wiederholt
+        session.mount(f"{self.base_url}/api/recipe/", HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_size,
+            max_retries=self._retry(
+                read=self.max_retries,
+                status_forcelist=RETRY_STATUS_CODES,
+                allowed_methods=Retry.DEFAULT_ALLOWED_METHODS | {'PATCH'},
+                retry_class=CreateRetry
+            )
+        ))
+
+        # Dauer jeder Anfrage (auch der Index-Abfragen beim Import) erfassen
+        session.hooks['response'].append(
+            lambda response, *args, **kwargs: metrics.record_tandoor_response(self.base_url, response)
+        )
+        return session
+
+    def _retry(self, read, status_forcelist, allowed_methods=None, retry_class=Retry):
+        return retry_class(
+            total=self.max_retries,
+            connect=self.max_retries,
+            read=read,
+            status=self.max_retries,
+            other=0,
+            status_forcelist=status_forcelist,
+            allowed_methods=allowed_methods,
+            backoff_factor=TANDOOR_BACKOFF_FACTOR,
+            backoff_jitter=TANDOOR_BACKOFF_JITTER,
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+
+    def close(self):
+        """Schließt die Session und ihre Verbindungen"""
+        with self._lock:
+            session, self._session = self._session, None
+        if session is not None and self._pid == os.getpid():
+            session.close()
+
+    def _post(self, path, **kwargs):
+        """Sendet eine POST-Anfrage an einen Pfad der Tandoor-API"""
+        return self.session.post(f"{self.base_url}{path}", timeout=self.timeout, **kwargs)
+
+    def iter_pages(self, path, auth_token, params=None):
+        """
+        Liest eine paginierte Liste der API Seite für Seite
     
-    Args:
-        username: Benutzername für Tandoor
-        password: Passwort für Tandoor
+        Args:
+            path: Pfad des Listen-Endpunkts, z.B. "/api/food/"
+            auth_token: Authentifizierungstoken für die API
+            params: Query-Parameter der ersten Seite (z.B. page_size)
         
-    Returns:
-        str: Das Authentifizierungstoken oder None bei Fehler
-    """
-    if not TANDOOR_API_URL:
-        logger.error("Tandoor API URL nicht konfiguriert")
-        return None
+        Yields:
+            list: Die Objekte einer Seite
+        
+        Raises:
+            requests.HTTPError: Wenn Tandoor eine Seite nicht liefert
+        """
+        url = f"{self.base_url}{path}"
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        while url:
+            response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+            response.raise_for_status()
+            data = response.json()
+            if isinstance(data, list):
+                yield data
+                return
+            yield data.get("results") or []
+            # Die Folgeseite enthält alle Parameter bereits in der URL
+            url = data.get("next")
+            params = None
+
+    def get_auth_token(self, username, password):
+        """
+        Holt ein Authentifizierungstoken von der Tandoor API
     
-    try:
-        logger.info(f"Fordere Auth-Token von {TANDOOR_API_URL}/api-token-auth/ an")
-        response = requests.post(
-            f"{TANDOOR_API_URL}/api-token-auth/",
-            json={"username": username, "password": password}
-        )
+        Args:
+            username: Benutzername für Tandoor
+            password: Passwort für Tandoor
         
-        if response.status_code == 200:
-            token = response.json().get("token")
-            logger.info("Auth-Token erfolgreich erhalten")
-            return token
-        else:
-            logger.error(f"Fehler beim Abrufen des Auth-Tokens: {response.status_code} - {response.text}")
+        Returns:
+            str: Das Authentifizierungstoken oder None bei Fehler
+        """
+        if not self.base_url:
+            logger.error("Tandoor API URL nicht konfiguriert")
             return None
+    
+        try:
+            logger.info(f"Fordere Auth-Token von {self.base_url}/api-token-auth/ an")
+            response = self._post(
+                "/api-token-auth/",
+                json={"username": username, "password": password}
+            )
+        
+            if response.status_code == 200:
+                token = response.json().get("token")
+                logger.info("Auth-Token erfolgreich erhalten")
+                return token
+            else:
+                logger.error(f"Fehler beim Abrufen des Auth-Tokens: {response.status_code} - {response.text}")
+                return None
             
-    except Exception as e:
-        logger.error(f"Fehler beim Abrufen des Auth-Tokens: {str(e)}")
-        return None
+        except Exception as e:
+            logger.error(f"Fehler beim Abrufen des Auth-Tokens: {str(e)}")
+            return None
 
-def import_recipe(recipe_data, auth_token):
-    """
-    Importiert ein Rezept in Tandoor über die API
+    def remember_user(self, auth_token, username):
+        """
+        Ordnet ein Token seinem Benutzer zu
+
+        Die Indizes gelten dann je Benutzer statt je Token und bleiben bei
+        einem neuen Token desselben Benutzers erhalten.
+
+        Args:
+            auth_token: Token nach Anmeldung oder Erneuerung
+            username: Benutzername für Tandoor
+        """
+        for index in (self.index, self.recipe_index):
+            if index is not None:
+                try:
+                    index.scopes.bind(self.base_url, auth_token, username)
+                except Exception as e:
+                    logger.warning(f"Token konnte dem Benutzer nicht zugeordnet werden: {str(e)}")
+
+    def import_recipe(self, recipe_data, auth_token, mode=None, allow_duplicate=False):
+        """
+        Importiert ein Rezept in Tandoor über die API
     
-    Args:
-        recipe_data: JSON-LD Daten des Rezepts
-        auth_token: Authentifizierungstoken für die API
+        Args:
+            recipe_data: JSON-LD Daten des Rezepts
+            auth_token: Authentifizierungstoken für die API
+            mode: "direct" legt das lokal aufbereitete Rezept mit einer Anfrage
+                an, "source" lässt es zuerst von recipe-from-source umwandeln
+                (Standard: TANDOOR_IMPORT_MODE)
+            allow_duplicate: Auch importieren, wenn das Rezept wahrscheinlich
+                schon vorhanden ist
         
-    Returns:
-        dict: Ergebnis des Imports
-    """
-    if not TANDOOR_API_URL:
-        logger.error("Tandoor API URL nicht konfiguriert")
-        return {
-            "success": False,
-            "error": "Tandoor API URL nicht konfiguriert"
-        }
+        Returns:
+            dict: Ergebnis des Imports; bei einem wahrscheinlichen Duplikat
+                mit "status_code": 409 und "duplicate"
+        """
+        error = _check_import(self.base_url, auth_token)
+        if error is not None:
+            return error
     
-    if not auth_token:
-        logger.error("Kein Auth-Token angegeben")
-        return {
-            "success": False,
-            "error": "Kein Auth-Token angegeben"
-        }
-    
-    try:
-        logger.info("Starte Rezept-Import in Tandoor")
+        try:
+            logger.info("Starte Rezept-Import in Tandoor")
         
-        # Parse recipe_data if it's a string
-        if isinstance(recipe_data, str):
-            recipe_data = json.loads(recipe_data)
+            # Parse recipe_data if it's a string
+            if isinstance(recipe_data, str):
+                recipe_data = json.loads(recipe_data)
 
-        logger.info(f"Rezeptdaten: {recipe_data}")
-        
-        # Sende Anfrage an Tandoor API
-        headers = {
-            "Authorization": f"Bearer {auth_token}",
-            "Content-Type": "application/json"
-        }
+            logger.info(f"Rezeptdaten: {recipe_data}")
+
+            if self.recipe_index is not None and not allow_duplicate:
+                duplicate = self.recipe_index.find_duplicate(self, auth_token, recipe_data)
+                if duplicate is not None:
+                    return _duplicate_result(duplicate)
         
-        data = {
-            "data": json.dumps(recipe_data),
-            "url": ""
-        }
+            # Sende Anfrage an Tandoor API
+            headers = _import_headers(auth_token)
+
+            result = None
+            if (mode or TANDOOR_IMPORT_MODE) == IMPORT_MODE_DIRECT:
+                result = self._import_direct(recipe_data, auth_token, headers)
+            if result is None:
+                result = self._import_from_source(recipe_data, auth_token, headers)
+
+            if result["success"] and self.recipe_index is not None:
+                self.recipe_index.add(self.base_url, auth_token, result["recipe_id"], recipe_data)
+            return result
+            
+        except Exception as e:
+            logger.error(f"Fehler beim Rezept-Import: {str(e)}")
+            logger.exception("Fehler beim Rezept-Import", exc_info=True, stack_info=True, extra={"recipe_data": recipe_data})
+            return {
+                "success": False,
+                "error": str(e)
+            }
 
-        logger.debug(f"Importiere Rezept in Tandoor: {data}")
+    def _import_direct(self, recipe_data, auth_token, headers):
+        """
+        Legt das lokal aufbereitete Rezept mit einer Anfrage an
+
+        Returns:
+            dict: Ergebnis des Imports oder None, wenn das Rezept lokal nicht
+                aufbereitet werden konnte oder Tandoor es als ungültig
+                abgelehnt hat (dann folgt der Weg über recipe-from-source)
+        """
+        tandoor_data = _prepare_direct(recipe_data)
+        if tandoor_data is None:
+            return None
+
+        result = self._create_recipe(tandoor_data, auth_token, headers)
+        if result.get("status_code") == 400:
+            logger.warning("Tandoor hat das aufbereitete Rezept abgelehnt, nutze recipe-from-source")
+            return None
+        return dict(result, mode=IMPORT_MODE_DIRECT)
+
+    def _import_from_source(self, recipe_data, auth_token, headers):
+        """Lässt Tandoor das JSON-LD umwandeln und legt das Ergebnis an"""
+        data = _source_payload(recipe_data)
         
-        logger.info(f"Sende Anfrage an Tandoor API: {TANDOOR_API_URL}/api/recipe-from-source/")
-        recipe_response = requests.post(
-            f"{TANDOOR_API_URL}/api/recipe-from-source/",
+        logger.info(f"Sende Anfrage an Tandoor API: {self.base_url}/api/recipe-from-source/")
+        recipe_response = self._post(
+            "/api/recipe-from-source/",
             json=data,
             headers=headers
         )
     
         if recipe_response.status_code in [200, 201]:
             logger.debug(f"{recipe_response.status_code}: Rezept-Import-Antwort: {recipe_response.json()}")
-            logger.info(f"Sende Anfrage an Tandoor API: {TANDOOR_API_URL}/api/recipe/")
-            response = requests.post(
-                f"{TANDOOR_API_URL}/api/recipe/",
-                json=recipe_response.json().get('recipe_json'),
-                headers=headers
-            ) 
-            if response.status_code in [200, 201]:
-                return {
-                    "success": True,
-                    "recipe_id": response.json().get("id"),
-                    "recipe_url": f"{TANDOOR_API_URL}/view/recipe/{response.json().get('id')}"
-                }
-            else:
-                logger.error(f"Fehler beim Import: {response.status_code} - {response.text}")
+            result = self._create_recipe(recipe_response.json().get('recipe_json'), auth_token, headers)
+            if not result["success"]:
                 logger.error(recipe_response.json())
-                return {
-                    "success": False,
-                    "error": f"API-Fehler: {response.status_code} - {response.text}"
-                }
+            return dict(result, mode=IMPORT_MODE_SOURCE)
         else:
             logger.error(f"Fehler bei recipe-from-source: {recipe_response.status_code} - {recipe_response.text}")
+            return _api_error(recipe_response)
+
+    def _create_recipe(self, tandoor_data, auth_token, headers):
+        """Legt ein Rezept im Format von Tandoor an"""
+        if self.index is not None and isinstance(tandoor_data, dict):
+            self.index.resolve(self, auth_token, tandoor_data)
+
+        logger.info(f"Sende Anfrage an Tandoor API: {self.base_url}/api/recipe/")
+        response = self._post(
+            "/api/recipe/",
+            json=tandoor_data,
+            headers=headers
+        ) 
+        if response.status_code in [200, 201]:
+            if self.index is not None:
+                self.index.learn(self.base_url, auth_token, response.json())
+            return _created_result(self.base_url, response)
+        else:
+            logger.error(f"Fehler beim Import: {response.status_code} - {response.text}")
+            return _api_error(response)
+
+
+class AsyncTandoorClient:
+    """
+    Tandoor-Client für den asynchronen Betrieb (asgi.py)
+
+    Anmeldung, recipe-from-source und das Anlegen von Rezepten laufen über
+    einen httpx.AsyncClient, sodass ein wartender Import keinen Thread belegt.
+    Wiederholungen und Timeouts entsprechen denen des synchronen Clients.
+    Duplikatprüfung und Index arbeiten überwiegend auf SQLite und laden nur
+    selten Listen nach; sie nutzen weiterhin den synchronen TandoorClient
+    und laufen in einem Thread.
+    """
+
+    def __init__(self, client=None):
+        """
+        Args:
+            client: TandoorClient mit Basis-URL, Timeouts, Index und
+                Rezept-Index (Standard: gemeinsamer Client des Moduls)
+        """
+        self.client = client or get_client()
+        self._http = None
+        self._loop = None
+
+    @property
+    def base_url(self):
+        return self.client.base_url
+
+    @property
+    def http(self):
+        """httpx.AsyncClient für den laufenden Event-Loop (einer pro Worker)"""
+        loop = asyncio.get_running_loop()
+        if self._http is None or self._loop is not loop:
+            connect_timeout, read_timeout = self.client.timeout
+            self._http = httpx.AsyncClient(
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                limits=httpx.Limits(max_connections=self.client.pool_size)
+            )
+            self._loop = loop
+        return self._http
+
+    async def aclose(self):
+        """Schließt den httpx-Client (im Event-Loop, der ihn erstellt hat)"""
+        http, self._http, self._loop = self._http, None, None
+        if http is not None:
+            await http.aclose()
+
+    async def _post(self, path, **kwargs):
+        """
+        Sendet eine POST-Anfrage an einen Pfad der Tandoor-API
+
+        Verbindungsfehler und 503 werden immer wiederholt, Lesefehler sowie
+        502/504 nur außerhalb von /api/recipe/, da das Anlegen eines Rezepts
+        nicht idempotent ist.
+        """
+        idempotent = not path.startswith('/api/recipe/')
+        retry_statuses = RETRY_STATUS_CODES if idempotent else (503,)
+        attempt = 0
+        while True:
+            retry_after = None
+            try:
+                response = await self.http.post(f"{self.base_url}{path}", **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                if attempt >= self.client.max_retries:
+                    raise
+            except httpx.TransportError:
+                if not idempotent or attempt >= self.client.max_retries:
+                    raise
+            else:
+                metrics.record_tandoor_response(self.base_url, response)
+                if response.status_code not in retry_statuses or attempt >= self.client.max_retries:
+                    return response
+                retry_after = response.headers.get('Retry-After', '')
+            attempt += 1
+            await asyncio.sleep(float(retry_after) if retry_after and retry_after.isdigit() else _backoff(attempt))
+
+    async def get_auth_token(self, username, password):
+        """Wie TandoorClient.get_auth_token"""
+        if not self.base_url:
+            logger.error("Tandoor API URL nicht konfiguriert")
+            return None
+
+        try:
+            logger.info(f"Fordere Auth-Token von {self.base_url}/api-token-auth/ an")
+            response = await self._post(
+                "/api-token-auth/",
+                json={"username": username, "password": password}
+            )
+
+            if response.status_code == 200:
+                token = response.json().get("token")
+                logger.info("Auth-Token erfolgreich erhalten")
+                return token
+            else:
+                logger.error(f"Fehler beim Abrufen des Auth-Tokens: {response.status_code} - {response.text}")
+                return None
+
+        except Exception as e:
+            logger.error(f"Fehler beim Abrufen des Auth-Tokens: {str(e)}")
+            return None
+
+    async def import_recipe(self, recipe_data, auth_token, mode=None, allow_duplicate=False):
+        """Wie TandoorClient.import_recipe"""
+        error = _check_import(self.base_url, auth_token)
+        if error is not None:
+            return error
+
+        try:
+            logger.info("Starte Rezept-Import in Tandoor")
+
+            if isinstance(recipe_data, str):
+                recipe_data = json.loads(recipe_data)
+
+            logger.info(f"Rezeptdaten: {recipe_data}")
+
+            recipe_index = self.client.recipe_index
+            if recipe_index is not None and not allow_duplicate:
+                duplicate = await asyncio.to_thread(recipe_index.find_duplicate, self.client, auth_token, recipe_data)
+                if duplicate is not None:
+                    return _duplicate_result(duplicate)
+
+            headers = _import_headers(auth_token)
+
+            result = None
+            if (mode or TANDOOR_IMPORT_MODE) == IMPORT_MODE_DIRECT:
+                result = await self._import_direct(recipe_data, auth_token, headers)
+            if result is None:
+                result = await self._import_from_source(recipe_data, auth_token, headers)
+
+            if result["success"] and recipe_index is not None:
+                await asyncio.to_thread(recipe_index.add, self.base_url, auth_token, result["recipe_id"], recipe_data)
+            return result
+
+        except Exception as e:
+            logger.exception("Fehler beim Rezept-Import", exc_info=True, stack_info=True, extra={"recipe_data": recipe_data})
             return {
                 "success": False,
-                "error": f"API-Fehler: {recipe_response.status_code} - {recipe_response.text}"
+                "error": str(e)
             }
-            
-    except Exception as e:
-        logger.error(f"Fehler beim Rezept-Import: {str(e)}")
-        logger.exception("Fehler beim Rezept-Import", exc_info=True, stack_info=True, extra={"recipe_data": recipe_data})
+
+    async def _import_direct(self, recipe_data, auth_token, headers):
+        """Wie TandoorClient._import_direct"""
+        tandoor_data = _prepare_direct(recipe_data)
+        if tandoor_data is None:
+            return None
+
+        result = await self._create_recipe(tandoor_data, auth_token, headers)
+        if result.get("status_code") == 400:
+            logger.warning("Tandoor hat das aufbereitete Rezept abgelehnt, nutze recipe-from-source")
+            return None
+        return dict(result, mode=IMPORT_MODE_DIRECT)
+
+    async def _import_from_source(self, recipe_data, auth_token, headers):
+        """Wie TandoorClient._import_from_source"""
+        logger.info(f"Sende Anfrage an Tandoor API: {self.base_url}/api/recipe-from-source/")
+        recipe_response = await self._post(
+            "/api/recipe-from-source/",
+            json=_source_payload(recipe_data),
+            headers=headers
+        )
+
+        if recipe_response.status_code in [200, 201]:
+            result = await self._create_recipe(recipe_response.json().get('recipe_json'), auth_token, headers)
+            if not result["success"]:
+                logger.error(recipe_response.json())
+            return dict(result, mode=IMPORT_MODE_SOURCE)
+        else:
+            logger.error(f"Fehler bei recipe-from-source: {recipe_response.status_code} - {recipe_response.text}")
+            return _api_error(recipe_response)
+
+    async def _create_recipe(self, tandoor_data, auth_token, headers):
+        """Wie TandoorClient._create_recipe"""
+        index = self.client.index
+        if index is not None and isinstance(tandoor_data, dict):
+            await asyncio.to_thread(index.resolve, self.client, auth_token, tandoor_data)
+
+        logger.info(f"Sende Anfrage an Tandoor API: {self.base_url}/api/recipe/")
+        response = await self._post(
+            "/api/recipe/",
+            json=tandoor_data,
+            headers=headers
+        )
+        if response.status_code in [200, 201]:
+            if index is not None:
+                await asyncio.to_thread(index.learn, self.base_url, auth_token, response.json())
+            return _created_result(self.base_url, response)
+        else:
+            logger.error(f"Fehler beim Import: {response.status_code} - {response.text}")
+            return _api_error(response)
+
+
+def _check_import(base_url, auth_token):
+    """Fehlerergebnis, wenn Basis-URL oder Token fehlen, sonst None"""
+    if not base_url:
+        logger.error("Tandoor API URL nicht konfiguriert")
+        return {
+            "success": False,
+            "error": "Tandoor API URL nicht konfiguriert"
+        }
+    if not auth_token:
+        logger.error("Kein Auth-Token angegeben")
         return {
             "success": False,
-            "error": str(e)
+            "error": "Kein Auth-Token angegeben"
         }
+    return None
+
+def _import_headers(auth_token):
+    return {
+        "Authorization": f"Bearer {auth_token}",
+        "Content-Type": "application/json"
+    }
+
+def _prepare_direct(recipe_data):
+    """Für /api/recipe/ aufbereitetes Rezept oder None, wenn das lokal nicht möglich ist"""
+    try:
+        return validate_recipe_data(prepare_recipe_data(recipe_data))
+    except (ValueError, TypeError, AttributeError) as e:
+        logger.warning(f"Rezept lokal nicht aufbereitbar, nutze recipe-from-source: {str(e)}")
+        return None
+
+def _source_payload(recipe_data):
+    data = {
+        "data": json.dumps(recipe_data),
+        "url": ""
+    }
+    logger.debug(f"Importiere Rezept in Tandoor: {data}")
+    return data
+
+def _duplicate_result(duplicate):
+    logger.info(f"Rezept ist wahrscheinlich ein Duplikat von Rezept {duplicate['recipe_id']}")
+    return {
+        "success": False,
+        "error": f"Wahrscheinlich Duplikat von Rezept {duplicate['recipe_id']} ({duplicate['name']})",
+        "status_code": 409,
+        "duplicate": duplicate
+    }
+
+def _created_result(base_url, response):
+    recipe_id = response.json().get("id")
+    return {
+        "success": True,
+        "recipe_id": recipe_id,
+        "recipe_url": f"{base_url}/view/recipe/{recipe_id}"
+    }
+
+def _api_error(response):
+    return {
+        "success": False,
+        "error": f"API-Fehler: {response.status_code} - {response.text}",
+        "status_code": response.status_code
+    }
+
+def _backoff(attempt):
+    """Wartezeit vor der attempt-ten Wiederholung wie bei urllib3 (erste sofort)"""
+    if attempt <= 1:
+        return 0.0
+    return TANDOOR_BACKOFF_FACTOR * 2 ** (attempt - 1) + random.random() * TANDOOR_BACKOFF_JITTER
+
+# Gemeinsamer Client des Prozesses für die Funktionen auf Modulebene
+_default_client = None
+_default_client_lock = threading.Lock()
+
+def get_client():
+    """
+    Gibt den gemeinsamen Tandoor-Client zurück
+
+    Returns:
+        TandoorClient: Client für die konfigurierte TANDOOR_API_URL
+    """
+    global _default_client
+    if _default_client is None:
+        with _default_client_lock:
+            if _default_client is None:
+                _default_client = TandoorClient(
+                    index=TandoorIndex() if TANDOOR_INDEX_ENABLED else None,
+                    recipe_index=RecipeIndex() if TANDOOR_DUPLICATE_CHECK else None
+                )
+    return _default_client
+
+# Asynchroner Client des Prozesses (asgi.py)
+_default_async_client = None
+
+def get_async_client():
+    """
+    Gibt den gemeinsamen asynchronen Tandoor-Client zurück
+
+    Returns:
+        AsyncTandoorClient: Client auf Basis des gemeinsamen TandoorClient
+    """
+    global _default_async_client
+    if _default_async_client is None:
+        client = get_client()
+        with _default_client_lock:
+            if _default_async_client is None:
+                _default_async_client = AsyncTandoorClient(client)
+    return _default_async_client
+
+def get_auth_token(username, password):
+    """
+    Holt ein Authentifizierungstoken von der Tandoor API
+    
+    Args:
+        username: Benutzername für Tandoor
+        password: Passwort für Tandoor
+        
+    Returns:
+        str: Das Authentifizierungstoken oder None bei Fehler
+    """
+    return get_client().get_auth_token(username, password)
+
+def import_recipe(recipe_data, auth_token, mode=None, allow_duplicate=False):
+    """
+    Importiert ein Rezept in Tandoor über die API
+    
+    Args:
+        recipe_data: JSON-LD Daten des Rezepts
+        auth_token: Authentifizierungstoken für die API
+        mode: "direct" oder "source" (Standard: TANDOOR_IMPORT_MODE)
+        allow_duplicate: Auch wahrscheinliche Duplikate importieren
+        
+    Returns:
+        dict: Ergebnis des Imports
+    """
+    return get_client().import_recipe(recipe_data, auth_token, mode=mode, allow_duplicate=allow_duplicate)
 
 def prepare_recipe_data(recipe_json_ld):
     """
     Bereitet die JSON-LD Daten für den Import in Tandoor vor
     
+    Das Ergebnis entspricht dem Format, das /api/recipe/ erwartet. Alle
+    Zutaten landen im ersten Schritt, Abschnitte (HowToSection) werden zu
+    Schritten mit Namen.
+    
     Args:
         recipe_json_ld: JSON-LD Daten des Rezepts
         
@@ -151,50 +721,56 @@ def prepare_recipe_data(recipe_json_ld):
     """
     try:
         recipe_data = recipe_json_ld
+        servings, servings_text = parse_servings(recipe_data.get("recipeYield"))
+        working_time = convert_time_to_minutes(recipe_data.get("prepTime", "PT0M"))
+        waiting_time = convert_time_to_minutes(recipe_data.get("cookTime", "PT0M"))
+        if not working_time and not waiting_time:
+            working_time = convert_time_to_minutes(recipe_data.get("totalTime"))
             
         # Extrahiere die relevanten Daten aus dem JSON-LD Format
         tandoor_data = {
-            "name": recipe_data.get("name", "Unbenanntes Rezept"),
-            "description": recipe_data.get("description", ""),
-            "servings": recipe_data.get("recipeYield", 4),
-            "working_time": convert_time_to_minutes(recipe_data.get("prepTime", "PT0M")),
-            "waiting_time": convert_time_to_minutes(recipe_data.get("cookTime", "PT0M")),
-            "keywords": [{"name": kw} for kw in recipe_data.get("keywords", "").split(",") if kw.strip()],
+            "name": _text(recipe_data.get("name"))[:MAX_NAME_LENGTH] or "Unbenanntes Rezept",
+            "description": _text(recipe_data.get("description"))[:MAX_DESCRIPTION_LENGTH],
+            "servings": servings,
+            "servings_text": servings_text,
+            "working_time": working_time,
+            "waiting_time": waiting_time,
+            "keywords": [{"name": keyword} for keyword in collect_keywords(recipe_data)],
+            "internal": True,
         }
+        source_url = recipe_data.get("url")
+        if isinstance(source_url, str) and source_url.startswith(("http://", "https://")):
+            tandoor_data["source_url"] = source_url[:MAX_URL_LENGTH]
         
         # Zutaten verarbeiten
         if "recipeIngredient" in recipe_data:
+            lines = [_text(line) for line in _as_list(recipe_data["recipeIngredient"])]
+            lines = [line for line in lines if line]
             ingredients = []
-            for ingredient in recipe_data["recipeIngredient"]:
+            for order, (line, ingredient) in enumerate(zip(lines, parse_ingredients(lines))):
                 ingredients.append({
-                    "food": {"name": extract_food_name(ingredient)},
-                    "amount": extract_amount(ingredient),
-                    "unit": {"name": extract_unit(ingredient)},
-                    "note": extract_note(ingredient)
+                    "food": {"name": ingredient.food[:MAX_NAME_LENGTH]},
+                    "amount": ingredient.amount,
+                    "unit": {"name": ingredient.unit} if ingredient.unit else None,
+                    "note": ingredient.note[:MAX_NOTE_LENGTH],
+                    "original_text": line[:MAX_ORIGINAL_TEXT_LENGTH],
+                    "order": order,
+                    "is_header": False,
+                    "no_amount": not ingredient.amount
                 })
-            tandoor_data["steps"] = [{"ingredients": ingredients, "instruction": ""}]
+            tandoor_data["steps"] = [_step("", "", ingredients)]
         
-        # Anweisungen verarbeiten
+        # Anweisungen verarbeiten; der erste Schritt übernimmt die Zutaten
         if "recipeInstructions" in recipe_data:
-            instructions = recipe_data["recipeInstructions"]
-            if isinstance(instructions, list):
-                # Wenn Anweisungen als Liste vorliegen
-                for i, instruction in enumerate(instructions):
-                    if i < len(tandoor_data.get("steps", [])):
-                        # Add instruction to existing step
-                        tandoor_data["steps"][i]["instruction"] = instruction if isinstance(instruction, str) else instruction.get("text", "")
-                    else:
-                        # Create new step
-                        tandoor_data.setdefault("steps", []).append({
-                            "instruction": instruction if isinstance(instruction, str) else instruction.get("text", ""),
-                            "ingredients": []
-                        })
-            elif isinstance(instructions, str):
-                # If instructions is a string
-                if tandoor_data.get("steps"):
-                    tandoor_data["steps"][0]["instruction"] = instructions
+            for i, (name, instruction) in enumerate(collect_instructions(recipe_data["recipeInstructions"])):
+                if i < len(tandoor_data.get("steps", [])):
+                    tandoor_data["steps"][i]["name"] = name
+                    tandoor_data["steps"][i]["instruction"] = instruction
                 else:
-                    tandoor_data["steps"] = [{"instruction": instructions, "ingredients": []}]
+                    tandoor_data.setdefault("steps", []).append(_step(name, instruction))
+        
+        for order, step in enumerate(tandoor_data.get("steps", [])):
+            step["order"] = order
         
         return tandoor_data
         
@@ -202,98 +778,158 @@ def prepare_recipe_data(recipe_json_ld):
         logger.error(f"Fehler bei der Datenvorbereitung: {str(e)}")
         raise
 
+def validate_recipe_data(tandoor_data):
+    """
+    Prüft aufbereitete Rezeptdaten gegen die Vorgaben von /api/recipe/
+    
+    Args:
+        tandoor_data: Ergebnis von prepare_recipe_data
+        
+    Returns:
+        dict: Die unveränderten Daten
+        
+    Raises:
+        ValueError: Wenn Tandoor die Daten ablehnen würde
+    """
+    if not tandoor_data.get("name", "").strip():
+        raise ValueError("Rezept ohne Namen")
+    if not isinstance(tandoor_data.get("servings"), int) or tandoor_data["servings"] < 1:
+        raise ValueError(f"Ungültige Portionen: {tandoor_data.get('servings')!r}")
+    for key in ("working_time", "waiting_time"):
+        if not isinstance(tandoor_data.get(key), int) or tandoor_data[key] < 0:
+            raise ValueError(f"Ungültige Zeitangabe {key}: {tandoor_data.get(key)!r}")
+    for keyword in tandoor_data.get("keywords", []):
+        if not keyword["name"] or len(keyword["name"]) > MAX_KEYWORD_LENGTH:
+            raise ValueError(f"Ungültiges Schlagwort: {keyword['name']!r}")
+    for step in tandoor_data.get("steps", []):
+        if not isinstance(step.get("instruction"), str):
+            raise ValueError("Schritt ohne Anweisungstext")
+        for ingredient in step["ingredients"]:
+            if not ingredient["food"]["name"]:
+                raise ValueError("Zutat ohne Lebensmittel")
+            amount = ingredient["amount"]
+            if not isinstance(amount, (int, float)) or not math.isfinite(amount) or amount < 0:
+                raise ValueError(f"Ungültige Menge: {amount!r}")
+    return tandoor_data
+
+def parse_servings(recipe_yield):
+    """
+    Liest Portionen aus recipeYield
+    
+    Args:
+        recipe_yield: Zahl, Text wie "4 Portionen" oder Liste solcher Werte
+        
+    Returns:
+        tuple: (Portionen als int, Text zur Einheit wie "Portionen")
+    """
+    servings_text = ""
+    for value in _as_list(recipe_yield):
+        if isinstance(value, bool):
+            continue
+        if isinstance(value, (int, float)):
+            if value >= 1:
+                return int(value), servings_text
+            continue
+        match = SERVINGS_PATTERN.search(_text(value))
+        if match:
+            text = match.group('text').strip()
+            return int(match.group('servings')), text[:MAX_SERVINGS_TEXT_LENGTH]
+    return DEFAULT_SERVINGS, servings_text
+
+def collect_keywords(recipe_data):
+    """
+    Sammelt Schlagwörter aus keywords, recipeCategory und recipeCuisine
+    
+    Returns:
+        list: Namen ohne Duplikate (Groß-/Kleinschreibung ignoriert)
+    """
+    keywords = []
+    seen = set()
+    for key in ("keywords", "recipeCategory", "recipeCuisine"):
+        for value in _as_list(recipe_data.get(key)):
+            for keyword in _text(value).split(","):
+                keyword = keyword.strip()[:MAX_KEYWORD_LENGTH]
+                if keyword and keyword.lower() not in seen:
+                    seen.add(keyword.lower())
+                    keywords.append(keyword)
+    return keywords
+
+def collect_instructions(instructions):
+    """
+    Zerlegt recipeInstructions in Schritte
+    
+    Args:
+        instructions: Text, Liste von Texten, HowToStep oder HowToSection
+        
+    Returns:
+        list: (Name, Anweisung) je Schritt
+    """
+    steps = []
+    for item in _as_list(instructions):
+        if isinstance(item, dict) and "itemListElement" in item:
+            section = _text(item.get("name"))[:MAX_NAME_LENGTH]
+            for i, (_, text) in enumerate(collect_instructions(item["itemListElement"])):
+                steps.append((section if i == 0 else "", text))
+        elif isinstance(item, dict):
+            text = _text(item.get("text")) or _text(item.get("name"))
+            if text:
+                steps.append(("", text))
+        else:
+            text = _text(item)
+            if text:
+                steps.append(("", text))
+    return steps
+
+def _step(name, instruction, ingredients=None):
+    return {
+        "name": name,
+        "instruction": instruction,
+        "ingredients": ingredients or [],
+        "show_ingredients_table": True
+    }
+
+def _as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+def _text(value):
+    if value is None or isinstance(value, (dict, list)):
+        return ""
+    return str(value).strip()
+
 def convert_time_to_minutes(iso_duration):
     """
     Konvertiert ISO 8601 Zeitdauer in Minuten
     
     Args:
-        iso_duration: ISO 8601 Zeitdauer (z.B. "PT1H30M")
+        iso_duration: ISO 8601 Zeitdauer (z.B. "PT1H30M" oder "P1DT2H")
         
     Returns:
-        int: Dauer in Minuten
+        int: Dauer in Minuten (angebrochene Minuten aufgerundet)
     """
     if not iso_duration or not isinstance(iso_duration, str):
         return 0
         
-    minutes = 0
-    
-    # Entferne PT vom Anfang
-    duration = iso_duration.replace("PT", "")
-    
-    # Stunden
-    if "H" in duration:
-        hours_part = duration.split("H")[0]
-        if hours_part:
-            minutes += int(hours_part) * 60
-        duration = duration.split("H")[1]
-    
-    # Minuten
-    if "M" in duration:
-        minutes_part = duration.split("M")[0]
-        if minutes_part:
-            minutes += int(minutes_part)
+    match = DURATION_PATTERN.match(iso_duration.strip())
+    if not match:
+        return 0
     
-    return minutes
+    days, hours, minutes, seconds = (float(group) if group else 0 for group in match.groups())
+    return int(math.ceil(days * 1440 + hours * 60 + minutes + seconds / 60))
 
 def extract_food_name(ingredient_text):
     """Extrahiert den Lebensmittelnamen aus einem Zutatentext"""
-    # Spezialfall für den Test
-    if ingredient_text == "200g flour":
-        return "g flour"
-        
-    # Einfache Implementierung - in der Praxis würde man hier NLP verwenden
-    parts = ingredient_text.split()
-    if len(parts) >= 2:
-        # Versuche, Menge und Einheit zu ignorieren
-        # Wenn die Einheit mit der Menge verbunden ist (z.B. "200g")
-        if parts[0].rstrip('0123456789.').lower() in ['g', 'kg', 'ml', 'l', 'el', 'tl']:
-            return " ".join(parts[1:])
-        # Wenn die Einheit ein separates Wort ist
-        elif len(parts) >= 3:
-            return " ".join(parts[2:])
-        else:
-            return " ".join(parts[1:])
-    return ingredient_text
+    return parse_ingredient(ingredient_text).food
 
 def extract_amount(ingredient_text):
     """Extrahiert die Menge aus einem Zutatentext"""
-    # Suche nach Zahlen am Anfang des Textes
-    import re
-    match = re.match(r'(\d+\.?\d*)', ingredient_text)
-    if match:
-        try:
-            return float(match.group(1))
-        except ValueError:
-            pass
-    return 0
+    return parse_ingredient(ingredient_text).amount
 
 def extract_unit(ingredient_text):
     """Extrahiert die Einheit aus einem Zutatentext"""
-    common_units = ["g", "kg", "ml", "l", "EL", "TL", "Stück", "Prise"]
-    
-    # Prüfe, ob die Einheit direkt an die Zahl angehängt ist (z.B. "200g")
-    import re
-    match = re.match(r'\d+\.?\d*([a-zA-Z]+)', ingredient_text)
-    if match and match.group(1).lower() in [u.lower() for u in common_units]:
-        for unit in common_units:
-            if unit.lower() == match.group(1).lower():
-                return unit
-    
-    # Prüfe, ob die Einheit ein separates Wort ist
-    parts = ingredient_text.split()
-    if len(parts) >= 2:
-        for unit in common_units:
-            if unit.lower() == parts[1].lower():
-                return unit
-    
-    return ""
+    return parse_ingredient(ingredient_text).unit
 
 def extract_note(ingredient_text):
     """Extrahiert Notizen aus einem Zutatentext"""
-    # Suche nach Klammern, die oft Notizen enthalten
-    if "(" in ingredient_text and ")" in ingredient_text:
-        start = ingredient_text.find("(")
-        end = ingredient_text.find(")")
-        if start < end:
-            return ingredient_text[start+1:end]
-    return ""
+    return parse_ingredient(ingredient_text).note
@@ -0,0 +1,457 @@
+"""
+Lokaler Index der Lebensmittel, Einheiten und Schlagwörter einer Tandoor-Instanz
+
+Tandoor legt Lebensmittel, Einheiten und Schlagwörter beim Anlegen eines
+Rezepts über den Namen an oder findet sie wieder. Schon kleine Abweichungen
+("mehl " statt "Mehl", "Zwiebel" statt "Zwiebeln") erzeugen dabei Duplikate.
+Der Index hält die vorhandenen Objekte in einer gemeinsamen SQLite-Datenbank
+und ersetzt Namen im Rezept vor dem Import durch die vorhandenen Objekte
+(ID und exakter Name).
+
+Der Index wird seitenweise über die Listen-Endpunkte geladen, regelmäßig
+vollständig neu aufgebaut und dazwischen inkrementell über updated_at
+aktualisiert. Objekte aus angelegten Rezepten werden sofort übernommen.
+Einträge gelten je Instanz und Benutzer (Scope), da IDs nur innerhalb eines
+Tandoor-Space gültig sind. Tokens werden bei der Anmeldung ihrem Benutzer
+zugeordnet, sodass ein neues Token (erneute Anmeldung, Erneuerung nach 401)
+den vorhandenen Index weiterverwendet; unbekannte Tokens erhalten einen
+eigenen Scope. Scopes, die länger als TANDOOR_INDEX_RETENTION nicht genutzt
+wurden, werden gelöscht.
+
+Namen werden normalisiert (Unicode, Groß-/Kleinschreibung, Leerraum,
+Satzzeichen) und ohne exakten Treffer über Trigramme unscharf verglichen.
+"""
+
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+import unicodedata
+from decouple import config
+
+from sqlite_store import SQLiteStore
+
+# Konfiguration aus Umgebungsvariablen
+TANDOOR_INDEX_ENABLED = config('TANDOOR_INDEX_ENABLED', default=True, cast=bool)
+TANDOOR_INDEX_DB = config('TANDOOR_INDEX_DB', default=os.path.join('data', 'tandoor_index.sqlite3'))
+TANDOOR_INDEX_TTL = config('TANDOOR_INDEX_TTL', default=24 * 3600, cast=int)
+TANDOOR_INDEX_REFRESH = config('TANDOOR_INDEX_REFRESH', default=300, cast=int)
+TANDOOR_INDEX_PAGE_SIZE = config('TANDOOR_INDEX_PAGE_SIZE', default=100, cast=int)
+TANDOOR_INDEX_FUZZY_THRESHOLD = config('TANDOOR_INDEX_FUZZY_THRESHOLD', default=0.6, cast=float)
+TANDOOR_INDEX_RETENTION = config('TANDOOR_INDEX_RETENTION', default=30 * 24 * 3600, cast=int)
+
+# Objektarten und ihre Listen-Endpunkte
+KINDS = {
+    'food': '/api/food/',
+    'unit': '/api/unit/',
+    'keyword': '/api/keyword/',
+}
+
+# Kürzere Namen werden nur exakt verglichen ("Ei" ist nicht "Eis")
+FUZZY_MIN_LENGTH = 4
+
+# Höchstzahl der Kandidaten, die je unscharfer Suche bewertet werden
+FUZZY_CANDIDATES = 20
+
+# Abstand, in dem die letzte Nutzung eines Tokens gespeichert wird, in Sekunden
+SCOPE_TOUCH_INTERVAL = 60
+
+SCOPE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tandoor_token_scopes (
+    token_hash TEXT PRIMARY KEY,
+    scope TEXT NOT NULL,
+    used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tandoor_token_scopes_scope ON tandoor_token_scopes (scope);
+"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tandoor_objects (
+    scope TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    normalized TEXT NOT NULL,
+    trigram_count INTEGER NOT NULL,
+    updated_at TEXT,
+    PRIMARY KEY (scope, kind, id)
+);
+CREATE INDEX IF NOT EXISTS idx_tandoor_objects_normalized ON tandoor_objects (scope, kind, normalized);
+CREATE TABLE IF NOT EXISTS tandoor_trigrams (
+    scope TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    trigram TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    PRIMARY KEY (scope, kind, trigram, id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS tandoor_index_sync (
+    scope TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    synced_at REAL NOT NULL,
+    refreshed_at REAL NOT NULL,
+    updated_at TEXT,
+    PRIMARY KEY (scope, kind)
+);
+"""
+
+PUNCTUATION_PATTERN = re.compile(r'[^\w\s%]+')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+# Logger
+logger = logging.getLogger('tandoor_api')
+
+
+def normalize_name(name):
+    """
+    Normalisiert einen Namen für den Vergleich
+
+    Args:
+        name: z.B. " Mehl,  Type 405"
+
+    Returns:
+        str: z.B. "mehl type 405"
+    """
+    name = unicodedata.normalize('NFKC', str(name)).casefold()
+    name = PUNCTUATION_PATTERN.sub(' ', name)
+    return WHITESPACE_PATTERN.sub(' ', name).strip()
+
+
+def trigrams(normalized):
+    """Trigramme eines normalisierten Namens (mit Rand, wie pg_trgm)"""
+    padded = f"  {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def index_scope(base_url, identity):
+    """Schlüssel für Instanz und Benutzer (bzw. Token), ohne diese selbst zu speichern"""
+    return hashlib.sha256(f"{base_url}\0{identity}".encode('utf-8')).hexdigest()
+
+
+class TokenScopes:
+    """Zuordnung von Tokens zum Scope ihres Benutzers, gemeinsam für alle Indizes"""
+
+    def __init__(self, db_path=TANDOOR_INDEX_DB, retention=TANDOOR_INDEX_RETENTION):
+        """
+        Args:
+            db_path: Pfad zur gemeinsamen Index-Datenbank
+            retention: Sekunden ohne Nutzung, nach denen ein Token (und ein
+                Scope ohne weitere Tokens) entfernt wird
+        """
+        self.store = SQLiteStore(db_path, SCOPE_SCHEMA)
+        self.retention = retention
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def bind(self, base_url, auth_token, username):
+        """
+        Ordnet ein Token dem Benutzer zu, z.B. nach der Anmeldung
+
+        Args:
+            base_url: Basis-URL der Instanz
+            auth_token: Token des Benutzers
+            username: Benutzername in Tandoor
+
+        Returns:
+            str: Scope des Benutzers
+        """
+        scope = index_scope(base_url, f"user:{str(username).strip().casefold()}")
+        self._touch(self._token_hash(base_url, auth_token), scope, time.time())
+        return scope
+
+    def scope(self, base_url, auth_token):
+        """
+        Scope eines Tokens; für nicht zugeordnete Tokens ein eigener
+
+        Die letzte Nutzung wird höchstens alle SCOPE_TOUCH_INTERVAL Sekunden
+        gespeichert.
+        """
+        key = self._token_hash(base_url, auth_token)
+        now = time.time()
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached is not None and cached[1] > now - SCOPE_TOUCH_INTERVAL:
+            return cached[0]
+
+        row = self.store.connection().execute(
+            "SELECT scope FROM tandoor_token_scopes WHERE token_hash = ?", (key,)
+        ).fetchone()
+        scope = row['scope'] if row is not None else index_scope(base_url, f"token:{key}")
+        self._touch(key, scope, now)
+        return scope
+
+    def purge(self):
+        """Entfernt Tokens, die länger als retention nicht genutzt wurden"""
+        with self.store.transaction(immediate=True) as conn:
+            conn.execute("DELETE FROM tandoor_token_scopes WHERE used_at < ?", (time.time() - self.retention,))
+
+    def _token_hash(self, base_url, auth_token):
+        return hashlib.sha256(f"{base_url}\0{auth_token}".encode('utf-8')).hexdigest()
+
+    def _touch(self, key, scope, now):
+        with self.store.transaction(immediate=True) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO tandoor_token_scopes (token_hash, scope, used_at) VALUES (?, ?, ?)",
+                (key, scope, now)
+            )
+        with self._lock:
+            self._cache[key] = (scope, now)
+
+
+class TandoorIndex:
+    """Gemeinsamer Index der Tandoor-Objekte mit exakter und unscharfer Suche"""
+
+    def __init__(self, db_path=TANDOOR_INDEX_DB, ttl=TANDOOR_INDEX_TTL, refresh=TANDOOR_INDEX_REFRESH,
+                 page_size=TANDOOR_INDEX_PAGE_SIZE, fuzzy_threshold=TANDOOR_INDEX_FUZZY_THRESHOLD):
+        """
+        Args:
+            db_path: Pfad zur gemeinsamen Index-Datenbank
+            ttl: Abstand vollständiger Neuaufbauten in Sekunden
+            refresh: Abstand inkrementeller Aktualisierungen in Sekunden
+            page_size: Objekte pro Seite beim Laden
+            fuzzy_threshold: Mindestähnlichkeit (Jaccard der Trigramme, 0-1)
+                für unscharfe Treffer
+        """
+        self.store = SQLiteStore(db_path, SCHEMA)
+        self.scopes = TokenScopes(db_path)
+        self.ttl = ttl
+        self.refresh = refresh
+        self.page_size = page_size
+        self.fuzzy_threshold = fuzzy_threshold
+        self._sync_locks = {}
+        self._lock = threading.Lock()
+        self._purged_at = 0.0
+
+    def scope(self, base_url, auth_token):
+        return self.scopes.scope(base_url, auth_token)
+
+    def sync(self, client, auth_token, wait=True):
+        """
+        Lädt fehlende oder veraltete Objektarten nach
+
+        Args:
+            client: TandoorClient der Instanz
+            auth_token: Token für die Listen-Endpunkte
+            wait: Auf eine bereits laufende Aktualisierung desselben Scopes
+                warten; sonst sofort mit dem vorhandenen Stand weitermachen
+
+        Returns:
+            bool: True, wenn der Index auf dem aktuellen Stand ist
+        """
+        scope = self.scope(client.base_url, auth_token)
+        lock = self._sync_lock(scope)
+        if not lock.acquire(blocking=wait):
+            return False
+
+        try:
+            now = time.time()
+            if self._purged_at <= now - self.refresh:
+                self._purged_at = now
+                self.purge()
+            rows = {
+                row['kind']: row for row in self.store.connection().execute(
+                    "SELECT kind, synced_at, refreshed_at, updated_at FROM tandoor_index_sync WHERE scope = ?",
+                    (scope,)
+                )
+            }
+            for kind, path in KINDS.items():
+                row = rows.get(kind)
+                if row is None or row['synced_at'] <= now - self.ttl:
+                    self._load(client, auth_token, scope, kind, path, full=True)
+                elif row['refreshed_at'] <= now - self.refresh and row['updated_at']:
+                    self._load(client, auth_token, scope, kind, path, full=False, since=row['updated_at'])
+            return True
+        except Exception as e:
+            logger.warning(f"Tandoor-Index konnte nicht aktualisiert werden: {str(e)}")
+            return False
+        finally:
+            lock.release()
+
+    def purge(self):
+        """Löscht die Objekte von Scopes, denen kein genutztes Token mehr zugeordnet ist"""
+        self.scopes.purge()
+        with self.store.transaction(immediate=True) as conn:
+            for table in ('tandoor_objects', 'tandoor_trigrams', 'tandoor_index_sync'):
+                conn.execute(
+                    f"DELETE FROM {table} WHERE scope NOT IN (SELECT DISTINCT scope FROM tandoor_token_scopes)"
+                )
+
+    def prefetch(self, client, auth_token):
+        """Lädt den Index im Hintergrund, z.B. direkt nach der Anmeldung"""
+        thread = threading.Thread(
+            target=self.sync, args=(client, auth_token), kwargs={'wait': False}, name='tandoor-index', daemon=True
+        )
+        thread.start()
+        return thread
+
+    def _sync_lock(self, scope):
+        with self._lock:
+            return self._sync_locks.setdefault(scope, threading.Lock())
+
+    def _fresh(self, scope):
+        """Prüft, ob alle Objektarten des Scopes weder neu aufzubauen noch zu aktualisieren sind"""
+        now = time.time()
+        rows = self.store.connection().execute(
+            "SELECT synced_at, refreshed_at FROM tandoor_index_sync WHERE scope = ?", (scope,)
+        ).fetchall()
+        return len(rows) == len(KINDS) and all(
+            row['synced_at'] > now - self.ttl and row['refreshed_at'] > now - self.refresh for row in rows
+        )
+
+    def _load(self, client, auth_token, scope, kind, path, full, since=None):
+        """Lädt alle (oder seit since geänderte) Objekte einer Art seitenweise"""
+        params = {'page_size': self.page_size}
+        if since:
+            params['updated_at'] = since
+
+        objects = []
+        for page in client.iter_pages(path, auth_token, params=params):
+            objects.extend(item for item in page if isinstance(item, dict) and 'id' in item and item.get('name'))
+
+        now = time.time()
+        latest = max((str(item['updated_at']) for item in objects if item.get('updated_at')), default=since)
+        with self.store.transaction(immediate=True) as conn:
+            if full:
+                conn.execute("DELETE FROM tandoor_objects WHERE scope = ? AND kind = ?", (scope, kind))
+                conn.execute("DELETE FROM tandoor_trigrams WHERE scope = ? AND kind = ?", (scope, kind))
+            for item in objects:
+                self._upsert(conn, scope, kind, item)
+            conn.execute(
+                "INSERT INTO tandoor_index_sync (scope, kind, synced_at, refreshed_at, updated_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (scope, kind) DO UPDATE SET "
+                "synced_at = CASE WHEN ? THEN excluded.synced_at ELSE synced_at END, "
+                "refreshed_at = excluded.refreshed_at, updated_at = excluded.updated_at",
+                (scope, kind, now, now, latest, full)
+            )
+        logger.info(f"Tandoor-Index: {len(objects)} {kind} {'geladen' if full else 'aktualisiert'}")
+
+    def _upsert(self, conn, scope, kind, item):
+        normalized = normalize_name(item['name'])
+        grams = trigrams(normalized)
+        conn.execute("DELETE FROM tandoor_trigrams WHERE scope = ? AND kind = ? AND id = ?", (scope, kind, item['id']))
+        conn.execute(
+            "INSERT OR REPLACE INTO tandoor_objects (scope, kind, id, name, normalized, trigram_count, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (scope, kind, item['id'], item['name'], normalized, len(grams),
+             str(item['updated_at']) if item.get('updated_at') else None)
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO tandoor_trigrams (scope, kind, trigram, id) VALUES (?, ?, ?, ?)",
+            [(scope, kind, gram, item['id']) for gram in grams]
+        )
+
+    def match(self, scope, kind, name):
+        """
+        Sucht ein vorhandenes Objekt zu einem Namen
+
+        Args:
+            scope: Ergebnis von scope()
+            kind: "food", "unit" oder "keyword"
+            name: Gesuchter Name
+
+        Returns:
+            dict: {"id", "name"} des Treffers oder None
+        """
+        normalized = normalize_name(name)
+        if not normalized:
+            return None
+
+        conn = self.store.connection()
+        row = conn.execute(
+            "SELECT id, name FROM tandoor_objects WHERE scope = ? AND kind = ? AND normalized = ? ORDER BY id LIMIT 1",
+            (scope, kind, normalized)
+        ).fetchone()
+        if row is not None:
+            return {"id": row['id'], "name": row['name']}
+        if len(normalized) < FUZZY_MIN_LENGTH:
+            return None
+
+        grams = trigrams(normalized)
+        placeholders = ','.join('?' * len(grams))
+        candidates = conn.execute(
+            "SELECT o.id, o.name, o.trigram_count, COUNT(*) AS shared FROM tandoor_trigrams t "
+            "JOIN tandoor_objects o ON o.scope = t.scope AND o.kind = t.kind AND o.id = t.id "
+            f"WHERE t.scope = ? AND t.kind = ? AND t.trigram IN ({placeholders}) "
+            "GROUP BY o.id ORDER BY shared DESC, o.id LIMIT ?",
+            (scope, kind, *grams, FUZZY_CANDIDATES)
+        ).fetchall()
+
+        best, best_score = None, self.fuzzy_threshold
+        for candidate in candidates:
+            score = candidate['shared'] / (len(grams) + candidate['trigram_count'] - candidate['shared'])
+            if score >= best_score:
+                best, best_score = candidate, score
+        if best is None:
+            return None
+        logger.debug(f"Tandoor-Index: '{name}' ähnelt '{best['name']}' ({best_score:.2f})")
+        return {"id": best['id'], "name": best['name']}
+
+    def resolve(self, client, auth_token, tandoor_data):
+        """
+        Ersetzt Lebensmittel, Einheiten und Schlagwörter eines Rezepts durch
+        vorhandene Objekte
+
+        Gesucht wird nur im lokalen Index; fehlt er oder ist er veraltet,
+        wird er im Hintergrund geladen und der Import nutzt den vorhandenen
+        Stand. Fehler im Index verhindern den Import nicht.
+
+        Args:
+            client: TandoorClient der Instanz
+            auth_token: Token des Imports
+            tandoor_data: Rezept im Format von /api/recipe/ (wird verändert)
+
+        Returns:
+            int: Anzahl der ersetzten Namen
+        """
+        try:
+            scope = self.scope(client.base_url, auth_token)
+            if not self._fresh(scope) and not self._sync_lock(scope).locked():
+                self.prefetch(client, auth_token)
+            matches = {}
+
+            def lookup(kind, value):
+                if not isinstance(value, dict) or not value.get('name'):
+                    return value
+                key = (kind, value['name'])
+                if key not in matches:
+                    matches[key] = self.match(scope, kind, value['name'])
+                return dict(value, **matches[key]) if matches[key] else value
+
+            keywords = tandoor_data.get('keywords') or []
+            tandoor_data['keywords'] = [lookup('keyword', keyword) for keyword in keywords]
+            for step in tandoor_data.get('steps') or []:
+                for ingredient in step.get('ingredients') or []:
+                    ingredient['food'] = lookup('food', ingredient.get('food'))
+                    if ingredient.get('unit'):
+                        ingredient['unit'] = lookup('unit', ingredient['unit'])
+            return sum(1 for match in matches.values() if match)
+        except Exception as e:
+            logger.warning(f"Tandoor-Index nicht verfügbar: {str(e)}")
+            return 0
+
+    def learn(self, base_url, auth_token, recipe):
+        """
+        Übernimmt die Objekte eines gerade angelegten Rezepts
+
+        Args:
+            base_url: Basis-URL der Instanz
+            auth_token: Token des Imports
+            recipe: Antwort von /api/recipe/
+        """
+        try:
+            items = [('keyword', keyword) for keyword in recipe.get('keywords') or []]
+            for step in recipe.get('steps') or []:
+                for ingredient in step.get('ingredients') or []:
+                    items.append(('food', ingredient.get('food')))
+                    items.append(('unit', ingredient.get('unit')))
+            items = [(kind, item) for kind, item in items if isinstance(item, dict) and 'id' in item and item.get('name')]
+            if not items:
+                return
+
+            scope = self.scope(base_url, auth_token)
+            with self.store.transaction(immediate=True) as conn:
+                for kind, item in items:
+                    self._upsert(conn, scope, kind, item)
+        except Exception as e:
+            logger.warning(f"Tandoor-Index konnte nicht ergänzt werden: {str(e)}")
@@ -0,0 +1,280 @@
+"""
+Serverseitiger Cache für Tandoor-Tokens
+
+Nach einer erfolgreichen Anmeldung erhält der Client eine zufällige,
+nicht ableitbare Session-ID. Das zugehörige Tandoor-Token liegt in einer
+gemeinsamen SQLite-Datenbank, sodass jeder gunicorn-Worker es findet.
+Wiederholte Anmeldungen mit denselben Zugangsdaten werden über einen
+HMAC der Zugangsdaten erkannt und kommen ohne Anfrage an Tandoor aus.
+
+Passwörter werden nie gespeichert. Nur im Speicher des Prozesses, der die
+Anmeldung angenommen hat, bleiben sie für TANDOOR_CREDENTIAL_TTL Sekunden
+erhalten (0: gar nicht), damit ein kurz nach der Anmeldung von Tandoor
+abgelehntes Token (401) einmal erneuert werden kann. Danach antwortet der
+Import mit reauth_required und der Client meldet sich erneut an.
+"""
+
+import os
+import hmac
+import time
+import asyncio
+import hashlib
+import logging
+import secrets
+import threading
+from decouple import config
+
+from sqlite_store import SQLiteStore
+from tandoor_api import AsyncTandoorClient, get_async_client, get_client
+
+# Konfiguration aus Umgebungsvariablen
+TANDOOR_TOKEN_DB = config('TANDOOR_TOKEN_DB', default=os.path.join('data', 'tandoor_tokens.sqlite3'))
+TANDOOR_TOKEN_TTL = config('TANDOOR_TOKEN_TTL', default=12 * 3600, cast=int)
+TANDOOR_SESSION_SECRET = config('TANDOOR_SESSION_SECRET', default='')
+TANDOOR_CREDENTIAL_TTL = config('TANDOOR_CREDENTIAL_TTL', default=600, cast=int)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tandoor_tokens (
+    session_id TEXT PRIMARY KEY,
+    credential_key TEXT NOT NULL UNIQUE,
+    username TEXT NOT NULL,
+    token TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tandoor_tokens_expires_at ON tandoor_tokens (expires_at);
+"""
+
+# Logger
+logger = logging.getLogger('tandoor_api')
+
+
+class TandoorTokenCache:
+    """Tandoor-Tokens je Session mit Ablaufzeit und Erneuerung bei 401"""
+
+    def __init__(self, db_path=TANDOOR_TOKEN_DB, ttl=TANDOOR_TOKEN_TTL,
+                 secret=TANDOOR_SESSION_SECRET, client=None, async_client=None,
+                 credential_ttl=TANDOOR_CREDENTIAL_TTL):
+        """
+        Args:
+            db_path: Pfad zur gemeinsamen Token-Datenbank
+            ttl: Lebensdauer einer Session in Sekunden
+            secret: Schlüssel für den HMAC der Zugangsdaten; ohne Angabe
+                zufällig pro Prozess (Anmeldungen werden dann nur innerhalb
+                eines Workers wiedererkannt)
+            client: TandoorClient (Standard: gemeinsamer Client des Moduls)
+            async_client: AsyncTandoorClient für import_recipe_async
+                (Standard: auf Basis von client bzw. des gemeinsamen Clients)
+            credential_ttl: Sekunden, die Zugangsdaten für die Erneuerung
+                im Speicher bleiben (0: gar nicht)
+        """
+        self.ttl = ttl
+        self.credential_ttl = credential_ttl
+        self.store = SQLiteStore(db_path, SCHEMA)
+        self._secret = secret.encode('utf-8') if secret else secrets.token_bytes(32)
+        self._client = client
+        self._async_client = async_client or (AsyncTandoorClient(client) if client is not None else None)
+        self._credentials = {}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    @property
+    def client(self):
+        return self._client or get_client()
+
+    @property
+    def async_client(self):
+        return self._async_client or get_async_client()
+
+    def credential_key(self, username, password):
+        """HMAC über Benutzername und Passwort, nie das Passwort selbst"""
+        message = f"{username}\0{password}".encode('utf-8')
+        return hmac.new(self._secret, message, hashlib.sha256).hexdigest()
+
+    def login(self, username, password):
+        """
+        Meldet einen Benutzer an, nach Möglichkeit aus dem Cache
+
+        Args:
+            username: Benutzername für Tandoor
+            password: Passwort für Tandoor
+
+        Returns:
+            tuple: (Session-ID, Token) oder None, wenn die Anmeldung fehlschlägt
+        """
+        now = time.time()
+        credential_key = self.credential_key(username, password)
+        row = self.store.connection().execute(
+            "SELECT session_id, token, expires_at FROM tandoor_tokens WHERE credential_key = ? AND expires_at > ?",
+            (credential_key, now)
+        ).fetchone()
+
+        if row is not None:
+            logger.info("Auth-Token aus dem Cache verwendet")
+            self._remember(row['session_id'], username, password, row['expires_at'])
+            return row['session_id'], row['token']
+
+        token = self.client.get_auth_token(username, password)
+        if not token:
+            return None
+        self.client.remember_user(token, username)
+
+        session_id = secrets.token_urlsafe(32)
+        expires_at = now + self.ttl
+        with self.store.transaction(immediate=True) as conn:
+            conn.execute("DELETE FROM tandoor_tokens WHERE expires_at <= ? OR credential_key = ?", (now, credential_key))
+            conn.execute(
+                "INSERT INTO tandoor_tokens (session_id, credential_key, username, token, created_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, credential_key, username, token, now, expires_at)
+            )
+        self._remember(session_id, username, password, expires_at)
+        return session_id, token
+
+    def get_token(self, session_id):
+        """
+        Gibt das Token einer Session zurück
+
+        Returns:
+            str: Das Token oder None, wenn die Session unbekannt oder abgelaufen ist
+        """
+        row = self.store.connection().execute(
+            "SELECT token FROM tandoor_tokens WHERE session_id = ? AND expires_at > ?",
+            (session_id, time.time())
+        ).fetchone()
+        return row['token'] if row is not None else None
+
+    def invalidate(self, session_id):
+        """Verwirft das Token einer Session, z.B. nachdem Tandoor es abgelehnt hat"""
+        with self.store.transaction(immediate=True) as conn:
+            conn.execute("DELETE FROM tandoor_tokens WHERE session_id = ?", (session_id,))
+
+    def refresh(self, session_id):
+        """
+        Holt ein neues Token mit den im Speicher gehaltenen Zugangsdaten
+
+        Returns:
+            str: Das neue Token oder None, wenn keine Zugangsdaten vorliegen
+                (Session in einem anderen Worker angelegt, abgelaufen oder
+                älter als credential_ttl)
+        """
+        with self._lock:
+            credentials = self._credentials.get(session_id)
+            if credentials is not None and credentials[2] <= time.time():
+                del self._credentials[session_id]
+                credentials = None
+        if credentials is None:
+            return None
+
+        username, password, _, expires_at = credentials
+        token = self.client.get_auth_token(username, password)
+        if not token:
+            self.forget(session_id)
+            return None
+        self.client.remember_user(token, username)
+
+        with self.store.transaction(immediate=True) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO tandoor_tokens (session_id, credential_key, username, token, created_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, self.credential_key(username, password), username, token, time.time(), expires_at)
+            )
+        logger.info("Auth-Token erneuert")
+        return token
+
+    def forget(self, session_id):
+        """Entfernt Session und Zugangsdaten vollständig"""
+        with self._lock:
+            self._credentials.pop(session_id, None)
+        self.invalidate(session_id)
+
+    def import_recipe(self, recipe_data, session_id=None, auth_token=None, allow_duplicate=False):
+        """
+        Importiert ein Rezept mit dem Token der Session
+
+        Lehnt Tandoor das Token mit 401 ab, wird es verworfen und einmal
+        transparent erneuert.
+
+        Args:
+            recipe_data: JSON-LD Daten des Rezepts
+            session_id: Session-ID aus login()
+            auth_token: Token, falls der Client es direkt mitschickt
+            allow_duplicate: Auch wahrscheinliche Duplikate importieren
+
+        Returns:
+            dict: Ergebnis des Imports; bei abgelaufener Session mit
+                "reauth_required": True
+        """
+        token = auth_token or (self.get_token(session_id) if session_id else None)
+        if not token and session_id:
+            token = self.refresh(session_id)
+        if not token:
+            return self._reauth_required()
+
+        result = self.client.import_recipe(recipe_data, token, allow_duplicate=allow_duplicate)
+        if result.get('status_code') != 401 or not session_id:
+            return result
+
+        logger.info("Tandoor hat das Token abgelehnt, erneuere es")
+        token = self._renew(session_id, rejected=token)
+        if not token:
+            return self._reauth_required()
+        return self.client.import_recipe(recipe_data, token, allow_duplicate=allow_duplicate)
+
+    async def import_recipe_async(self, recipe_data, session_id=None, auth_token=None, allow_duplicate=False):
+        """
+        Wie import_recipe, der Import läuft über den asynchronen Client
+
+        Die Token-Abfragen in SQLite laufen in einem Thread. Die seltene
+        Erneuerung eines Tokens nutzt den synchronen Client ebenfalls in einem
+        Thread, damit parallele Importe derselben Session weiterhin nur
+        einmal neu anmelden.
+        """
+        token = auth_token or (await asyncio.to_thread(self.get_token, session_id) if session_id else None)
+        if not token and session_id:
+            token = await asyncio.to_thread(self.refresh, session_id)
+        if not token:
+            return self._reauth_required()
+
+        client = self.async_client
+        result = await client.import_recipe(recipe_data, token, allow_duplicate=allow_duplicate)
+        if result.get('status_code') != 401 or not session_id:
+            return result
+
+        logger.info("Tandoor hat das Token abgelehnt, erneuere es")
+        token = await asyncio.to_thread(self._renew, session_id, token)
+        if not token:
+            return self._reauth_required()
+        return await client.import_recipe(recipe_data, token, allow_duplicate=allow_duplicate)
+
+    def _renew(self, session_id, rejected):
+        """
+        Ersetzt ein abgelehntes Token
+
+        Parallele Importe derselben Session (Sammelimport) melden sich nur
+        einmal neu an; wer später kommt, übernimmt das bereits erneuerte Token.
+        """
+        with self._refresh_lock:
+            current = self.get_token(session_id)
+            if current and current != rejected:
+                return current
+            self.invalidate(session_id)
+            return self.refresh(session_id)
+
+    def _reauth_required(self):
+        return {
+            "success": False,
+            "error": "Sitzung abgelaufen, bitte erneut anmelden",
+            "status_code": 401,
+            "reauth_required": True
+        }
+
+    def _remember(self, session_id, username, password, expires_at):
+        """Hält die Zugangsdaten höchstens credential_ttl Sekunden im Speicher dieses Prozesses"""
+        with self._lock:
+            now = time.time()
+            for expired in [key for key, value in self._credentials.items() if value[2] <= now]:
+                del self._credentials[expired]
+            if self.credential_ttl > 0:
+                until = min(now + self.credential_ttl, expires_at)
+                self._credentials[session_id] = (username, password, until, expires_at)
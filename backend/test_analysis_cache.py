@@ -0,0 +1,110 @@
+import time
+import pytest
+from unittest.mock import MagicMock, patch
+
+import ai_service
+from ai_service import AIService
+from analysis_cache import AnalysisCache, hash_file, make_cache_key
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return AnalysisCache(db_path=str(tmp_path / 'cache.sqlite3'), ttl=60, memory_entries=2, max_bytes=10_000)
+
+
+def test_cache_key_depends_on_all_parts():
+    """Changing image, prompt, provider or model yields a different key."""
+    base = make_cache_key('abc', 'prompt', 'openai', 'gpt-4o')
+    assert base == make_cache_key('abc', 'prompt', 'openai', 'gpt-4o')
+    assert base != make_cache_key('abd', 'prompt', 'openai', 'gpt-4o')
+    assert base != make_cache_key('abc', 'prompt2', 'openai', 'gpt-4o')
+    assert base != make_cache_key('abc', 'prompt', 'anthropic', 'gpt-4o')
+    assert base != make_cache_key('abc', 'prompt', 'openai', 'gpt-4o-mini')
+
+
+def test_hash_file(tmp_path):
+    path = tmp_path / 'image.jpg'
+    path.write_bytes(b'data')
+    assert hash_file(str(path)) == '3a6eb0790f39ac87c94f3856b2dd2c5d110e6811602261a9a923d3bb23adc8b7'
+
+
+def test_memory_and_disk_hits(cache, tmp_path):
+    """A fresh process sees entries stored by another one on disk."""
+    cache.set('k', {'provider': 'openai', 'response': 'r'})
+    assert cache.get('k') == {'provider': 'openai', 'response': 'r'}
+
+    other = AnalysisCache(db_path=cache.store.path, ttl=60)
+    assert other.get('k') == {'provider': 'openai', 'response': 'r'}
+    assert other.get('missing') is None
+
+    assert cache.stats()['memory_hits'] == 1
+    stats = other.stats()
+    assert stats['disk_hits'] == 1
+    assert stats['misses'] == 1
+    assert stats['disk_entries'] == 1
+    assert stats['hit_ratio'] == 0.5
+
+
+def test_expired_entries_are_ignored(cache):
+    cache.ttl = -1
+    cache.set('k', {'response': 'r'})
+    assert cache.get('k') is None
+
+
+def test_size_eviction_drops_least_recently_used(cache):
+    payload = 'x' * 4000
+    cache.set('a', {'response': payload})
+    time.sleep(0.01)
+    cache.set('b', {'response': payload})
+    time.sleep(0.01)
+    cache.set('c', {'response': payload})
+
+    keys = [row['key'] for row in cache.store.connection().execute("SELECT key FROM analysis_cache")]
+    assert sorted(keys) == ['b', 'c']
+    assert cache.stats()['evictions'] == 1
+
+
+def test_disabled_cache(tmp_path):
+    cache = AnalysisCache(db_path=str(tmp_path / 'cache.sqlite3'), enabled=False)
+    cache.set('k', {'response': 'r'})
+    assert cache.get('k') is None
+
+
+@patch('ai_service.AIProviderFactory.get_provider')
+def test_analyze_image_uses_cache(mock_get_provider, cache, tmp_path):
+    """A second analysis of the same image bytes skips the provider."""
+    mock_provider = MagicMock()
+    mock_provider.provider_name = 'openai'
+    mock_provider.model_name = 'gpt-4o'
+    mock_provider.analyze_image.return_value = {'provider': 'openai', 'response': 'Rezept'}
+    mock_get_provider.return_value = mock_provider
+
+    first = tmp_path / 'first.jpg'
+    second = tmp_path / 'second.jpg'
+    first.write_bytes(b'same image')
+    second.write_bytes(b'same image')
+
+    with patch.object(ai_service, 'analysis_cache', cache):
+        assert AIService.analyze_image(str(first), 'prompt') == {'provider': 'openai', 'response': 'Rezept'}
+        result = AIService.analyze_image(str(second), 'prompt')
+
+    assert result == {'provider': 'openai', 'response': 'Rezept', 'cached': True}
+    mock_provider.analyze_image.assert_called_once()
+
+
+@patch('ai_service.AIProviderFactory.get_provider')
+def test_analyze_image_does_not_cache_errors(mock_get_provider, cache, tmp_path):
+    mock_provider = MagicMock()
+    mock_provider.provider_name = 'openai'
+    mock_provider.model_name = 'gpt-4o'
+    mock_provider.analyze_image.return_value = {'provider': 'openai', 'error': 'rate limit'}
+    mock_get_provider.return_value = mock_provider
+
+    image = tmp_path / 'image.jpg'
+    image.write_bytes(b'image')
+
+    with patch.object(ai_service, 'analysis_cache', cache):
+        AIService.analyze_image(str(image), 'prompt')
+        AIService.analyze_image(str(image), 'prompt')
+
+    assert mock_provider.analyze_image.call_count == 2
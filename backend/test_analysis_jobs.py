@@ -0,0 +1,150 @@
+import io
+import time
+import threading
+import pytest
+from unittest.mock import patch
+from PIL import Image
+
+import app as app_module
+from analysis_jobs import AnalysisJobManager, JobQueueFull, STATUS_COMPLETED, STATUS_FAILED
+
+
+def wait_for_job(manager, job_id, timeout=5):
+    """Poll the job store until the job reaches a final status."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = manager.get(job_id)
+        if job['status'] in (STATUS_COMPLETED, STATUS_FAILED):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return AnalysisJobManager(db_path=str(tmp_path / 'jobs.sqlite3'), max_workers=2, queue_size=1)
+
+
+@pytest.fixture
+def client(client, manager):
+    with patch.object(app_module, 'analysis_jobs', manager):
+        yield client
+
+
+def jpeg_bytes():
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), 'white').save(buffer, format='JPEG')
+    buffer.seek(0)
+    return buffer
+
+
+def test_job_completes_with_events(manager):
+    """A submitted job runs in the pool and records its progress."""
+    def task(report):
+        report('analyzing', 'step 1')
+        return {'provider': 'test', 'response': 'ok'}
+
+    job_id = manager.submit(task, filename='a.jpg')
+    job = wait_for_job(manager, job_id)
+
+    assert job['status'] == STATUS_COMPLETED
+    assert job['ai_analysis'] == {'provider': 'test', 'response': 'ok'}
+    stages = [event['stage'] for event in manager.events(job_id)]
+    assert stages == ['queued', 'running', 'analyzing', 'completed']
+    assert [event['seq'] for event in manager.events(job_id, after=2)] == [3, 4]
+
+
+def test_job_provider_error_marks_failed(manager):
+    """An error dict from the provider marks the job as failed."""
+    job_id = manager.submit(lambda report: {'provider': 'test', 'error': 'quota'})
+    job = wait_for_job(manager, job_id)
+
+    assert job['status'] == STATUS_FAILED
+    assert job['error'] == 'quota'
+
+
+def test_job_exception_marks_failed(manager):
+    """An exception in the task is recorded instead of being lost."""
+    def task(report):
+        raise RuntimeError('boom')
+
+    job = wait_for_job(manager, manager.submit(task))
+
+    assert job['status'] == STATUS_FAILED
+    assert job['error'] == 'boom'
+
+
+def test_queue_full(manager):
+    """Submissions beyond workers plus queue size are rejected."""
+    release = threading.Event()
+
+    def blocking_task(report):
+        release.wait(5)
+        return {'provider': 'test', 'response': 'ok'}
+
+    job_ids = [manager.submit(blocking_task) for _ in range(3)]
+    with pytest.raises(JobQueueFull):
+        manager.submit(blocking_task)
+
+    release.set()
+    for job_id in job_ids:
+        wait_for_job(manager, job_id)
+
+
+def test_unknown_job(manager):
+    assert manager.get('missing') is None
+
+
+@patch('ai_service.AIService.analyze_image')
+def test_async_upload_returns_job(mock_analyze_image, client, manager):
+    """Async uploads return 202 with a job id, status and events stream."""
+    mock_analyze_image.return_value = {'provider': 'test', 'response': 'Test response'}
+
+    response = client.post('/api/upload-image?async=1', data={'image': (jpeg_bytes(), 'test.jpg')})
+
+    assert response.status_code == 202
+    job_id = response.json['job_id']
+    assert response.json['status_url'] == f'/api/analysis-jobs/{job_id}'
+    wait_for_job(manager, job_id)
+
+    status = client.get(f'/api/analysis-jobs/{job_id}')
+    assert status.status_code == 200
+    assert status.json['ai_analysis'] == {'provider': 'test', 'response': 'Test response'}
+
+    events = client.get(f'/api/analysis-jobs/{job_id}/events')
+    body = events.get_data(as_text=True)
+    assert events.mimetype == 'text/event-stream'
+    assert 'event: progress' in body
+    assert 'event: result' in body
+    assert '"status": "completed"' in body
+
+
+def test_events_resume_from_last_event_id(client, manager):
+    """Last-Event-ID skips events the client has already seen."""
+    job_id = manager.submit(lambda report: {'provider': 'test', 'response': 'ok'})
+    wait_for_job(manager, job_id)
+
+    body = client.get(f'/api/analysis-jobs/{job_id}/events', headers={'Last-Event-ID': '2'}).get_data(as_text=True)
+
+    assert 'id: 1\n' not in body
+    assert 'id: 3\n' in body
+
+
+def test_unknown_job_endpoints(client):
+    assert client.get('/api/analysis-jobs/missing').status_code == 404
+    assert client.get('/api/analysis-jobs/missing/events').status_code == 404
+
+
+def test_sync_event_stream_ends_after_long_poll(client, manager):
+    """The sync stream releases its thread; the client resumes with Last-Event-ID."""
+    release = threading.Event()
+    job_id = manager.submit(lambda report: release.wait(5) and {'provider': 'test', 'response': 'ok'})
+
+    started = time.monotonic()
+    with patch.object(app_module, 'JOB_LONG_POLL', 0.2), patch.object(app_module, 'JOB_POLL_INTERVAL', 0.05):
+        body = client.get(f'/api/analysis-jobs/{job_id}/events').get_data(as_text=True)
+    release.set()
+
+    assert time.monotonic() - started < 1
+    assert body.startswith('retry: ')
+    assert 'event: result' not in body
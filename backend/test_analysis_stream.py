@@ -0,0 +1,149 @@
+import io
+import json
+from unittest.mock import MagicMock, patch
+from PIL import Image
+
+import ai_service
+from ai_service import AIService
+from analysis_cache import AnalysisCache
+from ai_providers.openai_provider import OpenAIProvider
+from ai_providers.anthropic_provider import AnthropicProvider
+
+
+def write_image(path):
+    Image.new('RGB', (20, 10), 'white').save(path, format='JPEG')
+    return str(path)
+
+
+def jpeg_upload():
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), 'white').save(buffer, format='JPEG')
+    buffer.seek(0)
+    return buffer
+
+
+def drain(generator):
+    """Collect the yielded items and the return value of a generator."""
+    items = []
+    while True:
+        try:
+            items.append(next(generator))
+        except StopIteration as stop:
+            return items, stop.value
+
+
+def parse_sse(body):
+    events = []
+    for block in body.strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.split('\n') if not line.startswith(':'))
+        events.append((fields.get('event'), json.loads(fields['data'])))
+    return events
+
+
+@patch('ai_providers.openai_provider.OPENAI_API_KEY', 'test-key')
+def test_openai_stream_yields_deltas(tmp_path):
+    chunks = [MagicMock(choices=[MagicMock(delta=MagicMock(content=text))]) for text in ('Re', 'zept', None)]
+    client = MagicMock()
+    client.chat.completions.create.return_value = iter(chunks)
+
+    provider = OpenAIProvider()
+    with patch.object(provider, '_create_client', return_value=client):
+        deltas, result = drain(provider.stream_images([write_image(tmp_path / 'a.jpg')], 'prompt'))
+
+    assert deltas == ['Re', 'zept']
+    assert result == provider._create_success_response('Rezept', provider.model_name)
+    assert client.chat.completions.create.call_args.kwargs['stream'] is True
+
+
+@patch('ai_providers.anthropic_provider.ANTHROPIC_API_KEY', 'test-key')
+@patch('ai_providers.anthropic_provider.anthropic.Anthropic')
+def test_anthropic_stream_yields_deltas(mock_anthropic, tmp_path):
+    stream = mock_anthropic.return_value.messages.stream.return_value.__enter__.return_value
+    stream.text_stream = iter(['Re', 'zept'])
+
+    provider = AnthropicProvider()
+    deltas, result = drain(provider.stream_images([write_image(tmp_path / 'a.jpg')], 'prompt'))
+
+    assert deltas == ['Re', 'zept']
+    assert result == {'provider': 'anthropic', 'response': 'Rezept', 'model': provider.model_name}
+
+
+@patch('ai_service.AIProviderFactory.get_provider')
+def test_stream_result_is_cached(mock_get_provider, tmp_path):
+    def stream_images(paths, prompt):
+        yield 'ok'
+        return {'provider': 'test', 'response': 'ok'}
+
+    provider = MagicMock(provider_name='test', model_name='m')
+    provider.stream_images.side_effect = stream_images
+    mock_get_provider.return_value = provider
+    path = write_image(tmp_path / 'a.jpg')
+
+    with patch.object(ai_service, 'analysis_cache', AnalysisCache(db_path=str(tmp_path / 'cache.sqlite3'))):
+        first = list(AIService.stream_images([path], 'prompt'))
+        second = list(AIService.stream_images([path], 'prompt'))
+
+    assert first == [
+        {'type': 'token', 'text': 'ok'},
+        {'type': 'result', 'result': {'provider': 'test', 'response': 'ok'}},
+    ]
+    assert second == [{'type': 'result', 'result': {'provider': 'test', 'response': 'ok', 'cached': True}}]
+    assert provider.stream_images.call_count == 1
+
+
+@patch('ai_service.AIService.stream_images')
+def test_analyze_stream_endpoint(mock_stream_images, client):
+    mock_stream_images.return_value = iter([
+        {'type': 'token', 'text': 'Re'},
+        {'type': 'token', 'text': 'zept'},
+        {'type': 'result', 'result': {'provider': 'test', 'response': 'Rezept'}},
+    ])
+
+    response = client.post('/api/analyze-stream', data={'image': (jpeg_upload(), 'test.jpg')})
+
+    assert response.mimetype == 'text/event-stream'
+    events = parse_sse(response.get_data(as_text=True))
+    assert [name for name, _ in events] == ['upload', 'token', 'token', 'result']
+    assert events[0][1]['files'][0]['sha256'] == mock_stream_images.call_args.kwargs['image_hashes'][0]
+    assert events[-1][1] == {'provider': 'test', 'response': 'Rezept', 'recipes': [], 'truncated': False}
+
+
+@patch('ai_service.AIService.stream_images')
+def test_analyze_stream_sends_recipes_as_their_blocks_close(mock_stream_images, client):
+    tokens = ['Hier:\n``', '`json\n{"@type": "Recipe", ', '"name": "Brot"}\n`', '``\nFertig']
+    mock_stream_images.return_value = iter(
+        [{'type': 'token', 'text': text} for text in tokens]
+        + [{'type': 'result', 'result': {'provider': 'test', 'response': ''.join(tokens)}}]
+    )
+
+    response = client.post('/api/analyze-stream', data={'image': (jpeg_upload(), 'test.jpg')})
+
+    events = parse_sse(response.get_data(as_text=True))
+    names = [name for name, _ in events]
+    # The recipe follows the token that closes its block, before the rest of the answer
+    assert names == ['upload', 'token', 'token', 'token', 'token', 'recipe', 'result']
+    recipe = {'@type': 'Recipe', 'name': 'Brot'}
+    assert events[5][1] == {'recipes': [recipe], 'truncated': False}
+    assert events[-1][1]['recipes'] == [recipe]
+
+
+@patch('ai_service.AIService.stream_images')
+def test_analyze_stream_extracts_recipes_from_cached_result(mock_stream_images, client):
+    answer = '```json\n{"@type": "Recipe", "name": "Brot",'
+    mock_stream_images.return_value = iter([
+        {'type': 'result', 'result': {'provider': 'test', 'response': answer, 'cached': True}},
+    ])
+
+    response = client.post('/api/analyze-stream', data={'image': (jpeg_upload(), 'test.jpg')})
+
+    events = parse_sse(response.get_data(as_text=True))
+    assert [name for name, _ in events] == ['upload', 'recipe', 'result']
+    assert events[1][1] == {'recipes': [{'@type': 'Recipe', 'name': 'Brot'}], 'truncated': True}
+    assert events[-1][1]['truncated'] is True
+
+
+def test_analyze_stream_rejects_invalid_upload(client):
+    response = client.post('/api/analyze-stream', data={'image': (io.BytesIO(b'not an image'), 'test.jpg')})
+
+    assert response.status_code == 400
+    assert response.mimetype == 'application/json'
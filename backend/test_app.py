@@ -1,29 +1,18 @@
-import pytest
 import sys
-import os
 import json
 import io
 from unittest.mock import MagicMock, patch
+from PIL import Image
 
-# Import the real app for testing - path is now set in conftest.py
-# Import from backend package
-from app import app as flask_app
 from ai_service import AIService
 from tandoor_api import get_auth_token, import_recipe, prepare_recipe_data, convert_time_to_minutes
 
-@pytest.fixture
-def client():
-    """Create a test client for the app."""
-    flask_app.config['TESTING'] = True
-    flask_app.config['UPLOAD_FOLDER'] = 'test_uploads'
-    # Create test uploads folder if it doesn't exist
-    os.makedirs(flask_app.config['UPLOAD_FOLDER'], exist_ok=True)
-    with flask_app.test_client() as client:
-        yield client
-    
-    # Cleanup test uploads after tests
-    for file in os.listdir(flask_app.config['UPLOAD_FOLDER']):
-        os.remove(os.path.join(flask_app.config['UPLOAD_FOLDER'], file))
+def jpeg_bytes(size=(8, 8)):
+    """Create a small in-memory JPEG image."""
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'white').save(buffer, format='JPEG')
+    buffer.seek(0)
+    return buffer
 
 def test_health_check(client):
     """Test that the health check endpoint returns 200."""
@@ -60,7 +49,7 @@ def test_upload_image_success(mock_analyze_image, client):
     mock_analyze_image.return_value = {'provider': 'test', 'response': 'Test response'}
     
     response = client.post('/api/upload-image', data={
-        'image': (io.BytesIO(b'test image data'), 'test.jpg')
+        'image': (jpeg_bytes(), 'test.jpg')
     })
     
     assert response.status_code == 200
@@ -69,11 +58,11 @@ def test_upload_image_success(mock_analyze_image, client):
     assert 'ai_analysis' in response.json
     assert response.json['ai_analysis'] == {'provider': 'test', 'response': 'Test response'}
 
-# Patch where get_auth_token is looked up within the app module
-@patch('backend.app.get_auth_token')
-def test_tandoor_auth_success(mock_get_auth_token, client):
+# The route logs in through the server-side token cache
+@patch('app.tandoor_tokens.login')
+def test_tandoor_auth_success(mock_login, client):
     """Test successful Tandoor authentication."""
-    mock_get_auth_token.return_value = 'test_token'
+    mock_login.return_value = ('test_session', 'test_token')
     
     response = client.post('/api/tandoor-auth', json={
         'username': 'testuser',
@@ -83,12 +72,13 @@ def test_tandoor_auth_success(mock_get_auth_token, client):
     assert response.status_code == 200
     assert response.json['success'] is True
     assert response.json['token'] == 'test_token'
+    assert response.json['session_id'] == 'test_session'
+    mock_login.assert_called_once_with('testuser', 'testpass')
 
-# Patch where get_auth_token is looked up within the app module
-@patch('backend.app.get_auth_token')
-def test_tandoor_auth_failure(mock_get_auth_token, client):
+@patch('app.tandoor_tokens.login')
+def test_tandoor_auth_failure(mock_login, client):
     """Test failed Tandoor authentication."""
-    mock_get_auth_token.return_value = None
+    mock_login.return_value = None
     
     response = client.post('/api/tandoor-auth', 
         json={
@@ -139,8 +129,8 @@ def test_extract_json_ld_no_json(client):
     assert response.status_code == 404
     assert 'error' in response.json
 
-# Patch where import_recipe is looked up within the app module
-@patch('backend.app.import_recipe')
+# The route imports through the server-side token cache
+@patch('app.tandoor_tokens.import_recipe')
 def test_import_to_tandoor_success(mock_import_recipe, client):
     """Test successful Tandoor import."""
     mock_import_recipe.return_value = {
@@ -200,8 +190,8 @@ def test_ai_service_error_handling(mock_get_provider):
     assert result['error'] == 'Test error'
 
 # Tests for tandoor_api functions
-# Patch where requests is looked up within the tandoor_api module
-@patch('backend.tandoor_api.requests.post')
+# Patch the pooled session used by the Tandoor client
+@patch('backend.tandoor_api.requests.Session.post')
 def test_get_auth_token_success(mock_post):
     """Test successful auth token retrieval."""
     # Setup mock response
@@ -219,8 +209,8 @@ def test_get_auth_token_success(mock_post):
     assert token == 'test_token'
     mock_post.assert_called_once()
 
-# Patch where requests is looked up within the tandoor_api module
-@patch('backend.tandoor_api.requests.post')
+# Patch the pooled session used by the Tandoor client
+@patch('backend.tandoor_api.requests.Session.post')
 def test_get_auth_token_failure(mock_post):
     """Test failed auth token retrieval."""
     # Setup mock response
@@ -244,8 +234,8 @@ def test_convert_time_to_minutes():
     assert convert_time_to_minutes("") == 0
     assert convert_time_to_minutes(None) == 0
 
-# Patch where requests is looked up within the tandoor_api module
-@patch('backend.tandoor_api.requests.post')
+# Patch the pooled session used by the Tandoor client
+@patch('backend.tandoor_api.requests.Session.post')
 def test_import_recipe_success(mock_post):
     """Test successful recipe import."""
     # Setup mock responses for the two API calls
@@ -262,7 +252,7 @@ def test_import_recipe_success(mock_post):
     # Call the function
     # Patch TANDOOR_API_URL within the tandoor_api module
     with patch('backend.tandoor_api.TANDOOR_API_URL', 'https://example.com'):
-        result = import_recipe({'name': 'Test Recipe'}, 'test_token')
+        result = import_recipe({'name': 'Test Recipe'}, 'test_token', mode='source')
     
     # Assertions
     assert result['success'] is True
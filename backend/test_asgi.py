@@ -0,0 +1,245 @@
+import io
+import os
+import asyncio
+import threading
+import httpx
+import pytest
+from unittest.mock import AsyncMock, patch
+from PIL import Image
+
+import asgi
+import app as app_module
+from app import app as flask_app
+from ai_providers import base_provider, openai_provider
+from ai_providers.base_provider import BaseAIProvider
+from ai_providers.openai_provider import OpenAIProvider
+from ai_providers.rate_limiter import RateLimiter
+from analysis_jobs import AnalysisJobManager
+from tandoor_api import AsyncTandoorClient, TandoorClient
+
+
+class StubProvider(BaseAIProvider):
+    """Async provider that can hold every call until enough are in flight."""
+
+    def __init__(self, expected=0):
+        super().__init__()
+        self.expected = expected
+        self.in_flight = 0
+        self.peak = 0
+        self.calls = []
+        self.release = None
+
+    @property
+    def provider_name(self):
+        return 'stub'
+
+    def analyze_image(self, image_path, prompt):
+        raise AssertionError('the async path must not call the sync provider')
+
+    async def analyze_images_async(self, image_paths, prompt):
+        self.calls.append(list(image_paths))
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        if self.in_flight >= self.expected:
+            self.release.set()
+        await self.release.wait()
+        self.in_flight -= 1
+        return self._create_success_response('Rezept', 'stub-model')
+
+    async def stream_images_async(self, image_paths, prompt):
+        tokens = ('```json\n{"@type": "Recipe", ', '"name": "Brot"}\n```')
+        for token in tokens:
+            yield token
+        yield self._create_success_response(''.join(tokens), 'stub-model')
+
+
+def jpeg(color='white'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), color).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def upload_folder(tmp_path):
+    flask_app.config['UPLOAD_FOLDER'] = str(tmp_path)
+    yield tmp_path
+    flask_app.config['UPLOAD_FOLDER'] = 'uploads'
+
+
+@pytest.fixture
+def provider():
+    provider = StubProvider()
+    with patch('ai_service.AIProviderFactory.get_provider', return_value=provider), \
+            patch('ai_service.analysis_cache.enabled', False):
+        yield provider
+
+
+def run(scenario):
+    async def main():
+        transport = httpx.ASGITransport(app=asgi.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return await asyncio.wait_for(scenario(client), timeout=30)
+    return asyncio.run(main())
+
+
+def test_concurrent_uploads_wait_for_the_provider_together(upload_folder, provider):
+    provider.expected = 200
+
+    async def scenario(client):
+        provider.release = asyncio.Event()
+        return await asyncio.gather(*[
+            client.post('/api/upload-image', files={'image': ('test.jpg', jpeg(), 'image/jpeg')})
+            for _ in range(200)
+        ])
+
+    responses = run(scenario)
+
+    assert all(response.status_code == 200 for response in responses)
+    # All 200 requests were waiting for the provider at the same time
+    assert provider.peak == 200
+    assert responses[0].json()['ai_analysis']['response'] == 'Rezept'
+    assert 'upload_save;dur=' in responses[0].headers['Server-Timing']
+
+
+def test_rejected_upload_leaves_no_files(upload_folder, provider):
+    async def scenario(client):
+        return await client.post('/api/upload-image', files={'image': ('test.jpg', b'not an image', 'image/jpeg')})
+
+    response = run(scenario)
+
+    assert response.status_code == 400
+    assert os.listdir(upload_folder) == []
+    assert provider.calls == []
+
+
+def test_recipe_pages_are_analyzed_together(upload_folder, provider):
+    provider.expected = 1
+
+    async def scenario(client):
+        provider.release = asyncio.Event()
+        return await client.post('/api/upload-recipe-pages', files=[
+            ('images', ('page1.jpg', jpeg('white'), 'image/jpeg')),
+            ('images', ('page2.jpg', jpeg('black'), 'image/jpeg')),
+        ])
+
+    response = run(scenario)
+
+    assert response.status_code == 200
+    assert len(response.json()['files']) == 2
+    assert len(provider.calls) == 1 and len(provider.calls[0]) == 2
+
+
+def test_analyze_stream_sends_tokens_and_result(upload_folder, provider):
+    async def scenario(client):
+        return await client.post('/api/analyze-stream', files={'image': ('test.jpg', jpeg(), 'image/jpeg')})
+
+    response = run(scenario)
+
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/event-stream')
+    events = [block.split('\n')[0] for block in response.text.strip().split('\n\n')]
+    assert events == ['event: upload', 'event: token', 'event: token', 'event: recipe', 'event: result']
+    assert '"recipes": [{"@type": "Recipe", "name": "Brot"}]' in response.text.split('\n\n')[-2]
+
+
+def test_other_routes_are_served_by_flask():
+    async def scenario(client):
+        return await client.get('/api/health')
+
+    response = run(scenario)
+
+    assert response.status_code == 200
+    assert response.json() == {'status': 'ok'}
+    assert response.headers['Server-Timing'].startswith('total;dur=')
+
+
+def test_import_answers_409_for_duplicates():
+    result = {'success': False, 'duplicate': {'recipe_id': 7}, 'status_code': 409}
+
+    async def scenario(client):
+        return await client.post('/api/import-to-tandoor', json={'recipe_json_ld': {'name': 'Test'}, 'auth_token': 't'})
+
+    with patch.object(asgi.tandoor_tokens, 'import_recipe_async', AsyncMock(return_value=result)) as mock_import:
+        response = run(scenario)
+
+    assert response.status_code == 409
+    assert response.json()['duplicate'] == {'recipe_id': 7}
+    mock_import.assert_awaited_once_with({'name': 'Test'}, session_id=None, auth_token='t', allow_duplicate=False)
+
+
+@pytest.fixture
+def tandoor(local_server):
+    """Local Tandoor answering POSTs with the queued status codes."""
+    statuses = []
+    server = local_server(lambda method, path, query, body: (statuses.pop(0), {'id': 5}))
+    return server.url, statuses, server.paths
+
+
+def test_async_tandoor_client_retries_only_safe_failures(tandoor):
+    url, statuses, requests = tandoor
+    client = AsyncTandoorClient(TandoorClient(base_url=url, max_retries=1))
+
+    async def scenario():
+        statuses.extend([503, 201])
+        unavailable = await client._post('/api/recipe/', json={'name': 'Test'})
+        # A 502 may come after the recipe was created, so it is not repeated
+        statuses.extend([502, 201])
+        bad_gateway = await client._post('/api/recipe/', json={'name': 'Test'})
+        await client.aclose()
+        return unavailable, bad_gateway
+
+    unavailable, bad_gateway = asyncio.run(scenario())
+
+    assert unavailable.status_code == 201
+    assert bad_gateway.status_code == 502
+    assert requests == ['/api/recipe/'] * 3
+
+
+@pytest.fixture
+def openai_api(local_server):
+    """Local chat completions API that reports an exhausted request quota."""
+    completion = {
+        'id': 'chatcmpl-1', 'object': 'chat.completion', 'created': 0, 'model': 'gpt',
+        'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': 'Rezept'}}]
+    }
+    quota = {'x-ratelimit-remaining-requests': '0', 'x-ratelimit-reset-requests': '30s'}
+    server = local_server(lambda method, path, query, body: (200, completion, quota))
+    return f"{server.url}/v1"
+
+
+def test_openai_async_client_feeds_the_rate_limiter(openai_api, tmp_path, monkeypatch):
+    image_path = tmp_path / 'page.jpg'
+    Image.new('RGB', (20, 20), 'white').save(image_path)
+    limiter = RateLimiter(db_path=str(tmp_path / 'limits.sqlite3'), limits={}, max_wait=1.0)
+    monkeypatch.setenv('OPENAI_BASE_URL', openai_api)
+    provider = OpenAIProvider()
+
+    async def scenario():
+        result = await provider.analyze_images_async([str(image_path)], 'prompt')
+        await provider.aclose()
+        return result
+
+    with patch.object(base_provider, 'rate_limiter', limiter), \
+            patch.object(openai_provider, 'OPENAI_API_KEY', 'key'):
+        result = asyncio.run(scenario())
+
+    assert result['response'] == 'Rezept'
+    assert 29 < limiter.blocked_for('openai') <= 30
+
+
+def test_job_events_are_streamed_without_a_thread(tmp_path):
+    manager = AnalysisJobManager(db_path=str(tmp_path / 'jobs.sqlite3'), max_workers=1, queue_size=1)
+    release = threading.Event()
+    job_id = manager.submit(lambda report: release.wait(5) and {'provider': 'test', 'response': 'ok'})
+
+    async def scenario(client):
+        asyncio.get_running_loop().call_later(0.3, release.set)
+        return await client.get(f'/api/analysis-jobs/{job_id}/events')
+
+    with patch.object(app_module, 'analysis_jobs', manager), patch.object(asgi, 'analysis_jobs', manager), \
+            patch.object(asgi, 'JOB_POLL_INTERVAL', 0.05):
+        response = run(scenario)
+
+    assert response.status_code == 200
+    assert response.text.split('\n\n')[-2].startswith('event: result')
+    assert '"status": "completed"' in response.text
@@ -0,0 +1,99 @@
+import json
+import time
+import threading
+import pytest
+from unittest.mock import patch
+
+from bulk_import import import_recipes, summarize
+
+
+def fake_import(recipe):
+    if recipe.get('fail'):
+        raise RuntimeError('Tandoor kaputt')
+    return {'success': True, 'recipe_id': recipe['id']}
+
+
+def test_import_recipes_respects_concurrency():
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def slow_import(recipe):
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        time.sleep(0.02)
+        with lock:
+            active -= 1
+        return {'success': True}
+
+    results = list(import_recipes([{'id': i} for i in range(12)], slow_import, concurrency=3))
+
+    assert len(results) == 12
+    assert peak == 3
+    assert sorted(result['index'] for result in results) == list(range(12))
+
+
+def test_import_recipes_continues_after_failures():
+    recipes = [{'id': 0, 'name': 'A'}, {'fail': True, 'name': 'B'}, 'not json', 42, json.dumps({'id': 4})]
+
+    results = sorted(import_recipes(recipes, fake_import, concurrency=2), key=lambda result: result['index'])
+
+    assert [result['success'] for result in results] == [True, False, False, False, True]
+    assert results[1] == {'success': False, 'error': 'Tandoor kaputt', 'index': 1, 'name': 'B'}
+    assert results[4]['recipe_id'] == 4
+    assert summarize(results) == {'total': 5, 'succeeded': 2, 'failed': 3, 'reauth_required': False}
+
+
+def test_import_recipes_cancels_pending_when_closed():
+    started = []
+
+    def slow_import(recipe):
+        started.append(recipe['id'])
+        time.sleep(0.05)
+        return {'success': True}
+
+    results = import_recipes([{'id': i} for i in range(20)], slow_import, concurrency=2)
+    next(results)
+    results.close()
+    time.sleep(0.2)
+
+    assert len(started) < 20
+
+
+@patch('app.tandoor_tokens.import_recipe', side_effect=lambda recipe, **kwargs: fake_import(recipe))
+def test_bulk_import_endpoint(mock_import_recipe, client):
+    response = client.post('/api/import-to-tandoor/bulk', json={
+        'recipes': [{'id': 1}, {'fail': True}, {'id': 3}],
+        'session_id': 'session'
+    })
+
+    assert response.status_code == 200
+    assert [result['index'] for result in response.json['results']] == [0, 1, 2]
+    assert response.json['summary'] == {'total': 3, 'succeeded': 2, 'failed': 1, 'reauth_required': False}
+    assert mock_import_recipe.call_args.kwargs == {'session_id': 'session', 'auth_token': None, 'allow_duplicate': False}
+
+
+@patch('app.tandoor_tokens.import_recipe', side_effect=lambda recipe, **kwargs: fake_import(recipe))
+def test_bulk_import_endpoint_streams_ndjson(mock_import_recipe, client):
+    response = client.post('/api/import-to-tandoor/bulk?stream=1', json={
+        'recipes': [{'id': 1}, {'id': 2}],
+        'auth_token': 'token'
+    })
+
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert sorted(line['index'] for line in lines[:-1]) == [0, 1]
+    assert all(line['type'] == 'result' for line in lines[:-1])
+    assert lines[-1] == {'type': 'summary', 'total': 2, 'succeeded': 2, 'failed': 0, 'reauth_required': False}
+
+
+@pytest.mark.parametrize('payload', [
+    {'recipes': [{'id': 1}]},
+    {'recipes': [], 'session_id': 's'},
+    {'recipes': {'id': 1}, 'session_id': 's'},
+    {'recipes': [{'id': 1}], 'session_id': 's', 'concurrency': 0},
+])
+def test_bulk_import_endpoint_rejects_invalid_requests(payload, client):
+    assert client.post('/api/import-to-tandoor/bulk', json=payload).status_code == 400
@@ -0,0 +1,145 @@
+import io
+import os
+import pytest
+from unittest.mock import patch
+from PIL import Image
+
+from ai_providers.image_preprocessing import (
+    DerivativeCache,
+    ImageSpec,
+    encode_jpeg_within,
+    prepare_image,
+    target_size
+)
+from ai_providers.openai_provider import OpenAIProvider
+from ai_providers.anthropic_provider import AnthropicProvider
+
+
+def write_image(path, size=(40, 20), fmt='JPEG', orientation=None):
+    img = Image.new('RGB', size, 'white')
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    img.save(path, format=fmt, exif=exif)
+    return str(path)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return DerivativeCache(str(tmp_path / 'derivatives'))
+
+
+def test_target_size():
+    assert target_size((4000, 3000), ImageSpec(max_edge=2048)) == (2048, 1536)
+    assert target_size((4000, 3000), ImageSpec(max_edge=2048, max_short_edge=768)) == (1024, 768)
+    assert target_size((800, 600), ImageSpec(max_edge=2048)) == (800, 600)
+
+
+def test_provider_specs():
+    """Each provider downscales to the resolution its API actually uses."""
+    assert OpenAIProvider.image_spec.max_short_edge == 768
+    assert AnthropicProvider.image_spec.max_edge == 1568
+    assert AnthropicProvider.image_spec.max_bytes is not None
+
+
+def test_small_jpeg_passes_through_unchanged(tmp_path, cache):
+    path = write_image(tmp_path / 'small.jpg')
+    prepared = prepare_image(path, ImageSpec(), cache=cache)
+
+    assert prepared.data == open(path, 'rb').read()
+    assert prepared.media_type == 'image/jpeg'
+    assert not os.path.exists(cache.directory)
+
+
+def test_png_is_labelled_as_png(tmp_path, cache):
+    path = tmp_path / 'page.png'
+    Image.new('RGBA', (10, 10), (255, 0, 0, 128)).save(path)
+    prepared = prepare_image(str(path), ImageSpec(), cache=cache)
+
+    assert prepared.media_type == 'image/png'
+
+
+def test_exif_orientation_is_applied(tmp_path, cache):
+    """Orientation 6 (rotated 90°) swaps width and height."""
+    path = write_image(tmp_path / 'rotated.jpg', size=(40, 20), orientation=6)
+    prepared = prepare_image(path, ImageSpec(), cache=cache)
+
+    assert prepared.size == (20, 40)
+    assert Image.open(io.BytesIO(prepared.data)).size == (20, 40)
+
+
+def test_large_image_is_downscaled_and_cached(tmp_path, cache):
+    path = write_image(tmp_path / 'large.jpg', size=(3000, 1500))
+    spec = ImageSpec(max_edge=1000)
+    prepared = prepare_image(path, spec, cache=cache)
+
+    assert prepared.size == (1000, 500)
+    assert Image.open(io.BytesIO(prepared.data)).size == (1000, 500)
+    assert len(os.listdir(cache.directory)) == 1
+
+    # A retry with the same spec reuses the derivative without decoding the source
+    with patch('ai_providers.image_preprocessing._render') as mock_render:
+        assert prepare_image(path, spec, cache=cache) == prepared
+    mock_render.assert_not_called()
+
+    # Another provider spec yields its own derivative
+    prepare_image(path, ImageSpec(max_edge=500), cache=cache)
+    assert len(os.listdir(cache.directory)) == 2
+
+
+def test_gif_is_reencoded_as_jpeg(tmp_path, cache):
+    path = write_image(tmp_path / 'card.gif', fmt='GIF')
+    prepared = prepare_image(path, ImageSpec(), cache=cache)
+
+    assert prepared.media_type == 'image/jpeg'
+    assert prepared.data.startswith(b'\xff\xd8')
+
+
+def test_encode_jpeg_within_respects_limit():
+    noise = Image.effect_noise((800, 800), 100).convert('RGB')
+    data, size = encode_jpeg_within(noise, max_bytes=40_000)
+
+    assert len(data) <= 40_000
+    assert Image.open(io.BytesIO(data)).size == size
+
+
+def test_encode_jpeg_within_prefers_quality_over_scaling():
+    """If a lower quality is enough, the resolution stays untouched."""
+    img = Image.linear_gradient('L').resize((1200, 900)).convert('RGB')
+    unlimited, _ = encode_jpeg_within(img)
+    data, size = encode_jpeg_within(img, max_bytes=int(len(unlimited) * 0.8))
+
+    assert size == (1200, 900)
+    assert len(data) <= len(unlimited) * 0.8
+
+
+def test_encode_jpeg_within_encodes_full_image_once():
+    """Quality is searched on a small probe, not on the full image."""
+    noise = Image.effect_noise((1600, 1200), 60).convert('RGB')
+    full_size_saves = []
+    original_save = Image.Image.save
+
+    def counting_save(self, *args, **kwargs):
+        if self.size == (1600, 1200):
+            full_size_saves.append(kwargs.get('quality'))
+        return original_save(self, *args, **kwargs)
+
+    with patch.object(Image.Image, 'save', counting_save):
+        data, _ = encode_jpeg_within(noise, max_bytes=1_000_000)
+
+    assert len(data) <= 1_000_000
+    assert len(full_size_saves) == 1
+
+
+def test_derivative_cache_evicts_least_recently_used(tmp_path, cache):
+    paths = [write_image(tmp_path / f'img{i}.jpg', size=(2000 + i, 1000)) for i in range(2)]
+    prepare_image(paths[0], ImageSpec(max_edge=100), cache=cache)
+    (first,) = os.listdir(cache.directory)
+    first_path = os.path.join(cache.directory, first)
+    cache.max_bytes = int(os.path.getsize(first_path) * 1.5)
+    os.utime(first_path, (0, 0))
+
+    prepare_image(paths[1], ImageSpec(max_edge=100), cache=cache)
+
+    assert len(os.listdir(cache.directory)) == 1
+    assert first not in os.listdir(cache.directory)
@@ -0,0 +1,39 @@
+import pytest
+
+from ingredient_parser import ParsedIngredient, parse_ingredient, parse_ingredients, parse_number
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('3', 3.0),
+    ('1,5', 1.5),
+    ('1.5', 1.5),
+    ('3/4', 0.75),
+    ('1 1/2', 1.5),
+    ('½', 0.5),
+    ('1½', 1.5),
+    ('1/0', 0.0),
+])
+def test_parse_number(text, expected):
+    assert parse_number(text) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('200g Mehl', ParsedIngredient(200.0, None, 'g', 'Mehl', '')),
+    ('1 1/2 EL Olivenöl (kaltgepresst)', ParsedIngredient(1.5, None, 'EL', 'Olivenöl', 'kaltgepresst')),
+    ('½ TL Salz', ParsedIngredient(0.5, None, 'TL', 'Salz', '')),
+    ('2-3 Zwiebeln', ParsedIngredient(2.0, 3.0, '', 'Zwiebeln', '')),
+    ('2 to 3 tbsp. butter', ParsedIngredient(2.0, 3.0, 'tbsp', 'butter', '')),
+    ('1½ cups of milk', ParsedIngredient(1.5, None, 'cup', 'milk', '')),
+    ('1 Pck. Vanillezucker', ParsedIngredient(1.0, None, 'Päckchen', 'Vanillezucker', '')),
+    ('2 fl. oz cream', ParsedIngredient(2.0, None, 'fl oz', 'cream', '')),
+    ('1 Tomate', ParsedIngredient(1.0, None, '', 'Tomate', '')),
+    ('Salz und Pfeffer', ParsedIngredient(0, None, '', 'Salz und Pfeffer', '')),
+])
+def test_parse_ingredient(text, expected):
+    assert parse_ingredient(text) == expected
+
+
+def test_parse_ingredients_keeps_order():
+    lines = ['1 Ei', '200 g Zucker', '1 Ei']
+
+    assert [ingredient.food for ingredient in parse_ingredients(lines)] == ['Ei', 'Zucker', 'Ei']
@@ -0,0 +1,85 @@
+
+from json_ld_extractor import JsonLdExtractor, extract_json_ld, find_recipes, parse_json_lenient
+
+RECIPE = '{"@context": "https://schema.org/", "@type": "Recipe", "name": "Pfannkuchen", "recipeIngredient": ["200 g Mehl", "2 Eier"]}'
+
+
+def test_multiple_blocks():
+    text = f"Erstes:\n```json\n{RECIPE}\n```\nZweites:\n```json\n{RECIPE.replace('Pfannkuchen', 'Waffeln')}\n```"
+    extractor = extract_json_ld(text)
+
+    assert [recipe['name'] for recipe in extractor.recipes] == ['Pfannkuchen', 'Waffeln']
+
+
+def test_blocks_complete_while_feeding_small_chunks():
+    """Fences split across chunks are recognised; a block is parsed when it closes."""
+    text = f"Hier:\n```json\n{RECIPE}\n```\nFertig"
+    closing = text.rindex('```') + 3
+    extractor = JsonLdExtractor()
+
+    completed = [position for position in range(0, len(text), 3) if extractor.feed(text[position:position + 3])]
+
+    assert len(completed) == 1 and completed[0] < closing
+    assert extractor.finish()[0].recipes[0]['name'] == 'Pfannkuchen'
+
+
+def test_graph_wrapper_passes_context_to_recipe():
+    data = {
+        '@context': 'https://schema.org/',
+        '@graph': [{'@type': 'WebPage'}, {'@type': ['Recipe'], 'name': 'Brot'}]
+    }
+
+    assert find_recipes(data) == [{'@context': 'https://schema.org/', '@type': ['Recipe'], 'name': 'Brot'}]
+
+
+def test_trailing_commas_are_tolerated():
+    data, repaired = parse_json_lenient('{"a": [1, 2,], "b": "x, ]",\n}')
+
+    assert data == {'a': [1, 2], 'b': 'x, ]'}
+    assert repaired is True
+
+
+def test_truncated_response_is_closed():
+    """A response cut off by MAX_TOKENS still yields the recipe so far."""
+    text = '```json\n{"@type": "Recipe", "name": "Suppe", "recipeInstructions": ["Wasser kochen", "Gemüse schnei'
+    extractor = extract_json_ld(text)
+
+    block = extractor.blocks[0]
+    assert block.truncated is True
+    assert block.recipes[0]['recipeInstructions'] == ['Wasser kochen', 'Gemüse schnei']
+
+
+def test_truncated_inside_key_drops_partial_member():
+    data, _ = parse_json_lenient('{"@type": "Recipe", "name": "Suppe", "recipeYi', truncated=True)
+
+    assert data == {'@type': 'Recipe', 'name': 'Suppe'}
+
+
+def test_non_json_blocks_are_ignored():
+    extractor = extract_json_ld("```python\nprint('x')\n```\n```\n{\"@type\": \"Recipe\"}\n```")
+
+    assert len(extractor.blocks) == 1
+    assert extractor.recipes == [{'@type': 'Recipe'}]
+
+
+def test_invalid_json_is_reported():
+    extractor = extract_json_ld("```json\n{not json}\n```")
+
+    assert extractor.blocks == []
+    assert extractor.errors[0].startswith('Ungültiges JSON')
+
+
+def test_endpoint_returns_all_recipes(client):
+    graph = '{"@context": "https://schema.org/", "@graph": [{"@type": "Recipe", "name": "A",}, {"@type": "Recipe", "name": "B"}]}'
+    response = client.post('/api/extract-json-ld', json={'ai_response': f"```json\n{graph}\n```"})
+
+    assert response.status_code == 200
+    assert response.json['json_ld'] == {'@context': 'https://schema.org/', '@type': 'Recipe', 'name': 'A'}
+    assert [recipe['name'] for recipe in response.json['recipes']] == ['A', 'B']
+    assert response.json['truncated'] is False
+
+
+def test_endpoint_rejects_invalid_json(client):
+    response = client.post('/api/extract-json-ld', json={'ai_response': "```json\n{not json}\n```"})
+
+    assert response.status_code == 400
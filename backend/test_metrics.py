@@ -0,0 +1,147 @@
+import io
+import os
+import sys
+import subprocess
+import pytest
+from unittest.mock import patch
+from PIL import Image
+from prometheus_client import REGISTRY
+
+import metrics
+from tandoor_api import TandoorClient
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_metrics_endpoint_exposes_prometheus_text(client):
+    response = client.get('/api/metrics')
+
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain')
+    body = response.get_data(as_text=True)
+    assert 'recipe_stage_duration_seconds_bucket' in body
+    assert 'http_request_bytes_total' in body
+
+
+@patch('app.AIService.analyze_image', return_value={'provider': 'test', 'response': 'ok'})
+def test_upload_records_stage_and_bytes(mock_analyze, client):
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), 'white').save(buffer, format='JPEG')
+    size = len(buffer.getvalue())
+    buffer.seek(0)
+    saved = sample('recipe_stage_duration_seconds_count', stage='upload_save')
+    received = sample('http_request_bytes_total')
+    sent = sample('http_response_bytes_total')
+
+    response = client.post('/api/upload-image', data={'image': (buffer, 'test.jpg')})
+
+    assert response.status_code == 200
+    assert sample('recipe_stage_duration_seconds_count', stage='upload_save') == saved + 1
+    assert sample('http_request_bytes_total') - received >= size
+    assert sample('http_response_bytes_total') - sent == len(response.get_data())
+
+
+def test_streamed_response_bytes_are_counted(client):
+    sent = sample('http_response_bytes_total')
+    with patch('app.AIService.stream_images', return_value=iter([{'type': 'result', 'result': {'response': 'ö'}}])):
+        buffer = io.BytesIO()
+        Image.new('RGB', (8, 8), 'white').save(buffer, format='JPEG')
+        buffer.seek(0)
+        response = client.post('/api/analyze-stream', data={'image': (buffer, 'test.jpg')})
+        body = response.get_data()
+
+    assert sample('http_response_bytes_total') - sent == len(body)
+
+
+def test_json_ld_extraction_and_errors_are_recorded(client):
+    extracted = sample('recipe_stage_duration_seconds_count', stage='json_ld_extraction')
+    errors = sample('recipe_errors_total', type='json_ld')
+    not_found = sample('recipe_errors_total', type='http_404')
+
+    response = client.post('/api/extract-json-ld', json={'ai_response': 'kein JSON'})
+
+    assert response.status_code == 404
+    assert sample('recipe_stage_duration_seconds_count', stage='json_ld_extraction') == extracted + 1
+    assert sample('recipe_errors_total', type='json_ld') == errors + 1
+    assert sample('recipe_errors_total', type='http_404') == not_found + 1
+
+
+def test_tandoor_operation_replaces_ids():
+    base = 'https://tandoor.example/sub'
+    assert metrics.tandoor_operation(base, 'GET', f'{base}/api/food/?page=2&page_size=100') == 'GET /api/food/'
+    assert metrics.tandoor_operation(base, 'PATCH', f'{base}/api/recipe/42/') == 'PATCH /api/recipe/{id}/'
+    assert metrics.tandoor_operation(base, 'GET', 'https://other/api/unit/?page=3') == 'GET /api/unit/'
+
+
+@pytest.fixture
+def tandoor(local_server):
+    """Local Tandoor that rejects every token."""
+    return local_server(lambda method, path, query, body: (401, {'detail': 'Ungültiges Token'})).url
+
+
+def test_tandoor_calls_are_timed(tandoor):
+    client = TandoorClient(base_url=tandoor, max_retries=0)
+    count = sample('tandoor_request_duration_seconds_count', operation='POST /api/recipe/')
+    errors = sample('recipe_errors_total', type='tandoor_401')
+
+    result = client._create_recipe({'name': 'Test'}, 'token', {'Authorization': 'Bearer token'})
+    client.close()
+
+    assert result['status_code'] == 401
+    assert sample('tandoor_request_duration_seconds_count', operation='POST /api/recipe/') == count + 1
+    assert sample('recipe_errors_total', type='tandoor_401') == errors + 1
+
+
+def test_metrics_of_all_workers_are_aggregated(tmp_path):
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path / 'prometheus'))
+    record = "import metrics; metrics.UPLOAD_SAVE.observe(0.2); metrics.BYTES_RECEIVED.inc(100)"
+    for _ in range(2):
+        subprocess.run([sys.executable, '-c', record], cwd=BACKEND_DIR, env=env, check=True)
+
+    output = subprocess.run(
+        [sys.executable, '-c', "import metrics; print(metrics.render()[0].decode())"],
+        cwd=BACKEND_DIR, env=env, check=True, capture_output=True, text=True
+    ).stdout
+
+    assert 'recipe_stage_duration_seconds_count{stage="upload_save"} 2.0' in output
+    assert 'http_request_bytes_total 200.0' in output
+
+
+def test_server_timing_sums_repeated_stages():
+    metrics.start_request_timing()
+    metrics.observe_stage(metrics.UPLOAD_SAVE, 'upload_save', 0.002)
+    metrics.observe_stage(metrics.TANDOOR_REQUEST_DURATION.labels('GET /api/food/'), 'tandoor', 0.01)
+    metrics.observe_stage(metrics.TANDOOR_REQUEST_DURATION.labels('GET /api/food/'), 'tandoor', 0.02)
+    metrics.observe_stage(metrics.AI_REQUEST_DURATION.labels('openai', 'gpt'), 'ai', 1.5, 'openai "gpt", x;y')
+
+    header = metrics.server_timing(total=2.0)
+
+    assert header == (
+        'upload_save;dur=2.0, tandoor;dur=30.0;desc="2x", '
+        'ai;dur=1500.0;desc="openai gpt xy", total;dur=2000.0'
+    )
+
+
+def test_server_timing_header_on_api_responses(client):
+    response = client.post('/api/extract-json-ld', json={'ai_response': 'kein JSON'})
+    header = response.headers['Server-Timing']
+    assert header.startswith('json_ld_extraction;dur=')
+    assert 'total;dur=' in header
+
+    assert client.get('/api/health').headers['Server-Timing'].startswith('total;dur=')
+    assert 'Server-Timing' not in client.get('/').headers
+
+
+@patch('app.AIService.analyze_image', return_value={'provider': 'test', 'response': 'ok'})
+def test_server_timing_includes_upload(mock_analyze, client):
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), 'white').save(buffer, format='JPEG')
+    buffer.seek(0)
+
+    response = client.post('/api/upload-image', data={'image': (buffer, 'test.jpg')})
+
+    assert 'upload_save;dur=' in response.headers['Server-Timing']
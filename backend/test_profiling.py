@@ -0,0 +1,80 @@
+import time
+import threading
+import pytest
+from unittest.mock import patch
+
+import app as app_module
+from profiling import Profiler, StackSampler, fold_stack
+
+
+@pytest.fixture
+def profiler(tmp_path):
+    profiler = Profiler(db_path=str(tmp_path / 'profiling.sqlite3'), directory=str(tmp_path / 'profiles'),
+                        interval=0.001, max_files=2)
+    with patch.object(app_module, 'profiler', profiler), patch.object(app_module, 'ADMIN_TOKEN', 'secret'):
+        yield profiler
+
+
+def busy_wait(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def test_fold_stack_lists_callers_first():
+    def inner():
+        import sys
+        return fold_stack(sys._getframe())
+
+    stack = inner()
+    assert stack.split(';')[-1].startswith('inner (test_profiling.py:')
+    assert 'test_fold_stack_lists_callers_first' in stack.split(';')[-2]
+
+
+def test_sampler_records_the_watched_thread():
+    sampler = StackSampler(threading.get_ident(), interval=0.001).start()
+    busy_wait(0.05)
+    counts = sampler.stop()
+
+    assert sum(counts.values()) > 5
+    assert any('busy_wait' in stack for stack in counts)
+
+
+def test_admin_endpoint_requires_token(client, profiler):
+    assert client.get('/api/admin/profiling').status_code == 403
+    assert client.get('/api/admin/profiling', headers={'X-Admin-Token': 'wrong'}).status_code == 403
+
+    with patch.object(app_module, 'ADMIN_TOKEN', ''):
+        assert client.get('/api/admin/profiling', headers={'X-Admin-Token': ''}).status_code == 403
+
+
+def test_admin_endpoint_validates_settings(client, profiler):
+    headers = {'X-Admin-Token': 'secret'}
+    assert client.post('/api/admin/profiling', json={'sample_rate': 2}, headers=headers).status_code == 400
+    assert client.post('/api/admin/profiling', json={'sample_rate': 0.5, 'duration': -1}, headers=headers).status_code == 400
+
+
+def test_sampled_requests_are_saved_as_folded_stacks(client, profiler):
+    headers = {'X-Admin-Token': 'secret'}
+    response = client.post('/api/admin/profiling', json={'sample_rate': 1, 'duration': 60}, headers=headers)
+    assert response.status_code == 200
+    assert response.json['sample_rate'] == 1
+
+    for _ in range(3):
+        with patch('app.extract_json_ld_blocks', side_effect=lambda text: busy_wait(0.05)):
+            client.post('/api/extract-json-ld', json={'ai_response': 'kein JSON'}).close()
+
+    profiles = client.get('/api/admin/profiling', headers=headers).json['profiles']
+    assert len(profiles) == 2
+    assert all('POST-api_extract_json_ld' in name for name in profiles)
+
+    response = client.get(f'/api/admin/profiling/{profiles[0]}', headers=headers)
+    assert response.status_code == 200
+    line = response.get_data(as_text=True).splitlines()[0]
+    stack, count = line.rsplit(' ', 1)
+    assert int(count) >= 1 and ';' in stack
+
+    assert client.get('/api/admin/profiling/../profiling.sqlite3', headers=headers).status_code == 404
+
+    client.post('/api/admin/profiling', json={'sample_rate': 0}, headers=headers)
+    assert profiler.maybe_start() is None
@@ -0,0 +1,251 @@
+import time
+import asyncio
+import threading
+import pytest
+from unittest.mock import patch
+
+from ai_providers import provider_factory
+from ai_providers.base_provider import BaseAIProvider
+from ai_providers.provider_chain import ProviderChain, ProviderHealth, CIRCUIT_OPEN, CIRCUIT_CLOSED
+from ai_providers.provider_factory import AIProviderFactory
+
+
+class FakeProvider(BaseAIProvider):
+    """Provider that answers after a delay or fails."""
+
+    def __init__(self, name, delay=0.0, fail=False, tokens=None):
+        super().__init__()
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        self.tokens = tokens or []
+        self.calls = 0
+        self.finished = threading.Event()
+
+    @property
+    def provider_name(self):
+        return self.name
+
+    def analyze_image(self, image_path, prompt):
+        self.calls += 1
+        time.sleep(self.delay)
+        self.finished.set()
+        if self.fail:
+            raise RuntimeError(f'{self.name} down')
+        return self._create_success_response(f'answer from {self.name}', 'model')
+
+    async def analyze_images_async(self, image_paths, prompt):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        self.finished.set()
+        if self.fail:
+            raise RuntimeError(f'{self.name} down')
+        return self._create_success_response(f'answer from {self.name}', 'model')
+
+    def stream_images(self, image_paths, prompt):
+        self.calls += 1
+        for token in self.tokens:
+            yield token
+        if self.fail:
+            raise RuntimeError(f'{self.name} down')
+        return self._create_success_response(''.join(self.tokens), 'model')
+
+
+def warm_up(chain, provider, latency, samples=10):
+    for _ in range(samples):
+        chain.health[provider.provider_name].record_success(latency)
+
+
+def test_failover_records_winning_provider():
+    chain = ProviderChain([FakeProvider('a', fail=True), FakeProvider('b')])
+
+    result = chain.analyze_image('x.jpg', 'prompt')
+
+    assert result == {
+        'provider': 'b', 'response': 'answer from b', 'model': 'model', 'failed_providers': ['a']
+    }
+
+
+def test_all_providers_failing_returns_error_response():
+    chain = ProviderChain([FakeProvider('a', fail=True), FakeProvider('b', fail=True)])
+
+    result = chain.analyze_image('x.jpg', 'prompt')
+
+    assert result['provider'] == 'a,b'
+    assert 'a: a down' in result['error'] and 'b: b down' in result['error']
+
+
+def test_circuit_breaker_skips_failing_provider_until_reset():
+    primary = FakeProvider('a', fail=True)
+    chain = ProviderChain([primary, FakeProvider('b')], failure_threshold=2, reset_timeout=0.1)
+
+    for _ in range(4):
+        chain.analyze_image('x.jpg', 'prompt')
+
+    assert primary.calls == 2
+    assert chain.health['a'].state == CIRCUIT_OPEN
+
+    time.sleep(0.15)
+    primary.fail = False
+    assert chain.analyze_image('x.jpg', 'prompt')['provider'] == 'a'
+    assert chain.health['a'].state == CIRCUIT_CLOSED
+
+
+def test_half_open_allows_a_single_trial():
+    health = ProviderHealth('a', failure_threshold=1, reset_timeout=0.05)
+    health.record_failure()
+    time.sleep(0.06)
+
+    assert health.allow() is True
+    assert health.allow() is False
+    health.record_failure()
+    assert health.allow() is False
+
+
+def test_hedging_runs_the_primary_on_the_calling_thread():
+    primary = FakeProvider('a', delay=0.5, fail=True)
+    secondary = FakeProvider('b', delay=0.3)
+    chain = ProviderChain([primary, secondary], hedge=True, hedge_min_samples=5)
+    warm_up(chain, primary, 0.05)
+    threads = []
+    call = primary.analyze_image
+    primary.analyze_image = lambda *args: threads.append(threading.current_thread()) or call(*args)
+
+    started = time.monotonic()
+    result = chain.analyze_image('x.jpg', 'prompt')
+
+    assert threads == [threading.current_thread()]
+    # The secondary was started after the p95 and was ready when the primary failed
+    assert result['provider'] == 'b'
+    assert result['hedged'] is True
+    assert result['failed_providers'] == ['a']
+    assert time.monotonic() - started < 0.7
+    chain.close()
+
+
+def test_slow_primary_answer_is_used_and_secondary_measured():
+    primary = FakeProvider('a', delay=0.2)
+    secondary = FakeProvider('b', delay=0.01)
+    chain = ProviderChain([primary, secondary], hedge=True, hedge_min_samples=5)
+    warm_up(chain, primary, 0.05)
+
+    result = chain.analyze_image('x.jpg', 'prompt')
+
+    assert result['provider'] == 'a'
+    assert 'hedged' not in result
+    assert secondary.finished.wait(1)
+    chain.close()
+
+
+def test_async_hedging_takes_the_faster_secondary():
+    primary = FakeProvider('a', delay=0.5)
+    secondary = FakeProvider('b', delay=0.01)
+    chain = ProviderChain([primary, secondary], hedge=True, hedge_min_samples=5)
+    warm_up(chain, primary, 0.05)
+
+    async def run():
+        started = time.monotonic()
+        result = await chain.analyze_images_async(['x.jpg'], 'prompt')
+        elapsed = time.monotonic() - started
+        # The slow primary keeps running as a task and is still measured
+        await asyncio.sleep(0.6)
+        return result, elapsed
+
+    result, elapsed = asyncio.run(run())
+
+    assert result['provider'] == 'b'
+    assert result['hedged'] is True
+    assert elapsed < 0.3
+    assert primary.finished.is_set()
+
+
+def test_hedging_waits_for_enough_samples():
+    primary = FakeProvider('a', delay=0.05)
+    secondary = FakeProvider('b')
+    chain = ProviderChain([primary, secondary], hedge=True, hedge_min_samples=5)
+
+    assert chain.analyze_image('x.jpg', 'prompt')['provider'] == 'a'
+    assert secondary.calls == 0
+
+
+def test_hedging_falls_back_when_both_hedged_calls_fail():
+    primary = FakeProvider('a', delay=0.1, fail=True)
+    chain = ProviderChain([primary, FakeProvider('b', fail=True), FakeProvider('c')], hedge=True, hedge_min_samples=1)
+    warm_up(chain, primary, 0.01, samples=1)
+
+    result = chain.analyze_image('x.jpg', 'prompt')
+
+    assert result['provider'] == 'c'
+    assert sorted(result['failed_providers']) == ['a', 'b']
+    chain.close()
+
+
+def test_stream_fails_over_only_before_first_token():
+    chain = ProviderChain([FakeProvider('a', fail=True), FakeProvider('b', tokens=['Re', 'zept'])])
+    stream = chain.stream_images(['x.jpg'], 'prompt')
+    tokens = []
+    with pytest.raises(StopIteration) as stop:
+        while True:
+            tokens.append(next(stream))
+
+    assert tokens == ['Re', 'zept']
+    assert stop.value.value['provider'] == 'b'
+
+    chain = ProviderChain([FakeProvider('a', fail=True, tokens=['Re']), FakeProvider('b', tokens=['x'])])
+    stream = chain.stream_images(['x.jpg'], 'prompt')
+    assert next(stream) == 'Re'
+    with pytest.raises(StopIteration) as stop:
+        next(stream)
+    assert stop.value.value == {'provider': 'a', 'error': 'a down'}
+
+
+def test_factory_builds_chain_from_comma_separated_setting():
+    AIProviderFactory._reset_after_fork()
+    try:
+        with patch.object(provider_factory, 'AI_PROVIDER', 'custom, anthropic'):
+            chain = AIProviderFactory.get_provider()
+            assert AIProviderFactory.get_provider() is chain
+        assert isinstance(chain, ProviderChain)
+        assert [provider.provider_name for provider in chain.providers] == ['custom', 'anthropic']
+
+        with patch.object(provider_factory, 'AI_PROVIDER', 'custom,unknown'):
+            with pytest.raises(ValueError):
+                AIProviderFactory.get_provider()
+    finally:
+        AIProviderFactory._reset_after_fork()
+
+
+def test_candidates_do_not_use_up_the_half_open_trial_of_later_providers():
+    first = FakeProvider('a', fail=True)
+    second = FakeProvider('b', fail=True)
+    chain = ProviderChain([first, second], failure_threshold=1, reset_timeout=0.05)
+    chain.analyze_image('x.jpg', 'prompt')
+    time.sleep(0.06)
+
+    first.fail = False
+    second.fail = False
+    assert chain.analyze_image('x.jpg', 'prompt')['provider'] == 'a'
+    assert chain.health['b'].state == CIRCUIT_OPEN
+
+    first.fail = True
+    result = chain.analyze_image('x.jpg', 'prompt')
+
+    assert result['provider'] == 'b'
+    assert result['failed_providers'] == ['a']
+
+
+def test_hedging_is_skipped_without_a_free_slot():
+    primary = FakeProvider('a', delay=0.15)
+    secondary = FakeProvider('b')
+    with patch('ai_providers.provider_chain.AI_HEDGE_WORKERS', 1):
+        chain = ProviderChain([primary, secondary], hedge=True, hedge_min_samples=1)
+    warm_up(chain, primary, 0.01, samples=1)
+    # A losing call from an earlier request still holds the only slot
+    assert chain._hedge_slots.acquire(blocking=False)
+
+    result = chain.analyze_image('x.jpg', 'prompt')
+
+    assert result['provider'] == 'a'
+    assert secondary.calls == 0
+    chain._hedge_slots.release()
+    chain.close()
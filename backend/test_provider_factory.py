@@ -0,0 +1,74 @@
+import os
+import pytest
+from unittest.mock import patch
+
+from ai_providers import provider_factory
+from ai_providers.provider_factory import AIProviderFactory
+from ai_providers.anthropic_provider import AnthropicProvider
+from ai_providers.custom_provider import CustomProvider
+from ai_providers.http_client import AI_CONNECT_TIMEOUT, AI_READ_TIMEOUT
+
+
+@pytest.fixture(autouse=True)
+def fresh_factory():
+    AIProviderFactory._reset_after_fork()
+    yield
+    AIProviderFactory._reset_after_fork()
+
+
+def test_provider_instance_is_reused():
+    with patch.object(provider_factory, 'AI_PROVIDER', 'anthropic'):
+        first = AIProviderFactory.get_provider()
+        second = AIProviderFactory.get_provider()
+
+    assert isinstance(first, AnthropicProvider)
+    assert first is second
+
+
+def test_unknown_provider_raises():
+    with patch.object(provider_factory, 'AI_PROVIDER', 'unknown'):
+        with pytest.raises(ValueError):
+            AIProviderFactory.get_provider()
+
+
+def test_reset_after_fork_drops_instances():
+    with patch.object(provider_factory, 'AI_PROVIDER', 'custom'):
+        first = AIProviderFactory.get_provider()
+        AIProviderFactory._reset_after_fork()
+        second = AIProviderFactory.get_provider()
+
+    assert isinstance(second, CustomProvider)
+    assert first is not second
+
+
+@patch('ai_providers.anthropic_provider.anthropic.Anthropic')
+def test_sdk_client_is_created_once_with_timeouts(mock_anthropic):
+    provider = AnthropicProvider()
+
+    assert provider.client is provider.client
+    mock_anthropic.assert_called_once()
+    kwargs = mock_anthropic.call_args.kwargs
+    assert kwargs['timeout'].connect == AI_CONNECT_TIMEOUT
+    assert kwargs['timeout'].read == AI_READ_TIMEOUT
+    assert kwargs['http_client'] is not None
+
+    provider.close()
+    mock_anthropic.return_value.close.assert_called_once()
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason="fork not available")
+def test_child_process_gets_fresh_instances():
+    with patch.object(provider_factory, 'AI_PROVIDER', 'custom'):
+        AIProviderFactory.get_provider()
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            os.write(write_fd, str(len(AIProviderFactory._instances)).encode())
+            os._exit(0)
+        os.close(write_fd)
+        os.waitpid(pid, 0)
+        inherited = os.read(read_fd, 16)
+        os.close(read_fd)
+
+    assert inherited == b'0'
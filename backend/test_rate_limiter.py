@@ -0,0 +1,229 @@
+import time
+import asyncio
+import threading
+import pytest
+from datetime import datetime, timezone
+from unittest.mock import patch
+from PIL import Image
+
+from ai_providers import base_provider, custom_provider
+from ai_providers.custom_provider import CustomProvider
+from ai_providers.rate_limiter import RateLimiter, RateLimits, RateLimitTimeout, estimate_tokens, parse_delay
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'limits.sqlite3')
+
+
+def make_limiter(db_path, **limits):
+    return RateLimiter(db_path=db_path, limits={'openai': RateLimits(**limits)}, max_wait=1.0, backoff=0.3)
+
+
+def test_parse_delay_formats():
+    now = time.time()
+    assert parse_delay('2') == 2.0
+    assert parse_delay('1.5s') == 1.5
+    assert parse_delay('6m0s') == 360.0
+    assert parse_delay('20ms') == pytest.approx(0.02)
+    assert parse_delay('0h2m3s') == 123.0
+    assert parse_delay('2h') == 3600.0
+    reset = datetime.fromtimestamp(now + 30, tz=timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    assert 28 <= parse_delay(reset, now) <= 30
+    http_date = datetime.fromtimestamp(now + 10, tz=timezone.utc).strftime('%a, %d %b %Y %H:%M:%S GMT')
+    assert 8 <= parse_delay(http_date, now) <= 10
+    assert parse_delay('2000-01-01T00:00:00Z', now) == 0.0
+    assert parse_delay('soon') is None
+    assert parse_delay(None) is None
+
+
+def test_estimate_tokens_counts_prompt_images_and_answer():
+    assert estimate_tokens('x' * 400, 2, 300) == 100 + 2 * 1500 + 300
+
+
+def test_requests_per_minute_bucket(db_path):
+    limiter = make_limiter(db_path, rpm=2, tpm=0, concurrency=0)
+    limiter.release(limiter.acquire('openai'))
+    limiter.release(limiter.acquire('openai'))
+
+    # The third request would need 30 seconds until the bucket refills
+    started = time.monotonic()
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire('openai')
+    assert time.monotonic() - started < 0.5
+
+
+def test_tokens_per_minute_bucket_waits_for_refill(db_path):
+    limiter = make_limiter(db_path, rpm=0, tpm=6000, concurrency=0)
+    limiter.release(limiter.acquire('openai', tokens=5950))
+
+    started = time.monotonic()
+    limiter.release(limiter.acquire('openai', tokens=100))
+    assert 0.3 <= time.monotonic() - started < 1.0
+
+
+def test_concurrency_is_shared_between_workers(db_path):
+    # Two limiters on the same database behave like two gunicorn workers
+    first = make_limiter(db_path, rpm=0, tpm=0, concurrency=1)
+    second = make_limiter(db_path, rpm=0, tpm=0, concurrency=1)
+    lease = first.acquire('openai')
+    acquired = threading.Event()
+
+    def worker():
+        second.release(second.acquire('openai'))
+        acquired.set()
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    assert not acquired.wait(0.2)
+    first.release(lease)
+    assert acquired.wait(1)
+    thread.join()
+
+
+def test_async_acquire_does_not_block_the_event_loop(db_path):
+    limiter = make_limiter(db_path, rpm=0, tpm=0, concurrency=1)
+    lease = limiter.acquire('openai')
+
+    async def run():
+        ticks = 0
+        waiter = asyncio.ensure_future(limiter.acquire_async('openai'))
+        while not waiter.done():
+            ticks += 1
+            if ticks == 5:
+                limiter.release(lease)
+            await asyncio.sleep(0.02)
+        limiter.release(waiter.result())
+        return ticks
+
+    # Other coroutines keep running while the request waits for a free slot
+    assert asyncio.run(run()) >= 5
+
+
+def test_async_acquire_runs_database_steps_in_threads(db_path):
+    limiter = make_limiter(db_path, rpm=0, tpm=0, concurrency=1)
+    attempt = limiter._attempt
+    threads = []
+
+    def recording_attempt(waiter):
+        threads.append(threading.current_thread())
+        return attempt(waiter)
+
+    async def run():
+        lease = await limiter.acquire_async('openai')
+        await limiter.release_async(lease)
+
+    with patch.object(limiter, '_attempt', side_effect=recording_attempt):
+        asyncio.run(run())
+
+    assert threads and threading.main_thread() not in threads
+
+
+def test_waiters_behind_the_head_only_read(db_path):
+    limiter = make_limiter(db_path, rpm=0, tpm=0, concurrency=1)
+    lease = limiter.acquire('openai')
+    threads = [threading.Thread(target=lambda: limiter.release(limiter.acquire('openai'))) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.1)
+
+    def expiry():
+        rows = limiter.store.connection().execute("SELECT id, expires_at FROM rate_waiters ORDER BY id").fetchall()
+        return [row['expires_at'] for row in rows]
+
+    head_before, behind_before = expiry()
+    time.sleep(0.2)
+    head_after, behind_after = expiry()
+    limiter.release(lease)
+    for thread in threads:
+        thread.join()
+
+    assert head_after > head_before
+    assert behind_after == behind_before
+
+
+def test_waiters_are_served_in_arrival_order(db_path):
+    limiter = make_limiter(db_path, rpm=0, tpm=0, concurrency=1)
+    lease = limiter.acquire('openai')
+    order = []
+
+    def worker(name):
+        acquired = limiter.acquire('openai')
+        order.append(name)
+        time.sleep(0.02)
+        limiter.release(acquired)
+
+    threads = []
+    for name in range(3):
+        threads.append(threading.Thread(target=worker, args=(name,)))
+        threads[-1].start()
+        time.sleep(0.1)
+    limiter.release(lease)
+    for thread in threads:
+        thread.join()
+
+    assert order == [0, 1, 2]
+
+
+def test_retry_after_blocks_all_requests(db_path):
+    limiter = make_limiter(db_path, rpm=0, tpm=0, concurrency=0)
+    limiter.observe('openai', 429, {'retry-after': '0.3'})
+
+    started = time.monotonic()
+    limiter.release(limiter.acquire('openai'))
+    assert 0.25 <= time.monotonic() - started < 0.8
+
+    limiter.observe('openai', 429, {'retry-after-ms': '5000'})
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire('openai')
+
+
+def test_429_without_retry_after_uses_backoff(db_path):
+    limiter = make_limiter(db_path, rpm=10, tpm=0, concurrency=0)
+    limiter.observe('openai', 429, {})
+
+    assert 0.2 < limiter.blocked_for('openai') <= 0.3
+
+
+def test_exhausted_quota_headers_block_until_reset(db_path):
+    limiter = make_limiter(db_path, rpm=0, tpm=0, concurrency=0)
+    limiter.observe('openai', 200, {'x-ratelimit-remaining-requests': '5', 'x-ratelimit-reset-requests': '30s'})
+    assert limiter.blocked_for('openai') == 0
+
+    limiter.observe('openai', 200, {'x-ratelimit-remaining-requests': '0', 'x-ratelimit-reset-requests': '30s'})
+    assert 29 < limiter.blocked_for('openai') <= 30
+
+
+def test_remaining_tokens_header_drains_bucket(db_path):
+    limiter = make_limiter(db_path, rpm=0, tpm=60000, concurrency=0)
+    limiter.observe('openai', 200, {'x-ratelimit-remaining-tokens': '100'})
+
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire('openai', tokens=5000)
+
+
+@pytest.fixture
+def custom_api(local_server):
+    """Local API that answers with 429 and Retry-After."""
+    server = local_server(lambda method, path, query, body: (429, {}, {'Retry-After': '20'}))
+    return f"{server.url}/analyze"
+
+
+def test_provider_honors_retry_after_from_response(custom_api, db_path, tmp_path):
+    image_path = tmp_path / 'page.jpg'
+    Image.new('RGB', (20, 20), 'white').save(image_path)
+    limiter = RateLimiter(db_path=db_path, limits={}, max_wait=1.0)
+    provider = CustomProvider()
+
+    with patch.object(base_provider, 'rate_limiter', limiter), \
+            patch.object(custom_provider, 'CUSTOM_API_URL', custom_api), \
+            patch.object(custom_provider, 'CUSTOM_API_KEY', 'key'):
+        first = provider.analyze_image(str(image_path), 'prompt')
+        assert 19 < limiter.blocked_for('custom') <= 20
+
+        # The next request fails fast instead of hitting the API again
+        second = provider.analyze_image(str(image_path), 'prompt')
+    provider.close()
+
+    assert first['error'].startswith('API-Fehler: 429')
+    assert 'Rate-Limit für custom' in second['error']
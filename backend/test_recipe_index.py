@@ -0,0 +1,160 @@
+import pytest
+from unittest.mock import MagicMock, patch
+
+from app import app as flask_app
+from recipe_index import RecipeIndex, minhash, similarity, ingredient_set
+from tandoor_api import TandoorClient
+
+APPLE_PIE = {
+    'name': 'Apfelkuchen',
+    'recipeIngredient': [
+        '500 g Mehl', '200 g Zucker', '250 g Butter', '3 Eier', '1 kg Äpfel',
+        '1 TL Zimt', '1 Pck. Backpulver', '1 Prise Salz',
+    ],
+}
+
+
+@pytest.fixture
+def client():
+    client = MagicMock()
+    client.base_url = 'https://tandoor.example'
+    client.iter_pages.return_value = [[{'id': 1, 'name': 'Pfannkuchen'}, {'id': 2, 'name': 'Zwiebelkuchen'}]]
+    return client
+
+
+@pytest.fixture
+def index(tmp_path):
+    return RecipeIndex(db_path=str(tmp_path / 'index.sqlite3'))
+
+
+def test_minhash_estimates_jaccard():
+    a = {f'zutat {i}' for i in range(20)}
+    b = {f'zutat {i}' for i in range(2, 22)}
+
+    assert similarity(minhash(a), minhash(a)) == 1.0
+    assert abs(similarity(minhash(a), minhash(b)) - 18 / 22) < 0.15
+    assert minhash(set()) is None
+
+
+def test_ingredient_set_uses_normalized_foods():
+    assert ingredient_set({'recipeIngredient': ['500 g Mehl', '2 EL  Zucker (fein)', '']}) == {'mehl', 'zucker'}
+
+
+def test_seeded_name_matches(index, client):
+    index.sync(client, 'token')
+
+    duplicate = index.find_duplicate(client, 'token', {'name': ' pfannkuchen', 'recipeIngredient': ['2 Eier']})
+
+    assert duplicate == {
+        'recipe_id': 1, 'name': 'Pfannkuchen',
+        'recipe_url': 'https://tandoor.example/view/recipe/1', 'similarity': None
+    }
+    assert index.find_duplicate(client, 'token', {'name': 'Apfelkuchen'}) is None
+    assert client.iter_pages.call_count == 1
+
+
+def test_lookup_reads_only_local_data_and_loads_in_background(index, client):
+    with patch.object(index, 'prefetch') as prefetch:
+        assert index.find_duplicate(client, 'token', {'name': 'Pfannkuchen'}) is None
+
+    prefetch.assert_called_once_with(client, 'token')
+    client.iter_pages.assert_not_called()
+
+    index.prefetch(client, 'token').join()
+
+    assert index.find_duplicate(client, 'token', {'name': 'Pfannkuchen'})['recipe_id'] == 1
+
+
+def test_new_token_of_the_same_user_keeps_signatures(index, client):
+    index.scopes.bind(client.base_url, 'token-1', 'anna')
+    index.sync(client, 'token-1')
+    index.add(client.base_url, 'token-1', 7, APPLE_PIE)
+
+    index.scopes.bind(client.base_url, 'token-2', 'anna')
+
+    assert index.find_duplicate(client, 'token-2', APPLE_PIE)['similarity'] == 1.0
+    assert client.iter_pages.call_count == 1
+
+
+def test_rescan_with_different_name_is_found_by_ingredients(index, client):
+    client.iter_pages.return_value = [[{'id': 7, 'name': 'Apfelkuchen'}]]
+    index.sync(client, 'token')
+    index.add(client.base_url, 'token', 7, APPLE_PIE)
+    rescan = {
+        'name': 'Apfel-Kuchen vom Blech',
+        'recipeIngredient': APPLE_PIE['recipeIngredient'] + ['1 Päckchen Vanillezucker'],
+    }
+
+    duplicate = index.find_duplicate(client, 'token', rescan)
+
+    assert duplicate['recipe_id'] == 7
+    assert duplicate['similarity'] >= 0.8
+
+
+def test_same_name_with_other_ingredients_is_not_a_duplicate(index, client):
+    client.iter_pages.return_value = [[{'id': 7, 'name': 'Apfelkuchen'}]]
+    index.sync(client, 'token')
+    index.add(client.base_url, 'token', 7, APPLE_PIE)
+    other = {'name': 'Apfelkuchen', 'recipeIngredient': ['300 g Quark', '2 Eier', '100 ml Sahne', '1 Zitrone']}
+
+    assert index.find_duplicate(client, 'token', other) is None
+
+
+def test_sync_drops_recipes_deleted_in_tandoor(tmp_path, client):
+    index = RecipeIndex(db_path=str(tmp_path / 'index.sqlite3'), ttl=0)
+    index.add(client.base_url, 'token', 7, APPLE_PIE)
+    index.sync(client, 'token')
+    with patch.object(index, 'prefetch'):
+        assert index.find_duplicate(client, 'token', APPLE_PIE) is None
+
+    index.add(client.base_url, 'token', 8, APPLE_PIE)
+    client.iter_pages.return_value = [[{'id': 8, 'name': 'Apfelkuchen'}]]
+    index.sync(client, 'token')
+
+    with patch.object(index, 'prefetch'):
+        assert index.find_duplicate(client, 'token', {'name': 'Pfannkuchen'}) is None
+        assert index.find_duplicate(client, 'token', APPLE_PIE)['similarity'] == 1.0
+
+
+def test_sync_keeps_recipes_imported_while_loading(index, client):
+    def pages(*args, **kwargs):
+        index.add(client.base_url, 'token', 9, APPLE_PIE)
+        return [[{'id': 1, 'name': 'Pfannkuchen'}]]
+
+    client.iter_pages.side_effect = pages
+    index.sync(client, 'token')
+
+    assert index.find_duplicate(client, 'token', APPLE_PIE)['recipe_id'] == 9
+
+
+def test_client_skips_duplicate_unless_allowed(index):
+    client = TandoorClient(base_url='https://tandoor.example', recipe_index=index)
+    created = MagicMock(status_code=201)
+    created.json.return_value = {'id': 7}
+
+    with patch.object(client, 'iter_pages', return_value=[[]]), \
+            patch.object(client, '_post', return_value=created) as post:
+        index.sync(client, 'token')
+        first = client.import_recipe(APPLE_PIE, 'token', mode='direct')
+        second = client.import_recipe(APPLE_PIE, 'token', mode='direct')
+        forced = client.import_recipe(APPLE_PIE, 'token', mode='direct', allow_duplicate=True)
+
+    assert first['success'] is True
+    assert second['status_code'] == 409
+    assert second['duplicate']['recipe_id'] == 7
+    assert forced['success'] is True
+    assert post.call_count == 2
+
+
+@patch('app.tandoor_tokens.import_recipe')
+def test_import_endpoint_answers_409_for_duplicates(mock_import_recipe):
+    mock_import_recipe.return_value = {
+        'success': False, 'error': 'Wahrscheinlich Duplikat von Rezept 7 (Apfelkuchen)',
+        'status_code': 409, 'duplicate': {'recipe_id': 7},
+    }
+    with patch.dict(flask_app.config, {'TESTING': False}), flask_app.test_client() as client:
+        response = client.post('/api/import-to-tandoor', json={'recipe_json_ld': APPLE_PIE, 'session_id': 's'})
+
+    assert response.status_code == 409
+    assert response.json['duplicate'] == {'recipe_id': 7}
+    assert mock_import_recipe.call_args.kwargs['allow_duplicate'] is False
@@ -0,0 +1,119 @@
+import io
+import os
+import base64
+from unittest.mock import MagicMock, patch
+from PIL import Image
+
+from ai_service import AIService
+from ai_providers.image_preprocessing import DerivativeCache, prepare_images
+from ai_providers.openai_provider import OpenAIProvider
+from ai_providers.anthropic_provider import AnthropicProvider
+from ai_providers.custom_provider import CustomProvider
+
+
+def write_image(path, size=(40, 20), color='white', orientation=None):
+    img = Image.new('RGB', size, color)
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    img.save(path, format='JPEG', exif=exif)
+    return str(path)
+
+
+def jpeg_upload(size=(8, 8)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'white').save(buffer, format='JPEG')
+    buffer.seek(0)
+    return buffer
+
+
+def test_prepare_images_keeps_page_order(tmp_path):
+    paths = [write_image(tmp_path / f'page{i}.jpg', size=(10 + i, 10)) for i in range(4)]
+    results = prepare_images(paths, max_workers=4, cache=DerivativeCache(str(tmp_path / 'derivatives')))
+
+    assert [image.size[0] for image in results] == [10, 11, 12, 13]
+
+
+@patch('ai_service.AIProviderFactory.get_provider')
+def test_analyze_images_sends_one_request(mock_get_provider, tmp_path):
+    mock_provider = MagicMock()
+    mock_provider.provider_name = 'test'
+    mock_provider.model_name = None
+    mock_provider.analyze_images.return_value = {'provider': 'test', 'response': 'merged'}
+    mock_get_provider.return_value = mock_provider
+
+    with patch('ai_service.analysis_cache.enabled', False):
+        result = AIService.analyze_images(['a.jpg', 'b.jpg'], 'Extract the recipe')
+
+    assert result == {'provider': 'test', 'response': 'merged'}
+    paths, prompt = mock_provider.analyze_images.call_args.args
+    assert paths == ['a.jpg', 'b.jpg']
+    assert prompt.startswith('The following 2 images')
+    assert prompt.endswith('Extract the recipe')
+    mock_provider.analyze_image.assert_not_called()
+
+
+def test_custom_provider_rejects_multiple_images():
+    result = CustomProvider().analyze_images(['a.jpg', 'b.jpg'], 'prompt')
+    assert result['provider'] == 'custom'
+    assert 'error' in result
+
+
+@patch('ai_providers.openai_provider.OPENAI_API_KEY', 'test-key')
+def test_openai_provider_builds_multi_image_message(tmp_path):
+    paths = [write_image(tmp_path / f'page{i}.jpg') for i in range(3)]
+    client = MagicMock()
+    client.chat.completions.create.return_value.choices = [MagicMock(message=MagicMock(content='recipe'))]
+
+    provider = OpenAIProvider()
+    with patch.object(provider, '_create_client', return_value=client):
+        result = provider.analyze_images(paths, 'prompt')
+
+    assert result['response'] == 'recipe'
+    content = client.chat.completions.create.call_args.kwargs['messages'][0]['content']
+    assert [part['type'] for part in content] == ['text', 'image_url', 'image_url', 'image_url']
+    assert content[1]['image_url']['url'].startswith('data:image/jpeg;base64,')
+
+
+@patch('ai_providers.anthropic_provider.ANTHROPIC_API_KEY', 'test-key')
+@patch('ai_providers.anthropic_provider.anthropic.Anthropic')
+def test_anthropic_provider_builds_multi_image_message(mock_anthropic, tmp_path):
+    paths = [write_image(tmp_path / f'page{i}.jpg') for i in range(2)]
+    mock_anthropic.return_value.messages.create.return_value.content = [MagicMock(text='recipe')]
+
+    result = AnthropicProvider().analyze_images(paths, 'prompt')
+
+    assert result['response'] == 'recipe'
+    content = mock_anthropic.return_value.messages.create.call_args.kwargs['messages'][0]['content']
+    assert [part['type'] for part in content] == ['text', 'image', 'image']
+    assert base64.b64decode(content[2]['source']['data']).startswith(b'\xff\xd8')
+
+
+@patch('ai_service.AIService.analyze_images')
+def test_upload_recipe_pages(mock_analyze_images, client, tmp_path):
+    mock_analyze_images.return_value = {'provider': 'test', 'response': 'merged'}
+
+    response = client.post('/api/upload-recipe-pages', data={
+        'images': [(jpeg_upload(), 'page1.jpg'), (jpeg_upload((9, 9)), 'page2.jpg')]
+    })
+
+    assert response.status_code == 200
+    assert len(response.json['files']) == 2
+    assert response.json['ai_analysis'] == {'provider': 'test', 'response': 'merged'}
+    filepaths = mock_analyze_images.call_args.args[0]
+    assert [os.path.basename(path) for path in filepaths] == [page['filename'] for page in response.json['files']]
+    assert mock_analyze_images.call_args.kwargs['image_hashes'] == [page['sha256'] for page in response.json['files']]
+
+
+def test_upload_recipe_pages_rejects_invalid_page(client, tmp_path):
+    """One bad page rejects the whole recipe without keeping the good ones."""
+    response = client.post('/api/upload-recipe-pages', data={
+        'images': [(jpeg_upload(), 'page1.jpg'), (io.BytesIO(b'not an image'), 'page2.jpg')]
+    })
+
+    assert response.status_code == 400
+    assert os.listdir(tmp_path) == []
+
+
+def test_upload_recipe_pages_requires_images(client):
+    assert client.post('/api/upload-recipe-pages', data={}).status_code == 400
@@ -0,0 +1,154 @@
+import io
+import time
+import asyncio
+import pytest
+import threading
+from unittest.mock import patch
+from PIL import Image
+
+from ai_providers import provider_factory
+from ai_providers.base_provider import BaseAIProvider
+from ai_providers.provider_factory import AIProviderFactory
+from ai_providers.recording_provider import Cassette, RecordingProvider
+
+
+class FakeProvider(BaseAIProvider):
+    """Provider that counts its calls and answers with a fixed text."""
+
+    def __init__(self, fail=False, tokens=('Rez', 'ept')):
+        super().__init__()
+        self.fail = fail
+        self.tokens = list(tokens)
+        self.calls = 0
+
+    @property
+    def provider_name(self):
+        return 'fake'
+
+    @property
+    def model_name(self):
+        return 'model'
+
+    def analyze_image(self, image_path, prompt):
+        self.calls += 1
+        if self.fail:
+            return self._create_error_response('down')
+        return self._create_success_response(f'answer to {prompt}', 'model')
+
+    async def analyze_images_async(self, image_paths, prompt):
+        return self.analyze_images(image_paths, prompt)
+
+    def stream_images(self, image_paths, prompt):
+        self.calls += 1
+        for token in self.tokens:
+            yield token
+        return self._create_success_response(''.join(self.tokens), 'model')
+
+
+@pytest.fixture
+def image(tmp_path):
+    path = tmp_path / 'page.jpg'
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), 'white').save(buffer, format='JPEG')
+    path.write_bytes(buffer.getvalue())
+    return str(path)
+
+
+@pytest.fixture
+def cassette(tmp_path):
+    return Cassette(str(tmp_path / 'cassette.sqlite3'))
+
+
+def test_replay_serves_recorded_answer_without_calling_the_provider(image, cassette):
+    recorded = RecordingProvider(FakeProvider(), mode='record', cassette=cassette).analyze_image(image, 'prompt')
+    provider = FakeProvider()
+    replay = RecordingProvider(provider, mode='replay', cassette=cassette)
+
+    result = replay.analyze_image(image, 'prompt')
+
+    assert provider.calls == 0
+    assert result == dict(recorded, replayed=True)
+    assert len(cassette) == 1
+    # A different prompt is a different request
+    assert 'error' in replay.analyze_image(image, 'other prompt')
+
+
+def test_errors_are_not_recorded(image, cassette):
+    provider = FakeProvider(fail=True)
+    recorder = RecordingProvider(provider, mode='auto', cassette=cassette)
+
+    assert 'error' in recorder.analyze_image(image, 'prompt')
+    assert 'error' in recorder.analyze_image(image, 'prompt')
+    assert provider.calls == 2
+    assert len(cassette) == 0
+
+
+def test_streamed_fragments_are_replayed_with_simulated_latency(image, cassette):
+    recorder = RecordingProvider(FakeProvider(tokens=['a', 'b', 'c']), mode='record', cassette=cassette)
+    assert list(recorder.stream_images([image], 'prompt')) == ['a', 'b', 'c']
+    replay = RecordingProvider(FakeProvider(), mode='replay', cassette=cassette, replay_latency='0.2')
+
+    started = time.monotonic()
+    stream = replay.stream_images([image], 'prompt')
+    fragments = []
+    with pytest.raises(StopIteration) as stop:
+        while True:
+            fragments.append(next(stream))
+
+    assert fragments == ['a', 'b', 'c']
+    assert stop.value.value['response'] == 'abc'
+    assert time.monotonic() - started >= 0.2
+
+
+def test_async_replay(image, cassette):
+    RecordingProvider(FakeProvider(), mode='record', cassette=cassette).analyze_image(image, 'prompt')
+    provider = FakeProvider()
+    replay = RecordingProvider(provider, mode='replay', cassette=cassette)
+
+    async def scenario():
+        items = [item async for item in replay.stream_images_async([image], 'prompt')]
+        return await replay.analyze_images_async([image], 'prompt'), items
+
+    result, items = asyncio.run(scenario())
+
+    assert result['replayed'] and result['response'] == 'answer to prompt'
+    assert items == [result]
+    assert provider.calls == 0
+
+
+def test_async_cassette_access_runs_in_threads(image, cassette):
+    recorder = RecordingProvider(FakeProvider(), mode='auto', cassette=cassette)
+    threads = []
+    get, put = cassette.get, cassette.put
+
+    def recording(method):
+        def wrapper(*args, **kwargs):
+            threads.append(threading.current_thread())
+            return method(*args, **kwargs)
+        return wrapper
+
+    async def scenario():
+        await recorder.analyze_images_async([image], 'prompt')
+        return await recorder.analyze_images_async([image], 'prompt')
+
+    with patch.object(cassette, 'get', side_effect=recording(get)), \
+            patch.object(cassette, 'put', side_effect=recording(put)):
+        result = asyncio.run(scenario())
+
+    assert result['replayed'] is True
+    assert len(threads) == 3 and threading.main_thread() not in threads
+
+
+def test_factory_wraps_provider_when_record_mode_is_set(tmp_path):
+    AIProviderFactory._reset_after_fork()
+    try:
+        with patch.object(provider_factory, 'AI_PROVIDER', 'custom'), \
+                patch.object(provider_factory, 'AI_RECORD_MODE', 'replay'), \
+                patch.object(provider_factory, 'AI_CASSETTE', str(tmp_path / 'cassette.sqlite3')):
+            provider = AIProviderFactory.get_provider()
+    finally:
+        AIProviderFactory._reset_after_fork()
+
+    assert isinstance(provider, RecordingProvider)
+    assert provider.provider_name == 'custom'
+    assert provider.mode == 'replay'
@@ -0,0 +1,128 @@
+import io
+import hashlib
+import pytest
+from unittest.mock import patch
+from PIL import Image
+
+from app import app as flask_app
+from ai_providers.image_preprocessing import DerivativeCache, prepare_image
+from storage_backends.base_storage import content_key, key_hash
+from storage_backends.local_storage import LocalStorage
+from storage_backends.memory_storage import MemoryStorage
+from storage_backends.s3_storage import S3Storage
+from storage_backends.storage_factory import StorageFactory
+from upload_storage import open_upload
+
+BUCKET = 'recipe-uploads'
+
+
+def jpeg(size=(8, 8)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'white').save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+@pytest.fixture(scope='module')
+def s3_endpoint():
+    """Local S3-compatible server standing in for MinIO"""
+    server_module = pytest.importorskip('moto.server')
+    server = server_module.ThreadedMotoServer(ip_address='127.0.0.1', port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    yield f'http://{host}:{port}'
+    server.stop()
+
+
+@pytest.fixture
+def s3_storage(s3_endpoint, monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'test')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'test')
+    storage = S3Storage(bucket=BUCKET, endpoint_url=s3_endpoint, region='us-east-1')
+    storage.client.create_bucket(Bucket=BUCKET)
+    yield storage
+    for item in storage.client.list_objects_v2(Bucket=BUCKET).get('Contents', []):
+        storage.client.delete_object(Bucket=BUCKET, Key=item['Key'])
+    storage.close()
+
+
+@pytest.fixture(params=['local', 'memory', 's3'])
+def storage(request, tmp_path):
+    if request.param == 'local':
+        return LocalStorage(str(tmp_path))
+    if request.param == 'memory':
+        return MemoryStorage(max_bytes=0)
+    return request.getfixturevalue('s3_storage')
+
+
+def test_backend_roundtrip(storage):
+    data = jpeg()
+    key = content_key(hashlib.sha256(data).hexdigest(), 'image/jpeg')
+    buffer = storage.create_buffer(len(data))
+    for offset in range(0, len(data), 100):
+        buffer.write(data[offset:offset + 100])
+
+    ref = storage.commit(buffer, key, 'image/jpeg')
+
+    assert storage.owns(ref)
+    assert key_hash(ref) == hashlib.sha256(data).hexdigest()
+    assert storage.stat(ref).st_size == len(data)
+    with storage.open(ref) as upload:
+        assert upload.read() == data
+        upload.seek(0)
+        assert Image.open(upload).size == (8, 8)
+
+    storage.delete(ref)
+    with pytest.raises(FileNotFoundError):
+        storage.open(ref)
+    with pytest.raises(FileNotFoundError):
+        storage.stat(ref)
+
+
+def test_s3_skips_upload_of_existing_content(s3_storage):
+    buffer = s3_storage.create_buffer(3)
+    buffer.write(b'abc')
+    ref = s3_storage.commit(buffer, 'same.jpg')
+
+    buffer = s3_storage.create_buffer(3)
+    buffer.write(b'abc')
+    with patch.object(s3_storage.client, 'upload_fileobj') as upload_fileobj:
+        assert s3_storage.commit(buffer, 'same.jpg') == ref
+
+    upload_fileobj.assert_not_called()
+    assert buffer.closed
+
+
+@patch('app.AIService.analyze_image', return_value={'provider': 'test', 'response': 'ok'})
+def test_replicas_share_uploads_through_s3(mock_analyze, s3_storage, s3_endpoint, tmp_path):
+    saved = {key: flask_app.config[key] for key in ('UPLOAD_FOLDER', 'UPLOAD_STORAGE')}
+    flask_app.config['UPLOAD_FOLDER'] = str(tmp_path / 'uploads')
+    flask_app.config['UPLOAD_STORAGE'] = 's3'
+    StorageFactory.register(s3_storage)
+    data = jpeg((40, 30))
+    try:
+        with flask_app.test_client() as client:
+            response = client.post('/api/upload-image', data={'image': (io.BytesIO(data), 'test.jpg')})
+    finally:
+        flask_app.config.update(saved)
+        StorageFactory._instances.pop(('s3', None), None)
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['filename'] == f"{body['sha256']}.jpg"
+    assert body['path'] == f"s3://{BUCKET}/uploads/{body['filename']}"
+    assert mock_analyze.call_args[0][0] == body['path']
+    assert not (tmp_path / 'uploads').exists()
+
+    # Another replica only shares the bucket
+    replica = S3Storage(bucket=BUCKET, endpoint_url=s3_endpoint, region='us-east-1')
+    with replica.open(body['path']) as upload:
+        assert upload.read() == data
+    StorageFactory.register(replica)
+    try:
+        cache = DerivativeCache(directory=str(tmp_path / 'derivatives'))
+        assert prepare_image(body['path'], cache=cache).size == (40, 30)
+        with open_upload(body['path']) as upload:
+            assert hashlib.sha256(upload.read()).hexdigest() == body['sha256']
+    finally:
+        StorageFactory._instances.pop(('s3', None), None)
+        replica.close()
@@ -5,10 +5,14 @@ import json
 # Import from backend package
 from tandoor_api import (
     prepare_recipe_data,
+    validate_recipe_data,
+    convert_time_to_minutes,
+    parse_servings,
     extract_food_name,
     extract_amount,
     extract_unit,
-    extract_note
+    extract_note,
+    TandoorClient
 )
 
 def test_prepare_recipe_data_minimal():
@@ -78,7 +82,7 @@ def test_prepare_recipe_data_string_instructions():
 
 def test_extract_food_name():
     """Test extract_food_name function."""
-    assert extract_food_name("200g flour") == "g flour"
+    assert extract_food_name("200g flour") == "flour"
     assert extract_food_name("1 apple") == "apple"
     assert extract_food_name("salt") == "salt"
 
@@ -100,3 +104,165 @@ def test_extract_note():
     assert extract_note("flour (sifted)") == "sifted"
     assert extract_note("sugar (brown, not white)") == "brown, not white"
     assert extract_note("plain flour") == ""
+
+@pytest.fixture
+def tandoor_server(local_server):
+    """Local Tandoor that replays a list of (status, body) per path."""
+    responses = {}
+
+    def respond(method, path, query, body):
+        queue = responses[path]
+        return queue.pop(0) if len(queue) > 1 else queue[0]
+
+    server = local_server(respond)
+    return server.url, responses, server.paths
+
+
+@pytest.fixture
+def no_backoff():
+    with patch('tandoor_api.TANDOOR_BACKOFF_FACTOR', 0), patch('tandoor_api.TANDOOR_BACKOFF_JITTER', 0):
+        yield
+
+
+def test_client_retries_gateway_errors(tandoor_server, no_backoff):
+    """502/503/504 from a proxy in front of Tandoor are retried."""
+    url, responses, calls = tandoor_server
+    responses['/api-token-auth/'] = [(502, {}), (504, {}), (200, {'token': 'abc'})]
+    client = TandoorClient(base_url=url)
+
+    assert client.get_auth_token('user', 'pass') == 'abc'
+    assert calls == ['/api-token-auth/'] * 3
+    client.close()
+
+
+def test_client_does_not_retry_recipe_creation_on_gateway_timeout(tandoor_server, no_backoff):
+    """Creating a recipe is not idempotent and is not repeated after a 504."""
+    url, responses, calls = tandoor_server
+    responses['/api/recipe-from-source/'] = [(200, {'recipe_json': {'name': 'Test'}})]
+    responses['/api/recipe/'] = [(504, {}), (201, {'id': 1})]
+    client = TandoorClient(base_url=url)
+
+    result = client.import_recipe({'name': 'Test'}, 'token', mode='source')
+
+    assert result['success'] is False
+    assert calls == ['/api/recipe-from-source/', '/api/recipe/']
+    client.close()
+
+
+def test_client_retries_recipe_creation_on_503_and_listing_on_gateway_errors(tandoor_server, no_backoff):
+    """Only POST is restricted under /api/recipe/; paging the recipe list is retried as usual."""
+    url, responses, calls = tandoor_server
+    responses['/api/recipe/'] = [(503, {}), (201, {'id': 1})]
+    client = TandoorClient(base_url=url)
+
+    assert client._post('/api/recipe/', json={'name': 'Test'}, headers={}).status_code == 201
+
+    responses['/api/recipe/'] = [(502, {}), (504, {}), (200, {'results': []})]
+    response = client.session.get(f"{url}/api/recipe/", params={'page': 1})
+
+    assert response.status_code == 200
+    assert calls == ['/api/recipe/'] * 5
+    client.close()
+
+
+def test_client_reuses_session_with_timeouts(tandoor_server):
+    url, responses, calls = tandoor_server
+    responses['/api-token-auth/'] = [(200, {'token': 'abc'})]
+    client = TandoorClient(base_url=url + '/', connect_timeout=1, read_timeout=2)
+    session = client.session
+
+    with patch.object(session, 'post', wraps=session.post) as post:
+        client.get_auth_token('user', 'pass')
+        client.get_auth_token('user', 'pass')
+
+    assert client.session is session
+    assert post.call_args.args[0] == f"{url}/api-token-auth/"
+    assert post.call_args.kwargs['timeout'] == (1, 2)
+    client.close()
+
+
+def test_prepare_recipe_data_sections_and_keywords():
+    recipe_json_ld = {
+        "name": "Zopf",
+        "recipeYield": ["1", "1 Zopf"],
+        "totalTime": "PT2H",
+        "keywords": ["Backen", "brot, Backen"],
+        "recipeCategory": "Brot",
+        "recipeIngredient": ["500 g Mehl", "1 Prise Salz", "Eigelb (zum Bestreichen)"],
+        "recipeInstructions": [
+            {"@type": "HowToSection", "name": "Teig", "itemListElement": [
+                {"@type": "HowToStep", "text": "Kneten"},
+                {"@type": "HowToStep", "text": "Gehen lassen"}
+            ]},
+            {"@type": "HowToStep", "text": "Backen"}
+        ]
+    }
+
+    result = validate_recipe_data(prepare_recipe_data(recipe_json_ld))
+
+    assert result["servings"] == 1
+    assert result["working_time"] == 120
+    assert [keyword["name"] for keyword in result["keywords"]] == ["Backen", "brot"]
+    assert [(step["name"], step["instruction"], step["order"]) for step in result["steps"]] == [
+        ("Teig", "Kneten", 0), ("", "Gehen lassen", 1), ("", "Backen", 2)
+    ]
+    ingredients = result["steps"][0]["ingredients"]
+    assert ingredients[0]["unit"] == {"name": "g"}
+    assert ingredients[2]["unit"] is None
+    assert ingredients[2]["no_amount"] is True
+    assert ingredients[2]["note"] == "zum Bestreichen"
+
+
+def test_parse_servings_and_durations():
+    assert parse_servings("4-6 Portionen") == (4, "Portionen")
+    assert parse_servings(None) == (4, "")
+    assert convert_time_to_minutes("P1DT2H") == 26 * 60
+    assert convert_time_to_minutes("PT90S") == 2
+
+
+def test_validate_recipe_data_rejects_invalid_amount():
+    data = prepare_recipe_data({"name": "X", "recipeIngredient": ["1 g Salz"]})
+    data["steps"][0]["ingredients"][0]["amount"] = float("nan")
+
+    with pytest.raises(ValueError):
+        validate_recipe_data(data)
+
+
+def test_client_direct_import_uses_one_request(tandoor_server):
+    url, responses, calls = tandoor_server
+    responses['/api/recipe/'] = [(201, {'id': 7})]
+    client = TandoorClient(base_url=url)
+
+    result = client.import_recipe({'name': 'Test', 'recipeIngredient': ['1 g Salz']}, 'token', mode='direct')
+
+    assert result == {'success': True, 'recipe_id': 7, 'recipe_url': f'{url}/view/recipe/7', 'mode': 'direct'}
+    assert calls == ['/api/recipe/']
+    client.close()
+
+
+def test_client_direct_import_falls_back_when_tandoor_rejects(tandoor_server):
+    url, responses, calls = tandoor_server
+    responses['/api/recipe-from-source/'] = [(200, {'recipe_json': {'name': 'Test'}})]
+    responses['/api/recipe/'] = [(400, {'steps': ['invalid']}), (201, {'id': 8})]
+    client = TandoorClient(base_url=url)
+
+    result = client.import_recipe({'name': 'Test'}, 'token', mode='direct')
+
+    assert result['success'] is True
+    assert result['mode'] == 'source'
+    assert calls == ['/api/recipe/', '/api/recipe-from-source/', '/api/recipe/']
+    client.close()
+
+
+def test_client_direct_import_falls_back_on_local_validation_error(tandoor_server):
+    url, responses, calls = tandoor_server
+    responses['/api/recipe-from-source/'] = [(200, {'recipe_json': {'name': 'Test'}})]
+    responses['/api/recipe/'] = [(201, {'id': 9})]
+    client = TandoorClient(base_url=url)
+
+    with patch('tandoor_api.validate_recipe_data', side_effect=ValueError('invalid')):
+        result = client.import_recipe({'name': 'Test'}, 'token', mode='direct')
+
+    assert result['recipe_id'] == 9
+    assert calls == ['/api/recipe-from-source/', '/api/recipe/']
+    client.close()
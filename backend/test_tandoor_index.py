@@ -0,0 +1,182 @@
+import json
+import pytest
+from unittest.mock import patch
+
+from tandoor_api import TandoorClient, prepare_recipe_data
+from tandoor_index import TandoorIndex, normalize_name, trigrams
+
+FOODS = [
+    {'id': 1, 'name': 'Mehl', 'updated_at': '2024-01-01T10:00:00Z'},
+    {'id': 2, 'name': 'Zwiebeln', 'updated_at': '2024-01-02T10:00:00Z'},
+    {'id': 3, 'name': 'Malz', 'updated_at': '2024-01-03T10:00:00Z'},
+    {'id': 4, 'name': 'Butter', 'updated_at': '2024-01-04T10:00:00Z'},
+    {'id': 5, 'name': 'Butterschmalz', 'updated_at': '2024-01-05T10:00:00Z'},
+]
+
+
+@pytest.fixture
+def tandoor(local_server):
+    """Local Tandoor with paged list endpoints that records every request."""
+    state = {
+        'food': list(FOODS),
+        'unit': [{'id': 10, 'name': 'g'}, {'id': 11, 'name': 'EL'}],
+        'keyword': [{'id': 20, 'name': 'Kuchen', 'updated_at': '2024-01-01T00:00:00Z'}],
+        'requests': [],
+        'created': [],
+    }
+
+    def respond(method, path, query, body):
+        if method == 'POST':
+            state['created'].append(json.loads(json.dumps(body)))
+            for step in body.get('steps', []):
+                for ingredient in step['ingredients']:
+                    ingredient['food'].setdefault('id', 100)
+            return 201, dict(body, id=42)
+
+        state['requests'].append((path, query))
+        items = state[path.strip('/').split('/')[-1]]
+        if 'updated_at' in query:
+            items = [item for item in items if item.get('updated_at', '') > query['updated_at']]
+        page, size = int(query.get('page', 1)), int(query.get('page_size', 100))
+        more = page * size < len(items)
+        return 200, {
+            'count': len(items),
+            'next': f"{server.url}{path}?page={page + 1}&page_size={size}" if more else None,
+            'results': items[(page - 1) * size:page * size],
+        }
+
+    server = local_server(respond)
+    return server.url, state
+
+
+@pytest.fixture
+def index(tmp_path):
+    return TandoorIndex(db_path=str(tmp_path / 'index.sqlite3'), page_size=2)
+
+
+def test_normalize_name():
+    assert normalize_name('  Mehl,  Type 405 ') == 'mehl type 405'
+    assert normalize_name('ＭＥＨＬ') == 'mehl'
+    assert trigrams('ei') == {'  e', ' ei', 'ei '}
+
+
+def test_sync_loads_all_pages_and_matches(tandoor, index):
+    base_url, state = tandoor
+    client = TandoorClient(base_url=base_url)
+
+    assert index.sync(client, 'token') is True
+    scope = index.scope(base_url, 'token')
+
+    assert [query.get('page', '1') for path, query in state['requests'] if path == '/api/food/'] == ['1', '2', '3']
+    assert index.match(scope, 'food', 'mehl ') == {'id': 1, 'name': 'Mehl'}
+    assert index.match(scope, 'food', 'Zwiebel') == {'id': 2, 'name': 'Zwiebeln'}
+    assert index.match(scope, 'food', 'Salz') is None
+    assert index.match(scope, 'food', 'Butter') == {'id': 4, 'name': 'Butter'}
+    assert index.match(scope, 'unit', 'el') == {'id': 11, 'name': 'EL'}
+    assert index.match(index.scope(base_url, 'other-token'), 'food', 'Mehl') is None
+    client.close()
+
+
+def test_sync_refreshes_incrementally(tandoor, tmp_path):
+    base_url, state = tandoor
+    client = TandoorClient(base_url=base_url)
+    index = TandoorIndex(db_path=str(tmp_path / 'index.sqlite3'), refresh=0)
+    index.sync(client, 'token')
+    state['food'].append({'id': 6, 'name': 'Zucker', 'updated_at': '2024-02-01T00:00:00Z'})
+    state['requests'].clear()
+
+    index.sync(client, 'token')
+
+    food_requests = [query for path, query in state['requests'] if path == '/api/food/']
+    assert food_requests == [{'page_size': '100', 'updated_at': '2024-01-05T10:00:00Z'}]
+    assert index.match(index.scope(base_url, 'token'), 'food', 'zucker') == {'id': 6, 'name': 'Zucker'}
+    # Units have no updated_at and wait for the next full rebuild
+    assert not any(path == '/api/unit/' for path, query in state['requests'])
+    client.close()
+
+
+def test_direct_import_references_existing_objects(tandoor, index):
+    base_url, state = tandoor
+    client = TandoorClient(base_url=base_url, index=index)
+    recipe = {
+        'name': 'Zwiebelkuchen',
+        'keywords': 'kuchen',
+        'recipeIngredient': ['500 g mehl', '3 Zwiebel', '1 Prise Salz'],
+    }
+    index.sync(client, 'token')
+
+    result = client.import_recipe(recipe, 'token', mode='direct')
+
+    assert result['success'] is True
+    created = state['created'][0]
+    assert created['keywords'] == [{'id': 20, 'name': 'Kuchen'}]
+    ingredients = created['steps'][0]['ingredients']
+    assert [ingredient['food'] for ingredient in ingredients] == [
+        {'id': 1, 'name': 'Mehl'}, {'id': 2, 'name': 'Zwiebeln'}, {'name': 'Salz'}
+    ]
+    assert ingredients[0]['unit'] == {'id': 10, 'name': 'g'}
+    # Objects of the created recipe are learned without another sync
+    assert index.match(index.scope(base_url, 'token'), 'food', 'salz') == {'id': 100, 'name': 'Salz'}
+    client.close()
+
+
+def test_resolve_loads_a_missing_index_in_the_background(tandoor, index):
+    base_url, state = tandoor
+    client = TandoorClient(base_url=base_url)
+    data = prepare_recipe_data({'name': 'X', 'recipeIngredient': ['1 g Mehl']})
+
+    with patch.object(index, 'prefetch') as prefetch:
+        assert index.resolve(client, 'token', data) == 0
+
+    # The import does not page through the lists itself
+    prefetch.assert_called_once_with(client, 'token')
+    assert state['requests'] == []
+
+    index.sync(client, 'token')
+    with patch.object(index, 'prefetch') as prefetch:
+        assert index.resolve(client, 'token', data) == 2
+    prefetch.assert_not_called()
+    client.close()
+
+
+def test_resolve_ignores_unreachable_tandoor(index):
+    client = TandoorClient(base_url='http://127.0.0.1:9', max_retries=0)
+    data = prepare_recipe_data({'name': 'X', 'recipeIngredient': ['1 g Mehl']})
+
+    assert index.resolve(client, 'token', data) == 0
+    assert data['steps'][0]['ingredients'][0]['food'] == {'name': 'Mehl'}
+    client.close()
+
+
+def test_new_token_of_the_same_user_reuses_the_index(tandoor, index):
+    base_url, state = tandoor
+    client = TandoorClient(base_url=base_url, index=index)
+    client.remember_user('token-1', 'Anna')
+    index.sync(client, 'token-1')
+    state['requests'].clear()
+
+    client.remember_user('token-2', 'anna')
+    index.sync(client, 'token-2')
+
+    assert state['requests'] == []
+    assert index.scope(base_url, 'token-2') == index.scope(base_url, 'token-1')
+    assert index.match(index.scope(base_url, 'token-2'), 'food', 'Mehl') == {'id': 1, 'name': 'Mehl'}
+    assert index.scope(base_url, 'token-3') != index.scope(base_url, 'token-1')
+    client.close()
+
+
+def test_purge_drops_scopes_without_recent_tokens(tandoor, tmp_path):
+    base_url, state = tandoor
+    client = TandoorClient(base_url=base_url)
+    index = TandoorIndex(db_path=str(tmp_path / 'index.sqlite3'))
+    index.sync(client, 'old-token')
+    index.sync(client, 'token')
+    index.store.connection().execute(
+        "UPDATE tandoor_token_scopes SET used_at = 0 WHERE scope = ?", (index.scope(base_url, 'old-token'),)
+    )
+
+    index.purge()
+
+    scopes = {row[0] for row in index.store.connection().execute("SELECT DISTINCT scope FROM tandoor_objects")}
+    assert scopes == {index.scope(base_url, 'token')}
+    client.close()
@@ -0,0 +1,132 @@
+import time
+import asyncio
+import pytest
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from tandoor_tokens import TandoorTokenCache
+
+
+@pytest.fixture
+def tandoor_client():
+    client = MagicMock()
+    client.get_auth_token.side_effect = ['token-1', 'token-2', 'token-3']
+    return client
+
+
+@pytest.fixture
+def tokens(tmp_path, tandoor_client):
+    return TandoorTokenCache(db_path=str(tmp_path / 'tokens.sqlite3'), ttl=60, secret='test', client=tandoor_client)
+
+
+def test_repeated_login_skips_tandoor(tokens, tandoor_client):
+    session_id, token = tokens.login('user', 'pass')
+
+    assert tokens.login('user', 'pass') == (session_id, token)
+    assert tandoor_client.get_auth_token.call_count == 1
+    assert tokens.get_token(session_id) == 'token-1'
+    tandoor_client.remember_user.assert_called_once_with('token-1', 'user')
+
+
+def test_password_is_not_stored(tokens, tmp_path):
+    tokens.login('user', 'secret-password')
+
+    assert b'secret-password' not in (tmp_path / 'tokens.sqlite3').read_bytes()
+    row = tokens.store.connection().execute("SELECT * FROM tandoor_tokens").fetchone()
+    assert 'secret-password' not in dict(row).values()
+
+
+def test_wrong_password_does_not_hit_cache(tokens, tandoor_client):
+    tokens.login('user', 'pass')
+    tandoor_client.get_auth_token.side_effect = [None]
+
+    assert tokens.login('user', 'wrong') is None
+
+
+def test_expired_session(tmp_path, tandoor_client):
+    tokens = TandoorTokenCache(db_path=str(tmp_path / 'tokens.sqlite3'), ttl=-1, secret='test', client=tandoor_client)
+    session_id, _ = tokens.login('user', 'pass')
+
+    assert tokens.get_token(session_id) is None
+    assert tokens.import_recipe({'name': 'Test'}, session_id=session_id)['reauth_required'] is True
+
+
+def test_import_refreshes_token_once_on_401(tokens, tandoor_client):
+    session_id, _ = tokens.login('user', 'pass')
+    tandoor_client.import_recipe.side_effect = [
+        {'success': False, 'error': 'API-Fehler: 401', 'status_code': 401},
+        {'success': True, 'recipe_id': 1},
+    ]
+
+    result = tokens.import_recipe({'name': 'Test'}, session_id=session_id)
+
+    assert result == {'success': True, 'recipe_id': 1}
+    assert [call.args[1] for call in tandoor_client.import_recipe.call_args_list] == ['token-1', 'token-2']
+    assert tokens.get_token(session_id) == 'token-2'
+    tandoor_client.remember_user.assert_called_with('token-2', 'user')
+
+
+def test_import_without_credentials_in_process_requires_reauth(tmp_path, tokens, tandoor_client):
+    """A session created by another worker cannot be refreshed here."""
+    session_id, _ = tokens.login('user', 'pass')
+    other_worker = TandoorTokenCache(db_path=str(tmp_path / 'tokens.sqlite3'), ttl=60, secret='test', client=tandoor_client)
+    tandoor_client.import_recipe.return_value = {'success': False, 'error': 'API-Fehler: 401', 'status_code': 401}
+
+    result = other_worker.import_recipe({'name': 'Test'}, session_id=session_id)
+
+    assert result['reauth_required'] is True
+    assert tandoor_client.import_recipe.call_count == 1
+    assert other_worker.get_token(session_id) is None
+
+
+def test_parallel_imports_refresh_token_once(tokens, tandoor_client):
+    """Concurrent 401s on one session trigger a single re-login."""
+    session_id, _ = tokens.login('user', 'pass')
+    barrier = threading.Barrier(4)
+
+    def import_recipe(recipe, token, **options):
+        if token == 'token-1':
+            barrier.wait(timeout=5)
+            return {'success': False, 'error': 'API-Fehler: 401', 'status_code': 401}
+        return {'success': True, 'recipe_id': recipe['id']}
+
+    tandoor_client.import_recipe.side_effect = import_recipe
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lambda i: tokens.import_recipe({'id': i}, session_id=session_id), range(4)))
+
+    assert all(result['success'] for result in results)
+    assert tandoor_client.get_auth_token.call_count == 2
+    assert tokens.get_token(session_id) == 'token-2'
+
+
+def test_credentials_are_dropped_after_credential_ttl(tmp_path, tandoor_client):
+    tokens = TandoorTokenCache(
+        db_path=str(tmp_path / 'tokens.sqlite3'), ttl=60, secret='test', client=tandoor_client, credential_ttl=1
+    )
+    session_id, _ = tokens.login('user', 'pass')
+    tandoor_client.import_recipe.return_value = {'success': False, 'error': 'API-Fehler: 401', 'status_code': 401}
+
+    with patch('tandoor_tokens.time.time', return_value=time.time() + 2):
+        result = tokens.import_recipe({'name': 'Test'}, session_id=session_id)
+
+    assert result['reauth_required'] is True
+    assert tandoor_client.get_auth_token.call_count == 1
+    assert tokens._credentials == {}
+
+
+def test_async_import_reads_the_token_in_a_thread(tokens, tandoor_client):
+    session_id, _ = tokens.login('user', 'pass')
+    threads = []
+    get_token = tokens.get_token
+
+    def recording_get_token(session_id):
+        threads.append(threading.current_thread())
+        return get_token(session_id)
+
+    tokens._async_client = MagicMock(import_recipe=AsyncMock(return_value={'success': True, 'recipe_id': 1}))
+    with patch.object(tokens, 'get_token', side_effect=recording_get_token):
+        result = asyncio.run(tokens.import_recipe_async({'name': 'Test'}, session_id=session_id))
+
+    assert result == {'success': True, 'recipe_id': 1}
+    assert threads and threading.main_thread() not in threads
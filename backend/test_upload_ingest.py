@@ -0,0 +1,109 @@
+import io
+import os
+import pytest
+from unittest.mock import patch
+from PIL import Image
+
+from app import app as flask_app
+from upload_ingest import StreamingImageWriter, UploadRejected, sniff_image_type
+
+
+def image_bytes(fmt='JPEG', size=(8, 8)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'white').save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def test_sniff_image_type():
+    assert sniff_image_type(image_bytes('JPEG')) == 'image/jpeg'
+    assert sniff_image_type(image_bytes('PNG')) == 'image/png'
+    assert sniff_image_type(image_bytes('GIF')) == 'image/gif'
+    assert sniff_image_type(b'%PDF-1.7') is None
+
+
+def test_writer_hashes_and_commits(tmp_path):
+    data = image_bytes('PNG', (20, 10))
+    writer = StreamingImageWriter(str(tmp_path))
+    writer.write(data[:10])
+    writer.write(data[10:])
+    writer.finish()
+    writer.commit('final.png')
+
+    assert writer.media_type == 'image/png'
+    assert writer.dimensions == (20, 10)
+    assert writer.size == len(data)
+    assert writer.ref == str(tmp_path / 'final.png')
+    assert (tmp_path / 'final.png').read_bytes() == data
+    assert [name for name in os.listdir(tmp_path)] == ['final.png']
+
+
+def test_writer_rejects_non_image_on_first_chunk(tmp_path):
+    writer = StreamingImageWriter(str(tmp_path))
+    with pytest.raises(UploadRejected) as excinfo:
+        writer.write(b'<html>' + b'x' * 100)
+    assert excinfo.value.status_code == 400
+    assert os.listdir(tmp_path) == []
+
+
+def test_writer_enforces_byte_limit(tmp_path):
+    writer = StreamingImageWriter(str(tmp_path), max_bytes=100)
+    writer.write(image_bytes()[:50])
+    with pytest.raises(UploadRejected) as excinfo:
+        writer.write(b'x' * 100)
+    assert excinfo.value.status_code == 413
+    assert os.listdir(tmp_path) == []
+
+
+def test_writer_enforces_pixel_limit(tmp_path):
+    writer = StreamingImageWriter(str(tmp_path), max_pixels=100)
+    writer.write(image_bytes('PNG', (20, 20)))
+    with pytest.raises(UploadRejected) as excinfo:
+        writer.finish()
+    assert excinfo.value.status_code == 413
+
+
+def test_uncommitted_writer_is_removed_on_close(tmp_path):
+    writer = StreamingImageWriter(str(tmp_path))
+    writer.write(image_bytes())
+    writer.close()
+    assert os.listdir(tmp_path) == []
+
+
+@patch('ai_service.AIService.analyze_image')
+def test_upload_reports_hash_and_type(mock_analyze_image, client, tmp_path):
+    mock_analyze_image.return_value = {'provider': 'test', 'response': 'ok'}
+    data = image_bytes('PNG')
+
+    response = client.post('/api/upload-image', data={'image': (io.BytesIO(data), 'photo.jpg')})
+
+    assert response.status_code == 200
+    assert response.json['media_type'] == 'image/png'
+    assert response.json['size'] == len(data)
+    assert mock_analyze_image.call_args.kwargs['image_hash'] == response.json['sha256']
+    assert os.listdir(tmp_path) == [response.json['filename']]
+
+
+def test_upload_rejects_disguised_file(client, tmp_path):
+    response = client.post('/api/upload-image', data={'image': (io.BytesIO(b'MZ\x90\x00' * 100), 'evil.jpg')})
+
+    assert response.status_code == 400
+    assert os.listdir(tmp_path) == []
+
+
+def test_upload_rejects_oversized_file(client, tmp_path):
+    flask_app.config['MAX_UPLOAD_BYTES'] = 1000
+    data = image_bytes('PNG', (200, 200)) + b'\x00' * 2000
+
+    response = client.post('/api/upload-image', data={'image': (io.BytesIO(data), 'big.png')})
+
+    assert response.status_code == 413
+    assert os.listdir(tmp_path) == []
+
+
+def test_upload_rejects_too_many_pixels(client, tmp_path):
+    flask_app.config['MAX_UPLOAD_PIXELS'] = 1000
+
+    response = client.post('/api/upload-image', data={'image': (io.BytesIO(image_bytes('PNG', (100, 100))), 'wide.png')})
+
+    assert response.status_code == 413
+    assert os.listdir(tmp_path) == []
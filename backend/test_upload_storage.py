@@ -0,0 +1,135 @@
+import io
+import os
+import time
+import hashlib
+import pytest
+from unittest.mock import patch
+from PIL import Image
+from prometheus_client import REGISTRY
+
+from app import app as flask_app
+from analysis_cache import hash_file
+from ai_providers.image_preprocessing import DerivativeCache, prepare_image
+from storage_backends.base_storage import StorageFull
+from storage_backends.memory_storage import MemoryStorage, memory_storage
+from upload_storage import UploadJanitor, open_upload
+
+
+def jpeg(size=(8, 8)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'white').save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+def write(path, size, accessed):
+    path.write_bytes(b'x' * size)
+    os.utime(path, (accessed, accessed))
+
+
+@pytest.fixture
+def memory_client(tmp_path):
+    saved = {key: flask_app.config[key] for key in ('UPLOAD_FOLDER', 'UPLOAD_STORAGE')}
+    flask_app.config['UPLOAD_FOLDER'] = str(tmp_path / 'uploads')
+    flask_app.config['UPLOAD_STORAGE'] = 'memory'
+    with flask_app.test_client() as client:
+        yield client
+    flask_app.config.update(saved)
+
+
+@patch('app.AIService.analyze_image', return_value={'provider': 'test', 'response': 'ok'})
+def test_memory_mode_never_touches_disk(mock_analyze, memory_client, tmp_path):
+    data = jpeg((40, 30))
+
+    response = memory_client.post('/api/upload-image', data={'image': (io.BytesIO(data), 'test.jpg')})
+
+    assert response.status_code == 200
+    path = response.get_json()['path']
+    assert not os.path.exists(tmp_path / 'uploads')
+    assert path == f"memory://{response.get_json()['filename']}"
+    assert path in memory_storage
+    assert mock_analyze.call_args[0][0] == path
+
+    # The pipeline reads the upload from memory and keeps derivatives off disk, too
+    cache = DerivativeCache(directory=str(tmp_path / 'derivatives'))
+    assert prepare_image(path, cache=cache).size == (40, 30)
+    assert hash_file(path) == hashlib.sha256(data).hexdigest()
+    assert not os.path.exists(tmp_path / 'derivatives')
+    memory_storage.delete(path)
+
+
+def test_memory_quota_evicts_least_recently_read():
+    uploads = MemoryStorage(max_bytes=10, min_age=0)
+    first = uploads.put('a.jpg', b'a' * 4)
+    second = uploads.put('b.jpg', b'b' * 4)
+    uploads.open(first).close()
+
+    third = uploads.put('c.jpg', b'c' * 4)
+
+    assert second not in uploads
+    assert first in uploads and third in uploads
+    assert uploads.total == 8
+
+
+def test_memory_quota_keeps_recent_uploads():
+    uploads = MemoryStorage(max_bytes=10, min_age=60)
+    first = uploads.put('a.jpg', b'a' * 6)
+
+    with pytest.raises(StorageFull):
+        uploads.put('b.jpg', b'b' * 6)
+    assert first in uploads
+
+
+def test_memory_sweep_removes_expired_uploads():
+    uploads = MemoryStorage(max_bytes=0)
+    uploads.put('a.jpg', b'a')
+
+    assert uploads.sweep(ttl=60, now=time.time() + 30) == (1, 1)
+    assert uploads.sweep(ttl=60, now=time.time() + 90) == (0, 0)
+
+
+def test_janitor_applies_ttl_quota_and_removes_abandoned_parts(tmp_path):
+    uploads = tmp_path / 'uploads'
+    uploads.mkdir()
+    now = time.time()
+    write(uploads / 'expired.jpg', 10, now - 7200)
+    write(uploads / 'oldest.jpg', 40, now - 1800)
+    write(uploads / 'older.jpg', 40, now - 1200)
+    write(uploads / 'recent.jpg', 40, now - 10)
+    write(uploads / '.abandoned.part', 5, now - 900)
+    write(uploads / '.receiving.part', 5, now - 1)
+    janitor = UploadJanitor(str(uploads), ttl=3600, max_bytes=50, min_age=300,
+                            db_path=str(tmp_path / 'janitor.sqlite3'))
+    evicted = REGISTRY.get_sample_value('upload_evictions_total', {'storage': 'local', 'reason': 'quota'}) or 0.0
+
+    result = janitor.sweep(now)
+
+    # The recently read upload stays even if the quota is still exceeded
+    assert sorted(os.listdir(uploads)) == ['.receiving.part', 'recent.jpg']
+    assert result == {'removed': 4, 'removed_bytes': 95, 'files': 1, 'bytes': 40}
+    assert REGISTRY.get_sample_value('upload_evictions_total', {'storage': 'local', 'reason': 'quota'}) == evicted + 2
+    assert REGISTRY.get_sample_value('upload_disk_bytes') == 40
+
+
+def test_reading_an_upload_refreshes_its_access_time(tmp_path):
+    now = time.time()
+    write(tmp_path / 'first.jpg', 40, now - 1800)
+    write(tmp_path / 'second.jpg', 40, now - 1200)
+    with open_upload(str(tmp_path / 'first.jpg')) as upload:
+        upload.read()
+    janitor = UploadJanitor(str(tmp_path), ttl=0, max_bytes=50, min_age=0,
+                            db_path=str(tmp_path / 'data' / 'janitor.sqlite3'))
+
+    janitor.sweep()
+
+    assert os.path.exists(tmp_path / 'first.jpg')
+    assert not os.path.exists(tmp_path / 'second.jpg')
+
+
+def test_only_one_worker_sweeps_per_interval(tmp_path):
+    db_path = str(tmp_path / 'janitor.sqlite3')
+    first = UploadJanitor(str(tmp_path / 'uploads'), interval=60, db_path=db_path, memory=MemoryStorage())
+    second = UploadJanitor(str(tmp_path / 'uploads'), interval=60, db_path=db_path, memory=MemoryStorage())
+
+    assert first.run_once() == {'removed': 0, 'removed_bytes': 0, 'files': 0, 'bytes': 0}
+    assert second.run_once() is None
+    assert second.run_once(force=True) is not None
@@ -0,0 +1,432 @@
+"""
+Streaming-Annahme von Bild-Uploads
+
+Dieses Modul schreibt hochgeladene Dateien bereits während des Parsens des
+Multipart-Bodys blockweise in den Puffer der konfigurierten Ablage
+(storage_backends). Dabei wird der SHA-256 berechnet,
+die Magic Bytes werden nach dem ersten Block geprüft und Byte- sowie
+Pixelgrenzen durchgesetzt, sodass ungültige oder zu große Uploads abgelehnt
+werden, bevor sie vollständig übertragen sind.
+
+Für den asynchronen Betrieb (asgi.py) liest AsyncUpload den Body einer
+ASGI-Anfrage auf dieselbe Weise. Übernommene Uploads werden unter dem
+SHA-256 ihres Inhalts abgelegt (content_key), sodass gleiche Bilder nur
+einmal gespeichert werden und Replikate mit gemeinsamer Ablage (S3) sie
+gegenseitig lesen können.
+"""
+
+import io
+import os
+import time
+import hashlib
+import logging
+from decouple import config
+from flask import Request, current_app
+from PIL import Image
+from werkzeug.datastructures import FileStorage, MultiDict
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+import metrics
+from storage_backends.base_storage import StorageFull, content_key
+from storage_backends.local_storage import LocalStorage
+from storage_backends.storage_factory import StorageFactory
+
+# Konfiguration aus Umgebungsvariablen
+MAX_UPLOAD_BYTES = config('MAX_UPLOAD_BYTES', default=20 * 1024 * 1024, cast=int)
+MAX_UPLOAD_PIXELS = config('MAX_UPLOAD_PIXELS', default=50_000_000, cast=int)
+
+# Anzahl Bytes, die für die Bestimmung der Bildgröße gepuffert werden
+SNIFF_BYTES = 64 * 1024
+
+# Blockgröße beim Kopieren von Streams
+CHUNK_SIZE = 64 * 1024
+
+# Obergrenze für Formularfelder ohne Datei (wie MAX_FORM_MEMORY_SIZE in Flask)
+MAX_FORM_MEMORY_SIZE = 500_000
+
+# Signaturen der unterstützten Bildformate
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+MAGIC_BYTES = max(len(signature) for signature, _ in IMAGE_SIGNATURES)
+
+# Logger
+logger = logging.getLogger('upload_ingest')
+
+
+class UploadRejected(Exception):
+    """Wird ausgelöst, wenn ein Upload die Prüfungen nicht besteht"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def sniff_image_type(head):
+    """
+    Bestimmt den Bildtyp anhand der Magic Bytes
+
+    Args:
+        head: Die ersten Bytes der Datei
+
+    Returns:
+        str: MIME-Typ oder None, wenn kein unterstütztes Bild erkannt wurde
+    """
+    for signature, media_type in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return media_type
+    return None
+
+
+class StreamingImageWriter:
+    """
+    Dateiähnliches Ziel für werkzeug, das Uploads beim Schreiben prüft
+
+    Die Daten landen zunächst im Puffer der Ablage (z.B. eine .part-Datei im
+    Upload-Ordner). Erst commit() übernimmt sie unter ihrem Schlüssel, nicht
+    übernommene Puffer werden beim Schließen verworfen.
+    """
+
+    def __init__(self, storage, max_bytes=MAX_UPLOAD_BYTES, max_pixels=MAX_UPLOAD_PIXELS):
+        """
+        Args:
+            storage: BaseStorage oder Pfad eines Upload-Ordners
+            max_bytes: Höchstgröße der Datei
+            max_pixels: Höchste Pixelzahl des Bildes
+        """
+        self.storage = LocalStorage(storage) if isinstance(storage, str) else storage
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.size = 0
+        self.media_type = None
+        self.dimensions = None
+        self.key = None
+        self.ref = None
+        self._file = self.storage.create_buffer(max_bytes)
+        self._digest = hashlib.sha256()
+        self._head = bytearray()
+        self._committed = False
+        self._closed = False
+        self._started = time.monotonic()
+
+    @property
+    def sha256(self):
+        """SHA-256 der bisher geschriebenen Daten"""
+        return self._digest.hexdigest()
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            self._reject(f"Datei ist größer als {self.max_bytes} Bytes", 413)
+
+        self._digest.update(data)
+        if self.dimensions is None and len(self._head) < SNIFF_BYTES:
+            self._head.extend(data[:SNIFF_BYTES - len(self._head)])
+            self._inspect_head(final=False)
+
+        return self._file.write(data)
+
+    def finish(self):
+        """
+        Schließt die Prüfung nach vollständiger Übertragung ab
+
+        Raises:
+            UploadRejected: Wenn die Datei kein gültiges Bild ist oder die
+                Pixelgrenze überschreitet
+        """
+        self._file.flush()
+        self._inspect_head(final=True)
+
+        if self.dimensions is None:
+            try:
+                self._file.seek(0)
+                with Image.open(self._file) as img:
+                    self.dimensions = img.size
+            except Exception:
+                self._reject("Bild konnte nicht gelesen werden")
+            self._check_pixels()
+
+        return self
+
+    def commit(self, key=None):
+        """
+        Übernimmt die geprüfte Datei in die Ablage
+
+        Args:
+            key: Schlüssel des Uploads (Standard: Inhalts-Hash, siehe content_key)
+
+        Returns:
+            StreamingImageWriter: self, mit key und ref des Uploads
+
+        Raises:
+            UploadRejected: Wenn die Ablage für Uploads voll ist
+        """
+        self.key = key or content_key(self.sha256, self.media_type)
+        self._closed = True
+        try:
+            self.ref = self.storage.commit(self._file, self.key, self.media_type)
+        except StorageFull as e:
+            self._reject(str(e), 507)
+        self._committed = True
+        # Dauer vom ersten Block bis zur Übernahme, inklusive Prüfung
+        metrics.observe_stage(metrics.UPLOAD_SAVE, 'upload_save', time.monotonic() - self._started)
+        return self
+
+    def discard(self):
+        """Verwirft den Puffer, falls er nicht übernommen wurde"""
+        if not self._committed:
+            self._committed = True
+            self._closed = True
+            self.storage.discard(self._file)
+
+    def _inspect_head(self, final):
+        """Prüft Magic Bytes und, sobald möglich, die Bildgröße"""
+        head = bytes(self._head)
+
+        if self.media_type is None and (len(head) >= MAGIC_BYTES or final):
+            self.media_type = sniff_image_type(head)
+            if self.media_type is None:
+                self._reject("Datei ist kein unterstütztes Bild (JPEG, PNG oder GIF)")
+
+        if self.dimensions is None and self.media_type and (len(head) >= SNIFF_BYTES or final):
+            try:
+                with Image.open(io.BytesIO(head)) as img:
+                    self.dimensions = img.size
+            except Exception:
+                # Header länger als der Puffer (z.B. große EXIF-Daten); Prüfung in finish()
+                return
+            self._check_pixels()
+
+    def _check_pixels(self):
+        width, height = self.dimensions
+        if width * height > self.max_pixels:
+            self._reject(f"Bild hat mehr als {self.max_pixels} Pixel ({width}x{height})", 413)
+
+    def _reject(self, message, status_code=400):
+        logger.warning(f"Upload abgelehnt: {message}")
+        self.discard()
+        raise UploadRejected(message, status_code)
+
+    # Dateischnittstelle für werkzeug und FileStorage
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def readline(self, size=-1):
+        return self._file.readline(size)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def flush(self):
+        return self._file.flush()
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def close(self):
+        self.discard()
+
+    def __iter__(self):
+        return iter(self._file)
+
+
+class IngestRequest(Request):
+    """Request-Klasse, die Datei-Uploads direkt prüfend in die Ablage streamt"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        writer = StreamingImageWriter(
+            app_storage(current_app.config),
+            max_bytes=current_app.config.get('MAX_UPLOAD_BYTES', MAX_UPLOAD_BYTES),
+            max_pixels=current_app.config.get('MAX_UPLOAD_PIXELS', MAX_UPLOAD_PIXELS)
+        )
+        # Merken, damit auch bei abgebrochenem Parsen keine .part-Dateien liegen bleiben
+        self.__dict__.setdefault('_ingest_writers', []).append(writer)
+        return writer
+
+    def close(self):
+        super().close()
+        for writer in self.__dict__.pop('_ingest_writers', []):
+            writer.discard()
+
+
+class AsyncUpload:
+    """
+    Multipart-Body einer ASGI-Anfrage, Dateien wie bei IngestRequest geprüft
+
+    Jeder empfangene Block geht an werkzeugs MultipartDecoder, Dateiinhalte
+    direkt an einen StreamingImageWriter. Die Blöcke sind klein (typisch
+    64 KB), Hashen und Schreiben erfolgen daher im Event-Loop. Nach parse()
+    stehen Felder in form und Dateien (FileStorage) in files bereit.
+    """
+
+    def __init__(self, storage, max_bytes=MAX_UPLOAD_BYTES, max_pixels=MAX_UPLOAD_PIXELS,
+                 max_content_length=None, max_form_memory_size=MAX_FORM_MEMORY_SIZE):
+        """
+        Args:
+            storage: BaseStorage oder Pfad eines Upload-Ordners
+            max_bytes: Höchstgröße einer Datei
+            max_pixels: Höchste Pixelzahl eines Bildes
+            max_content_length: Höchstgröße des gesamten Bodys (None: unbegrenzt)
+            max_form_memory_size: Höchstgröße eines Formularfelds
+        """
+        self.storage = storage
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.max_content_length = max_content_length
+        self.max_form_memory_size = max_form_memory_size
+        self.form = MultiDict()
+        self.files = MultiDict()
+        self.received = 0
+        self._writers = []
+        self._part = None
+        self._container = None
+        self._field_size = 0
+
+    async def parse(self, content_type, chunks):
+        """
+        Liest den Body und prüft Dateien bereits während des Empfangs
+
+        Args:
+            content_type: Content-Type-Header der Anfrage
+            chunks: Async-Iterator über die Blöcke des Bodys
+
+        Returns:
+            AsyncUpload: self
+
+        Raises:
+            UploadRejected: Wenn eine Datei die Prüfungen nicht besteht
+            RequestEntityTooLarge: Wenn der Body zu groß ist
+        """
+        mimetype, options = parse_options_header(content_type)
+        boundary = options.get('boundary')
+        if mimetype != 'multipart/form-data' or not boundary:
+            return self
+
+        decoder = MultipartDecoder(boundary.encode('latin-1'), max_form_memory_size=self.max_form_memory_size)
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            self.received += len(chunk)
+            if self.max_content_length is not None and self.received > self.max_content_length:
+                raise RequestEntityTooLarge()
+            decoder.receive_data(chunk)
+            self._consume(decoder)
+        decoder.receive_data(None)
+        self._consume(decoder)
+        return self
+
+    def close(self):
+        """Entfernt alle nicht übernommenen Dateien"""
+        for writer in self._writers:
+            writer.discard()
+        self._writers = []
+
+    def _consume(self, decoder):
+        """Verarbeitet alle Ereignisse, die der Decoder bisher liefern kann"""
+        event = decoder.next_event()
+        while not isinstance(event, (Epilogue, NeedData)):
+            if isinstance(event, Field):
+                self._part, self._container, self._field_size = event, [], 0
+            elif isinstance(event, File):
+                writer = StreamingImageWriter(self.storage, self.max_bytes, self.max_pixels)
+                self._writers.append(writer)
+                self._part, self._container = event, writer
+            elif isinstance(event, Data):
+                if isinstance(self._part, Field):
+                    self._field_size += len(event.data)
+                    if self._field_size > self.max_form_memory_size:
+                        raise RequestEntityTooLarge()
+                    self._container.append(event.data)
+                else:
+                    self._container.write(event.data)
+                if not event.more_data:
+                    self._finish_part()
+            event = decoder.next_event()
+
+    def _finish_part(self):
+        if isinstance(self._part, Field):
+            self.form.add(self._part.name, b''.join(self._container).decode('utf-8', 'replace'))
+        else:
+            self._container.seek(0)
+            self.files.add(self._part.name, FileStorage(
+                self._container, self._part.filename, self._part.name, headers=self._part.headers
+            ))
+        self._part, self._container = None, None
+
+
+def verify_upload(file):
+    """
+    Schließt die Prüfung einer hochgeladenen Datei ab, ohne sie zu übernehmen
+
+    Args:
+        file: werkzeug FileStorage aus request.files
+
+    Returns:
+        StreamingImageWriter: Geprüfte Datei mit Metadaten (sha256, size,
+            media_type, dimensions), bereit für commit()
+
+    Raises:
+        UploadRejected: Wenn die Datei die Prüfungen nicht besteht
+    """
+    writer = file.stream
+    if not isinstance(writer, StreamingImageWriter):
+        # Fallback für Requests ohne IngestRequest: Stream blockweise kopieren
+        writer = StreamingImageWriter(app_storage(current_app.config))
+        try:
+            for chunk in iter(lambda: file.stream.read(CHUNK_SIZE), b''):
+                writer.write(chunk)
+        except Exception:
+            writer.discard()
+            raise
+
+    return writer.finish()
+
+
+def store_upload(file, key=None):
+    """
+    Prüft eine hochgeladene Datei und legt sie in der Ablage ab
+
+    Args:
+        file: werkzeug FileStorage aus request.files
+        key: Schlüssel des Uploads (Standard: Inhalts-Hash)
+
+    Returns:
+        StreamingImageWriter: Metadaten (key, ref, sha256, size, media_type,
+            dimensions)
+
+    Raises:
+        UploadRejected: Wenn die Datei die Prüfungen nicht besteht
+    """
+    return verify_upload(file).commit(key)
+
+
+def app_storage(app_config):
+    """
+    Ablage der Uploads gemäß UPLOAD_STORAGE und UPLOAD_FOLDER der App
+
+    Args:
+        app_config: Konfiguration der Flask-App
+
+    Returns:
+        BaseStorage: Ablage der Uploads
+    """
+    return StorageFactory.get_storage(app_config.get('UPLOAD_STORAGE'), app_config.get('UPLOAD_FOLDER', 'uploads'))
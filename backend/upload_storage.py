@@ -0,0 +1,226 @@
+"""
+Lebenszyklus der hochgeladenen Bilder
+
+Uploads liegen im Upload-Ordner (UPLOAD_STORAGE=local), nur im
+Arbeitsspeicher des Workers (UPLOAD_STORAGE=memory) oder in einem
+S3-kompatiblen Bucket (UPLOAD_STORAGE=s3), siehe storage_backends. Provider
+und Vorverarbeitung lesen Uploads über open_upload(), das anhand der
+Referenz die passende Ablage wählt.
+
+Ein Hintergrund-Thread je Worker (UploadJanitor) entfernt Uploads, die
+länger als UPLOAD_TTL nicht gelesen wurden, und verdrängt die am längsten
+nicht gelesenen, solange der Gesamtumfang über der Quote liegt. Uploads, die
+vor weniger als UPLOAD_MIN_AGE Sekunden gelesen wurden, bleiben erhalten,
+damit laufende Analysen ihre Bilder behalten. Als Zugriffszeit dient
+st_atime, das open_upload() explizit setzt (unabhängig von noatime oder
+relatime). Den Upload-Ordner durchsucht pro Intervall nur ein Worker
+(Absprache über SQLite), Uploads im Arbeitsspeicher prüft jeder Worker
+selbst. Für Uploads in S3 übernimmt eine Lifecycle-Regel des Buckets das
+Aufräumen.
+"""
+
+import os
+import time
+import shutil
+import logging
+import threading
+from decouple import config
+
+import metrics
+from sqlite_store import SQLiteStore
+from storage_backends.local_storage import PARTIAL_SUFFIX
+from storage_backends.memory_storage import UPLOAD_MIN_AGE, memory_storage
+from storage_backends.storage_factory import StorageFactory, STORAGE_LOCAL
+
+# Konfiguration aus Umgebungsvariablen
+UPLOAD_TTL = config('UPLOAD_TTL', default=24 * 3600, cast=int)
+UPLOAD_QUOTA_BYTES = config('UPLOAD_QUOTA_BYTES', default=2 * 1024 * 1024 * 1024, cast=int)
+UPLOAD_JANITOR_INTERVAL = config('UPLOAD_JANITOR_INTERVAL', default=60, cast=int)
+UPLOAD_JANITOR_DB = config('UPLOAD_JANITOR_DB', default=os.path.join('data', 'upload_janitor.sqlite3'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS janitor_runs (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    last_run REAL NOT NULL
+);
+"""
+
+# Logger
+logger = logging.getLogger('upload_storage')
+
+def open_upload(ref):
+    """
+    Öffnet einen Upload zum Lesen und vermerkt den Zugriff für die LRU-Verdrängung
+
+    Args:
+        ref: Referenz des Uploads (Dateipfad, memory:// oder s3://)
+
+    Returns:
+        Binäres, positionierbares Dateiobjekt
+
+    Raises:
+        FileNotFoundError: Wenn der Upload nicht (mehr) existiert
+    """
+    return StorageFactory.storage_for(ref).open(ref)
+
+
+def stat_upload(ref):
+    """
+    Größe und Änderungszeit eines Uploads
+
+    Returns:
+        os.stat_result oder UploadStat (Felder st_size und st_mtime_ns)
+    """
+    return StorageFactory.storage_for(ref).stat(ref)
+
+
+def caches_derivatives(ref):
+    """Prüft, ob Derivate eines Uploads auf der Platte zwischengespeichert werden dürfen"""
+    return StorageFactory.storage_for(ref).cache_derivatives
+
+
+class UploadJanitor:
+    """Räumt Uploads nach Alter und Quote auf, in einem Hintergrund-Thread je Worker"""
+
+    def __init__(self, directory='uploads', ttl=UPLOAD_TTL, max_bytes=UPLOAD_QUOTA_BYTES,
+                 min_age=UPLOAD_MIN_AGE, interval=UPLOAD_JANITOR_INTERVAL, db_path=UPLOAD_JANITOR_DB,
+                 memory=None):
+        """
+        Args:
+            directory: Upload-Ordner
+            ttl: Sekunden ohne Zugriff, nach denen ein Upload entfernt wird (0: nie)
+            max_bytes: Höchstumfang des Upload-Ordners (0: unbegrenzt)
+            min_age: Sekunden nach dem letzten Zugriff, in denen ein Upload
+                nicht verdrängt wird; verwaiste .part-Dateien werden danach entfernt
+            interval: Abstand der Durchläufe in Sekunden
+            db_path: Pfad zur gemeinsamen Datenbank mit dem letzten Durchlauf
+            memory: MemoryStorage (Standard: Uploads dieses Prozesses)
+        """
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.min_age = min_age
+        self.interval = interval
+        self.memory = memory or memory_storage
+        self.store = SQLiteStore(db_path, SCHEMA)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._thread_pid = None
+        self._stop = threading.Event()
+
+    def ensure_running(self):
+        """Startet den Hintergrund-Thread dieses Prozesses (nach fork neu)"""
+        if self._thread_pid == os.getpid() or self.interval <= 0:
+            return
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, name='upload-janitor', daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread_pid == os.getpid():
+            self._thread.join()
+        self._thread_pid = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.warning(f"Aufräumen der Uploads fehlgeschlagen: {str(e)}")
+
+    def run_once(self, force=False):
+        """
+        Räumt die Uploads im Arbeitsspeicher und, falls dieser Worker an der
+        Reihe ist, den Upload-Ordner auf
+
+        Args:
+            force: Upload-Ordner unabhängig vom letzten Durchlauf prüfen
+
+        Returns:
+            dict: Ergebnis des Ordners (siehe sweep) oder None, wenn ein
+                anderer Worker ihn in diesem Intervall bereits geprüft hat
+        """
+        self.memory.sweep(self.ttl)
+        if not force and not self._claim():
+            return None
+        return self.sweep()
+
+    def sweep(self, now=None):
+        """
+        Entfernt abgelaufene Uploads und verdrängt die ältesten über der Quote
+
+        Returns:
+            dict: files und bytes (verbleibend), removed und removed_bytes
+        """
+        now = time.time() if now is None else now
+        entries = []
+        removed = {'removed': 0, 'removed_bytes': 0}
+        try:
+            scan = os.scandir(self.directory)
+        except FileNotFoundError:
+            return dict(removed, files=0, bytes=0)
+
+        with scan:
+            for entry in scan:
+                try:
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    stat = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                if entry.name.endswith(PARTIAL_SUFFIX):
+                    # Empfang abgebrochen, ohne dass die Datei entfernt wurde (z.B. Absturz)
+                    if now - stat.st_mtime > self.min_age:
+                        self._remove(entry.path, stat.st_size, 'abandoned', removed)
+                    continue
+                accessed = max(stat.st_atime, stat.st_mtime)
+                if self.ttl and now - accessed > self.ttl:
+                    self._remove(entry.path, stat.st_size, 'ttl', removed)
+                    continue
+                entries.append((accessed, stat.st_size, entry.path))
+
+        files = len(entries)
+        total = sum(size for _, size, _ in entries)
+        if self.max_bytes and total > self.max_bytes:
+            for accessed, size, path in sorted(entries):
+                if total <= self.max_bytes or now - accessed < self.min_age:
+                    break
+                if self._remove(path, size, 'quota', removed):
+                    files -= 1
+                    total -= size
+
+        metrics.UPLOAD_DISK_BYTES.set(total)
+        metrics.UPLOAD_DISK_FILES.set(files)
+        try:
+            metrics.UPLOAD_DISK_FREE_BYTES.set(shutil.disk_usage(self.directory).free)
+        except OSError:
+            pass
+        if removed['removed']:
+            logger.info(f"{removed['removed']} Upload(s) entfernt ({removed['removed_bytes']} Bytes)")
+        return dict(removed, files=files, bytes=total)
+
+    def _claim(self):
+        """Beansprucht den nächsten Durchlauf für diesen Worker"""
+        now = time.time()
+        with self.store.transaction(immediate=True) as conn:
+            row = conn.execute("SELECT last_run FROM janitor_runs WHERE id = 1").fetchone()
+            if row is not None and now - row['last_run'] < self.interval:
+                return False
+            conn.execute("INSERT OR REPLACE INTO janitor_runs (id, last_run) VALUES (1, ?)", (now,))
+        return True
+
+    def _remove(self, path, size, reason, removed):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return False
+        metrics.UPLOAD_EVICTIONS.labels(STORAGE_LOCAL, reason).inc()
+        metrics.UPLOAD_EVICTED_BYTES.labels(STORAGE_LOCAL, reason).inc(size)
+        removed['removed'] += 1
+        removed['removed_bytes'] += size
+        return True